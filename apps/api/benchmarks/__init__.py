@@ -0,0 +1,3 @@
+"""
+Webhook 傳送效能壓測工具
+"""
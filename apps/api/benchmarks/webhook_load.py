@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Webhook 傳送壓力測試
+
+在本機以固定速率對多個租戶與 webhook 觸發事件，傳送到本地接收端，
+輸出事件接收速率、傳送完成速率、端到端延遲、每事件資料庫查詢數與重試放大倍數。
+全程離線執行，可指定 SQLite 或本機 Postgres。
+
+用法 (於 apps/api 目錄):
+    python -m benchmarks.webhook_load --rate 200 --duration 30 --output report.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+# 添加項目根目錄到 Python 路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.webhook_sink import WebhookSink  # noqa: E402
+
+PLANS = ["free", "basic", "premium", "enterprise"]
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Webhook 傳送壓力測試")
+    parser.add_argument("--database-url", help="資料庫 URL (預設為暫存 SQLite 檔案)")
+    parser.add_argument("--tenants", type=int, default=10, help="租戶數量")
+    parser.add_argument("--webhooks-per-tenant", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=100, help="每秒觸發事件數")
+    parser.add_argument("--duration", type=float, default=10, help="觸發持續秒數")
+    parser.add_argument("--workers", type=int, default=4, help="傳送工作執行緒數")
+    parser.add_argument("--sink-latency-ms", type=float, default=20)
+    parser.add_argument("--sink-jitter-ms", type=float, default=10)
+    parser.add_argument("--sink-error-rate", type=float, default=0.0)
+    parser.add_argument("--sink-timeout-rate", type=float, default=0.0)
+    parser.add_argument("--sink-timeout-hold", type=float, default=2.0)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--retry-delay", type=int, default=1, help="重試基礎延遲秒數")
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="將報告寫入 JSON 檔案")
+    return parser.parse_args(argv)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近排名法的百分位數"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return round(ordered[index], 2)
+
+
+class QueryCounter:
+    """計算 SQL 查詢數，並分別統計觸發事件執行緒上的查詢"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.total = 0
+        self.accept_path = 0
+        self._accept_thread = threading.get_ident()
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.total += 1
+            if threading.get_ident() == self._accept_thread:
+                self.accept_path += 1
+
+
+def create_fixtures(db, run_id, args, sink_url) -> List[Dict]:
+    """建立壓測用的租戶與 webhook"""
+    from src.models.tenant import Tenant
+    from src.models.webhook import Webhook
+
+    targets = []
+    for index in range(args.tenants):
+        tenant = Tenant(
+            name=f"Benchmark {index}",
+            slug=f"bench-{run_id}-{index}",
+            plan=PLANS[index % len(PLANS)],
+        )
+        db.session.add(tenant)
+        db.session.flush()
+
+        for hook_index in range(args.webhooks_per_tenant):
+            db.session.add(
+                Webhook(
+                    tenant_id=tenant.id,
+                    name=f"bench-{run_id}-{index}-{hook_index}",
+                    url=sink_url,
+                    events=["user.login"],
+                    max_retries=args.max_retries,
+                    retry_delay=args.retry_delay,
+                )
+            )
+        targets.append({"tenant_id": tenant.id})
+
+    db.session.commit()
+    return targets
+
+
+def generate_load(webhook_service, targets, rate, duration) -> Dict:
+    """以固定速率觸發事件，回傳每個事件的觸發時間與接收耗時"""
+    triggered_at = {}
+    accept_ms = []
+    total = int(rate * duration)
+    started = time.monotonic()
+
+    for index in range(total):
+        delay = started + index / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        target = targets[index % len(targets)]
+        wall_time = time.time()
+        call_started = time.monotonic()
+        event = webhook_service.trigger_event(
+            event_type="user.login",
+            event_data={"user_id": index, "benchmark": True},
+            tenant_id=target["tenant_id"],
+            source="benchmark",
+        )
+        accept_ms.append((time.monotonic() - call_started) * 1000)
+        triggered_at[event.id] = wall_time
+
+    return {
+        "triggered_at": triggered_at,
+        "accept_ms": accept_ms,
+        "elapsed": time.monotonic() - started,
+    }
+
+
+def wait_for_completion(WebhookDelivery, webhook_ids, timeout) -> bool:
+    """等待所有傳送進入成功或失敗狀態"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        remaining = WebhookDelivery.query.filter(
+            WebhookDelivery.webhook_id.in_(webhook_ids),
+            WebhookDelivery.status.in_(["pending", "retrying"]),
+        ).count()
+        if remaining == 0:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def end_to_end_latencies(sink_requests, triggered_at) -> List[float]:
+    """以接收端成功收到的時間計算每筆事件的端到端延遲 (毫秒)"""
+    latencies = []
+    for request in sink_requests:
+        if request.status != 200:
+            continue
+        body = json.loads(request.body)
+        for item in body if isinstance(body, list) else [body]:
+            event_time = triggered_at.get(item["event"]["id"])
+            if event_time is not None:
+                latencies.append((request.received_at - event_time) * 1000)
+    return latencies
+
+
+def build_report(args, load, completed, sink_requests, queries, deliveries) -> Dict:
+    """彙整壓測結果"""
+    events = len(load["triggered_at"])
+    latencies = end_to_end_latencies(sink_requests, load["triggered_at"])
+    statuses = [status for status, _ in deliveries]
+    attempts = sum(attempt_count for _, attempt_count in deliveries)
+
+    return {
+        "config": {
+            "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+            "tenants": args.tenants,
+            "webhooks_per_tenant": args.webhooks_per_tenant,
+            "target_rate": args.rate,
+            "duration": args.duration,
+            "workers": args.workers,
+            "sink_latency_ms": args.sink_latency_ms,
+            "sink_error_rate": args.sink_error_rate,
+            "sink_timeout_rate": args.sink_timeout_rate,
+        },
+        "events": events,
+        "events_per_second_accepted": round(events / load["elapsed"], 2),
+        "accept_latency_ms": {
+            "p50": percentile(load["accept_ms"], 50),
+            "p99": percentile(load["accept_ms"], 99),
+        },
+        "deliveries": len(deliveries),
+        "deliveries_succeeded": statuses.count("success"),
+        "deliveries_failed": statuses.count("failed"),
+        "deliveries_per_second_completed": round(len(deliveries) / completed, 2),
+        "end_to_end_latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+        },
+        "db_queries_per_event": {
+            "accept_path": round(queries.accept_path / events, 2) if events else 0,
+            "total": round(queries.total / events, 2) if events else 0,
+        },
+        "retry_amplification": (
+            round(attempts / len(deliveries), 3) if deliveries else 0
+        ),
+        "sink_requests": len(sink_requests),
+    }
+
+
+def run(args) -> Dict:
+    """執行壓測並回傳報告"""
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(prefix="webhook-bench-"), "bench.db"
+    )
+    # 須在載入應用程式前設定
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["WEBHOOK_DELIVERY_WORKERS"] = str(args.workers)
+
+    from src.database import db
+    from src.main import app
+    from src.models.webhook import Webhook, WebhookDelivery
+    from src.services.webhook_service import webhook_service
+
+    sink = WebhookSink(
+        latency_ms=args.sink_latency_ms,
+        latency_jitter_ms=args.sink_jitter_ms,
+        error_rate=args.sink_error_rate,
+        timeout_rate=args.sink_timeout_rate,
+        timeout_hold_seconds=args.sink_timeout_hold,
+        seed=args.seed,
+    )
+    sink_url = sink.start()
+    run_id = uuid.uuid4().hex[:8]
+
+    try:
+        with app.app_context():
+            db.create_all()
+            targets = create_fixtures(db, run_id, args, sink_url)
+            webhook_ids = [
+                webhook_id
+                for (webhook_id,) in Webhook.query.with_entities(Webhook.id).filter(
+                    Webhook.name.like(f"bench-{run_id}-%")
+                )
+            ]
+
+            queries = QueryCounter(db.engine)
+            started = time.monotonic()
+            load = generate_load(webhook_service, targets, args.rate, args.duration)
+
+            if not wait_for_completion(
+                WebhookDelivery, webhook_ids, args.drain_timeout
+            ):
+                print("⚠️ 部分傳送在時限內未完成，結果僅供參考")
+            completed = time.monotonic() - started
+
+            deliveries = (
+                WebhookDelivery.query.with_entities(
+                    WebhookDelivery.status, WebhookDelivery.attempt_count
+                )
+                .filter(WebhookDelivery.webhook_id.in_(webhook_ids))
+                .all()
+            )
+            return build_report(
+                args, load, completed, sink.requests(), queries, deliveries
+            )
+    finally:
+        sink.stop()
+
+
+def main(argv: Optional[List[str]] = None):
+    """主函數"""
+    args = parse_args(argv)
+    report = run(args)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"報告已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
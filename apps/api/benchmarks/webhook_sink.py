@@ -0,0 +1,149 @@
+"""
+本地 webhook 接收端 (asyncio)
+
+模擬 webhook 目標伺服器，可設定回應延遲、錯誤率與逾時率，
+並記錄每筆收到的請求供壓測報告計算端到端延遲。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+
+class SinkRequest(NamedTuple):
+    """接收端收到的一筆請求"""
+
+    received_at: float
+    status: Optional[int]  # None 表示模擬逾時，未回應即斷線
+    headers: Dict[str, str]
+    body: bytes
+
+
+class WebhookSink:
+    """
+    在背景執行緒中執行的 asyncio HTTP 接收端
+
+    - latency_ms / latency_jitter_ms: 回應前的延遲
+    - error_rate: 回應 500 的比例
+    - timeout_rate: 持有連線 timeout_hold_seconds 後不回應直接斷線的比例
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0,
+        latency_jitter_ms: float = 0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_hold_seconds: float = 5.0,
+        seed: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_hold_seconds = timeout_hold_seconds
+
+        self._random = random.Random(seed)
+        self._requests: List[SinkRequest] = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/webhook"
+
+    def start(self) -> str:
+        """啟動接收端並回傳 URL"""
+        self._thread = threading.Thread(
+            target=self._run, name="webhook-sink", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait(timeout=5)
+        return self.url
+
+    def stop(self):
+        """停止接收端"""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+
+    def requests(self) -> List[SinkRequest]:
+        """取得目前收到的所有請求"""
+        with self._lock:
+            return list(self._requests)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+    def _pick_outcome(self) -> Optional[int]:
+        roll = self._random.random()
+        if roll < self.timeout_rate:
+            return None
+        if roll < self.timeout_rate + self.error_rate:
+            return 500
+        return 200
+
+    async def _handle(self, reader, writer):
+        try:
+            await reader.readline()  # 請求行
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", 0))
+            body = await reader.readexactly(length) if length else b""
+            received_at = time.time()
+
+            status = self._pick_outcome()
+            with self._lock:
+                self._requests.append(SinkRequest(received_at, status, headers, body))
+
+            if status is None:
+                await asyncio.sleep(self.timeout_hold_seconds)
+                return
+
+            delay_ms = self.latency_ms
+            if self.latency_jitter_ms:
+                delay_ms += self._random.uniform(0, self.latency_jitter_ms)
+            if delay_ms:
+                await asyncio.sleep(delay_ms / 1000)
+
+            reason = "OK" if status == 200 else "Internal Server Error"
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\n"
+                "Content-Type: text/plain\r\n"
+                "Content-Length: 2\r\n"
+                "Connection: close\r\n\r\nok".encode("latin-1")
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+租戶分片搬移腳本
+將租戶的資料線上搬移到 TENANT_SHARDS 中設定的分片 (或 default 共用資料庫)
+
+用法:
+    python scripts/move_tenant_shard.py <tenant_id> <shard>
+    python scripts/move_tenant_shard.py <tenant_id> --abort
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+# 添加項目根目錄到 Python 路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def create_app():
+    """
+    只設定資料庫的 Flask 應用
+
+    不匯入 src.main，避免啟動排程器、背景工作者與資料庫遷移；
+    資料庫設定與 src.main 相同 (相對的 SQLite 路徑同樣位於 instance 目錄)
+    """
+    from flask import Flask
+
+    import src.models.tenant  # noqa: F401 (註冊路由表的模型)
+    import src.models.webhook  # noqa: F401
+    from src.database import db
+
+    app = Flask(
+        __name__,
+        instance_path=os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "..", "instance")
+        ),
+    )
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+        "DATABASE_URL", "sqlite:///app.db"
+    )
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="將租戶搬移到其他分片")
+    parser.add_argument("tenant_id", type=int, help="租戶 id")
+    parser.add_argument("shard", nargs="?", help="目標分片名稱")
+    parser.add_argument("--abort", action="store_true", help="放棄進行中的搬移")
+    parser.add_argument("--batch-size", type=int, help="每批複製的資料列數")
+    args = parser.parse_args()
+
+    if not args.abort and not args.shard:
+        parser.error("需要目標分片名稱或 --abort")
+
+    logging.basicConfig(level=logging.INFO)
+
+    app = create_app()
+    from src.services.shard_mover import TenantShardMover, tenant_shard_mover
+
+    mover = tenant_shard_mover
+    if args.batch_size:
+        mover = TenantShardMover(batch_size=args.batch_size)
+
+    with app.app_context():
+        try:
+            if args.abort:
+                aborted = mover.abort(args.tenant_id)
+                print("已放棄搬移" if aborted else "租戶沒有進行中的搬移")
+                return
+            result = mover.move(args.tenant_id, args.shard)
+        except Exception as e:
+            print(f"搬移失敗: {str(e)}")
+            sys.exit(1)
+
+    print(
+        f"租戶 {args.tenant_id} 已搬移到 {args.shard}: "
+        f"複製 {result['copied']} 筆，刪除 {result['deleted']} 筆"
+    )
+
+
+if __name__ == "__main__":
+    main()
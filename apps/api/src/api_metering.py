@@ -0,0 +1,91 @@
+"""
+API 用量計量中介層 - 依租戶累計請求數並執行方案的每日請求配額
+"""
+
+from datetime import datetime, timedelta
+
+import jwt
+from flask import current_app, g, jsonify, request
+
+from src.database import db
+from src.models.user import User
+from src.services.api_usage import api_usage_meter
+from src.services.tenant_resolver import tenant_resolver
+from src.tenant_resolution import EXEMPT_ENDPOINTS
+
+
+def _token_tenant_id():
+    """
+    取得 Bearer token 使用者目前所屬的租戶
+
+    token 只用來識別使用者 (驗證簽章)，租戶以使用者資料列為準：使用者換租戶後
+    仍有效的舊 token 不會計入原租戶。資料列以主鍵載入並留在 session 中，
+    路由再次以主鍵取得使用者時不需重新查詢。
+    """
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.lower().startswith("bearer "):
+        return None
+    try:
+        payload = jwt.decode(
+            auth_header[7:],
+            current_app.config["JWT_SECRET_KEY"],
+            algorithms=["HS256"],
+        )
+    except jwt.PyJWTError:
+        return None
+
+    try:
+        user = db.session.get(User, int(payload.get("sub")))
+    except (TypeError, ValueError):
+        return None
+    return user.tenant_id if user is not None else None
+
+
+def init_api_metering(app):
+    """註冊 API 用量計量中介層 (須在租戶解析中介層之後註冊)"""
+
+    @app.before_request
+    def enforce_api_quota():
+        g.metered_tenant = None
+        if request.endpoint is None or request.endpoint in EXEMPT_ENDPOINTS:
+            return
+
+        tenant = g.get("tenant") or tenant_resolver.resolve_id(_token_tenant_id())
+        if tenant is None:
+            return
+        g.metered_tenant = tenant
+
+        quota = api_usage_meter.check_quota(tenant.id, tenant.plan)
+        g.api_quota = quota
+        if not quota["allowed"]:
+            now = datetime.utcnow()
+            resets_at = now.replace(
+                hour=0, minute=0, second=0, microsecond=0
+            ) + timedelta(days=1)
+            response = jsonify(
+                {
+                    "message": "已超過方案的每日 API 請求配額",
+                    "limit": quota["limit"],
+                    "resets_at": resets_at.isoformat(),
+                }
+            )
+            response.status_code = 429
+            response.headers["Retry-After"] = str(
+                int((resets_at - now).total_seconds()) + 1
+            )
+            return response
+
+    @app.after_request
+    def record_api_usage(response):
+        tenant = g.get("metered_tenant")
+        if tenant is None:
+            return response
+
+        api_usage_meter.record(
+            tenant.id, request.blueprint or "app", response.status_code
+        )
+        quota = g.get("api_quota")
+        if quota and quota["limit"] is not None:
+            response.headers["X-Quota-Limit"] = str(quota["limit"])
+            response.headers["X-Quota-Remaining"] = str(quota["remaining"])
+        return response
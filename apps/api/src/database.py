@@ -1,11 +1,251 @@
+import contextvars
+import json
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import create_engine
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, select
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.util import find_tables
+
+# 共用資料庫的分片名稱
+DEFAULT_SHARD = "default"
+
+# 依租戶路由到分片的資料表
+# 只收錄查詢一律帶租戶條件、寫入後不再更新的表；與共用表 JOIN 的查詢不可路由
+#
+# 分片範圍刻意只涵蓋 webhook_events (租戶資料量最大、只追加的表)。
+# webhook_deliveries、webhook_batch_items、webhook_payloads 與 audit_logs 不路由：
+# 它們的查詢會與 webhooks、users JOIN，重試、批次重建、清理與死信重送也都是跨租戶查詢，
+# 需改為逐分片執行後才能一併搬移，仍留在共用資料庫。
+# 因此分片租戶的事件與其傳送記錄分屬兩個資料庫、無法在同一個交易中提交：
+# trigger_event 先提交事件 (processed_at 為空)，再於共用資料庫提交傳送記錄、批次暫存項目
+# 與扇出標記 (webhook_event_fanouts)，最後標記事件已處理；未完成的事件由
+# WebhookService.complete_unprocessed_events 依扇出標記定期補齊。
+TENANT_ROUTED_TABLES = {"webhook_events"}
+
+# 目前執行環境 (請求、背景工作) 所在的分片，None 表示共用資料庫
+_current_shard: contextvars.ContextVar = contextvars.ContextVar(
+    "current_shard", default=None
+)
+
+
+class TenantFrozenError(Exception):
+    """租戶正在搬移分片，暫停寫入"""
+
+
+class ShardRouter:
+    """
+    租戶分片路由
+
+    - shards: 分片名稱 -> 資料庫 URL，或 {"url": ..., "schema": ...}
+      (省略 url 時為共用資料庫中的獨立 schema)
+    - cache_ttl: 租戶分片對應的快取秒數；搬移工具在切換前後各等待一個週期
+    - freeze_timeout: 寫入遇到搬移中的租戶時最多等待的秒數
+
+    未設定任何分片時所有查詢直接使用共用資料庫，不查詢路由表。
+    """
+
+    def __init__(
+        self,
+        shards: Optional[Dict] = None,
+        cache_ttl: float = 5.0,
+        freeze_timeout: float = 10.0,
+    ):
+        self.cache_ttl = cache_ttl
+        self.freeze_timeout = freeze_timeout
+        self._lock = threading.Lock()
+        self._engines = {}
+        # tenant_id -> (到期時間, 分片, 狀態)
+        self._assignments: Dict[int, tuple] = {}
+        self.configure(shards or {})
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.shards)
+
+    def configure(self, shards: Dict):
+        """設定分片並清空已建立的連線與快取"""
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines = {}
+            self._assignments.clear()
+            self.shards = {
+                name: spec if isinstance(spec, dict) else {"url": spec}
+                for name, spec in shards.items()
+            }
+
+    def get_engine(self, shard: str):
+        """取得分片的引擎 (第一次使用時建立)"""
+        if shard == DEFAULT_SHARD:
+            return db.engine
+        engine = self._engines.get(shard)
+        if engine is not None:
+            return engine
+
+        spec = self.shards.get(shard)
+        if spec is None:
+            raise KeyError(f"Unknown shard: {shard}")
+        with self._lock:
+            engine = self._engines.get(shard)
+            if engine is None:
+                engine = create_engine(spec["url"]) if spec.get("url") else db.engine
+                if spec.get("schema"):
+                    engine = engine.execution_options(
+                        schema_translate_map={None: spec["schema"]}
+                    )
+                self._engines[shard] = engine
+        return engine
+
+    def get_schema(self, shard: str) -> Optional[str]:
+        """分片所在的 schema (None 表示預設 schema)"""
+        return self.shards.get(shard, {}).get("schema")
+
+    def shard_for_tenant(self, tenant_id: int, write: bool = False) -> str:
+        """
+        取得租戶所在的分片
+
+        寫入時若租戶正在切換分片 (frozen) 則等待切換完成，
+        超過 freeze_timeout 仍未完成時拋出 TenantFrozenError。
+        """
+        shard, status = self._assignment(tenant_id)
+        if not write or status != "frozen":
+            return shard
+
+        deadline = time.monotonic() + self.freeze_timeout
+        while status == "frozen":
+            if time.monotonic() >= deadline:
+                raise TenantFrozenError(f"Tenant {tenant_id} is moving between shards")
+            time.sleep(0.05)
+            self.invalidate(tenant_id)
+            shard, status = self._assignment(tenant_id)
+        return shard
+
+    def group_by_shard(self, tenant_ids: List[int]) -> Dict[str, List[int]]:
+        """依所在分片分組租戶 (一次查詢路由表，不經過快取)"""
+        if not self.enabled:
+            return {DEFAULT_SHARD: list(tenant_ids)}
+
+        from src.models.tenant import TenantShard
+
+        table = TenantShard.__table__
+        assigned = dict(
+            db.session.execute(
+                select(table.c.tenant_id, table.c.shard).where(
+                    table.c.tenant_id.in_(tenant_ids)
+                )
+            ).all()
+        )
+        groups: Dict[str, List[int]] = {}
+        for tenant_id in tenant_ids:
+            groups.setdefault(assigned.get(tenant_id, DEFAULT_SHARD), []).append(
+                tenant_id
+            )
+        return groups
+
+    def invalidate(self, tenant_id: Optional[int] = None):
+        """移除租戶 (未指定時為全部) 的分片快取"""
+        with self._lock:
+            if tenant_id is None:
+                self._assignments.clear()
+            else:
+                self._assignments.pop(tenant_id, None)
+
+    def _assignment(self, tenant_id: int):
+        now = time.monotonic()
+        entry = self._assignments.get(tenant_id)
+        if entry is not None and entry[0] > now:
+            return entry[1], entry[2]
+
+        from src.models.tenant import TenantShard
+
+        table = TenantShard.__table__
+        row = db.session.execute(
+            select(table.c.shard, table.c.status).where(table.c.tenant_id == tenant_id)
+        ).first()
+        shard, status = (row[0], row[1]) if row else (DEFAULT_SHARD, "active")
+        if shard != DEFAULT_SHARD and shard not in self.shards:
+            raise KeyError(f"Tenant {tenant_id} is assigned to unknown shard {shard}")
+
+        with self._lock:
+            self._assignments[tenant_id] = (now + self.cache_ttl, shard, status)
+        return shard, status
+
+
+def _load_shards() -> Dict:
+    value = os.environ.get("TENANT_SHARDS")
+    return json.loads(value) if value else {}
+
+
+shard_router = ShardRouter(
+    shards=_load_shards(),
+    cache_ttl=float(os.environ.get("TENANT_SHARD_CACHE_SECONDS", 5)),
+    freeze_timeout=float(os.environ.get("TENANT_SHARD_FREEZE_TIMEOUT_SECONDS", 10)),
+)
+
+
+@contextmanager
+def tenant_context(tenant_id: Optional[int], write: bool = False):
+    """在區塊內將路由表的查詢導向租戶所在的分片"""
+    shard = None
+    if tenant_id is not None and shard_router.enabled:
+        shard = shard_router.shard_for_tenant(tenant_id, write=write)
+    token = _current_shard.set(shard)
+    try:
+        yield shard
+    finally:
+        _current_shard.reset(token)
+
+
+@contextmanager
+def shard_context(shard: Optional[str]):
+    """在區塊內將路由表的查詢導向指定分片 (跨租戶的維護工作使用)"""
+    token = _current_shard.set(shard)
+    try:
+        yield shard
+    finally:
+        _current_shard.reset(token)
+
+
+def _routed(mapper, clause) -> bool:
+    if mapper is not None:
+        return mapper.local_table.name in TENANT_ROUTED_TABLES
+    if clause is not None:
+        return any(
+            getattr(table, "name", None) in TENANT_ROUTED_TABLES
+            for table in find_tables(clause, include_crud=True)
+        )
+    return False
+
+
+class TenantRoutingSession(Session):
+    """依目前分片將路由表的查詢與寫入導向分片引擎的 session"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            shard = _current_shard.get()
+            if shard is not None and shard != DEFAULT_SHARD and _routed(mapper, clause):
+                return shard_router.get_engine(shard)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(TenantRoutingSession, "do_orm_execute")
+def _tag_shard_identity(orm_execute_state):
+    """分片中載入的物件以分片名稱區分識別，不與共用資料庫中相同主鍵的物件混用"""
+    shard = _current_shard.get()
+    if shard is None or shard == DEFAULT_SHARD or not orm_execute_state.is_select:
+        return
+    if _routed(orm_execute_state.bind_mapper, orm_execute_state.statement):
+        orm_execute_state.update_execution_options(identity_token=shard)
+
 
 # 初始化 SQLAlchemy
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": TenantRoutingSession})
 
 # 設置資料庫連接
 DATABASE_URL = os.environ.get(
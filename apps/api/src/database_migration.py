@@ -5,7 +5,7 @@
 
 import logging
 
-from sqlalchemy import inspect, text
+from sqlalchemy import Text, cast, func, inspect, select, text
 
 from src.database import db
 
@@ -44,6 +44,27 @@ def add_column_if_not_exists(table_name, column_name, column_definition):
         raise
 
 
+def create_index_if_not_exists(table_name, index_name, columns):
+    """如果索引不存在，則建立索引"""
+    try:
+        inspector = inspect(db.engine)
+        if any(
+            index["name"] == index_name for index in inspector.get_indexes(table_name)
+        ):
+            logger.info(f"Index {index_name} already exists on table {table_name}")
+            return False
+
+        sql = f"CREATE INDEX {index_name} ON {table_name} ({', '.join(columns)})"
+        with db.engine.connect() as connection:
+            connection.execute(text(sql))
+            connection.commit()
+        logger.info(f"Created index {index_name} on table {table_name}")
+        return True
+    except Exception as e:
+        logger.error(f"Error creating index {index_name} on table {table_name}: {e}")
+        raise
+
+
 def migrate_user_table():
     """遷移 user 表格，添加 2FA 相關欄位"""
     logger.info("Starting user table migration...")
@@ -68,6 +89,359 @@ def migrate_user_table():
     return migrations_applied
 
 
+def migrate_tenant_table():
+    """遷移 tenants 表格，添加成員數量欄位並回填，建立列表與邀請索引、API 用量表與分片路由表"""
+    logger.info("Starting tenant table migration...")
+
+    migrations_applied = []
+
+    if not inspect(db.engine).has_table("tenants"):
+        return migrations_applied
+
+    if add_column_if_not_exists(
+        "tenants", "member_count", "INTEGER DEFAULT 0 NOT NULL"
+    ):
+        from src.models.tenant import Tenant
+
+        Tenant.refresh_member_counts()
+        db.session.commit()
+        migrations_applied.append("tenants.member_count")
+
+    # 租戶列表的篩選與鍵集分頁索引
+    tenant_indexes = [
+        ("ix_tenants_name_id", ["name", "id"]),
+        ("ix_tenants_member_count_id", ["member_count", "id"]),
+        ("ix_tenants_plan_id", ["plan", "id"]),
+        ("ix_tenants_trial_ends_at", ["trial_ends_at"]),
+    ]
+    for index_name, columns in tenant_indexes:
+        if create_index_if_not_exists("tenants", index_name, columns):
+            migrations_applied.append(index_name)
+
+    # 邀請的重複檢查與過期掃描索引
+    invitation_indexes = [
+        ("ix_tenant_invitations_tenant_email", ["tenant_id", "email"]),
+        (
+            "ix_tenant_invitations_pending_expiry",
+            ["is_accepted", "is_expired", "expires_at"],
+        ),
+        (
+            "ix_tenant_invitations_email_unsent",
+            ["email_sent_at", "email_queued_at"],
+        ),
+    ]
+    if inspect(db.engine).has_table("tenant_invitations"):
+        timestamp_type = (
+            "TIMESTAMP WITH TIME ZONE"
+            if db.engine.dialect.name == "postgresql"
+            else "DATETIME"
+        )
+        if add_column_if_not_exists(
+            "tenant_invitations", "email_queued_at", timestamp_type
+        ):
+            migrations_applied.append("tenant_invitations.email_queued_at")
+        if add_column_if_not_exists(
+            "tenant_invitations", "email_sent_at", timestamp_type
+        ):
+            from src.models.tenant import TenantInvitation
+
+            # 既有的邀請視為已寄出，避免補寄掃描重寄
+            invitations = TenantInvitation.__table__
+            db.session.execute(
+                invitations.update().values(
+                    email_sent_at=func.coalesce(
+                        invitations.c.created_at, func.current_timestamp()
+                    )
+                )
+            )
+            db.session.commit()
+            migrations_applied.append("tenant_invitations.email_sent_at")
+        if add_column_if_not_exists(
+            "tenant_invitations", "email_failed_at", timestamp_type
+        ):
+            migrations_applied.append("tenant_invitations.email_failed_at")
+        for index_name, columns in invitation_indexes:
+            if create_index_if_not_exists("tenant_invitations", index_name, columns):
+                migrations_applied.append(index_name)
+
+    if not inspect(db.engine).has_table("tenant_api_usage"):
+        from src.models.tenant import TenantApiUsage
+
+        TenantApiUsage.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("tenant_api_usage")
+
+    if not inspect(db.engine).has_table("tenant_shards"):
+        from src.models.tenant import TenantShard
+
+        TenantShard.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("tenant_shards")
+
+    if not inspect(db.engine).has_table("tenant_cache_version"):
+        from src.models.tenant import TenantCacheVersion
+
+        TenantCacheVersion.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("tenant_cache_version")
+
+    logger.info(
+        f"Tenant table migration completed. Added columns: {migrations_applied}"
+    )
+    return migrations_applied
+
+
+def migrate_member_directory():
+    """建立租戶成員目錄的篩選與分頁索引，PostgreSQL 另建搜尋用的表達式索引"""
+    logger.info("Starting member directory migration...")
+
+    migrations_applied = []
+
+    if not inspect(db.engine).has_table("users"):
+        return migrations_applied
+
+    member_indexes = [
+        ("ix_users_tenant_id_id", ["tenant_id", "id"]),
+        ("ix_users_tenant_username", ["tenant_id", "username"]),
+        ("ix_users_tenant_email", ["tenant_id", "email"]),
+        ("ix_users_tenant_role_id", ["tenant_id", "tenant_role", "id"]),
+    ]
+    for index_name, columns in member_indexes:
+        if create_index_if_not_exists("users", index_name, columns):
+            migrations_applied.append(index_name)
+
+    if db.engine.dialect.name == "postgresql":
+        # 前綴搜尋 lower(col) LIKE 'q%' 與包含搜尋 LIKE '%q%' (pg_trgm)
+        statements = [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX IF NOT EXISTS ix_users_tenant_username_prefix "
+            "ON users (tenant_id, lower(username) text_pattern_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_users_tenant_email_prefix "
+            "ON users (tenant_id, lower(email) text_pattern_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_users_username_trgm "
+            "ON users USING gin (lower(username) gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_users_email_trgm "
+            "ON users USING gin (lower(email) gin_trgm_ops)",
+        ]
+        with db.engine.connect() as connection:
+            for sql in statements:
+                connection.execute(text(sql))
+            connection.commit()
+        migrations_applied.append("users search indexes")
+
+    logger.info(f"Member directory migration completed: {migrations_applied}")
+    return migrations_applied
+
+
+def migrate_webhook_tables():
+    """遷移 webhook 相關表格，添加批次傳送欄位"""
+    logger.info("Starting webhook tables migration...")
+
+    migrations_applied = []
+    binary_type = "BYTEA" if db.engine.dialect.name == "postgresql" else "BLOB"
+    timestamp_type = (
+        "TIMESTAMP WITH TIME ZONE"
+        if db.engine.dialect.name == "postgresql"
+        else "DATETIME"
+    )
+
+    # 正規化的 payload 表須先於 webhook_deliveries.payload_hash 建立
+    if inspect(db.engine).has_table("webhooks") and not inspect(db.engine).has_table(
+        "webhook_payloads"
+    ):
+        from src.models.webhook import WebhookPayload
+
+        WebhookPayload.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("webhook_payloads")
+
+    # 死信重送工作表
+    if inspect(db.engine).has_table("webhooks") and not inspect(db.engine).has_table(
+        "webhook_redrive_jobs"
+    ):
+        from src.models.webhook import WebhookRedriveJob
+
+        WebhookRedriveJob.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("webhook_redrive_jobs")
+
+    # 事件重播工作表
+    if inspect(db.engine).has_table("webhooks") and not inspect(db.engine).has_table(
+        "webhook_replay_jobs"
+    ):
+        from src.models.webhook import WebhookReplayJob
+
+        WebhookReplayJob.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("webhook_replay_jobs")
+
+    webhook_columns = [
+        ("webhooks", "batch_enabled", "BOOLEAN DEFAULT FALSE NOT NULL"),
+        ("webhooks", "batch_max_events", "INTEGER DEFAULT 100 NOT NULL"),
+        ("webhooks", "batch_max_bytes", "INTEGER DEFAULT 262144 NOT NULL"),
+        ("webhooks", "batch_max_wait_ms", "INTEGER DEFAULT 1000 NOT NULL"),
+        ("webhook_deliveries", "event_count", "INTEGER DEFAULT 1 NOT NULL"),
+        ("webhook_deliveries", "duration_ms", "INTEGER"),
+        ("webhook_deliveries", "payload_hash", "VARCHAR(64)"),
+        ("webhook_deliveries", "response_data", binary_type),
+        ("webhook_deliveries", "request_data", binary_type),
+        ("webhook_deliveries", "error_class", "VARCHAR(20)"),
+        ("webhook_deliveries", "is_replay", "BOOLEAN DEFAULT FALSE NOT NULL"),
+        ("webhook_deliveries", "claimed_at", timestamp_type),
+        ("webhook_redrive_jobs", "heartbeat_at", timestamp_type),
+        ("webhook_replay_jobs", "heartbeat_at", timestamp_type),
+    ]
+
+    for table_name, column_name, column_definition in webhook_columns:
+        if not inspect(db.engine).has_table(table_name):
+            continue
+        if add_column_if_not_exists(table_name, column_name, column_definition):
+            migrations_applied.append(f"{table_name}.{column_name}")
+
+    webhook_indexes = [
+        (
+            "webhook_deliveries",
+            "ix_webhook_deliveries_webhook_created",
+            ["webhook_id", "created_at"],
+        ),
+        (
+            "webhook_deliveries",
+            "ix_webhook_deliveries_status_next_retry",
+            ["status", "next_retry_at"],
+        ),
+        (
+            "webhook_deliveries",
+            "ix_webhook_deliveries_payload_hash",
+            ["payload_hash"],
+        ),
+        (
+            "webhook_deliveries",
+            "ix_webhook_deliveries_status_failed",
+            ["status", "failed_at"],
+        ),
+        (
+            "webhook_deliveries",
+            "ix_webhook_deliveries_status_claimed",
+            ["status", "claimed_at"],
+        ),
+        ("webhook_events", "ix_webhook_events_tenant_id_id", ["tenant_id", "id"]),
+        ("webhook_redrive_jobs", "ix_webhook_redrive_jobs_status", ["status"]),
+        (
+            "webhook_replay_jobs",
+            "ix_webhook_replay_jobs_webhook_status",
+            ["webhook_id", "status"],
+        ),
+    ]
+
+    for table_name, index_name, columns in webhook_indexes:
+        if not inspect(db.engine).has_table(table_name):
+            continue
+        if create_index_if_not_exists(table_name, index_name, columns):
+            migrations_applied.append(index_name)
+
+    if inspect(db.engine).has_table("webhooks") and not inspect(db.engine).has_table(
+        "webhook_batch_items"
+    ):
+        from src.models.webhook import WebhookBatchItem
+
+        WebhookBatchItem.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("webhook_batch_items")
+
+    if inspect(db.engine).has_table("webhooks") and not inspect(db.engine).has_table(
+        "webhook_event_fanouts"
+    ):
+        from src.models.webhook import WebhookEventFanout
+
+        WebhookEventFanout.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("webhook_event_fanouts")
+
+    logger.info(
+        f"Webhook tables migration completed. Added columns: {migrations_applied}"
+    )
+    return migrations_applied
+
+
+def migrate_storage_usage():
+    """遷移儲存空間計量欄位與用量表，新增欄位時回填大小並重新計算用量"""
+    logger.info("Starting storage usage migration...")
+
+    migrations_applied = []
+    inspector = inspect(db.engine)
+    if not all(
+        inspector.has_table(table_name)
+        for table_name in ["tenants", "webhook_events", "webhook_deliveries"]
+    ):
+        return migrations_applied
+
+    from src.models.tenant import TenantStorageUsage
+    from src.models.webhook import WebhookDelivery, WebhookEvent, WebhookPayload
+
+    if not inspector.has_table("tenant_storage_usage"):
+        TenantStorageUsage.__table__.create(db.engine, checkfirst=True)
+        migrations_applied.append("tenant_storage_usage")
+    elif add_column_if_not_exists(
+        "tenant_storage_usage",
+        "reconciled_at",
+        (
+            "TIMESTAMP WITH TIME ZONE"
+            if db.engine.dialect.name == "postgresql"
+            else "DATETIME"
+        ),
+    ):
+        migrations_applied.append("tenant_storage_usage.reconciled_at")
+
+    if add_column_if_not_exists(
+        "tenants", "storage_bytes", "BIGINT DEFAULT 0 NOT NULL"
+    ):
+        migrations_applied.append("tenants.storage_bytes")
+
+    if add_column_if_not_exists(
+        "webhook_events", "size_bytes", "INTEGER DEFAULT 0 NOT NULL"
+    ):
+        events = WebhookEvent.__table__
+        db.session.execute(
+            events.update().values(
+                size_bytes=func.length(cast(events.c.event_data, Text))
+            )
+        )
+        migrations_applied.append("webhook_events.size_bytes")
+
+    if add_column_if_not_exists(
+        "webhook_deliveries", "size_bytes", "INTEGER DEFAULT 0 NOT NULL"
+    ):
+        deliveries = WebhookDelivery.__table__
+        payloads = WebhookPayload.__table__
+        # 共用的 payload 只計入引用它的第一筆傳送記錄
+        first_reference = deliveries.alias("first_reference")
+        payload_size = (
+            select(payloads.c.size_bytes)
+            .where(
+                payloads.c.hash == deliveries.c.payload_hash,
+                deliveries.c.id
+                == select(func.min(first_reference.c.id))
+                .where(first_reference.c.payload_hash == payloads.c.hash)
+                .scalar_subquery(),
+            )
+            .scalar_subquery()
+        )
+        db.session.execute(
+            deliveries.update().values(
+                size_bytes=func.coalesce(
+                    payload_size,
+                    func.length(deliveries.c.payload),
+                    0,
+                )
+                + func.coalesce(func.length(deliveries.c.request_data), 0)
+                + func.coalesce(func.length(deliveries.c.response_data), 0)
+            )
+        )
+        migrations_applied.append("webhook_deliveries.size_bytes")
+
+    if migrations_applied:
+        db.session.commit()
+        # 由來源表計算既有租戶的用量
+        from src.services.storage_meter import storage_meter
+
+        storage_meter.reconcile()
+
+    logger.info(f"Storage usage migration completed: {migrations_applied}")
+    return migrations_applied
+
+
 def run_all_migrations():
     """執行所有資料庫遷移"""
     logger = logging.getLogger(__name__)
@@ -88,6 +462,26 @@ def run_all_migrations():
         results.append(migration_result)
         logger.info(f"✅ Two-factor migration result: {migration_result}")
 
+        logger.info("Starting tenant table migration...")
+        tenant_result = migrate_tenant_table()
+        results.append(tenant_result)
+        logger.info(f"✅ Tenant migration result: {tenant_result}")
+
+        logger.info("Starting member directory migration...")
+        member_result = migrate_member_directory()
+        results.append(member_result)
+        logger.info(f"✅ Member directory migration result: {member_result}")
+
+        logger.info("Starting webhook tables migration...")
+        webhook_result = migrate_webhook_tables()
+        results.append(webhook_result)
+        logger.info(f"✅ Webhook migration result: {webhook_result}")
+
+        logger.info("Starting storage usage migration...")
+        storage_result = migrate_storage_usage()
+        results.append(storage_result)
+        logger.info(f"✅ Storage usage migration result: {storage_result}")
+
         # 提交所有變更
         db.session.commit()
         logger.info("✅ All migrations completed successfully")
@@ -8,6 +8,7 @@ from flask import current_app, jsonify, request
 
 from src.models.jwt_blacklist import JWTBlacklist
 from src.models.user import User
+from src.request_timing import phase
 
 
 def require_role(required_role):
@@ -42,13 +43,18 @@ def require_role(required_role):
 
             try:
                 # 解碼 JWT
-                payload = jwt.decode(
-                    token, current_app.config["JWT_SECRET_KEY"], algorithms=["HS256"]
-                )
+                with phase("auth"):
+                    payload = jwt.decode(
+                        token,
+                        current_app.config["JWT_SECRET_KEY"],
+                        algorithms=["HS256"],
+                    )
 
                 # 檢查 JWT 是否在黑名單中
                 jti = payload.get("jti")
-                if jti and JWTBlacklist.is_blacklisted(jti):
+                with phase("blacklist"):
+                    blacklisted = bool(jti) and JWTBlacklist.is_blacklisted(jti)
+                if blacklisted:
                     return jsonify({"error": "token is invalid"}), 401
 
                 # 檢查用戶是否存在
@@ -56,7 +62,8 @@ def require_role(required_role):
                 if not user_id:
                     return jsonify({"error": "token is invalid"}), 401
 
-                user = User.query.get(user_id)
+                with phase("principal"):
+                    user = User.query.get(user_id)
                 if not user:
                     return jsonify({"error": "token is invalid"}), 401
 
@@ -88,13 +95,14 @@ def require_role(required_role):
 def token_required(f):
     """
     JWT Token 驗證裝飾器
-    
+
     Args:
         f: 被裝飾的函數
-        
+
     Returns:
         decorated_function: 裝飾後的函數
     """
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         # 獲取 Authorization header
@@ -112,13 +120,16 @@ def token_required(f):
 
         try:
             # 解碼 JWT
-            payload = jwt.decode(
-                token, current_app.config["JWT_SECRET_KEY"], algorithms=["HS256"]
-            )
+            with phase("auth"):
+                payload = jwt.decode(
+                    token, current_app.config["JWT_SECRET_KEY"], algorithms=["HS256"]
+                )
 
             # 檢查 JWT 是否在黑名單中
             jti = payload.get("jti")
-            if jti and JWTBlacklist.is_blacklisted(jti):
+            with phase("blacklist"):
+                blacklisted = bool(jti) and JWTBlacklist.is_blacklisted(jti)
+            if blacklisted:
                 return jsonify({"error": "token is invalid"}), 401
 
             # 檢查用戶是否存在
@@ -126,7 +137,8 @@ def token_required(f):
             if not user_id:
                 return jsonify({"error": "token is invalid"}), 401
 
-            user = User.query.get(user_id)
+            with phase("principal"):
+                user = User.query.get(user_id)
             if not user:
                 return jsonify({"error": "token is invalid"}), 401
 
@@ -152,13 +164,14 @@ def token_required(f):
 def admin_required(f):
     """
     管理員權限裝飾器
-    
+
     Args:
         f: 被裝飾的函數
-        
+
     Returns:
         decorated_function: 裝飾後的函數
     """
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         # 獲取 Authorization header
@@ -176,13 +189,16 @@ def admin_required(f):
 
         try:
             # 解碼 JWT
-            payload = jwt.decode(
-                token, current_app.config["JWT_SECRET_KEY"], algorithms=["HS256"]
-            )
+            with phase("auth"):
+                payload = jwt.decode(
+                    token, current_app.config["JWT_SECRET_KEY"], algorithms=["HS256"]
+                )
 
             # 檢查 JWT 是否在黑名單中
             jti = payload.get("jti")
-            if jti and JWTBlacklist.is_blacklisted(jti):
+            with phase("blacklist"):
+                blacklisted = bool(jti) and JWTBlacklist.is_blacklisted(jti)
+            if blacklisted:
                 return jsonify({"error": "token is invalid"}), 401
 
             # 檢查用戶是否存在
@@ -190,7 +206,8 @@ def admin_required(f):
             if not user_id:
                 return jsonify({"error": "token is invalid"}), 401
 
-            user = User.query.get(user_id)
+            with phase("principal"):
+                user = User.query.get(user_id)
             if not user:
                 return jsonify({"error": "token is invalid"}), 401
 
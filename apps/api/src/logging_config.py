@@ -0,0 +1,213 @@
+"""
+非阻塞日誌 - 請求執行緒只把紀錄放入有界佇列，由 QueueListener 執行緒負責格式化與寫出
+
+佇列已滿時捨棄 WARNING 以下的紀錄；WARNING 以上的紀錄改為擠掉最舊的一筆。
+被捨棄的數量會在下一筆紀錄寫出時以一筆警告回報。熱路徑上的 DEBUG/INFO
+紀錄可依 logger 設定取樣比例 (LOG_SAMPLE_RATES)。
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# LogRecord 的標準屬性，其餘屬性 (logger 呼叫時的 extra) 會輸出為 JSON 欄位
+_RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None))
+) | {"message", "asctime"}
+
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warn": logging.WARNING,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+}
+
+_listener: Optional[QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆紀錄輸出一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """放入有界佇列的 handler，佇列已滿時依等級捨棄紀錄而不阻塞"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 在呼叫端先合併訊息參數與例外內容，之後的紀錄不再引用呼叫端的物件
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if record.levelno >= logging.WARNING:
+            # 警告以上的紀錄擠掉最舊的一筆
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+
+
+class _DropReportingListener(QueueListener):
+    """寫出紀錄後，若有被捨棄的紀錄則補上一筆警告"""
+
+    def __init__(self, log_queue, source: BoundedQueueHandler, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.source = source
+        self._reported = 0
+
+    def enqueue_sentinel(self):
+        # 佇列已滿時等待空位，確保停止時先寫完已排入的紀錄
+        self.queue.put(self._sentinel)
+
+    def handle(self, record):
+        super().handle(record)
+        dropped = self.source.dropped
+        if dropped > self._reported:
+            warning = logging.makeLogRecord(
+                {
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Log queue full, dropped {dropped - self._reported} records",
+                    "dropped_total": dropped,
+                }
+            )
+            self._reported = dropped
+            super().handle(warning)
+
+
+class SamplingFilter(logging.Filter):
+    """依 logger 名稱 (含子 logger) 取樣 WARNING 以下的紀錄，例如 0.01 表示每 100 筆保留 1 筆"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._counters: Dict[str, tuple] = {}
+
+    def _counter(self, name: str):
+        counter = self._counters.get(name)
+        if counter is None:
+            rate = 1.0
+            for prefix in sorted(self.rates, key=len, reverse=True):
+                if name == prefix or name.startswith(prefix + "."):
+                    rate = self.rates[prefix]
+                    break
+            interval = max(int(round(1 / rate)), 1) if rate > 0 else 0
+            counter = self._counters[name] = (interval, itertools.count())
+        return counter
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        interval, counter = self._counter(record.name)
+        if interval == 1:
+            return True
+        if interval == 0:
+            return False
+        return next(counter) % interval == 0
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """解析 "logger=比例,logger=比例" 格式的取樣設定"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    log_file: Optional[str] = None,
+    queue_size: Optional[int] = None,
+    sample_rates: Optional[Dict[str, float]] = None,
+) -> QueueListener:
+    """設定根 logger 經由有界佇列非同步寫出 (重複呼叫時沿用第一次的設定)"""
+    global _listener
+
+    with _configure_lock:
+        if _listener is not None:
+            return _listener
+
+        level = level or os.environ.get("LOG_LEVEL", "info")
+        fmt = fmt or os.environ.get("LOG_FORMAT", "json")
+        log_file = log_file or os.environ.get("LOG_FILE")
+        queue_size = queue_size or int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+        if sample_rates is None:
+            sample_rates = parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", ""))
+
+        if fmt == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter(
+                "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+            )
+
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(queue_size)
+        queue_handler = BoundedQueueHandler(log_queue)
+        if sample_rates:
+            queue_handler.addFilter(SamplingFilter(sample_rates))
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVELS.get(level.lower(), logging.INFO))
+        root.addHandler(queue_handler)
+
+        _listener = _DropReportingListener(log_queue, queue_handler, *handlers)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
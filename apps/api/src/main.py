@@ -1,5 +1,5 @@
 import os
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from flask import Flask, jsonify, request
 from flask_apscheduler import APScheduler
@@ -8,9 +8,14 @@ from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from flask_restx import Api
 
+from src.api_docs import docs_bp
+from src.api_metering import init_api_metering
+
 # 導入資料庫和模型
 from src.database import db
+from src.logging_config import configure_logging
 from src.models.user import User
+from src.monitoring_integration import init_monitoring
 from src.routes.admin import admin_bp
 from src.routes.audit_log import audit_log_bp
 
@@ -21,6 +26,21 @@ from src.routes.jwt_blacklist import jwt_blacklist_bp
 from src.routes.tenant import tenant_bp
 from src.routes.two_factor import two_factor_bp
 from src.routes.webhook import webhook_bp
+from src.services.api_usage import api_usage_meter
+from src.services.delivery_scheduler import delivery_scheduler
+from src.services.email_outbox import email_outbox
+from src.services.event_bus import event_bus
+from src.services.redrive_runner import redrive_runner
+from src.services.replay_runner import replay_runner
+from src.services.retry_scheduler import retry_scheduler
+from src.services.storage_meter import storage_meter
+from src.services.webhook_batcher import webhook_batcher
+from src.services.webhook_counters import webhook_counters
+from src.simple_docs import simple_docs_bp
+from src.tenant_resolution import init_tenant_resolution
+
+# 日誌經由有界佇列由背景執行緒寫出，必須在建立 app 之前設定
+configure_logging()
 
 app = Flask(__name__)
 
@@ -260,7 +280,6 @@ mail = Mail(app)
 app.config["SCHEDULER_API_ENABLED"] = True
 scheduler = APScheduler()
 scheduler.init_app(app)
-scheduler.start()
 
 
 # 添加定時任務：每小時清理一次過期的 JWT 黑名單
@@ -273,6 +292,118 @@ def cleanup_jwt_blacklist_job():
         print(f"清理了 {cleaned_count} 個過期的 JWT 黑名單 token")
 
 
+# 添加定時任務：每天清理超過保留期限的 webhook 傳送記錄
+@scheduler.task(
+    "interval", id="purge_webhook_deliveries", hours=24, misfire_grace_time=3600
+)
+def purge_webhook_deliveries_job():
+    with app.app_context():
+        from src.services.webhook_service import webhook_service
+
+        webhook_service.purge_delivery_history(
+            retention_days=int(os.environ.get("WEBHOOK_DELIVERY_RETENTION_DAYS", 30))
+        )
+
+
+# 添加定時任務：啟動時與每分鐘重新送出租約逾期的 webhook 傳送 (程序重啟時遺失於記憶體佇列中的傳送)
+@scheduler.task(
+    "interval",
+    id="resubmit_stale_webhook_deliveries",
+    minutes=1,
+    next_run_time=datetime.now(),
+    misfire_grace_time=60,
+)
+def resubmit_stale_webhook_deliveries_job():
+    with app.app_context():
+        from src.services.webhook_service import (
+            DELIVERY_LEASE_SECONDS,
+            webhook_service,
+        )
+
+        webhook_service.resubmit_stale_deliveries(lease_seconds=DELIVERY_LEASE_SECONDS)
+
+
+# 添加定時任務：啟動時與每分鐘重建租約逾期的 webhook 批次 (程序重啟時遺失於記憶體中的批次)
+@scheduler.task(
+    "interval",
+    id="recover_webhook_batch_items",
+    minutes=1,
+    next_run_time=datetime.now(),
+    misfire_grace_time=60,
+)
+def recover_webhook_batch_items_job():
+    with app.app_context():
+        from src.services.webhook_service import (
+            DELIVERY_LEASE_SECONDS,
+            webhook_service,
+        )
+
+        webhook_service.recover_batch_items(lease_seconds=DELIVERY_LEASE_SECONDS)
+
+
+# 添加定時任務：每 5 分鐘補齊分片上傳送記錄未能提交的事件
+@scheduler.task(
+    "interval",
+    id="complete_unprocessed_webhook_events",
+    minutes=5,
+    next_run_time=datetime.now(),
+    misfire_grace_time=300,
+)
+def complete_unprocessed_webhook_events_job():
+    with app.app_context():
+        from src.services.webhook_service import webhook_service
+
+        webhook_service.complete_unprocessed_events()
+
+
+# 添加定時任務：每天從來源表重新計算租戶儲存空間用量
+@scheduler.task(
+    "interval", id="reconcile_storage_usage", hours=24, misfire_grace_time=3600
+)
+def reconcile_storage_usage_job():
+    with app.app_context():
+        from src.services.storage_meter import storage_meter
+
+        storage_meter.reconcile()
+
+
+# 添加定時任務：每 15 分鐘將已過期的租戶邀請標記為過期
+@scheduler.task(
+    "interval", id="expire_tenant_invitations", minutes=15, misfire_grace_time=900
+)
+def expire_tenant_invitations_job():
+    with app.app_context():
+        from src.models.tenant import TenantInvitation
+
+        TenantInvitation.expire_overdue(
+            batch_size=int(os.environ.get("INVITATION_EXPIRY_BATCH_SIZE", 500))
+        )
+
+
+# 添加定時任務：啟動時與每 5 分鐘重新放入租約逾期仍未寄出的邀請郵件 (程序結束時遺失於記憶體佇列中的郵件)
+@scheduler.task(
+    "interval",
+    id="resend_unsent_invitation_emails",
+    minutes=5,
+    misfire_grace_time=300,
+    next_run_time=datetime.now(),
+)
+def resend_unsent_invitation_emails_job():
+    with app.app_context():
+        from src.routes.tenant import resend_unsent_invitation_emails
+
+        resend_unsent_invitation_emails(
+            lease_seconds=int(os.environ.get("INVITATION_EMAIL_LEASE_SECONDS", 600))
+        )
+
+
+# 請求指標與階段計時 (Server-Timing)，須在其他中介層之前註冊才能涵蓋它們的資料庫查詢
+init_monitoring(app)
+
+# 依 Host 或路徑 slug 解析每個請求的租戶，並計量 API 用量與執行方案配額
+init_tenant_resolution(app)
+init_api_metering(app)
+
 # 註冊藍圖
 app.register_blueprint(auth_bp, url_prefix="/api")
 app.register_blueprint(admin_bp, url_prefix="/api/admin")
@@ -283,17 +414,12 @@ app.register_blueprint(tenant_bp, url_prefix="/api")
 app.register_blueprint(webhook_bp, url_prefix="/api")
 app.register_blueprint(audit_log_bp, url_prefix="/api")
 
-# 註冊 API 文檔
-# 導入 API 文檔
-from src.api_docs import docs_bp
-from src.simple_docs import simple_docs_bp
-
 # 註冊 API 文檔 Blueprint
 app.register_blueprint(docs_bp)
 app.register_blueprint(simple_docs_bp)
 
 # 導入文檔化路由（這會註冊所有 API 文檔）
-import src.documented_routes
+import src.documented_routes  # noqa: E402,F401
 
 
 @app.route("/")
@@ -560,6 +686,23 @@ with app.app_context():
         print(f"Database initialization error: {e}")
         # 如果資料庫初始化失敗，嘗試繼續運行（可能表格已存在）
 
+# 資料表與欄位遷移完成後才啟動排程器與背景工作者，
+# 避免啟動時立即執行的工作 (next_run_time=now) 查詢尚未建立的欄位
+scheduler.start()
+
+# 啟動事件匯流排、webhook 傳送排程器、批次緩衝區、重試排程器、計數累加器、
+# 死信重送、事件重播、儲存空間計量、郵件發送佇列與 API 用量計量
+event_bus.start(app)
+delivery_scheduler.start(app)
+webhook_batcher.start(app)
+retry_scheduler.start(app)
+webhook_counters.start(app)
+redrive_runner.start(app)
+replay_runner.start(app)
+storage_meter.start(app)
+email_outbox.start(app)
+api_usage_meter.start(app)
+
 
 # 在應用啟動時列印路由（用於調試）
 print_routes()
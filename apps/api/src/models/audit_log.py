@@ -1,7 +1,11 @@
 import json
+import logging
 from datetime import datetime
 
 from src.database import db
+from src.request_timing import phase
+
+logger = logging.getLogger(__name__)
 
 
 class AuditLog(db.Model):
@@ -43,31 +47,32 @@ class AuditLog(db.Model):
         status="success",
     ):
         """記錄操作日誌"""
-        try:
-            # 如果 details 是字典，轉換為 JSON 字符串
-            if isinstance(details, dict):
-                details = json.dumps(details, ensure_ascii=False)
-
-            log_entry = cls(
-                user_id=user_id,
-                action=action,
-                resource_type=resource_type,
-                resource_id=resource_id,
-                details=details,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                status=status,
-            )
-
-            db.session.add(log_entry)
-            db.session.commit()
-            return log_entry
-
-        except Exception as e:
-            db.session.rollback()
-            # 記錄審計日誌失敗不應該影響主要操作
-            print(f"Failed to log audit entry: {str(e)}")
-            return None
+        with phase("audit"):
+            try:
+                # 如果 details 是字典，轉換為 JSON 字符串
+                if isinstance(details, dict):
+                    details = json.dumps(details, ensure_ascii=False)
+
+                log_entry = cls(
+                    user_id=user_id,
+                    action=action,
+                    resource_type=resource_type,
+                    resource_id=resource_id,
+                    details=details,
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                    status=status,
+                )
+
+                db.session.add(log_entry)
+                db.session.commit()
+                return log_entry
+
+            except Exception as e:
+                db.session.rollback()
+                # 記錄審計日誌失敗不應該影響主要操作
+                logger.error(f"Failed to log audit entry: {str(e)}")
+                return None
 
     @classmethod
     def get_user_logs(cls, user_id, limit=50, offset=0):
@@ -1,7 +1,10 @@
+import logging
 from datetime import datetime
 
 from src.database import db
 
+logger = logging.getLogger(__name__)
+
 
 class JWTBlacklist(db.Model):
     """JWT 黑名單模型"""
@@ -33,27 +36,27 @@ class JWTBlacklist(db.Model):
     def is_blacklisted(cls, jti):
         """檢查 JWT 是否在黑名單中"""
         if not jti:
-            print(f"[JWT_BLACKLIST] No JTI provided")
+            logger.debug("No JTI provided")
             return False
 
         try:
             token = cls.query.filter_by(jti=jti).first()
-            print(f"[JWT_BLACKLIST] Checking JTI: {jti}, Found: {token is not None}")
+            logger.debug(f"Checking JTI: {jti}, Found: {token is not None}")
 
             if not token:
                 return False
 
             # 如果 token 已過期，從黑名單中移除
             if token.expires_at < datetime.utcnow():
-                print(f"[JWT_BLACKLIST] Token expired, removing from blacklist: {jti}")
+                logger.debug(f"Token expired, removing from blacklist: {jti}")
                 db.session.delete(token)
                 # db.session.commit() # Removed to avoid side effects
                 return False
 
-            print(f"[JWT_BLACKLIST] Token is blacklisted: {jti}")
+            logger.info(f"Token is blacklisted: {jti}")
             return True
         except Exception as e:
-            print(f"[JWT_BLACKLIST] Error checking blacklist: {e}")
+            logger.error(f"Error checking blacklist: {e}")
             return False
 
     @classmethod
@@ -62,18 +65,18 @@ class JWTBlacklist(db.Model):
     ):
         """將 JWT 添加到黑名單"""
         if not jti:
-            print(f"[JWT_BLACKLIST] No JTI provided for blacklisting")
+            logger.warning("No JTI provided for blacklisting")
             return None
 
         try:
-            print(
-                f"[JWT_BLACKLIST] Adding to blacklist - JTI: {jti}, User: {user_id}, Reason: {reason}"
+            logger.info(
+                f"Adding to blacklist - JTI: {jti}, User: {user_id}, Reason: {reason}"
             )
 
             # 檢查是否已存在
             existing = cls.query.filter_by(jti=jti).first()
             if existing:
-                print(f"[JWT_BLACKLIST] Token already blacklisted: {jti}")
+                logger.debug(f"Token already blacklisted: {jti}")
                 return existing
 
             blacklisted_token = cls(
@@ -85,14 +88,11 @@ class JWTBlacklist(db.Model):
             )
             db.session.add(blacklisted_token)
             db.session.commit()
-            print(f"[JWT_BLACKLIST] Successfully added to blacklist: {jti}")
+            logger.debug(f"Successfully added to blacklist: {jti}")
             return blacklisted_token
         except Exception as e:
             db.session.rollback()
-            print(f"[JWT_BLACKLIST] Error adding token to blacklist: {e}")
-            import traceback
-
-            traceback.print_exc()
+            logger.exception(f"Error adding token to blacklist: {e}")
             return None
 
     @classmethod
@@ -109,7 +109,7 @@ class JWTBlacklist(db.Model):
             return count
         except Exception as e:
             db.session.rollback()
-            print(f"Error cleaning up expired tokens: {e}")
+            logger.error(f"Error cleaning up expired tokens: {e}")
             return 0
 
     def to_dict(self):
@@ -1,8 +1,29 @@
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    event,
+    inspect,
+    or_,
+    select,
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from src.database import db
+from src.models.user import User
+from src.pagination import keyset_page
+
+BYTES_PER_GB = 1024**3
 
 
 class Tenant(db.Model):
@@ -11,6 +32,12 @@ class Tenant(db.Model):
     """
 
     __tablename__ = "tenants"
+    __table_args__ = (
+        Index("ix_tenants_name_id", "name", "id"),
+        Index("ix_tenants_member_count_id", "member_count", "id"),
+        Index("ix_tenants_plan_id", "plan", "id"),
+        Index("ix_tenants_trial_ends_at", "trial_ends_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
@@ -29,6 +56,11 @@ class Tenant(db.Model):
     max_users = Column(Integer, default=5, nullable=False)
     max_storage_gb = Column(Integer, default=1, nullable=False)
 
+    # 成員數量 (由 User 的 mapper 事件在同一交易中維護)
+    member_count = Column(Integer, default=0, nullable=False)
+    # 儲存空間用量 (位元組，由 storage_meter 定期寫回，各類別明細見 tenant_storage_usage)
+    storage_bytes = Column(BigInteger, default=0, nullable=False)
+
     # 時間戳記
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -60,7 +92,7 @@ class Tenant(db.Model):
             "trial_ends_at": (
                 self.trial_ends_at.isoformat() if self.trial_ends_at else None
             ),
-            "user_count": len(self.users) if self.users else 0,
+            "user_count": self.member_count or 0,
         }
 
     @classmethod
@@ -73,37 +105,229 @@ class Tenant(db.Model):
         """根據自訂網域取得租戶"""
         return cls.query.filter_by(domain=domain, is_active=True).first()
 
+    @classmethod
+    def refresh_member_counts(cls):
+        """以一次更新重新計算所有租戶的成員數量 (用於回填或修正)"""
+        users = User.__table__
+        db.session.execute(
+            cls.__table__.update().values(
+                member_count=select(func.count(users.c.id))
+                .where(users.c.tenant_id == cls.__table__.c.id)
+                .scalar_subquery()
+            )
+        )
+
+    @classmethod
+    def keyset_page(cls, query, sort="id", after=None, limit=50):
+        """
+        以鍵集分頁取得一頁租戶
+
+        sort 為排序欄位，前綴 "-" 表示遞減；after 為上一頁最後一筆的
+        (排序值, id)。以 (排序值, id) 複合索引定位，深頁與首頁成本相同。
+        回傳 (租戶列表, 是否還有下一頁)。
+        """
+        return keyset_page(cls, query, sort=sort, after=after, limit=limit)
+
     def can_add_user(self):
         """檢查是否可以新增使用者"""
-        current_user_count = len(self.users) if self.users else 0
-        return current_user_count < self.max_users
+        return (self.member_count or 0) < self.max_users
+
+    def has_storage_capacity(self):
+        """檢查儲存空間用量是否仍低於方案配額"""
+        return (self.storage_bytes or 0) < self.max_storage_gb * BYTES_PER_GB
 
     def get_usage_stats(self):
         """取得租戶使用統計"""
+        member_count = self.member_count or 0
+        storage_gb = (self.storage_bytes or 0) / BYTES_PER_GB
         return {
             "users": {
-                "current": len(self.users) if self.users else 0,
+                "current": member_count,
                 "limit": self.max_users,
                 "percentage": (
-                    (len(self.users) / self.max_users * 100)
-                    if self.max_users > 0
-                    else 0
+                    (member_count / self.max_users * 100) if self.max_users > 0 else 0
                 ),
             },
             "storage": {
-                "current_gb": 0,  # TODO: 實作儲存空間計算
+                "current_gb": round(storage_gb, 3),
                 "limit_gb": self.max_storage_gb,
-                "percentage": 0,
+                "percentage": (
+                    (storage_gb / self.max_storage_gb * 100)
+                    if self.max_storage_gb > 0
+                    else 0
+                ),
             },
         }
 
 
+class TenantStorageUsage(db.Model):
+    """
+    租戶儲存空間用量明細 - 每個租戶每個資料類別一列
+    """
+
+    __tablename__ = "tenant_storage_usage"
+
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), primary_key=True)
+    category = Column(String(50), primary_key=True)  # 參見 STORAGE_CATEGORIES
+    bytes = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    # 最近一次從來源表校正的時間，寫回時只計入在此之後提交的增量
+    reconciled_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<TenantStorageUsage {self.tenant_id} {self.category}>"
+
+    def to_dict(self):
+        return {
+            "category": self.category,
+            "bytes": self.bytes,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "reconciled_at": (
+                self.reconciled_at.isoformat() if self.reconciled_at else None
+            ),
+        }
+
+
+class TenantApiUsage(db.Model):
+    """
+    租戶 API 用量 - 每個租戶每小時每個路由類別與狀態類別一列
+    """
+
+    __tablename__ = "tenant_api_usage"
+
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # 小時起點 (UTC)
+    route_class = Column(String(50), primary_key=True)  # 藍圖名稱
+    status_class = Column(String(3), primary_key=True)  # 2xx, 4xx, 5xx ...
+    request_count = Column(BigInteger, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<TenantApiUsage {self.tenant_id} {self.bucket_start}>"
+
+
+class TenantShard(db.Model):
+    """
+    租戶分片路由表 - 沒有資料列的租戶位於共用資料庫 (default)
+    """
+
+    __tablename__ = "tenant_shards"
+
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), primary_key=True)
+    shard = Column(String(100), default="default", nullable=False)
+    # active, copying (複製中，寫入仍在原分片), frozen (切換中，暫停寫入)
+    status = Column(String(20), default="active", nullable=False)
+    target_shard = Column(String(100), nullable=True)
+    copied_until_id = Column(Integer, nullable=True)  # 複製進度檢查點
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<TenantShard {self.tenant_id} {self.shard}>"
+
+    def to_dict(self):
+        return {
+            "tenant_id": self.tenant_id,
+            "shard": self.shard,
+            "status": self.status,
+            "target_shard": self.target_shard,
+            "copied_until_id": self.copied_until_id,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class TenantCacheVersion(db.Model):
+    """
+    租戶解析快取的版本 (單一資料列) - 租戶的 slug、網域、方案或啟用狀態變更時遞增，
+    各程序定期比對版本，得知其他程序已失效快取
+    """
+
+    __tablename__ = "tenant_cache_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(BigInteger, default=0, nullable=False)
+
+    @classmethod
+    def current(cls):
+        """目前的版本 (尚未遞增過時為 0)"""
+        table = cls.__table__
+        version = db.session.execute(
+            select(table.c.version).where(table.c.id == 1)
+        ).scalar()
+        return version or 0
+
+    @classmethod
+    def bump(cls):
+        """遞增版本，回傳新版本"""
+        table = cls.__table__
+        increment = (
+            table.update()
+            .where(table.c.id == 1)
+            .values(version=table.c.version + 1)
+            .returning(table.c.version)
+        )
+        version = db.session.execute(increment).scalar()
+        if version is None:
+            # 第一次遞增時建立資料列；同時建立的程序改為遞增
+            try:
+                db.session.execute(table.insert().values(id=1, version=1))
+                version = 1
+            except IntegrityError:
+                db.session.rollback()
+                version = db.session.execute(increment).scalar()
+        db.session.commit()
+        return version
+
+
+def _adjust_member_count(connection, tenant_id, delta):
+    """在 flush 的同一連線上以原子更新調整租戶成員數量"""
+    if tenant_id is None:
+        return
+    tenants = Tenant.__table__
+    connection.execute(
+        tenants.update()
+        .where(tenants.c.id == tenant_id)
+        .values(member_count=tenants.c.member_count + delta)
+    )
+
+
+@event.listens_for(User, "after_insert")
+def _user_joined_tenant(mapper, connection, target):
+    _adjust_member_count(connection, target.tenant_id, 1)
+
+
+@event.listens_for(User, "after_update")
+def _user_changed_tenant(mapper, connection, target):
+    history = inspect(target).attrs.tenant_id.history
+    if not history.has_changes():
+        return
+    for tenant_id in history.deleted:
+        _adjust_member_count(connection, tenant_id, -1)
+    for tenant_id in history.added:
+        _adjust_member_count(connection, tenant_id, 1)
+
+
+@event.listens_for(User, "after_delete")
+def _user_left_tenant(mapper, connection, target):
+    _adjust_member_count(connection, target.tenant_id, -1)
+
+
 class TenantInvitation(db.Model):
     """
     租戶邀請模型 - 管理使用者邀請加入租戶
     """
 
     __tablename__ = "tenant_invitations"
+    __table_args__ = (
+        Index("ix_tenant_invitations_tenant_email", "tenant_id", "email"),
+        # 過期掃描只讀取未處理的邀請
+        Index(
+            "ix_tenant_invitations_pending_expiry",
+            "is_accepted",
+            "is_expired",
+            "expires_at",
+        ),
+        # 邀請郵件補寄掃描只讀取尚未寄出的邀請
+        Index("ix_tenant_invitations_email_unsent", "email_sent_at", "email_queued_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
@@ -123,6 +347,12 @@ class TenantInvitation(db.Model):
     expires_at = Column(DateTime(timezone=True), nullable=False)
     accepted_at = Column(DateTime(timezone=True), nullable=True)
 
+    # 邀請郵件 (email_queued_at 為放入發送佇列的租約，逾期仍未寄出時由掃描重新放入；
+    # 收件者被拒絕或重試用盡時記錄 email_failed_at，不再重新放入)
+    email_queued_at = Column(DateTime(timezone=True), nullable=True)
+    email_sent_at = Column(DateTime(timezone=True), nullable=True)
+    email_failed_at = Column(DateTime(timezone=True), nullable=True)
+
     # 關聯
     tenant = relationship("Tenant")
     invited_by = relationship("User", foreign_keys=[invited_by_user_id])
@@ -144,6 +374,12 @@ class TenantInvitation(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "expires_at": self.expires_at.isoformat() if self.expires_at else None,
             "accepted_at": self.accepted_at.isoformat() if self.accepted_at else None,
+            "email_sent_at": (
+                self.email_sent_at.isoformat() if self.email_sent_at else None
+            ),
+            "email_failed_at": (
+                self.email_failed_at.isoformat() if self.email_failed_at else None
+            ),
         }
 
     @classmethod
@@ -153,6 +389,96 @@ class TenantInvitation(db.Model):
             token=token, is_accepted=False, is_expired=False
         ).first()
 
+    @classmethod
+    def expire_overdue(cls, batch_size=500, now=None):
+        """將已過期但尚未標記的邀請分批標記為過期，回傳標記的數量"""
+        now = now or datetime.utcnow()
+        table = cls.__table__
+        expired = 0
+        while True:
+            ids = [
+                invitation_id
+                for (invitation_id,) in db.session.execute(
+                    select(table.c.id)
+                    .where(
+                        table.c.is_accepted == False,
+                        table.c.is_expired == False,
+                        table.c.expires_at <= now,
+                    )
+                    .limit(batch_size)
+                )
+            ]
+            if not ids:
+                return expired
+
+            # 每批一個短交易，不長時間鎖住邀請表
+            db.session.execute(
+                table.update().where(table.c.id.in_(ids)).values(is_expired=True)
+            )
+            db.session.commit()
+            expired += len(ids)
+
+    @classmethod
+    def mark_email_sent(cls, token, now=None):
+        """記錄邀請郵件已寄出"""
+        table = cls.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.token == token)
+            .values(email_sent_at=now or datetime.utcnow())
+        )
+        db.session.commit()
+
+    @classmethod
+    def mark_email_failed(cls, token, now=None):
+        """記錄邀請郵件無法寄出 (補寄掃描不再重新放入)"""
+        table = cls.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.token == token)
+            .values(email_failed_at=now or datetime.utcnow())
+        )
+        db.session.commit()
+
+    @classmethod
+    def claim_unsent_emails(cls, lease_seconds=600, limit=500, now=None):
+        """認領郵件尚未寄出且佇列租約已逾期的有效邀請 (例如程序重啟時留在記憶體佇列中的郵件)"""
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(seconds=lease_seconds)
+        table = cls.__table__
+        unsent = (
+            (table.c.is_accepted == False)
+            & (table.c.is_expired == False)
+            & (table.c.expires_at > now)
+            & table.c.email_sent_at.is_(None)
+            & table.c.email_failed_at.is_(None)
+            & or_(table.c.email_queued_at.is_(None), table.c.email_queued_at < cutoff)
+        )
+
+        ids = [
+            invitation_id
+            for (invitation_id,) in db.session.execute(
+                select(table.c.id).where(unsent).order_by(table.c.id).limit(limit)
+            )
+        ]
+        if not ids:
+            return []
+
+        # 條件更新租約，同時執行的掃描不會重複認領
+        claimed = [
+            invitation_id
+            for (invitation_id,) in db.session.execute(
+                table.update()
+                .where(table.c.id.in_(ids), unsent)
+                .values(email_queued_at=now)
+                .returning(table.c.id)
+            )
+        ]
+        db.session.commit()
+        if not claimed:
+            return []
+        return cls.query.filter(cls.id.in_(claimed)).order_by(cls.id).all()
+
     def is_valid(self):
         """檢查邀請是否有效"""
         from datetime import datetime
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 import pyotp
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from src.database import db
@@ -9,7 +9,14 @@ from src.database import db
 
 class User(db.Model):
     __tablename__ = "users"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # 租戶成員目錄的篩選、搜尋與鍵集分頁索引
+        db.Index("ix_users_tenant_id_id", "tenant_id", "id"),
+        db.Index("ix_users_tenant_username", "tenant_id", "username"),
+        db.Index("ix_users_tenant_email", "tenant_id", "email"),
+        db.Index("ix_users_tenant_role_id", "tenant_id", "tenant_role", "id"),
+        {"extend_existing": True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -23,7 +30,11 @@ class User(db.Model):
     two_factor_backup_codes = db.Column(db.Text, nullable=True)
 
     # 多租戶相關欄位
-    tenant_id = db.Column(db.Integer, db.ForeignKey("tenants.id"), nullable=True)
+    # active_history: 變更時載入舊值，讓租戶成員數量能正確扣減
+    tenant_id = column_property(
+        db.Column(db.Integer, db.ForeignKey("tenants.id"), nullable=True),
+        active_history=True,
+    )
     tenant_role = db.Column(
         db.String(50), default="member", nullable=False
     )  # owner, admin, member
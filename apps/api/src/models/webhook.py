@@ -1,7 +1,9 @@
 import hashlib
 import hmac
 import json
-from datetime import datetime
+import random
+import zlib
+from datetime import datetime, timedelta
 
 from sqlalchemy import (
     JSON,
@@ -9,14 +11,40 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Text,
+    event,
+    inspect,
+    or_,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import column_property, object_session, relationship
 from sqlalchemy.sql import func
 
 from src.database import db
+from src.services.storage_meter import storage_meter
+
+# 重試退避的最長延遲 (秒)
+MAX_RETRY_DELAY_SECONDS = 6 * 60 * 60
+
+# 傳送耗時統計使用的延遲區間上界 (毫秒)
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+# 背景工作的心跳逾時 (秒)，超過時視為執行程序已結束，可由其他程序接手
+JOB_LEASE_SECONDS = 120
+
+
+def compress_text(text):
+    """以 zlib 壓縮文字"""
+    return zlib.compress(text.encode("utf-8"))
+
+
+def decompress_text(data):
+    """解壓縮 zlib 壓縮的文字"""
+    return zlib.decompress(data).decode("utf-8")
 
 
 class Webhook(db.Model):
@@ -44,12 +72,18 @@ class Webhook(db.Model):
     max_retries = Column(Integer, default=3, nullable=False)
     retry_delay = Column(Integer, default=60, nullable=False)  # 秒
 
+    # 批次傳送設定 (開啟後多個事件合併為一次 POST)
+    batch_enabled = Column(Boolean, default=False, nullable=False)
+    batch_max_events = Column(Integer, default=100, nullable=False)
+    batch_max_bytes = Column(Integer, default=262144, nullable=False)
+    batch_max_wait_ms = Column(Integer, default=1000, nullable=False)
+
     # 時間戳記
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     last_triggered_at = Column(DateTime(timezone=True), nullable=True)
 
-    # 統計資訊
+    # 統計資訊 (由 webhook_counters 定期以原子更新寫回)
     total_calls = Column(Integer, default=0, nullable=False)
     successful_calls = Column(Integer, default=0, nullable=False)
     failed_calls = Column(Integer, default=0, nullable=False)
@@ -59,6 +93,7 @@ class Webhook(db.Model):
     deliveries = relationship(
         "WebhookDelivery", back_populates="webhook", cascade="all, delete-orphan"
     )
+    batch_items = relationship("WebhookBatchItem", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Webhook {self.name} ({self.url})>"
@@ -73,6 +108,10 @@ class Webhook(db.Model):
             "is_active": self.is_active,
             "max_retries": self.max_retries,
             "retry_delay": self.retry_delay,
+            "batch_enabled": self.batch_enabled,
+            "batch_max_events": self.batch_max_events,
+            "batch_max_bytes": self.batch_max_bytes,
+            "batch_max_wait_ms": self.batch_max_wait_ms,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
             "last_triggered_at": (
@@ -106,39 +145,123 @@ class Webhook(db.Model):
         return f"sha256={signature}"
 
 
+class WebhookPayload(db.Model):
+    """
+    Webhook payload 模型 - 以內容雜湊為鍵，同一事件的多筆傳送共用一份
+    """
+
+    __tablename__ = "webhook_payloads"
+
+    hash = Column(String(64), primary_key=True)  # payload 的 SHA-256
+    body = Column(LargeBinary, nullable=False)  # zlib 壓縮的 payload
+    size_bytes = Column(Integer, nullable=False)  # 壓縮前的大小
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<WebhookPayload {self.hash[:12]} ({self.size_bytes} bytes)>"
+
+    @staticmethod
+    def compute_hash(payload):
+        """計算 payload 的內容雜湊"""
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def for_payload(cls, payload):
+        """取得內容相同的既有 payload，不存在時在目前的交易中寫入"""
+        payload_hash = cls.compute_hash(payload)
+
+        # 可能在建構傳送記錄的過程中呼叫，避免提前 flush 尚未完成的物件
+        with db.session.no_autoflush:
+            existing = db.session.get(cls, payload_hash)
+            if existing is not None:
+                return existing
+
+            # 直接在連線的 savepoint 中寫入 (不經過 session flush)；
+            # 其他交易同時寫入相同內容時忽略唯一鍵衝突，再讀取對方寫入的資料列
+            connection = db.session.connection(bind_arguments={"mapper": inspect(cls)})
+            try:
+                with connection.begin_nested():
+                    connection.execute(
+                        cls.__table__.insert().values(
+                            hash=payload_hash,
+                            body=compress_text(payload),
+                            size_bytes=len(payload.encode("utf-8")),
+                        )
+                    )
+            except IntegrityError:
+                pass
+            else:
+                # 只有實際寫入的 payload 計入儲存空間 (由第一筆引用的傳送記錄計入)
+                storage_meter.note_new_payload(
+                    db.session, payload_hash, len(payload.encode("utf-8"))
+                )
+            return db.session.get(cls, payload_hash)
+
+    def get_payload(self):
+        """取得解壓縮後的 payload"""
+        return decompress_text(self.body)
+
+
 class WebhookDelivery(db.Model):
     """
     Webhook 傳送記錄模型
     """
 
     __tablename__ = "webhook_deliveries"
+    __table_args__ = (
+        Index("ix_webhook_deliveries_webhook_created", "webhook_id", "created_at"),
+        Index("ix_webhook_deliveries_status_next_retry", "status", "next_retry_at"),
+        Index("ix_webhook_deliveries_status_failed", "status", "failed_at"),
+        Index("ix_webhook_deliveries_status_claimed", "status", "claimed_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     webhook_id = Column(Integer, ForeignKey("webhooks.id"), nullable=False)
 
     # 傳送資訊
-    event_type = Column(String(100), nullable=False)
-    payload = Column(Text, nullable=False)  # JSON payload
+    event_type = Column(String(100), nullable=False)  # 批次傳送為 "batch"
+    payload_hash = Column(
+        String(64), ForeignKey("webhook_payloads.hash"), nullable=True, index=True
+    )
+    # 正規化前的 payload，新資料存放於 webhook_payloads
+    legacy_payload = Column("payload", Text, nullable=False, default="")
+    event_count = Column(Integer, default=1, nullable=False)  # 批次內的事件數量
+    is_replay = Column(Boolean, default=False, nullable=False)  # 事件重播產生的傳送
 
     # 請求資訊
-    request_headers = Column(JSON, nullable=True)
+    # zlib 壓縮的請求標頭 (active_history: 覆寫時載入舊值以計算儲存空間增量)
+    request_data = column_property(
+        Column(LargeBinary, nullable=True), active_history=True
+    )
+    # 壓縮儲存前的請求標頭
+    legacy_request_headers = Column("request_headers", JSON, nullable=True)
     request_method = Column(String(10), default="POST", nullable=False)
 
     # 回應資訊
     response_status_code = Column(Integer, nullable=True)
-    response_headers = Column(JSON, nullable=True)
-    response_body = Column(Text, nullable=True)
+    # zlib 壓縮的回應標頭與內容 (active_history: 覆寫時載入舊值以計算儲存空間增量)
+    response_data = column_property(
+        Column(LargeBinary, nullable=True), active_history=True
+    )
+    # 壓縮儲存前的回應標頭與內容
+    legacy_response_headers = Column("response_headers", JSON, nullable=True)
+    legacy_response_body = Column("response_body", Text, nullable=True)
+    duration_ms = Column(Integer, nullable=True)  # 最近一次嘗試的耗時
+    size_bytes = Column(Integer, default=0, nullable=False)  # 計入租戶儲存空間的大小
 
     # 狀態
     status = Column(
         String(20), default="pending", nullable=False
     )  # pending, success, failed, retrying
     error_message = Column(Text, nullable=True)
+    error_class = Column(String(20), nullable=True)  # 參見 DELIVERY_ERROR_CLASSES
 
     # 重試資訊
     attempt_count = Column(Integer, default=0, nullable=False)
     max_attempts = Column(Integer, default=3, nullable=False)
     next_retry_at = Column(DateTime(timezone=True), nullable=True)
+    # 送入記憶體傳送佇列的時間 (租約)，逾期仍為 pending 時由清掃工作重新送出
+    claimed_at = Column(DateTime(timezone=True), nullable=True, default=datetime.utcnow)
 
     # 時間戳記
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -147,18 +270,83 @@ class WebhookDelivery(db.Model):
 
     # 關聯
     webhook = relationship("Webhook", back_populates="deliveries")
+    payload_ref = relationship("WebhookPayload")
 
     def __repr__(self):
         return f"<WebhookDelivery {self.id} ({self.event_type})>"
 
+    @property
+    def payload(self):
+        """傳送的 JSON payload"""
+        if self.payload_ref is not None:
+            return self.payload_ref.get_payload()
+        return self.legacy_payload
+
+    @payload.setter
+    def payload(self, value):
+        self.payload_ref = WebhookPayload.for_payload(value)
+
+    @property
+    def request_headers(self):
+        """最近一次嘗試的請求標頭"""
+        if self.request_data is None:
+            return self.legacy_request_headers
+        return json.loads(decompress_text(self.request_data))
+
+    @request_headers.setter
+    def request_headers(self, headers):
+        """壓縮儲存請求標頭"""
+        self.legacy_request_headers = None
+        self.request_data = (
+            None
+            if headers is None
+            else compress_text(json.dumps(headers, ensure_ascii=False))
+        )
+
+    def _get_response(self):
+        if self.response_data is None:
+            return None
+        return json.loads(decompress_text(self.response_data))
+
+    @property
+    def response_headers(self):
+        """回應標頭"""
+        response = self._get_response()
+        if response is None:
+            return self.legacy_response_headers
+        return response["headers"]
+
+    @property
+    def response_body(self):
+        """回應內容"""
+        response = self._get_response()
+        if response is None:
+            return self.legacy_response_body
+        return response["body"]
+
+    def set_response(self, headers=None, body=None):
+        """壓縮儲存回應標頭與內容"""
+        self.legacy_response_headers = None
+        self.legacy_response_body = None
+        if headers is None and body is None:
+            self.response_data = None
+            return
+        self.response_data = compress_text(
+            json.dumps({"headers": headers, "body": body}, ensure_ascii=False)
+        )
+
     def to_dict(self):
         return {
             "id": self.id,
             "webhook_id": self.webhook_id,
             "event_type": self.event_type,
+            "event_count": self.event_count,
+            "is_replay": self.is_replay,
             "status": self.status,
             "response_status_code": self.response_status_code,
+            "duration_ms": self.duration_ms,
             "error_message": self.error_message,
+            "error_class": self.error_class,
             "attempt_count": self.attempt_count,
             "max_attempts": self.max_attempts,
             "created_at": self.created_at.isoformat() if self.created_at else None,
@@ -171,6 +359,10 @@ class WebhookDelivery(db.Model):
             ),
         }
 
+    def has_attempts_left(self):
+        """檢查是否還有剩餘的嘗試次數"""
+        return self.attempt_count < self.max_attempts
+
     def can_retry(self):
         """檢查是否可以重試"""
         return (
@@ -185,14 +377,10 @@ class WebhookDelivery(db.Model):
         """標記為成功"""
         self.status = "success"
         self.response_status_code = response_status_code
-        self.response_headers = response_headers
-        self.response_body = response_body
+        self.set_response(response_headers, response_body)
         self.delivered_at = datetime.utcnow()
         self.error_message = None
-
-        # 更新 webhook 統計
-        self.webhook.successful_calls += 1
-        self.webhook.last_triggered_at = datetime.utcnow()
+        self.claimed_at = None
 
     def mark_as_failed(
         self,
@@ -205,37 +393,81 @@ class WebhookDelivery(db.Model):
         self.status = "failed"
         self.error_message = error_message
         self.response_status_code = response_status_code
-        self.response_headers = response_headers
-        self.response_body = response_body
+        self.set_response(response_headers, response_body)
         self.failed_at = datetime.utcnow()
-
-        # 更新 webhook 統計
-        self.webhook.failed_calls += 1
+        self.claimed_at = None
 
     def schedule_retry(self, delay_seconds=None):
-        """安排重試"""
-        if self.attempt_count >= self.max_attempts:
+        """安排重試 (嘗試次數在每次傳送時累加)"""
+        if not self.has_attempts_left():
             self.mark_as_failed("Maximum retry attempts exceeded")
             return False
 
         self.status = "retrying"
-        self.attempt_count += 1
+        self.claimed_at = None
 
         if delay_seconds is None:
-            delay_seconds = self.webhook.retry_delay * (
-                2 ** (self.attempt_count - 1)
-            )  # 指數退避
+            # 指數退避並加入隨機抖動，避免大量重試在同一時間點湧入
+            delay_seconds = min(
+                self.webhook.retry_delay * (2 ** max(self.attempt_count - 1, 0)),
+                MAX_RETRY_DELAY_SECONDS,
+            )
+            delay_seconds = random.uniform(delay_seconds / 2, delay_seconds)
 
         self.next_retry_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
         return True
 
 
+class WebhookBatchItem(db.Model):
+    """
+    Webhook 批次暫存項目 - 與事件一起提交，所屬批次送出時一併刪除；
+    程序結束時留在記憶體中未送出的批次由此重建
+    """
+
+    __tablename__ = "webhook_batch_items"
+    __table_args__ = (
+        Index("ix_webhook_batch_items_webhook_hash", "webhook_id", "payload_hash"),
+        Index("ix_webhook_batch_items_claimed_at", "claimed_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    webhook_id = Column(Integer, ForeignKey("webhooks.id"), nullable=False)
+    payload_hash = Column(String(64), nullable=False)  # 送出時依雜湊比對刪除
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # 加入記憶體批次的時間 (租約)，逾期仍未送出時重新加入
+    claimed_at = Column(
+        DateTime(timezone=True), nullable=False, default=datetime.utcnow
+    )
+
+    def __repr__(self):
+        return f"<WebhookBatchItem {self.id} (webhook {self.webhook_id})>"
+
+
+class WebhookEventFanout(db.Model):
+    """
+    分片事件的扇出標記 - 與傳送記錄、批次暫存項目在共用資料庫的同一個交易中提交；
+    事件的 processed_at 未能在分片提交時，補齊工作依此判斷是否已建立過傳送記錄
+    """
+
+    __tablename__ = "webhook_event_fanouts"
+
+    # 搬移分片時事件保留原 id，以租戶與事件 id 識別
+    tenant_id = Column(Integer, primary_key=True, autoincrement=False)
+    event_id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<WebhookEventFanout {self.tenant_id}/{self.event_id}>"
+
+
 class WebhookEvent(db.Model):
     """
     Webhook 事件模型 - 記錄系統中發生的事件
     """
 
     __tablename__ = "webhook_events"
+    __table_args__ = (Index("ix_webhook_events_tenant_id_id", "tenant_id", "id"),)
 
     id = Column(Integer, primary_key=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)
@@ -243,6 +475,7 @@ class WebhookEvent(db.Model):
     # 事件資訊
     event_type = Column(String(100), nullable=False)
     event_data = Column(JSON, nullable=False)
+    size_bytes = Column(Integer, default=0, nullable=False)  # 計入租戶儲存空間的大小
 
     # 觸發資訊
     triggered_by_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -274,6 +507,180 @@ class WebhookEvent(db.Model):
         }
 
 
+class LeasedJobMixin:
+    """
+    以心跳作為租約的背景工作 - 執行中的工作定期更新 heartbeat_at，
+    執行程序結束 (重啟、當機) 後心跳逾期，工作可被其他程序重新認領
+    """
+
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    @classmethod
+    def lease_cutoff(cls, now=None):
+        return (now or datetime.utcnow()) - timedelta(seconds=JOB_LEASE_SECONDS)
+
+    @classmethod
+    def claimable(cls, now=None):
+        """可認領的工作：待執行，或心跳逾期的執行中工作"""
+        return or_(
+            cls.status == "pending",
+            (cls.status == "running")
+            & or_(cls.heartbeat_at.is_(None), cls.heartbeat_at < cls.lease_cutoff(now)),
+        )
+
+    @classmethod
+    def active(cls, now=None):
+        """進行中的工作：待執行、暫停，或心跳未逾期的執行中工作"""
+        return or_(
+            cls.status.in_(["pending", "paused"]),
+            (cls.status == "running") & (cls.heartbeat_at >= cls.lease_cutoff(now)),
+        )
+
+
+class WebhookRedriveJob(LeasedJobMixin, db.Model):
+    """
+    死信重送工作模型 - 在背景依篩選條件分批重送永久失敗的傳送
+    """
+
+    __tablename__ = "webhook_redrive_jobs"
+    __table_args__ = (Index("ix_webhook_redrive_jobs_status", "status"),)
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)  # 限定租戶
+    created_by_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    # 篩選條件 (webhook_id, since, until, error_class)
+    filters = Column(JSON, nullable=False)
+    rate_per_second = Column(Integer, default=50, nullable=False)
+
+    # 進度
+    status = Column(
+        String(20), default="pending", nullable=False
+    )  # pending, running, completed, failed, cancelled
+    total = Column(Integer, default=0, nullable=False)
+    processed = Column(Integer, default=0, nullable=False)
+    redriven = Column(Integer, default=0, nullable=False)
+    error_message = Column(Text, nullable=True)
+
+    # 時間戳記
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<WebhookRedriveJob {self.id} ({self.status})>"
+
+    def is_finished(self):
+        """檢查工作是否已結束"""
+        return self.status in ["completed", "failed", "cancelled"]
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "tenant_id": self.tenant_id,
+            "created_by_user_id": self.created_by_user_id,
+            "filters": self.filters,
+            "rate_per_second": self.rate_per_second,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "redriven": self.redriven,
+            "progress": (
+                round(self.processed / self.total * 100, 2) if self.total else 0
+            ),
+            "error_message": self.error_message,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "heartbeat_at": (
+                self.heartbeat_at.isoformat() if self.heartbeat_at else None
+            ),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class WebhookReplayJob(LeasedJobMixin, db.Model):
+    """
+    事件重播工作模型 - 依時間或事件 id 範圍將歷史事件依序重新傳送給 webhook
+    """
+
+    __tablename__ = "webhook_replay_jobs"
+    __table_args__ = (
+        Index("ix_webhook_replay_jobs_webhook_status", "webhook_id", "status"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    webhook_id = Column(Integer, ForeignKey("webhooks.id"), nullable=False)
+    created_by_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    # 重播範圍 (時間與事件 id 範圍皆為選填)
+    since = Column(DateTime(timezone=True), nullable=True)
+    until = Column(DateTime(timezone=True), nullable=True)
+    from_event_id = Column(Integer, nullable=True)
+    to_event_id = Column(Integer, nullable=True)
+    rate_per_second = Column(Integer, default=10, nullable=False)
+
+    # 進度 (last_event_id 為檢查點，恢復時從其後繼續)
+    status = Column(
+        String(20), default="pending", nullable=False
+    )  # pending, running, paused, completed, failed, cancelled
+    total = Column(Integer, default=0, nullable=False)
+    replayed = Column(Integer, default=0, nullable=False)
+    last_event_id = Column(Integer, nullable=True)
+    error_message = Column(Text, nullable=True)
+
+    # 時間戳記
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # 關聯
+    webhook = relationship("Webhook")
+
+    def __repr__(self):
+        return f"<WebhookReplayJob {self.id} ({self.status})>"
+
+    def is_finished(self):
+        """檢查工作是否已結束"""
+        return self.status in ["completed", "failed", "cancelled"]
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "webhook_id": self.webhook_id,
+            "created_by_user_id": self.created_by_user_id,
+            "since": self.since.isoformat() if self.since else None,
+            "until": self.until.isoformat() if self.until else None,
+            "from_event_id": self.from_event_id,
+            "to_event_id": self.to_event_id,
+            "rate_per_second": self.rate_per_second,
+            "status": self.status,
+            "total": self.total,
+            "replayed": self.replayed,
+            "last_event_id": self.last_event_id,
+            "progress": (
+                round(self.replayed / self.total * 100, 2) if self.total else 0
+            ),
+            "error_message": self.error_message,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "heartbeat_at": (
+                self.heartbeat_at.isoformat() if self.heartbeat_at else None
+            ),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+# 傳送失敗原因分類
+DELIVERY_ERROR_CLASSES = {
+    "http_3xx": "HTTP 重新導向",
+    "http_4xx": "HTTP 用戶端錯誤",
+    "http_5xx": "HTTP 伺服器錯誤",
+    "timeout": "連線逾時",
+    "connection": "連線失敗",
+    "request_error": "請求錯誤",
+    "unexpected": "非預期錯誤",
+}
+
 # 預定義的事件類型
 WEBHOOK_EVENTS = {
     # 使用者事件
@@ -304,3 +711,81 @@ WEBHOOK_EVENTS = {
     "security.suspicious_activity": "可疑活動",
     "security.token_revoked": "Token 撤銷",
 }
+
+
+def _delivery_size(delivery):
+    """傳送記錄計入儲存空間的大小: 壓縮後的請求標頭與回應，加上本交易新寫入的共用 payload
+    (每份 payload 只由第一筆引用的傳送記錄計入) 或舊格式的 payload 欄位"""
+    if delivery.payload_ref is not None:
+        payload_size = storage_meter.take_new_payload(
+            object_session(delivery), delivery.payload_ref.hash
+        )
+    else:
+        payload_size = len((delivery.legacy_payload or "").encode("utf-8"))
+    return (
+        payload_size
+        + len(delivery.request_data or b"")
+        + len(delivery.response_data or b"")
+    )
+
+
+@event.listens_for(WebhookEvent, "before_insert")
+def _set_event_size(mapper, connection, target):
+    target.size_bytes = len(json.dumps(target.event_data, ensure_ascii=False))
+
+
+@event.listens_for(WebhookEvent, "after_insert")
+def _meter_event_insert(mapper, connection, target):
+    storage_meter.stage(
+        object_session(target), target.tenant_id, "webhook_events", target.size_bytes
+    )
+
+
+@event.listens_for(WebhookEvent, "after_delete")
+def _meter_event_delete(mapper, connection, target):
+    storage_meter.stage(
+        object_session(target), target.tenant_id, "webhook_events", -target.size_bytes
+    )
+
+
+@event.listens_for(WebhookDelivery, "before_insert")
+def _set_delivery_size(mapper, connection, target):
+    target.size_bytes = _delivery_size(target)
+
+
+@event.listens_for(WebhookDelivery, "before_update")
+def _update_delivery_size(mapper, connection, target):
+    attrs = inspect(target).attrs
+    delta = 0
+    for history in (attrs.request_data.history, attrs.response_data.history):
+        if history.has_changes():
+            delta += sum(len(data or b"") for data in history.added) - sum(
+                len(data or b"") for data in history.deleted
+            )
+    if delta:
+        target.size_bytes = (target.size_bytes or 0) + delta
+
+
+@event.listens_for(WebhookDelivery, "after_insert")
+def _meter_delivery_insert(mapper, connection, target):
+    storage_meter.stage_webhook(
+        object_session(target), target.webhook_id, target.size_bytes
+    )
+
+
+@event.listens_for(WebhookDelivery, "after_update")
+def _meter_delivery_update(mapper, connection, target):
+    history = inspect(target).attrs.size_bytes.history
+    if history.has_changes() and history.deleted:
+        storage_meter.stage_webhook(
+            object_session(target),
+            target.webhook_id,
+            (target.size_bytes or 0) - (history.deleted[0] or 0),
+        )
+
+
+@event.listens_for(WebhookDelivery, "after_delete")
+def _meter_delivery_delete(mapper, connection, target):
+    storage_meter.stage_webhook(
+        object_session(target), target.webhook_id, -(target.size_bytes or 0)
+    )
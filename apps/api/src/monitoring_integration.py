@@ -9,16 +9,28 @@ import sys
 import time
 from functools import wraps
 
-from flask import current_app, g, request
+from flask import Response, current_app, g, request
+from werkzeug.exceptions import HTTPException
+
+from src.query_instrumentation import (
+    finish_request_queries,
+    init_query_instrumentation,
+    query_report,
+)
+from src.request_timing import RequestTimer, init_request_timing
 
 # 添加監控模組路徑
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "..", "monitoring"))
 
 try:
     from metrics_config import get_metrics_collector
+    from prometheus_export import CONTENT_TYPE, render_prometheus
+    from worker_snapshots import collect_cluster_snapshot
 
     metrics_collector = get_metrics_collector()
 except ImportError:
+    render_prometheus = None
+
     # 如果監控模組不可用，創建一個空的收集器
     class DummyMetricsCollector:
         def record_request(self, *args, **kwargs):
@@ -30,55 +42,79 @@ except ImportError:
         def record_queue_size(self, *args, **kwargs):
             pass
 
-        def get_all_metrics(self):
+        def get_all_metrics(self, *args, **kwargs):
             return {"error": "Metrics collector not available"}
 
+        def get_endpoint_metrics(self, *args, **kwargs):
+            return []
+
         def check_alerts(self):
             return []
 
     metrics_collector = DummyMetricsCollector()
 
 
+# 是否在回應中附上各階段耗時的 Server-Timing 標頭
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "true").lower() in [
+    "true",
+    "on",
+    "1",
+]
+
+
+def _endpoint_rule():
+    """以路由規則作為指標的端點名稱，未匹配任何路由時回傳 None (歸入 other)"""
+    return request.url_rule.rule if request.url_rule else None
+
+
 def init_monitoring(app):
-    """初始化 Flask 應用程式的監控功能"""
+    """初始化 Flask 應用程式的監控功能 (須在其他 before_request 中介層之前呼叫)"""
+    init_request_timing(app)
+    init_query_instrumentation()
 
     @app.before_request
     def before_request():
-        """請求開始時記錄時間"""
+        """請求開始時記錄時間並建立階段計時器"""
         g.start_time = time.time()
         g.request_id = f"{int(time.time() * 1000)}-{id(request)}"
+        g.request_timer = RequestTimer()
 
     @app.after_request
     def after_request(response):
         """請求結束時記錄指標"""
         if hasattr(g, "start_time"):
             response_time_ms = (time.time() - g.start_time) * 1000
-            endpoint = request.endpoint or request.path
+            timer = g.get("request_timer")
+            query_stats, n_plus_one = finish_request_queries()
 
-            # 記錄請求指標
+            # 記錄請求指標、各階段耗時與 SQL 查詢數
             metrics_collector.record_request(
                 response_time_ms=response_time_ms,
                 status_code=response.status_code,
-                endpoint=endpoint,
+                endpoint=_endpoint_rule(),
+                method=request.method,
+                phases=timer.phases if timer else None,
+                queries=query_stats.count if query_stats else 0,
+                n_plus_one=n_plus_one > 0,
             )
 
             # 添加響應頭用於追蹤
             response.headers["X-Request-ID"] = getattr(g, "request_id", "unknown")
             response.headers["X-Response-Time"] = f"{response_time_ms:.2f}ms"
+            if timer and SERVER_TIMING_ENABLED:
+                response.headers["Server-Timing"] = timer.server_timing(
+                    response_time_ms,
+                    {"db": query_stats.describe(n_plus_one)} if query_stats else None,
+                )
 
         return response
 
     @app.errorhandler(Exception)
     def handle_exception(e):
-        """處理未捕獲的異常並記錄指標"""
-        if hasattr(g, "start_time"):
-            response_time_ms = (time.time() - g.start_time) * 1000
-            endpoint = request.endpoint or request.path
-
-            # 記錄錯誤請求
-            metrics_collector.record_request(
-                response_time_ms=response_time_ms, status_code=500, endpoint=endpoint
-            )
+        """記錄未捕獲的異常 (指標由 after_request 對最終的 500 回應記錄一次)"""
+        # 404、405、abort() 等 HTTP 錯誤照常回應
+        if isinstance(e, HTTPException):
+            return e
 
         # 記錄錯誤日誌
         current_app.logger.error(
@@ -97,13 +133,30 @@ def init_monitoring(app):
     # 添加監控端點
     @app.route("/api/metrics")
     def get_metrics():
-        """獲取當前監控指標"""
+        """獲取當前監控指標，top 為最慢端點的數量"""
         try:
-            metrics = metrics_collector.get_all_metrics()
+            top = min(max(request.args.get("top", 10, type=int), 0), 100)
+            metrics = metrics_collector.get_all_metrics(top_endpoints=top)
             return {"status": "success", "metrics": metrics}, 200
         except Exception as e:
             return {"status": "error", "message": str(e)}, 500
 
+    @app.route("/api/metrics/queries")
+    def get_query_metrics():
+        """慢查詢與疑似 N+1 的語句 (只含語句形狀與參數型別，不含參數值)"""
+        return {"status": "success", "queries": query_report.snapshot()}, 200
+
+    @app.route("/metrics")
+    def get_prometheus_metrics():
+        """Prometheus 抓取端點，合併所有 gunicorn worker 的指標"""
+        if render_prometheus is None:
+            return {
+                "status": "error",
+                "message": "Metrics collector not available",
+            }, 503
+        cluster = collect_cluster_snapshot(metrics_collector)
+        return Response(render_prometheus(cluster), content_type=CONTENT_TYPE)
+
     @app.route("/api/alerts")
     def get_alerts():
         """獲取當前告警"""
@@ -117,7 +170,7 @@ def init_monitoring(app):
         except Exception as e:
             return {"status": "error", "message": str(e)}, 500
 
-    current_app.logger.info("Monitoring integration initialized")
+    app.logger.info("Monitoring integration initialized")
 
 
 def monitor_external_call(service_name: str):
@@ -190,41 +243,10 @@ def example_api_call():
 
 # 結構化日誌配置
 def setup_structured_logging(app):
-    """設置結構化日誌"""
-    import logging.config
-
-    logging_config = {
-        "version": 1,
-        "disable_existing_loggers": False,
-        "formatters": {
-            "structured": {
-                "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-                "datefmt": "%Y-%m-%d %H:%M:%S",
-            },
-            "json": {
-                "format": '{"timestamp": "%(asctime)s", "level": "%(levelname)s", "logger": "%(name)s", "message": "%(message)s"}'
-            },
-        },
-        "handlers": {
-            "console": {
-                "class": "logging.StreamHandler",
-                "level": "INFO",
-                "formatter": "structured",
-                "stream": "ext://sys.stdout",
-            },
-            "file": {
-                "class": "logging.FileHandler",
-                "level": "INFO",
-                "formatter": "json",
-                "filename": "app.log",
-            },
-        },
-        "loggers": {
-            "": {"level": "INFO", "handlers": ["console", "file"]}  # root logger
-        },
-    }
+    """設置結構化日誌 (JSON，經由有界佇列非同步寫出，見 src.logging_config)"""
+    from src.logging_config import configure_logging
 
-    logging.config.dictConfig(logging_config)
+    configure_logging()
     app.logger.info("Structured logging configured")
 
 
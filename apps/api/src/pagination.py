@@ -0,0 +1,54 @@
+"""
+鍵集分頁 - 以 (排序值, id) 定位下一頁，深頁與首頁成本相同
+"""
+
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+
+def keyset_page(model, query, sort="id", after=None, limit=50):
+    """
+    以鍵集分頁取得一頁資料
+
+    sort 為排序欄位，前綴 "-" 表示遞減；after 為上一頁最後一筆的
+    (排序值, id)。回傳 (資料列表, 是否還有下一頁)。
+    """
+    descending = sort.startswith("-")
+    column = getattr(model, sort.lstrip("-"))
+
+    if after is not None:
+        value, last_id = after
+        if descending:
+            query = query.filter(
+                or_(column < value, and_(column == value, model.id < last_id))
+            )
+        else:
+            query = query.filter(
+                or_(column > value, and_(column == value, model.id > last_id))
+            )
+
+    if descending:
+        query = query.order_by(column.desc(), model.id.desc())
+    else:
+        query = query.order_by(column.asc(), model.id.asc())
+
+    items = query.limit(limit + 1).all()
+    return items[:limit], len(items) > limit
+
+
+def encode_cursor(item, sort):
+    """將一頁最後一筆的 (排序值, id) 編碼為不透明游標"""
+    value = getattr(item, sort.lstrip("-"))
+    raw = json.dumps([value, item.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """解碼游標，格式錯誤時拋出 ValueError"""
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("無效的游標")
+    return value, int(last_id)
@@ -0,0 +1,309 @@
+"""
+SQL 查詢檢測 - 以 SQLAlchemy 引擎事件統計每個請求的查詢數、資料庫耗時與最慢的語句，
+記錄超過門檻的慢查詢，並偵測同一請求內重複執行相同形狀語句的 N+1 查詢
+
+語句形狀會把字面值與佔位符統一為 ?、IN 清單收斂為 (?...)；參數只記錄型別
+(例如 (int, str))，不記錄值，因此日誌與指標中不會出現個人資料或密碼雜湊。
+"""
+
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.request_timing import current_timer
+
+logger = logging.getLogger(__name__)
+
+# 超過此毫秒數的語句記錄為慢查詢
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+# 同一請求中相同形狀的語句執行達此次數即視為 N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+# 每個請求保留的最慢語句數
+SLOWEST_STATEMENTS = 5
+# 查詢報告中最多保留的語句形狀數
+MAX_REPORTED_STATEMENTS = 100
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PYFORMAT_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(statement: str) -> str:
+    """去除字面值與參數數量差異後的語句，用於比對與彙總"""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _PYFORMAT_PLACEHOLDER.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def _type_name(value) -> str:
+    return "null" if value is None else type(value).__name__
+
+
+def parameter_shape(parameters, executemany: bool = False) -> str:
+    """綁定參數的型別，例如 (int, str)；executemany 時為 筆數×型別"""
+    if executemany and parameters:
+        return f"{len(parameters)}×{parameter_shape(parameters[0])}"
+    if isinstance(parameters, dict):
+        return (
+            "{"
+            + ", ".join(
+                f"{name}: {_type_name(value)}" for name, value in parameters.items()
+            )
+            + "}"
+        )
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(_type_name(value) for value in parameters) + ")"
+    return "()"
+
+
+class RequestQueryStats:
+    """一個請求的查詢統計 (只在處理該請求的執行緒中使用，不需加鎖)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes: Dict[str, int] = {}
+        # 最小堆積 (耗時, 序號, 形狀, 參數型別)，只保留最慢的幾筆
+        self._slowest: List[tuple] = []
+
+    def record(self, shape: str, parameters, executemany: bool, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+        if len(self._slowest) >= SLOWEST_STATEMENTS:
+            if elapsed_ms <= self._slowest[0][0]:
+                return
+            heapq.heappop(self._slowest)
+        heapq.heappush(
+            self._slowest,
+            (elapsed_ms, self.count, shape, parameter_shape(parameters, executemany)),
+        )
+
+    def slowest(self) -> List[Dict]:
+        """最慢的語句，由慢到快"""
+        return [
+            {
+                "statement": shape,
+                "parameters": parameters,
+                "duration_ms": round(elapsed_ms, 2),
+            }
+            for elapsed_ms, _, shape, parameters in sorted(self._slowest, reverse=True)
+        ]
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """執行次數達門檻的語句形狀 (疑似 N+1)，依次數由多到少"""
+        return sorted(
+            (
+                (shape, count)
+                for shape, count in self.shapes.items()
+                if count >= threshold
+            ),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+
+    def describe(self, n_plus_one: int = 0) -> str:
+        """Server-Timing 中 db 階段的說明 (不含逗號，避免與標頭的項目分隔混淆)"""
+        if n_plus_one:
+            return f"Database ({self.count} queries with {n_plus_one} N+1)"
+        return f"Database ({self.count} queries)"
+
+
+class QueryReport:
+    """跨請求彙總的慢查詢與 N+1 語句 (依形狀合併，數量有上限)"""
+
+    def __init__(self, max_statements: int = MAX_REPORTED_STATEMENTS):
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._slow: Dict[str, Dict] = {}
+        self._n_plus_one: Dict[Tuple[Optional[str], str], Dict] = {}
+
+    def _entry(self, entries: Dict, key, rank: float, factory) -> Optional[Dict]:
+        entry = entries.get(key)
+        if entry is not None:
+            return entry
+        if len(entries) >= self.max_statements:
+            # 已滿時以新項目取代排名最低的一筆，否則忽略
+            lowest = min(entries, key=lambda existing: entries[existing]["rank"])
+            if entries[lowest]["rank"] >= rank:
+                return None
+            del entries[lowest]
+        entry = entries[key] = factory()
+        return entry
+
+    def record_slow(
+        self,
+        shape: str,
+        parameters: str,
+        elapsed_ms: float,
+        endpoint: Optional[str],
+    ):
+        with self._lock:
+            entry = self._entry(
+                self._slow,
+                shape,
+                elapsed_ms,
+                lambda: {"rank": 0.0, "count": 0, "total_ms": 0.0},
+            )
+            if entry is None:
+                return
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["rank"] = max(entry["rank"], elapsed_ms)
+            entry["parameters"] = parameters
+            entry["endpoint"] = endpoint
+
+    def record_n_plus_one(self, endpoint: Optional[str], shape: str, repeats: int):
+        with self._lock:
+            entry = self._entry(
+                self._n_plus_one,
+                (endpoint, shape),
+                repeats,
+                lambda: {"rank": 0, "requests": 0},
+            )
+            if entry is None:
+                return
+            entry["requests"] += 1
+            entry["rank"] = max(entry["rank"], repeats)
+
+    def snapshot(self) -> Dict:
+        """慢查詢依最大耗時、N+1 依最大重複次數由高到低排序"""
+        with self._lock:
+            slow = [
+                {
+                    "statement": shape,
+                    "parameters": entry["parameters"],
+                    "count": entry["count"],
+                    "max_ms": round(entry["rank"], 2),
+                    "avg_ms": round(entry["total_ms"] / entry["count"], 2),
+                    "last_endpoint": entry["endpoint"],
+                }
+                for shape, entry in self._slow.items()
+            ]
+            n_plus_one = [
+                {
+                    "endpoint": endpoint,
+                    "statement": shape,
+                    "requests": entry["requests"],
+                    "max_repeats": entry["rank"],
+                }
+                for (endpoint, shape), entry in self._n_plus_one.items()
+            ]
+        slow.sort(key=lambda row: row["max_ms"], reverse=True)
+        n_plus_one.sort(key=lambda row: row["max_repeats"], reverse=True)
+        return {
+            "slow_query_threshold_ms": SLOW_QUERY_MS,
+            "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+            "slow_queries": slow,
+            "n_plus_one": n_plus_one,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._slow.clear()
+            self._n_plus_one.clear()
+
+
+query_report = QueryReport()
+
+
+def _endpoint_rule() -> Optional[str]:
+    return request.url_rule.rule if request.url_rule else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+    shape = statement_shape(statement)
+    timer = current_timer()
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        endpoint = _endpoint_rule() if timer is not None else None
+        parameters_shape = parameter_shape(parameters, executemany)
+        logger.warning(
+            f"Slow query ({elapsed_ms:.1f}ms): {shape}",
+            extra={
+                "duration_ms": round(elapsed_ms, 2),
+                "statement": shape,
+                "parameters": parameters_shape,
+                "endpoint": endpoint,
+            },
+        )
+        query_report.record_slow(shape, parameters_shape, elapsed_ms, endpoint)
+
+    if timer is None:
+        return
+    timer.add("db", elapsed_ms)
+    stats = g.get("query_stats")
+    if stats is None:
+        stats = g.query_stats = RequestQueryStats()
+    stats.record(shape, parameters, executemany, elapsed_ms)
+
+
+def _handle_error(exception_context):
+    # 執行失敗時不會觸發 after_cursor_execute，在此丟棄開始時間
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def finish_request_queries() -> Tuple[Optional[RequestQueryStats], int]:
+    """請求結束時檢查 N+1 並回傳 (本請求的查詢統計, 疑似 N+1 的語句形狀數)"""
+    stats = g.get("query_stats")
+    if stats is None:
+        return None, 0
+
+    endpoint = _endpoint_rule()
+    # 每個請求都會執行，只在 DEBUG 時記錄 (可用 LOG_SAMPLE_RATES 取樣)
+    logger.debug(
+        f"{stats.count} queries in {stats.total_ms:.1f}ms",
+        extra={
+            "endpoint": endpoint,
+            "query_count": stats.count,
+            "db_ms": round(stats.total_ms, 2),
+            "slowest_queries": stats.slowest(),
+        },
+    )
+
+    repeated = stats.repeated(N_PLUS_ONE_THRESHOLD)
+    if repeated:
+        for shape, count in repeated:
+            query_report.record_n_plus_one(endpoint, shape, count)
+        logger.warning(
+            f"Possible N+1 queries in {request.method} {endpoint}: "
+            + "; ".join(f"{count}× {shape}" for shape, count in repeated),
+            extra={
+                "endpoint": endpoint,
+                "query_count": stats.count,
+                "db_ms": round(stats.total_ms, 2),
+                "slowest_queries": stats.slowest(),
+            },
+        )
+    return stats, len(repeated)
+
+
+def init_query_instrumentation():
+    """監聽所有 Engine 的語句執行 (只需註冊一次)"""
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
@@ -0,0 +1,113 @@
+"""
+請求階段計時 - 記錄每個請求在 JWT 解碼、黑名單檢查、載入使用者、路由函式、
+資料庫、稽核寫入與序列化各階段的耗時，由監控中介層輸出為 Server-Timing 標頭並送入指標收集器
+
+階段以堆疊計時：進入巢狀階段時暫停外層階段，因此 auth / blacklist / principal /
+view / audit / serialize 互不重疊；db 由 src.query_instrumentation 的引擎事件累計，
+與其他階段重疊 (例如 principal 階段中的查詢同時計入 db)。
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from flask import g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+# 階段名稱 -> Server-Timing 說明
+PHASES = {
+    "auth": "JWT decode",
+    "blacklist": "Token blacklist check",
+    "principal": "User load",
+    "view": "View function",
+    "db": "Database",
+    "audit": "Audit log write",
+    "serialize": "JSON serialization",
+}
+
+
+class RequestTimer:
+    """一個請求的階段計時 (只在處理該請求的執行緒中使用，不需加鎖)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._stack: List[list] = []
+
+    def _charge(self, frame: list, now: float):
+        name, since = frame
+        self.phases[name] = self.phases.get(name, 0.0) + (now - since) * 1000
+
+    def enter(self, name: str):
+        now = time.perf_counter()
+        if self._stack:
+            self._charge(self._stack[-1], now)
+        self._stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        self._charge(self._stack.pop(), now)
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def add(self, name: str, elapsed_ms: float):
+        """累加不參與堆疊的階段 (例如 db)"""
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(
+        self, total_ms: float, descriptions: Optional[Dict[str, str]] = None
+    ) -> str:
+        """Server-Timing 標頭值，依 PHASES 的順序列出本請求經過的階段 (descriptions 可覆寫說明)"""
+        descriptions = {**PHASES, **(descriptions or {})}
+        entries = [
+            f'{name};dur={self.phases[name]:.2f};desc="{descriptions[name]}"'
+            for name in PHASES
+            if name in self.phases
+        ]
+        entries.append(f"total;dur={total_ms:.2f}")
+        return ", ".join(entries)
+
+
+def current_timer():
+    """目前請求的計時器，不在請求中 (背景執行緒、排程工作) 時回傳 None"""
+    if not has_request_context():
+        return None
+    return g.get("request_timer")
+
+
+@contextmanager
+def phase(name: str):
+    """將區塊的耗時計入目前請求的指定階段"""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    timer.enter(name)
+    try:
+        yield
+    finally:
+        timer.exit()
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify 與回傳 dict 時的序列化計入 serialize 階段"""
+
+    def response(self, *args, **kwargs):
+        with phase("serialize"):
+            return super().response(*args, **kwargs)
+
+
+def init_request_timing(app):
+    """啟用路由函式與序列化的計時 (計時器由監控中介層在每個請求開始時建立)"""
+    app.json = TimedJSONProvider(app)
+
+    dispatch_request = app.dispatch_request
+
+    def timed_dispatch_request(*args, **kwargs):
+        with phase("view"):
+            return dispatch_request(*args, **kwargs)
+
+    app.dispatch_request = timed_dispatch_request
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 
 from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy.orm import joinedload
 
 from src.database import db
 from src.decorators import token_required
@@ -33,8 +34,8 @@ def get_audit_logs(current_user):
         start_date = request.args.get("start_date")
         end_date = request.args.get("end_date")
 
-        # 構建查詢
-        query = AuditLog.query
+        # 構建查詢 (一併載入操作者，避免 to_dict 逐筆查詢 user)
+        query = AuditLog.query.options(joinedload(AuditLog.user))
 
         if action:
             query = query.filter(AuditLog.action == action)
@@ -250,8 +251,8 @@ def export_audit_logs(current_user):
         end_date = data.get("end_date")
         format_type = data.get("format", "json")  # json, csv
 
-        # 構建查詢
-        query = AuditLog.query
+        # 構建查詢 (一併載入操作者，避免 to_dict 逐筆查詢 user)
+        query = AuditLog.query.options(joinedload(AuditLog.user))
 
         if start_date:
             start_dt = datetime.fromisoformat(start_date.replace("Z", "+00:00"))
@@ -261,9 +262,7 @@ def export_audit_logs(current_user):
             end_dt = datetime.fromisoformat(end_date.replace("Z", "+00:00"))
             query = query.filter(AuditLog.created_at <= end_dt)
 
-        logs = (
-            query.order_by(AuditLog.created_at.desc()).limit(10000).all()
-        )  # 限制導出數量
+        logs = query.order_by(AuditLog.created_at.desc()).limit(10000).all()  # 限制導出數量
 
         # 記錄導出操作
         client_info = get_client_info(request)
@@ -9,6 +9,7 @@ from src.audit_log import AuditActions, audit_log
 from src.decorators import token_required
 from src.models.audit_log import AuditLog
 from src.models.user import User, db
+from src.services.event_bus import event_bus
 
 auth_bp = Blueprint("auth", __name__)
 # JWT 配置
@@ -65,6 +66,14 @@ def register():
         db.session.add(user)
         db.session.commit()
 
+        event_bus.publish(
+            "user.created",
+            {"user_id": user.id, "username": user.username, "role": user.role},
+            tenant_id=user.tenant_id,
+            triggered_by_user_id=user.id,
+            source="auth.register",
+        )
+
         return jsonify({"message": "用戶註冊成功", "user": user.to_dict()}), 201
 
     except Exception as e:
@@ -112,6 +121,18 @@ def login():
                 },
                 status="failed",
             )
+            event_bus.publish(
+                "security.login_failed",
+                {
+                    "user_id": user.id if user else None,
+                    "reason": "invalid_credentials",
+                    "ip_address": request.environ.get(
+                        "HTTP_X_FORWARDED_FOR", request.remote_addr
+                    ),
+                },
+                tenant_id=user.tenant_id if user else None,
+                source="auth.login",
+            )
             return jsonify({"message": "郵箱/用戶名或密碼錯誤"}), 401
 
         if not user.is_active:
@@ -168,6 +189,13 @@ def login():
                 "username": user.username,
             },
         )
+        event_bus.publish(
+            "user.login",
+            {"user_id": user.id, "username": user.username},
+            tenant_id=user.tenant_id,
+            triggered_by_user_id=user.id,
+            source="auth.login",
+        )
 
         return jsonify(response_data), 200
 
@@ -6,6 +6,7 @@ from flask import Blueprint, current_app, jsonify, request
 from src.database import db
 from src.decorators import token_required
 from src.models.jwt_blacklist import JWTBlacklist
+from src.services.event_bus import event_bus
 
 jwt_blacklist_bp = Blueprint("jwt_blacklist", __name__)
 
@@ -55,6 +56,13 @@ def logout(current_user):
             JWTBlacklist.add_to_blacklist(
                 jti=jti, user_id=current_user.id, expires_at=expires_at, reason="logout"
             )
+            event_bus.publish(
+                "user.logout",
+                {"user_id": current_user.id, "username": current_user.username},
+                tenant_id=current_user.tenant_id,
+                triggered_by_user_id=current_user.id,
+                source="auth.logout",
+            )
 
             return jsonify({"message": "登出成功"}), 200
 
@@ -1,31 +1,164 @@
-import json
+import os
+import re
 import secrets
 from datetime import datetime, timedelta
+from functools import partial
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import func, or_
+from sqlalchemy.orm import load_only
 
 from src.audit_log import audit_log
 from src.database import db
-from src.models.tenant import Tenant, TenantInvitation
+from src.models.tenant import (
+    Tenant,
+    TenantApiUsage,
+    TenantInvitation,
+    TenantStorageUsage,
+)
 from src.models.user import User
+from src.pagination import decode_cursor, encode_cursor, keyset_page
+from src.services.api_usage import api_usage_meter
+from src.services.email_outbox import email_outbox
+from src.services.event_bus import event_bus
+from src.services.tenant_resolver import tenant_resolver
 
 tenant_bp = Blueprint("tenant", __name__)
 
+# 租戶列表可用的排序欄位，前綴 "-" 表示遞減 (id 即建立順序)
+TENANT_SORT_FIELDS = ["id", "name", "member_count"]
+
+# 成員目錄可用的排序欄位與可選擇回傳的欄位
+MEMBER_SORT_FIELDS = ["id", "username", "email"]
+MEMBER_FIELDS = ["id", "username", "email", "tenant_role", "is_active", "created_at"]
+TENANT_ROLES = ["owner", "admin", "member"]
+
+# 邀請有效天數、批次邀請的上限與每次集合查詢的地址數
+INVITATION_TTL_DAYS = 7
+BULK_INVITE_MAX = 5000
+BULK_QUERY_CHUNK = 500
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _parse_member_filters(args):
+    """解析成員目錄篩選條件，回傳 (篩選條件列表, 錯誤訊息)"""
+    filters = []
+
+    roles = [role for role in args.get("role", "").split(",") if role]
+    invalid = [role for role in roles if role not in TENANT_ROLES]
+    if invalid:
+        return None, f"無效的角色: {', '.join(invalid)}"
+    if roles:
+        filters.append(User.tenant_role.in_(roles))
+
+    if args.get("is_active"):
+        if args["is_active"] not in ("true", "false"):
+            return None, "is_active 必須是 true 或 false"
+        filters.append(User.is_active == (args["is_active"] == "true"))
+
+    search = args.get("q", "").strip().lower()
+    if search:
+        match = args.get("match", "prefix")
+        if match not in ("prefix", "contains"):
+            return None, "match 必須是 prefix 或 contains"
+        # PostgreSQL 上分別由遷移建立的 lower() 前綴索引與 trigram 索引加速
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"{escaped}%" if match == "prefix" else f"%{escaped}%"
+        filters.append(
+            or_(
+                func.lower(User.username).like(pattern, escape="\\"),
+                func.lower(User.email).like(pattern, escape="\\"),
+            )
+        )
+
+    return filters, None
+
+
+def _parse_tenant_filters(args):
+    """解析租戶列表篩選條件，回傳 (篩選條件列表, 錯誤訊息)"""
+    filters = []
+
+    if args.get("plan"):
+        filters.append(Tenant.plan == args["plan"])
+
+    if args.get("is_active"):
+        if args["is_active"] not in ("true", "false"):
+            return None, "is_active 必須是 true 或 false"
+        filters.append(Tenant.is_active == (args["is_active"] == "true"))
+
+    expiry = {}
+    for field in ["trial_expires_before", "trial_expires_after"]:
+        if args.get(field):
+            try:
+                expiry[field] = datetime.fromisoformat(args[field])
+            except ValueError:
+                return None, f"{field} 必須是 ISO 8601 時間格式"
+    if "trial_expires_before" in expiry:
+        filters.append(Tenant.trial_ends_at < expiry["trial_expires_before"])
+    if "trial_expires_after" in expiry:
+        filters.append(Tenant.trial_ends_at >= expiry["trial_expires_after"])
+
+    return filters, None
+
 
 @tenant_bp.route("/tenants", methods=["GET"])
 @jwt_required()
 @audit_log(action="list_tenants", resource_type="tenant")
 def list_tenants():
-    """列出所有租戶 (僅限系統管理員)"""
+    """以鍵集分頁列出租戶 (僅限系統管理員)，可依方案、狀態與試用到期篩選"""
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
 
     if not user or not user.is_admin():
         return jsonify({"message": "權限不足"}), 403
 
-    tenants = Tenant.query.all()
-    return jsonify({"tenants": [tenant.to_dict() for tenant in tenants]}), 200
+    filters, error = _parse_tenant_filters(request.args)
+    if error:
+        return jsonify({"message": error}), 400
+
+    sort = request.args.get("sort", "id")
+    if sort.lstrip("-") not in TENANT_SORT_FIELDS:
+        return jsonify({"message": f"無效的排序欄位: {sort}"}), 400
+
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 100)
+    except ValueError:
+        return jsonify({"message": "limit 必須是整數"}), 400
+
+    try:
+        after = (
+            decode_cursor(request.args["cursor"])
+            if request.args.get("cursor")
+            else None
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    # 成員數量與使用量都來自 tenants 表本身的欄位，一頁只需一次查詢
+    tenants, has_more = Tenant.keyset_page(
+        Tenant.query.filter(*filters), sort=sort, after=after, limit=limit
+    )
+
+    return (
+        jsonify(
+            {
+                "tenants": [
+                    {**tenant.to_dict(), "usage": tenant.get_usage_stats()}
+                    for tenant in tenants
+                ],
+                "pagination": {
+                    "limit": limit,
+                    "sort": sort,
+                    "has_more": has_more,
+                    "next_cursor": (
+                        encode_cursor(tenants[-1], sort) if has_more else None
+                    ),
+                },
+            }
+        ),
+        200,
+    )
 
 
 @tenant_bp.route("/tenants", methods=["POST"])
@@ -77,6 +210,16 @@ def create_tenant():
         user.tenant_role = "owner"
 
         db.session.commit()
+        # 清除新 slug 與網域可能存在的負向快取
+        tenant_resolver.invalidate(slug=tenant.slug, domain=tenant.domain)
+
+        event_bus.publish(
+            "tenant.created",
+            {"tenant_id": tenant.id, "slug": tenant.slug, "plan": tenant.plan},
+            tenant_id=tenant.id,
+            triggered_by_user_id=user.id,
+            source="tenant.create",
+        )
 
         return jsonify({"message": "租戶建立成功", "tenant": tenant.to_dict()}), 201
 
@@ -106,10 +249,81 @@ def get_tenant(tenant_id):
 
     tenant_data = tenant.to_dict()
     tenant_data["usage_stats"] = tenant.get_usage_stats()
+    tenant_data["storage_usage"] = [
+        usage.to_dict()
+        for usage in TenantStorageUsage.query.filter_by(tenant_id=tenant.id)
+    ]
 
     return jsonify({"tenant": tenant_data}), 200
 
 
+@tenant_bp.route("/tenants/<int:tenant_id>/api-usage", methods=["GET"])
+@jwt_required()
+def get_tenant_api_usage(tenant_id):
+    """取得租戶的 API 用量 (依路由與狀態類別彙整) 與每日配額"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    tenant = Tenant.query.get(tenant_id)
+    if not tenant:
+        return jsonify({"message": "租戶不存在"}), 404
+
+    # 檢查權限：系統管理員或租戶成員
+    if not (user.is_admin() or user.tenant_id == tenant_id):
+        return jsonify({"message": "權限不足"}), 403
+
+    try:
+        hours = min(max(int(request.args.get("hours", 24)), 1), 24 * 31)
+    except ValueError:
+        return jsonify({"message": "hours 必須是整數"}), 400
+
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(
+        hours=hours - 1
+    )
+    rows = (
+        db.session.query(
+            TenantApiUsage.route_class,
+            TenantApiUsage.status_class,
+            db.func.sum(TenantApiUsage.request_count),
+        )
+        .filter(
+            TenantApiUsage.tenant_id == tenant_id,
+            TenantApiUsage.bucket_start >= since,
+        )
+        .group_by(TenantApiUsage.route_class, TenantApiUsage.status_class)
+        .all()
+    )
+
+    quota = api_usage_meter.check_quota(tenant.id, tenant.plan)
+    return (
+        jsonify(
+            {
+                "tenant_id": tenant.id,
+                "plan": tenant.plan,
+                "since": since.isoformat(),
+                "total_requests": sum(int(count) for _, _, count in rows),
+                "by_route": [
+                    {
+                        "route_class": route_class,
+                        "status_class": status_class,
+                        "requests": int(count),
+                    }
+                    for route_class, status_class, count in rows
+                ],
+                "daily_quota": {
+                    "limit": quota["limit"],
+                    "used": quota["used"],
+                    "remaining": quota["remaining"],
+                },
+            }
+        ),
+        200,
+    )
+
+
 @tenant_bp.route("/tenants/<int:tenant_id>", methods=["PUT"])
 @jwt_required()
 @audit_log(action="update_tenant", resource_type="tenant")
@@ -133,6 +347,8 @@ def update_tenant(tenant_id):
         return jsonify({"message": "權限不足"}), 403
 
     data = request.get_json()
+    previous_domain = tenant.domain
+    previous_is_active = tenant.is_active
 
     try:
         # 更新允許的欄位
@@ -146,6 +362,8 @@ def update_tenant(tenant_id):
                 return jsonify({"message": "此網域已被使用"}), 400
             tenant.domain = data["domain"]
 
+        previous_plan = tenant.plan
+
         # 只有系統管理員可以更新這些欄位
         if user.is_admin():
             if "plan" in data:
@@ -160,6 +378,37 @@ def update_tenant(tenant_id):
         tenant.updated_at = datetime.utcnow()
         db.session.commit()
 
+        # 租戶解析快取含網域、啟用狀態與方案，變更時失效新舊網域與 slug
+        if (
+            tenant.domain != previous_domain
+            or tenant.is_active != previous_is_active
+            or tenant.plan != previous_plan
+        ):
+            tenant_resolver.invalidate(
+                slug=tenant.slug, domain=previous_domain, tenant_id=tenant.id
+            )
+            tenant_resolver.invalidate(domain=tenant.domain)
+
+        event_bus.publish(
+            "tenant.updated",
+            {"tenant_id": tenant.id, "fields": sorted(data.keys())},
+            tenant_id=tenant.id,
+            triggered_by_user_id=user.id,
+            source="tenant.update",
+        )
+        if tenant.plan != previous_plan:
+            event_bus.publish(
+                "tenant.plan_changed",
+                {
+                    "tenant_id": tenant.id,
+                    "previous_plan": previous_plan,
+                    "plan": tenant.plan,
+                },
+                tenant_id=tenant.id,
+                triggered_by_user_id=user.id,
+                source="tenant.update",
+            )
+
         return jsonify({"message": "租戶更新成功", "tenant": tenant.to_dict()}), 200
 
     except Exception as e:
@@ -221,13 +470,14 @@ def invite_user_to_tenant(tenant_id):
             role=role,
             token=secrets.token_urlsafe(32),
             invited_by_user_id=current_user_id,
-            expires_at=datetime.utcnow() + timedelta(days=7),
+            expires_at=datetime.utcnow() + timedelta(days=INVITATION_TTL_DAYS),
+            email_queued_at=datetime.utcnow(),
         )
 
         db.session.add(invitation)
         db.session.commit()
 
-        # TODO: 發送邀請郵件
+        _queue_invitation_emails(tenant, [(invitation.email, invitation.token)])
 
         return (
             jsonify({"message": "邀請已發送", "invitation": invitation.to_dict()}),
@@ -239,6 +489,184 @@ def invite_user_to_tenant(tenant_id):
         return jsonify({"message": f"發送邀請失敗: {str(e)}"}), 500
 
 
+@tenant_bp.route("/tenants/<int:tenant_id>/invitations/bulk", methods=["POST"])
+@jwt_required()
+@audit_log(action="bulk_invite_users", resource_type="tenant")
+def bulk_invite_users_to_tenant(tenant_id):
+    """一次邀請多個電子郵件加入租戶，略過已是成員、已有有效邀請或格式錯誤的地址"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    tenant = Tenant.query.get(tenant_id)
+    if not tenant:
+        return jsonify({"message": "租戶不存在"}), 404
+
+    # 檢查權限：租戶擁有者或管理員
+    if not (user.tenant_id == tenant_id and user.tenant_role in ["owner", "admin"]):
+        return jsonify({"message": "權限不足"}), 403
+
+    data = request.get_json() or {}
+    emails = data.get("emails")
+    role = data.get("role", "member")
+
+    if not isinstance(emails, list) or not emails:
+        return jsonify({"message": "emails 必須是非空的陣列"}), 400
+    if len(emails) > BULK_INVITE_MAX:
+        return jsonify({"message": f"一次最多邀請 {BULK_INVITE_MAX} 個電子郵件"}), 400
+    if role not in ["member", "admin"]:
+        return jsonify({"message": "無效的角色"}), 400
+
+    # 正規化並去除重複，保留原始順序
+    candidates, invalid = {}, []
+    for email in emails:
+        normalized = email.strip().lower() if isinstance(email, str) else ""
+        if not EMAIL_PATTERN.match(normalized):
+            invalid.append(email)
+        else:
+            candidates.setdefault(normalized, None)
+
+    # 以集合查詢找出已是成員與已有有效邀請的地址
+    now = datetime.utcnow()
+    members, invited = set(), set()
+    addresses = list(candidates)
+    for start in range(0, len(addresses), BULK_QUERY_CHUNK):
+        chunk = addresses[start : start + BULK_QUERY_CHUNK]
+        members.update(
+            email
+            for (email,) in db.session.query(func.lower(User.email)).filter(
+                User.tenant_id == tenant_id, func.lower(User.email).in_(chunk)
+            )
+        )
+        invited.update(
+            email
+            for (email,) in db.session.query(func.lower(TenantInvitation.email)).filter(
+                TenantInvitation.tenant_id == tenant_id,
+                func.lower(TenantInvitation.email).in_(chunk),
+                TenantInvitation.is_accepted == False,
+                TenantInvitation.is_expired == False,
+                TenantInvitation.expires_at > now,
+            )
+        )
+
+    to_invite = [
+        email for email in addresses if email not in members and email not in invited
+    ]
+
+    # 已有成員加上這次的邀請不可超過方案的使用者上限
+    available = max(tenant.max_users - (tenant.member_count or 0), 0)
+    if len(to_invite) > available:
+        return (
+            jsonify(
+                {
+                    "message": "已達到使用者數量上限",
+                    "requested": len(to_invite),
+                    "available": available,
+                }
+            ),
+            400,
+        )
+
+    rows = [
+        {
+            "tenant_id": tenant_id,
+            "email": email,
+            "role": role,
+            "token": secrets.token_urlsafe(32),
+            "invited_by_user_id": user.id,
+            "expires_at": now + timedelta(days=INVITATION_TTL_DAYS),
+            "is_accepted": False,
+            "is_expired": False,
+            "email_queued_at": now,
+        }
+        for email in to_invite
+    ]
+
+    try:
+        if rows:
+            # 單一多列 INSERT，不逐筆建立 ORM 物件
+            db.session.execute(TenantInvitation.__table__.insert(), rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": f"發送邀請失敗: {str(e)}"}), 500
+
+    queued = _queue_invitation_emails(
+        tenant, [(row["email"], row["token"]) for row in rows]
+    )
+
+    return (
+        jsonify(
+            {
+                "message": "邀請已發送",
+                "invited": len(rows),
+                "emails_queued": queued,
+                "skipped": {
+                    "already_member": sorted(members),
+                    "already_invited": sorted(invited),
+                    "invalid": invalid,
+                    "duplicates": len(emails) - len(invalid) - len(candidates),
+                },
+            }
+        ),
+        201,
+    )
+
+
+def _queue_invitation_emails(tenant, invitations):
+    """將邀請郵件放入非同步發送佇列，回傳放入的數量
+
+    寄出後記錄於邀請 (email_sent_at)，無法寄出時記錄 email_failed_at；未寄出
+    (佇列已滿或程序結束時遺失) 的郵件在佇列租約逾期後由 resend_unsent_invitation_emails 重新放入。
+    """
+    base_url = os.environ.get("NEXT_PUBLIC_APP_URL", "https://morningai.me")
+    app = current_app._get_current_object()
+    return email_outbox.enqueue_many(
+        (
+            email,
+            f"邀請您加入 {tenant.name}",
+            f"您已受邀加入 {tenant.name}。\n\n"
+            f"請登入後開啟以下連結接受邀請 "
+            f"(有效期限 {INVITATION_TTL_DAYS} 天)：\n"
+            f"{base_url}/invitations/{token}",
+            partial(_mark_invitation_email_sent, app, token),
+            partial(_mark_invitation_email_failed, app, token),
+        )
+        for email, token in invitations
+    )
+
+
+def _mark_invitation_email_sent(app, token):
+    # 在郵件發送執行緒中呼叫
+    with app.app_context():
+        TenantInvitation.mark_email_sent(token)
+
+
+def _mark_invitation_email_failed(app, token):
+    # 在郵件發送執行緒中呼叫
+    with app.app_context():
+        TenantInvitation.mark_email_failed(token)
+
+
+def resend_unsent_invitation_emails(lease_seconds=600, limit=500):
+    """重新放入佇列租約已逾期仍未寄出的邀請郵件，回傳放入的數量"""
+    by_tenant = {}
+    for invitation in TenantInvitation.claim_unsent_emails(
+        lease_seconds=lease_seconds, limit=limit
+    ):
+        by_tenant.setdefault(invitation.tenant_id, []).append(invitation)
+
+    return sum(
+        _queue_invitation_emails(
+            invitations[0].tenant,
+            [(invitation.email, invitation.token) for invitation in invitations],
+        )
+        for invitations in by_tenant.values()
+    )
+
+
 @tenant_bp.route("/tenants/invitations/<token>/accept", methods=["POST"])
 @jwt_required()
 @audit_log(action="accept_invitation", resource_type="tenant")
@@ -258,7 +686,7 @@ def accept_invitation(token):
         return jsonify({"message": "邀請已過期或無效"}), 400
 
     # 檢查邀請的電子郵件是否與當前使用者匹配
-    if invitation.email != user.email:
+    if invitation.email.lower() != user.email.lower():
         return jsonify({"message": "邀請電子郵件與當前使用者不符"}), 400
 
     # 檢查使用者是否已屬於其他租戶
@@ -275,6 +703,19 @@ def accept_invitation(token):
 
         db.session.commit()
 
+        event_bus.publish(
+            "tenant.member_added",
+            {
+                "tenant_id": invitation.tenant_id,
+                "user_id": user.id,
+                "username": user.username,
+                "tenant_role": user.tenant_role,
+            },
+            tenant_id=invitation.tenant_id,
+            triggered_by_user_id=user.id,
+            source="tenant.accept_invitation",
+        )
+
         return (
             jsonify({"message": "邀請接受成功", "tenant": invitation.tenant.to_dict()}),
             200,
@@ -289,7 +730,7 @@ def accept_invitation(token):
 @jwt_required()
 @audit_log(action="list_members", resource_type="tenant")
 def list_tenant_members(tenant_id):
-    """列出租戶成員"""
+    """以鍵集分頁列出租戶成員，可搜尋使用者名稱與電子郵件、依角色篩選並選擇欄位"""
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
 
@@ -304,30 +745,67 @@ def list_tenant_members(tenant_id):
     if user.tenant_id != tenant_id:
         return jsonify({"message": "權限不足"}), 403
 
-    members = User.query.filter_by(tenant_id=tenant_id).all()
+    filters, error = _parse_member_filters(request.args)
+    if error:
+        return jsonify({"message": error}), 400
+
+    fields = [field for field in request.args.get("fields", "").split(",") if field]
+    invalid = [field for field in fields if field not in MEMBER_FIELDS]
+    if invalid:
+        return jsonify({"message": f"無效的欄位: {', '.join(invalid)}"}), 400
+    fields = fields or MEMBER_FIELDS
+
+    sort = request.args.get("sort", "id")
+    if sort.lstrip("-") not in MEMBER_SORT_FIELDS:
+        return jsonify({"message": f"無效的排序欄位: {sort}"}), 400
+
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 100)
+    except ValueError:
+        return jsonify({"message": "limit 必須是整數"}), 400
+
+    try:
+        after = (
+            decode_cursor(request.args["cursor"])
+            if request.args.get("cursor")
+            else None
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    # 只載入要回傳的欄位與游標需要的欄位
+    columns = set(fields) | {"id", sort.lstrip("-")}
+    query = User.query.filter(User.tenant_id == tenant_id, *filters).options(
+        load_only(*[getattr(User, column) for column in sorted(columns)])
+    )
+    members, has_more = keyset_page(User, query, sort=sort, after=after, limit=limit)
 
     return (
         jsonify(
             {
                 "members": [
-                    {
-                        "id": member.id,
-                        "username": member.username,
-                        "email": member.email,
-                        "tenant_role": member.tenant_role,
-                        "is_active": member.is_active,
-                        "created_at": (
-                            member.created_at.isoformat() if member.created_at else None
-                        ),
-                    }
+                    {field: _member_value(member, field) for field in fields}
                     for member in members
-                ]
+                ],
+                "pagination": {
+                    "limit": limit,
+                    "sort": sort,
+                    "has_more": has_more,
+                    "next_cursor": (
+                        encode_cursor(members[-1], sort) if has_more else None
+                    ),
+                },
             }
         ),
         200,
     )
 
 
+def _member_value(member, field):
+    value = getattr(member, field)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
 @tenant_bp.route("/tenants/<int:tenant_id>/members/<int:user_id>", methods=["PUT"])
 @jwt_required()
 @audit_log(action="update_member", resource_type="tenant")
@@ -357,7 +835,7 @@ def update_tenant_member(tenant_id, user_id):
     data = request.get_json()
     new_role = data.get("tenant_role")
 
-    if new_role not in ["member", "admin", "owner"]:
+    if new_role not in TENANT_ROLES:
         return jsonify({"message": "無效的角色"}), 400
 
     # 不能修改自己的角色
@@ -369,9 +847,23 @@ def update_tenant_member(tenant_id, user_id):
         return jsonify({"message": "只有擁有者可以設定其他擁有者"}), 403
 
     try:
+        previous_role = target_user.tenant_role
         target_user.tenant_role = new_role
         db.session.commit()
 
+        event_bus.publish(
+            "tenant.member_role_changed",
+            {
+                "tenant_id": tenant_id,
+                "user_id": target_user.id,
+                "previous_role": previous_role,
+                "tenant_role": new_role,
+            },
+            tenant_id=tenant_id,
+            triggered_by_user_id=current_user.id,
+            source="tenant.update_member",
+        )
+
         return (
             jsonify(
                 {
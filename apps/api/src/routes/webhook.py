@@ -1,12 +1,25 @@
+import os
 from datetime import datetime
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
 from src.audit_log import audit_log
-from src.database import db
+from src.database import DEFAULT_SHARD, db, tenant_context
+from src.models.tenant import Tenant
 from src.models.user import User
-from src.models.webhook import WEBHOOK_EVENTS, Webhook, WebhookDelivery, WebhookEvent
+from src.models.webhook import (
+    DELIVERY_ERROR_CLASSES,
+    WEBHOOK_EVENTS,
+    Webhook,
+    WebhookDelivery,
+    WebhookEvent,
+    WebhookRedriveJob,
+    WebhookReplayJob,
+)
+from src.services.delivery_scheduler import delivery_scheduler
+from src.services.redrive_runner import redrive_runner
+from src.services.replay_runner import replay_runner
 from src.services.webhook_service import webhook_service
 
 webhook_bp = Blueprint("webhook", __name__)
@@ -90,6 +103,11 @@ def create_webhook():
         # 管理員可以指定租戶 ID 或建立全域 webhook
         tenant_id = data.get("tenant_id")
 
+    if tenant_id:
+        tenant = Tenant.query.get(tenant_id)
+        if tenant and not tenant.has_storage_capacity():
+            return jsonify({"message": "租戶已超過儲存空間配額"}), 403
+
     try:
         webhook = webhook_service.create_webhook(
             tenant_id=tenant_id,
@@ -99,6 +117,10 @@ def create_webhook():
             secret=data.get("secret"),
             max_retries=data.get("max_retries", 3),
             retry_delay=data.get("retry_delay", 60),
+            batch_enabled=bool(data.get("batch_enabled", False)),
+            batch_max_events=data.get("batch_max_events", 100),
+            batch_max_bytes=data.get("batch_max_bytes", 262144),
+            batch_max_wait_ms=data.get("batch_max_wait_ms", 1000),
         )
 
         return (
@@ -112,6 +134,195 @@ def create_webhook():
         return jsonify({"message": f"建立 webhook 失敗: {str(e)}"}), 500
 
 
+@webhook_bp.route("/webhooks/queue-stats", methods=["GET"])
+@jwt_required()
+def get_delivery_queue_stats():
+    """取得各租戶的傳送佇列深度 (僅限系統管理員)"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user or not user.is_admin():
+        return jsonify({"message": "權限不足"}), 403
+
+    return jsonify({"queue_stats": delivery_scheduler.get_queue_stats()}), 200
+
+
+def _parse_dead_letter_filters(data, user):
+    """解析死信篩選條件，回傳 (filters, 錯誤訊息)"""
+    filters = {}
+
+    if data.get("webhook_id"):
+        try:
+            webhook_id = int(data["webhook_id"])
+        except (TypeError, ValueError):
+            return None, "webhook_id 必須是整數"
+        webhook = Webhook.query.get(webhook_id)
+        if not webhook:
+            return None, "Webhook 不存在"
+        if not user.is_admin() and webhook.tenant_id != user.tenant_id:
+            return None, "權限不足"
+        filters["webhook_id"] = webhook_id
+
+    for field in ["since", "until"]:
+        if data.get(field):
+            try:
+                datetime.fromisoformat(data[field])
+            except (TypeError, ValueError):
+                return None, f"{field} 必須是 ISO 8601 時間格式"
+            filters[field] = data[field]
+
+    if data.get("error_class"):
+        if data["error_class"] not in DELIVERY_ERROR_CLASSES:
+            return None, f"無效的失敗原因: {data['error_class']}"
+        filters["error_class"] = data["error_class"]
+
+    return filters, None
+
+
+def _dead_letter_scope(user):
+    """非管理員只能操作自己租戶的死信，回傳 (tenant_id, 是否允許)"""
+    if user.is_admin():
+        return None, True
+    if not user.tenant_id:
+        return None, False
+    return user.tenant_id, True
+
+
+@webhook_bp.route("/webhooks/dead-letters", methods=["GET"])
+@jwt_required()
+@audit_log(action="list_webhook_dead_letters", resource_type="webhook")
+def list_dead_letters():
+    """列出死信 (永久失敗的傳送) 及依失敗原因彙整的統計"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    tenant_id, allowed = _dead_letter_scope(user)
+    if not allowed:
+        return jsonify({"message": "權限不足"}), 403
+
+    filters, error = _parse_dead_letter_filters(request.args, user)
+    if error:
+        return jsonify({"message": error}), 400
+
+    limit = min(int(request.args.get("limit", 50)), 100)
+    summary = webhook_service.get_dead_letter_summary(filters, tenant_id, limit)
+
+    return (
+        jsonify(
+            {
+                "filters": filters,
+                "error_classes": DELIVERY_ERROR_CLASSES,
+                "dead_letters": summary,
+            }
+        ),
+        200,
+    )
+
+
+@webhook_bp.route("/webhooks/dead-letters/redrive", methods=["POST"])
+@jwt_required()
+@audit_log(action="redrive_webhook_dead_letters", resource_type="webhook")
+def redrive_dead_letters():
+    """建立背景重送工作，依篩選條件分批重送死信"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    tenant_id, allowed = _dead_letter_scope(user)
+    if not allowed:
+        return jsonify({"message": "權限不足"}), 403
+
+    data = request.get_json() or {}
+    filters, error = _parse_dead_letter_filters(data, user)
+    if error:
+        return jsonify({"message": error}), 400
+
+    max_rate = int(os.environ.get("WEBHOOK_REDRIVE_MAX_RATE", 500))
+    try:
+        rate_per_second = int(
+            data.get("rate_per_second", os.environ.get("WEBHOOK_REDRIVE_RATE", 50))
+        )
+    except (TypeError, ValueError):
+        return jsonify({"message": "rate_per_second 必須是整數"}), 400
+    if not 1 <= rate_per_second <= max_rate:
+        return jsonify({"message": f"rate_per_second 必須介於 1 到 {max_rate}"}), 400
+
+    try:
+        job = webhook_service.create_redrive_job(
+            filters,
+            tenant_id=tenant_id,
+            created_by_user_id=user.id,
+            rate_per_second=rate_per_second,
+        )
+        redrive_runner.enqueue(job.id)
+
+        return (
+            jsonify({"message": "重送工作已建立", "job": job.to_dict()}),
+            202,
+            {"Location": f"/api/webhooks/redrive-jobs/{job.id}"},
+        )
+
+    except Exception as e:
+        return jsonify({"message": f"建立重送工作失敗: {str(e)}"}), 500
+
+
+def _get_redrive_job_for_user(job_id, user):
+    """取得使用者可存取的重送工作，回傳 (job, 錯誤回應)"""
+    job = WebhookRedriveJob.query.get(job_id)
+    if not job:
+        return None, (jsonify({"message": "重送工作不存在"}), 404)
+    if not user.is_admin() and job.tenant_id != user.tenant_id:
+        return None, (jsonify({"message": "權限不足"}), 403)
+    return job, None
+
+
+@webhook_bp.route("/webhooks/redrive-jobs/<int:job_id>", methods=["GET"])
+@jwt_required()
+def get_redrive_job(job_id):
+    """取得重送工作進度"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    job, error_response = _get_redrive_job_for_user(job_id, user)
+    if error_response:
+        return error_response
+
+    return jsonify({"job": job.to_dict()}), 200
+
+
+@webhook_bp.route("/webhooks/redrive-jobs/<int:job_id>/cancel", methods=["POST"])
+@jwt_required()
+@audit_log(action="cancel_webhook_redrive", resource_type="webhook")
+def cancel_redrive_job(job_id):
+    """取消尚未結束的重送工作"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    job, error_response = _get_redrive_job_for_user(job_id, user)
+    if error_response:
+        return error_response
+
+    if job.is_finished():
+        return jsonify({"message": "重送工作已結束"}), 400
+
+    job.status = "cancelled"
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+    return jsonify({"message": "重送工作已取消", "job": job.to_dict()}), 200
+
+
 @webhook_bp.route("/webhooks/<int:webhook_id>", methods=["GET"])
 @jwt_required()
 @audit_log(action="get_webhook", resource_type="webhook")
@@ -191,9 +402,7 @@ def update_webhook(webhook_id):
             return jsonify({"message": "更新 webhook 失敗"}), 500
 
         return (
-            jsonify(
-                {"message": "Webhook 更新成功", "webhook": updated_webhook.to_dict()}
-            ),
+            jsonify({"message": "Webhook 更新成功", "webhook": updated_webhook.to_dict()}),
             200,
         )
 
@@ -352,30 +561,251 @@ def retry_webhook_delivery(webhook_id, delivery_id):
         return jsonify({"message": "只能重試失敗的傳送"}), 400
 
     try:
-        # 重置傳送狀態並安排重試
-        delivery.status = "retrying"
-        delivery.next_retry_at = datetime.utcnow()
-        delivery.error_message = None
-        db.session.commit()
+        # 交給傳送排程器在背景重送，不在請求中等待目標伺服器回應
+        if delivery.status == "failed":
+            queued = webhook_service.redrive_deliveries([delivery_id])
+        else:
+            queued = webhook_service.dispatch_retries([delivery_id])
 
-        # 立即執行重試
-        success = webhook_service.deliver_webhook_sync(delivery_id)
+        db.session.refresh(delivery)
 
         return (
             jsonify(
                 {
-                    "message": "重試完成",
-                    "success": success,
+                    "message": "已排入重試" if queued else "傳送已在處理中",
+                    "queued": bool(queued),
                     "delivery": delivery.to_dict(),
                 }
             ),
-            200,
+            202,
         )
 
     except Exception as e:
         return jsonify({"message": f"重試失敗: {str(e)}"}), 500
 
 
+def _get_webhook_for_user(webhook_id, user):
+    """取得使用者可存取的 webhook，回傳 (webhook, 錯誤回應)"""
+    webhook = Webhook.query.get(webhook_id)
+    if not webhook:
+        return None, (jsonify({"message": "Webhook 不存在"}), 404)
+    if not user.is_admin() and webhook.tenant_id != user.tenant_id:
+        return None, (jsonify({"message": "權限不足"}), 403)
+    return webhook, None
+
+
+def _recent_events(user, limit, offset):
+    """使用者可見的最近事件 (管理員只看得到共用資料庫中的事件)"""
+    query = WebhookEvent.query
+    newest_first = (WebhookEvent.created_at.desc(), WebhookEvent.id.desc())
+
+    if user.is_admin():
+        return query.order_by(*newest_first).limit(limit).offset(offset).all()
+    # 非管理員只能看到自己租戶的事件
+    if not user.tenant_id:
+        query = query.filter(WebhookEvent.tenant_id == None)
+        return query.order_by(*newest_first).limit(limit).offset(offset).all()
+
+    with tenant_context(user.tenant_id) as shard:
+        if shard in (None, DEFAULT_SHARD):
+            query = query.filter(
+                (WebhookEvent.tenant_id == user.tenant_id)
+                | (WebhookEvent.tenant_id == None)
+            )
+            return query.order_by(*newest_first).limit(limit).offset(offset).all()
+
+        # 租戶事件在專屬分片、全域事件在共用資料庫，各取到該頁為止後合併
+        tenant_events = (
+            query.filter(WebhookEvent.tenant_id == user.tenant_id)
+            .order_by(*newest_first)
+            .limit(offset + limit)
+            .all()
+        )
+    global_events = (
+        WebhookEvent.query.filter(WebhookEvent.tenant_id == None)
+        .order_by(*newest_first)
+        .limit(offset + limit)
+        .all()
+    )
+    events = sorted(
+        tenant_events + global_events,
+        key=lambda event: (event.created_at, event.id),
+        reverse=True,
+    )
+    return events[offset : offset + limit]
+
+
+@webhook_bp.route("/webhooks/<int:webhook_id>/replays", methods=["POST"])
+@jwt_required()
+@audit_log(action="replay_webhook_events", resource_type="webhook")
+def create_webhook_replay(webhook_id):
+    """建立事件重播工作，依時間或事件 id 範圍重新傳送歷史事件"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    webhook, error_response = _get_webhook_for_user(webhook_id, user)
+    if error_response:
+        return error_response
+
+    # 重播會產生新的傳送記錄
+    if webhook.tenant and not webhook.tenant.has_storage_capacity():
+        return jsonify({"message": "租戶已超過儲存空間配額"}), 403
+
+    data = request.get_json() or {}
+
+    try:
+        since = datetime.fromisoformat(data["since"]) if data.get("since") else None
+        until = datetime.fromisoformat(data["until"]) if data.get("until") else None
+    except (TypeError, ValueError):
+        return jsonify({"message": "since/until 必須是 ISO 8601 時間格式"}), 400
+
+    try:
+        from_event_id = (
+            int(data["from_event_id"]) if data.get("from_event_id") else None
+        )
+        to_event_id = int(data["to_event_id"]) if data.get("to_event_id") else None
+        rate_per_second = int(
+            data.get("rate_per_second", os.environ.get("WEBHOOK_REPLAY_RATE", 10))
+        )
+    except (TypeError, ValueError):
+        return (
+            jsonify({"message": "from_event_id/to_event_id/rate_per_second 必須是整數"}),
+            400,
+        )
+
+    if not (since or until or from_event_id or to_event_id):
+        return jsonify({"message": "必須指定時間範圍或事件 id 範圍"}), 400
+
+    max_rate = int(os.environ.get("WEBHOOK_REPLAY_MAX_RATE", 100))
+    if not 1 <= rate_per_second <= max_rate:
+        return jsonify({"message": f"rate_per_second 必須介於 1 到 {max_rate}"}), 400
+
+    # 每個 webhook 同時只能有一個重播，速率限制才能以目標為單位生效；
+    # 心跳逾期的執行中工作 (執行程序已結束) 不算進行中
+    active = WebhookReplayJob.query.filter(
+        WebhookReplayJob.webhook_id == webhook_id,
+        WebhookReplayJob.active(),
+    ).first()
+    if active:
+        return (
+            jsonify({"message": "此 webhook 已有進行中的重播", "job": active.to_dict()}),
+            409,
+        )
+
+    try:
+        job = webhook_service.create_replay_job(
+            webhook,
+            since=since,
+            until=until,
+            from_event_id=from_event_id,
+            to_event_id=to_event_id,
+            rate_per_second=rate_per_second,
+            created_by_user_id=user.id,
+        )
+        replay_runner.enqueue(job.id)
+
+        return (
+            jsonify({"message": "重播工作已建立", "job": job.to_dict()}),
+            202,
+            {"Location": f"/api/webhooks/{webhook_id}/replays/{job.id}"},
+        )
+
+    except Exception as e:
+        return jsonify({"message": f"建立重播工作失敗: {str(e)}"}), 500
+
+
+@webhook_bp.route("/webhooks/<int:webhook_id>/replays", methods=["GET"])
+@jwt_required()
+def list_webhook_replays(webhook_id):
+    """列出 webhook 的重播工作"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    webhook, error_response = _get_webhook_for_user(webhook_id, user)
+    if error_response:
+        return error_response
+
+    jobs = (
+        WebhookReplayJob.query.filter_by(webhook_id=webhook_id)
+        .order_by(WebhookReplayJob.id.desc())
+        .limit(50)
+        .all()
+    )
+
+    return jsonify({"jobs": [job.to_dict() for job in jobs]}), 200
+
+
+@webhook_bp.route("/webhooks/<int:webhook_id>/replays/<int:job_id>", methods=["GET"])
+@jwt_required()
+def get_webhook_replay(webhook_id, job_id):
+    """取得重播工作進度"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    webhook, error_response = _get_webhook_for_user(webhook_id, user)
+    if error_response:
+        return error_response
+
+    job = WebhookReplayJob.query.filter_by(id=job_id, webhook_id=webhook_id).first()
+    if not job:
+        return jsonify({"message": "重播工作不存在"}), 404
+
+    return jsonify({"job": job.to_dict()}), 200
+
+
+@webhook_bp.route(
+    "/webhooks/<int:webhook_id>/replays/<int:job_id>/<any(pause, resume, cancel):action>",
+    methods=["POST"],
+)
+@jwt_required()
+@audit_log(action="update_webhook_replay", resource_type="webhook")
+def update_webhook_replay(webhook_id, job_id, action):
+    """暫停、恢復或取消重播工作"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+
+    if not user:
+        return jsonify({"message": "使用者不存在"}), 404
+
+    webhook, error_response = _get_webhook_for_user(webhook_id, user)
+    if error_response:
+        return error_response
+
+    job = WebhookReplayJob.query.filter_by(id=job_id, webhook_id=webhook_id).first()
+    if not job:
+        return jsonify({"message": "重播工作不存在"}), 404
+
+    # 各動作允許的來源狀態與目標狀態
+    transitions = {
+        "pause": (["pending", "running"], "paused"),
+        "resume": (["paused", "failed"], "pending"),
+        "cancel": (["pending", "running", "paused"], "cancelled"),
+    }
+    allowed_statuses, new_status = transitions[action]
+    if job.status not in allowed_statuses:
+        return jsonify({"message": f"無法在 {job.status} 狀態下執行 {action}"}), 400
+
+    job.status = new_status
+    job.error_message = None if action == "resume" else job.error_message
+    job.finished_at = datetime.utcnow() if action == "cancel" else None
+    db.session.commit()
+
+    if action == "resume":
+        # 從檢查點繼續
+        replay_runner.enqueue(job.id)
+
+    return jsonify({"message": "重播工作已更新", "job": job.to_dict()}), 200
+
+
 @webhook_bp.route("/webhook-events", methods=["GET"])
 @jwt_required()
 @audit_log(action="list_webhook_events", resource_type="webhook")
@@ -399,21 +829,7 @@ def list_recent_events():
     limit = min(int(request.args.get("limit", 50)), 100)
     offset = int(request.args.get("offset", 0))
 
-    query = WebhookEvent.query
-
-    # 非管理員只能看到自己租戶的事件
-    if not user.is_admin():
-        if user.tenant_id:
-            query = query.filter(
-                (WebhookEvent.tenant_id == user.tenant_id)
-                | (WebhookEvent.tenant_id == None)
-            )
-        else:
-            query = query.filter(WebhookEvent.tenant_id == None)
-
-    events = (
-        query.order_by(WebhookEvent.created_at.desc()).limit(limit).offset(offset).all()
-    )
+    events = _recent_events(user, limit, offset)
 
     return (
         jsonify(
@@ -0,0 +1,235 @@
+"""
+租戶 API 用量計量與方案配額
+
+每個請求只在目前執行緒自己的計數器上累加 (不取鎖、不寫資料庫)，
+背景執行緒定期比對各執行緒計數器與上次寫回的快照，將差額以原子更新
+累加到 tenant_api_usage 的每小時資料列。多個程序或節點各自寫回增量，
+配額檢查讀取資料庫中當日的總量 (依租戶快取一個寫回週期)，
+因此超額最多只會多出一個寫回週期內各程序處理的請求數。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from src.database import db
+
+logger = logging.getLogger(__name__)
+
+# 各方案每日 (UTC) API 請求配額，None 表示不限
+PLAN_DAILY_QUOTAS = {
+    "free": 10000,
+    "basic": 100000,
+    "premium": 1000000,
+    "enterprise": None,
+}
+
+
+def get_daily_quota(plan: Optional[str]) -> Optional[int]:
+    """取得方案的每日請求配額，可用 API_DAILY_QUOTA_<PLAN> 覆寫"""
+    plan = plan or "free"
+    override = os.environ.get(f"API_DAILY_QUOTA_{plan.upper()}")
+    if override is not None:
+        quota = int(override)
+        return quota if quota > 0 else None
+    return PLAN_DAILY_QUOTAS.get(plan, PLAN_DAILY_QUOTAS["free"])
+
+
+def hour_bucket(now: datetime) -> datetime:
+    """時間所屬的小時區間起點"""
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+class ApiUsageMeter:
+    """每個執行緒獨立計數、定期寫回的 API 用量計量器"""
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        # 所有執行緒的計數器與其上次寫回時的快照
+        self._counters: List[Tuple[Counter, Dict]] = []
+        self._register_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # tenant_id -> (到期時間, 日期, 當日總量)
+        self._daily_totals: Dict[int, Tuple[float, datetime, int]] = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def record(self, tenant_id: int, route_class: str, status_code: int):
+        """累加一個請求 (只寫入目前執行緒的計數器)"""
+        counts = getattr(self._local, "counts", None)
+        if counts is None:
+            counts = self._local.counts = Counter()
+            # 每個執行緒只在第一次請求時註冊
+            with self._register_lock:
+                self._counters.append((counts, {}))
+
+        key = (
+            tenant_id,
+            hour_bucket(datetime.utcnow()),
+            route_class,
+            f"{status_code // 100}xx",
+        )
+        counts[key] += 1
+
+    def flush(self) -> int:
+        """將各執行緒計數器的差額寫回資料庫，回傳寫回的請求數"""
+        with self._flush_lock:
+            with self._register_lock:
+                counters = list(self._counters)
+
+            deltas = Counter()
+            snapshots = []
+            for counts, flushed in counters:
+                snapshot = counts.copy()
+                for key, value in snapshot.items():
+                    if value != flushed.get(key, 0):
+                        deltas[key] += value - flushed.get(key, 0)
+                snapshots.append((counts, flushed, snapshot))
+
+            if deltas:
+                try:
+                    # 固定順序，避免交錯鎖定造成死結
+                    for key in sorted(deltas):
+                        self._apply(key, deltas[key])
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    # 快照不更新，差額在下次寫回時重試
+                    logger.error(f"Failed to flush API usage: {e}")
+                    return 0
+
+            # 寫回成功後更新快照，並移除已寫回且不再累加的舊區間
+            stale_before = hour_bucket(datetime.utcnow()) - timedelta(hours=1)
+            for counts, flushed, snapshot in snapshots:
+                flushed.update(snapshot)
+                for key in [key for key in flushed if key[1] < stale_before]:
+                    if counts.get(key, 0) == flushed[key]:
+                        counts.pop(key, None)
+                        del flushed[key]
+
+            for tenant_id in {key[0] for key in deltas}:
+                self._daily_totals.pop(tenant_id, None)
+
+            return sum(deltas.values())
+
+    def _apply(self, key, count: int):
+        from src.models.tenant import TenantApiUsage
+
+        tenant_id, bucket_start, route_class, status_class = key
+        table = TenantApiUsage.__table__
+        where = (
+            (table.c.tenant_id == tenant_id)
+            & (table.c.bucket_start == bucket_start)
+            & (table.c.route_class == route_class)
+            & (table.c.status_class == status_class)
+        )
+        update = (
+            table.update()
+            .where(where)
+            .values(request_count=table.c.request_count + count)
+        )
+
+        if db.session.execute(update).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    table.insert().values(
+                        tenant_id=tenant_id,
+                        bucket_start=bucket_start,
+                        route_class=route_class,
+                        status_class=status_class,
+                        request_count=count,
+                    )
+                )
+        except IntegrityError:
+            # 其他程序剛建立同一列
+            db.session.execute(update)
+
+    def get_daily_usage(self, tenant_id: int) -> int:
+        """取得租戶當日 (UTC) 已寫回的請求總數，依租戶快取一個寫回週期"""
+        from src.models.tenant import TenantApiUsage
+
+        now = time.monotonic()
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        cached = self._daily_totals.get(tenant_id)
+        if cached is not None and cached[0] > now and cached[1] == today:
+            return cached[2]
+
+        total = (
+            db.session.query(func.coalesce(func.sum(TenantApiUsage.request_count), 0))
+            .filter(
+                TenantApiUsage.tenant_id == tenant_id,
+                TenantApiUsage.bucket_start >= today,
+            )
+            .scalar()
+        )
+        self._daily_totals[tenant_id] = (now + self.flush_interval, today, int(total))
+        return int(total)
+
+    def check_quota(self, tenant_id: int, plan: Optional[str]) -> Dict:
+        """檢查租戶是否仍在方案的每日配額內"""
+        limit = get_daily_quota(plan)
+        if limit is None:
+            return {"limit": None, "used": None, "remaining": None, "allowed": True}
+
+        used = self.get_daily_usage(tenant_id)
+        return {
+            "limit": limit,
+            "used": used,
+            "remaining": max(limit - used, 0),
+            "allowed": used < limit,
+        }
+
+    def clear(self):
+        """捨棄尚未寫回的計數與快取"""
+        with self._flush_lock:
+            with self._register_lock:
+                for counts, flushed in self._counters:
+                    counts.clear()
+                    flushed.clear()
+            self._daily_totals.clear()
+
+    def start(self, app):
+        """啟動定期寫回的背景執行緒"""
+        if self._thread is not None:
+            return
+        self._app = app
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._flush_loop, name="api-usage", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止背景執行緒並寫回剩餘的計數"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._app is not None:
+            with self._app.app_context():
+                self.flush()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Error in API usage flush loop: {e}")
+
+
+# 全域 API 用量計量器實例
+api_usage_meter = ApiUsageMeter(
+    flush_interval=float(os.environ.get("API_USAGE_FLUSH_SECONDS", 5))
+)
@@ -0,0 +1,249 @@
+"""
+Webhook 傳送排程器
+
+以 Deficit Round-Robin (DRR) 在租戶之間做加權公平排程，
+避免單一租戶大量事件塞滿佇列而拖慢其他租戶的 webhook 傳送。
+"""
+
+import logging
+import os
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 依方案決定的排程權重 (權重越高，每輪可傳送的數量越多)
+PLAN_WEIGHTS = {
+    "free": 1,
+    "basic": 2,
+    "premium": 4,
+    "enterprise": 8,
+}
+
+# 全域 webhook (tenant_id 為 None) 使用的權重
+SYSTEM_WEIGHT = 4
+
+
+class _TenantQueue:
+    """單一租戶的排程狀態"""
+
+    __slots__ = ("tenant_id", "weight", "items", "deficit", "in_flight")
+
+    def __init__(self, tenant_id: Optional[int], weight: int):
+        self.tenant_id = tenant_id
+        self.weight = weight
+        self.items: Deque[Tuple[int, int]] = deque()  # (delivery_id, cost)
+        self.deficit = 0
+        self.in_flight = 0
+
+
+class FairDeliveryScheduler:
+    """
+    租戶公平傳送排程器
+
+    - 每個租戶一條 FIFO 佇列，輪到時獲得 quantum * weight 的額度
+    - 每個租戶同時進行中的傳送數量受 max_in_flight_per_tenant 限制
+    - 工作執行緒從排程器取出傳送並呼叫 handler 執行
+    """
+
+    def __init__(
+        self,
+        handler: Optional[Callable[[int], object]] = None,
+        workers: int = 4,
+        quantum: int = 1,
+        max_in_flight_per_tenant: int = 2,
+        plan_weights: Optional[Dict[str, int]] = None,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.quantum = quantum
+        self.max_in_flight_per_tenant = max_in_flight_per_tenant
+        self.plan_weights = plan_weights or PLAN_WEIGHTS
+
+        self._queues: Dict[Optional[int], _TenantQueue] = {}
+        self._active: Deque[Optional[int]] = deque()  # 有待傳送項目的租戶
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = False
+        self._app = None
+
+    def weight_for_plan(self, plan: Optional[str]) -> int:
+        """取得方案對應的權重"""
+        if plan is None:
+            return SYSTEM_WEIGHT
+        return self.plan_weights.get(plan, 1)
+
+    def submit(
+        self,
+        tenant_id: Optional[int],
+        delivery_id: int,
+        plan: Optional[str] = None,
+        cost: int = 1,
+        weight: Optional[int] = None,
+    ):
+        """
+        將傳送加入租戶佇列
+
+        背景工作 (例如事件重播) 可使用獨立的佇列鍵並指定較低的 weight，
+        與即時傳送公平分享工作執行緒。
+        """
+        with self._condition:
+            queue = self._queues.get(tenant_id)
+            if queue is None:
+                queue = _TenantQueue(
+                    tenant_id, weight if weight else self.weight_for_plan(plan)
+                )
+                self._queues[tenant_id] = queue
+            elif weight:
+                queue.weight = weight
+            elif plan is not None:
+                # 方案可能已變更，以最新的方案權重為準
+                queue.weight = self.weight_for_plan(plan)
+
+            if not queue.items:
+                self._active.append(tenant_id)
+            queue.items.append((delivery_id, cost))
+            self._condition.notify()
+
+    def _select(self) -> Optional[Tuple[Optional[int], int]]:
+        """以 DRR 選出下一筆可執行的傳送 (呼叫者需持有鎖)"""
+        # 最多繞行兩輪：第一次拜訪補足額度，第二次才可能因額度不足而跳過
+        for _ in range(len(self._active) * 2):
+            tenant_id = self._active[0]
+            queue = self._queues[tenant_id]
+
+            if queue.in_flight >= self.max_in_flight_per_tenant:
+                # 已達並行上限，保留額度並換下一個租戶
+                self._active.rotate(-1)
+                continue
+
+            _, cost = queue.items[0]
+            if queue.deficit < cost:
+                queue.deficit += self.quantum * queue.weight
+                if queue.deficit < cost:
+                    self._active.rotate(-1)
+                    continue
+
+            delivery_id, cost = queue.items.popleft()
+            queue.deficit -= cost
+            queue.in_flight += 1
+
+            if not queue.items:
+                # 佇列清空時重設額度，避免閒置租戶累積額度
+                queue.deficit = 0
+                self._active.popleft()
+            elif queue.deficit < queue.items[0][1]:
+                # 本輪額度用完，換下一個租戶
+                self._active.rotate(-1)
+
+            return tenant_id, delivery_id
+
+        return None
+
+    def acquire(self, timeout: Optional[float] = None):
+        """取得下一筆要執行的傳送，沒有可執行的項目時等待"""
+        with self._condition:
+            item = self._select()
+            if item is None and timeout != 0:
+                self._condition.wait(timeout)
+                item = self._select()
+            return item
+
+    def release(self, tenant_id: Optional[int]):
+        """標記一筆傳送已完成，釋放租戶的並行額度"""
+        with self._condition:
+            queue = self._queues.get(tenant_id)
+            if queue is None:
+                return
+            queue.in_flight = max(queue.in_flight - 1, 0)
+            if queue.in_flight == 0 and not queue.items:
+                del self._queues[tenant_id]
+            self._condition.notify()
+
+    def pending_count(self, tenant_id) -> int:
+        """取得佇列中等待與進行中的傳送數量"""
+        with self._condition:
+            queue = self._queues.get(tenant_id)
+            if queue is None:
+                return 0
+            return len(queue.items) + queue.in_flight
+
+    def get_queue_stats(self) -> Dict:
+        """取得每個租戶的佇列深度與進行中數量"""
+        with self._condition:
+            tenants = {
+                str(tenant_id): {
+                    "queue_depth": len(queue.items),
+                    "in_flight": queue.in_flight,
+                    "weight": queue.weight,
+                    "deficit": queue.deficit,
+                }
+                for tenant_id, queue in self._queues.items()
+            }
+        return {
+            "total_queued": sum(t["queue_depth"] for t in tenants.values()),
+            "total_in_flight": sum(t["in_flight"] for t in tenants.values()),
+            "max_in_flight_per_tenant": self.max_in_flight_per_tenant,
+            "tenants": tenants,
+        }
+
+    def start(self, app):
+        """啟動工作執行緒"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._app = app
+
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"webhook-delivery-{index}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f"Webhook delivery scheduler started with {self.workers} workers")
+
+    def stop(self):
+        """停止工作執行緒"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def _worker_loop(self):
+        """工作執行緒：持續取出並執行傳送"""
+        while self._running:
+            item = self.acquire(timeout=1.0)
+            if item is None:
+                continue
+
+            tenant_id, delivery_id = item
+            try:
+                with self._app.app_context():
+                    self.handler(delivery_id)
+            except Exception as e:
+                logger.error(f"Scheduled webhook delivery {delivery_id} failed: {e}")
+            finally:
+                self.release(tenant_id)
+
+
+def _deliver(delivery_id: int):
+    from src.services.webhook_service import webhook_service
+
+    return webhook_service.deliver_webhook_sync(delivery_id)
+
+
+# 全域傳送排程器實例
+delivery_scheduler = FairDeliveryScheduler(
+    handler=_deliver,
+    workers=int(os.environ.get("WEBHOOK_DELIVERY_WORKERS", 4)),
+    quantum=int(os.environ.get("WEBHOOK_DRR_QUANTUM", 1)),
+    max_in_flight_per_tenant=int(os.environ.get("WEBHOOK_TENANT_MAX_IN_FLIGHT", 2)),
+)
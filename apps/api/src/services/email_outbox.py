@@ -0,0 +1,236 @@
+"""
+非同步郵件發送佇列
+
+請求只把郵件放入記憶體佇列就回應；固定數量的工作執行緒各自持有一條
+長連線的 SMTP 連線 (連線池)，連續發送多封郵件時重複使用同一連線，
+閒置超過 idle_timeout 才關閉。發送失敗時重新連線並重試，
+超過 max_attempts 後記錄錯誤並捨棄。未設定 SMTP_HOST 時只記錄日誌。
+
+佇列只存在記憶體中：程序結束時會先送完佇列中的郵件；需要保證送達的郵件
+(例如租戶邀請) 以 on_sent 回呼在資料庫記錄已寄出，未寄出的由掃描工作重新放入；
+收件者被拒絕或重試用盡時呼叫 on_failed，記錄為失敗後不再重新放入。
+"""
+
+import atexit
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EmailOutbox:
+    """以 SMTP 連線池非同步發送郵件的佇列"""
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: int = 587,
+        username: str = "",
+        password: str = "",
+        use_ssl: bool = False,
+        from_email: str = "noreply@morningai.com",
+        pool_size: int = 2,
+        max_queue_size: int = 20000,
+        max_attempts: int = 3,
+        idle_timeout: float = 30.0,
+        connection_factory: Optional[Callable] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.from_email = from_email
+        self.pool_size = pool_size
+        self.max_attempts = max_attempts
+        self.idle_timeout = idle_timeout
+        self._connection_factory = connection_factory or self._connect
+        # 未設定 SMTP 伺服器時只記錄日誌 (開發環境)
+        self._log_only = not host and connection_factory is None
+        # (郵件, 寄出後的回呼, 失敗後的回呼)，None 為停止訊號
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(max_queue_size)
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def enqueue(
+        self,
+        to: str,
+        subject: str,
+        body: str,
+        on_sent: Optional[Callable[[], None]] = None,
+        on_failed: Optional[Callable[[], None]] = None,
+    ) -> bool:
+        """
+        放入一封郵件，佇列已滿時回傳 False
+
+        寄出後在發送執行緒中呼叫 on_sent；收件者被拒絕或重試用盡時呼叫 on_failed
+        """
+        message = EmailMessage()
+        message["From"] = self.from_email
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+
+        try:
+            self._queue.put_nowait((message, on_sent, on_failed))
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            logger.warning(f"Email outbox full, dropped email to {to}")
+            return False
+
+    def enqueue_many(self, messages: Iterable[tuple]) -> int:
+        """放入多封 (收件者, 主旨, 內文[, on_sent[, on_failed]]) 郵件，回傳成功放入的數量"""
+        return sum(1 for message in messages if self.enqueue(*message))
+
+    def join(self):
+        """等待佇列中的郵件都處理完成"""
+        self._queue.join()
+
+    def get_stats(self):
+        """取得發送統計"""
+        with self._stats_lock:
+            return {
+                "pending": self._queue.qsize(),
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "workers": len(self._threads),
+            }
+
+    def start(self, app=None):
+        """啟動發送執行緒"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for index in range(self.pool_size):
+            thread = threading.Thread(
+                target=self._worker_loop, name=f"email-outbox-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        # 程序結束 (例如 worker 回收) 時先送完佇列中的郵件
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0):
+        """停止發送執行緒 (先送完已在佇列中的郵件)"""
+        if not self._threads:
+            return
+        self._stop_event.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def _connect(self):
+        if self.use_ssl:
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=30)
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    def _worker_loop(self):
+        connection = None
+        last_used = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                if connection and time.monotonic() - last_used > self.idle_timeout:
+                    connection = self._close(connection)
+                continue
+
+            try:
+                if item is None:
+                    self._close(connection)
+                    return
+                connection = self._deliver(connection, *item)
+                last_used = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error in email outbox worker: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, connection, message: EmailMessage, on_sent=None, on_failed=None):
+        """發送一封郵件，回傳之後可重複使用的連線"""
+        if self._log_only:
+            logger.info(f"Email to {message['To']}: {message['Subject']}")
+            self._mark_sent(message, on_sent)
+            return connection
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if connection is None:
+                    connection = self._connection_factory()
+                connection.send_message(message)
+                self._mark_sent(message, on_sent)
+                return connection
+            except smtplib.SMTPRecipientsRefused as e:
+                # 收件者被拒絕屬於永久錯誤，不重試，連線仍可使用
+                logger.error(f"Email to {message['To']} refused: {e}")
+                break
+            except Exception as e:
+                connection = self._close(connection)
+                if attempt < self.max_attempts:
+                    self._stop_event.wait(min(2**attempt, 30))
+                    continue
+                logger.error(
+                    f"Failed to send email to {message['To']} "
+                    f"after {attempt} attempts: {e}"
+                )
+
+        with self._stats_lock:
+            self.failed += 1
+        self._run_callback(message, on_failed)
+        return connection
+
+    def _mark_sent(self, message: EmailMessage, on_sent):
+        with self._stats_lock:
+            self.sent += 1
+        # 郵件已寄出，回呼失敗也不重試發送
+        self._run_callback(message, on_sent)
+
+    @staticmethod
+    def _run_callback(message: EmailMessage, callback):
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Error recording email to {message['To']}: {e}")
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.quit()
+            except Exception:
+                pass
+        return None
+
+
+# 全域郵件發送佇列實例
+email_outbox = EmailOutbox(
+    host=os.environ.get("SMTP_HOST"),
+    port=int(os.environ.get("SMTP_PORT", 587)),
+    username=os.environ.get("SMTP_USER", ""),
+    password=os.environ.get("SMTP_PASS", ""),
+    use_ssl=os.environ.get("SMTP_SECURE", "false").lower() == "true",
+    from_email=os.environ.get("EMAIL_FROM", "noreply@morningai.com"),
+    pool_size=int(os.environ.get("EMAIL_OUTBOX_CONNECTIONS", 2)),
+)
@@ -4,10 +4,13 @@ Email Service Module
 提供郵件發送功能的抽象層，支援測試環境的 mock
 """
 
+import logging
 import os
 from abc import ABC, abstractmethod
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 
 class EmailServiceInterface(ABC):
     """郵件服務介面"""
@@ -38,27 +41,27 @@ class EmailService(EmailServiceInterface):
         try:
             # 在實際環境中，這裡會使用 SMTP 發送郵件
             # 目前為了測試，我們只記錄日誌
-            print(f"[EMAIL_SERVICE] Sending verification email to {email}")
-            print(f"[EMAIL_SERVICE] Verification link: {verification_link}")
+            logger.info(f"Sending verification email to {email}")
+            logger.debug(f"Verification link: {verification_link}")
 
             # 模擬發送成功
             return True
 
         except Exception as e:
-            print(f"[EMAIL_SERVICE] Failed to send verification email: {e}")
+            logger.error(f"Failed to send verification email: {e}")
             return False
 
     def send_password_reset_email(self, email: str, reset_link: str) -> bool:
         """發送密碼重設郵件"""
         try:
-            print(f"[EMAIL_SERVICE] Sending password reset email to {email}")
-            print(f"[EMAIL_SERVICE] Reset link: {reset_link}")
+            logger.info(f"Sending password reset email to {email}")
+            logger.debug(f"Reset link: {reset_link}")
 
             # 模擬發送成功
             return True
 
         except Exception as e:
-            print(f"[EMAIL_SERVICE] Failed to send password reset email: {e}")
+            logger.error(f"Failed to send password reset email: {e}")
             return False
 
 
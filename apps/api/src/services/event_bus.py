@@ -0,0 +1,188 @@
+"""
+程序內領域事件匯流排
+
+路由在交易提交後發布事件，事件放入有界佇列，
+由背景執行緒分派給訂閱者 (例如 webhook 觸發)，不佔用使用者請求的時間。
+"""
+
+import logging
+import os
+import queue
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DomainEvent:
+    """領域事件"""
+
+    __slots__ = (
+        "event_type",
+        "data",
+        "tenant_id",
+        "triggered_by_user_id",
+        "source",
+        "occurred_at",
+    )
+
+    def __init__(
+        self,
+        event_type: str,
+        data: Dict,
+        tenant_id: Optional[int] = None,
+        triggered_by_user_id: Optional[int] = None,
+        source: Optional[str] = None,
+    ):
+        self.event_type = event_type
+        self.data = data
+        self.tenant_id = tenant_id
+        self.triggered_by_user_id = triggered_by_user_id
+        self.source = source
+        self.occurred_at = datetime.utcnow()
+
+    def __repr__(self):
+        return f"<DomainEvent {self.event_type}>"
+
+
+class EventBus:
+    """
+    有界佇列的非同步事件匯流排
+
+    佇列已滿時不阻塞發布者，直接丟棄事件並計數。
+    """
+
+    def __init__(self, max_queue_size: int = 10000, workers: int = 1):
+        self.max_queue_size = max_queue_size
+        self.workers = workers
+        self._queue: "queue.Queue[Optional[DomainEvent]]" = queue.Queue(
+            maxsize=max_queue_size
+        )
+        self._subscribers: Dict[str, List[Callable]] = defaultdict(list)
+        self._threads = []
+        self._app = None
+        self._lock = threading.Lock()
+        self.published_count = 0
+        self.dropped_count = 0
+        self.failed_count = 0
+
+    def subscribe(self, event_type: str, handler: Callable[[DomainEvent], None]):
+        """訂閱事件類型，"*" 表示所有事件"""
+        self._subscribers[event_type].append(handler)
+
+    def publish(
+        self,
+        event_type: str,
+        data: Dict,
+        tenant_id: Optional[int] = None,
+        triggered_by_user_id: Optional[int] = None,
+        source: Optional[str] = None,
+    ) -> bool:
+        """發布事件 (不阻塞)，佇列已滿時回傳 False"""
+        event = DomainEvent(event_type, data, tenant_id, triggered_by_user_id, source)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped_count += 1
+            logger.warning(f"Event bus queue full, dropped event {event_type}")
+            return False
+
+        with self._lock:
+            self.published_count += 1
+        return True
+
+    def dispatch(self, event: DomainEvent):
+        """同步將事件分派給所有訂閱者"""
+        handlers = self._subscribers.get(event.event_type, []) + self._subscribers.get(
+            "*", []
+        )
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                with self._lock:
+                    self.failed_count += 1
+                logger.error(f"Event handler failed for {event.event_type}: {e}")
+
+    def drain(self) -> int:
+        """同步處理佇列中剩餘的事件 (主要用於測試與關閉)"""
+        processed = 0
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                return processed
+            if event is not None:
+                self.dispatch(event)
+                processed += 1
+            self._queue.task_done()
+
+    def get_stats(self) -> Dict:
+        """取得佇列統計"""
+        with self._lock:
+            return {
+                "queue_size": self._queue.qsize(),
+                "max_queue_size": self.max_queue_size,
+                "published": self.published_count,
+                "dropped": self.dropped_count,
+                "handler_failures": self.failed_count,
+            }
+
+    def start(self, app):
+        """啟動分派執行緒"""
+        if self._threads:
+            return
+        self._app = app
+
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop, name=f"event-bus-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """停止分派執行緒"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def _worker_loop(self):
+        while True:
+            event = self._queue.get()
+            try:
+                if event is None:
+                    return
+                with self._app.app_context():
+                    self.dispatch(event)
+            finally:
+                self._queue.task_done()
+
+
+def _trigger_webhooks(event: DomainEvent):
+    from src.models.webhook import WEBHOOK_EVENTS
+    from src.services.webhook_service import webhook_service
+
+    if event.event_type not in WEBHOOK_EVENTS:
+        return
+
+    webhook_service.trigger_event(
+        event_type=event.event_type,
+        event_data=event.data,
+        tenant_id=event.tenant_id,
+        triggered_by_user_id=event.triggered_by_user_id,
+        source=event.source,
+    )
+
+
+# 全域事件匯流排實例
+event_bus = EventBus(
+    max_queue_size=int(os.environ.get("EVENT_BUS_MAX_QUEUE_SIZE", 10000)),
+    workers=int(os.environ.get("EVENT_BUS_WORKERS", 1)),
+)
+event_bus.subscribe("*", _trigger_webhooks)
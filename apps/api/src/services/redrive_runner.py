@@ -0,0 +1,175 @@
+"""
+死信重送工作執行器
+
+在背景依工作的篩選條件以 id 遞增分批認領永久失敗的傳送，
+按工作設定的速率節流後交給傳送排程器，並將進度與心跳寫回工作記錄。
+執行程序結束後心跳逾期的工作由任一程序重新認領，已重送的傳送不再是死信，不會重複處理。
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from src.database import db
+
+logger = logging.getLogger(__name__)
+
+
+class RedriveRunner:
+    """死信重送工作執行器"""
+
+    def __init__(self, batch_size: int = 100, poll_interval: float = 30.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def enqueue(self, job_id: int):
+        """通知執行器有新的工作"""
+        self._queue.put(job_id)
+
+    def run_job(self, job_id: int) -> bool:
+        """認領並執行一個重送工作 (包含心跳逾期的執行中工作)，未認領到時回傳 False"""
+        from src.models.webhook import WebhookRedriveJob
+        from src.services.webhook_service import webhook_service
+
+        table = WebhookRedriveJob.__table__
+        now = datetime.utcnow()
+        # 以條件更新認領，多個程序同時輪詢時只會有一個執行
+        result = db.session.execute(
+            table.update()
+            .where(table.c.id == job_id, WebhookRedriveJob.claimable(now))
+            .values(
+                status="running",
+                started_at=func.coalesce(table.c.started_at, now),
+                heartbeat_at=now,
+            )
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            return False
+
+        job = db.session.get(WebhookRedriveJob, job_id)
+        filters = job.filters or {}
+        rate = max(job.rate_per_second, 1)
+        last_id = 0
+
+        try:
+            while not self._stop_event.is_set():
+                batch_started = time.monotonic()
+                delivery_ids = webhook_service.find_dead_letter_ids(
+                    filters,
+                    tenant_id=job.tenant_id,
+                    after_id=last_id,
+                    limit=min(self.batch_size, rate),
+                )
+                if not delivery_ids:
+                    break
+
+                redriven = webhook_service.redrive_deliveries(delivery_ids)
+                last_id = delivery_ids[-1]
+
+                job.processed += len(delivery_ids)
+                job.redriven += redriven
+                job.heartbeat_at = datetime.utcnow()
+                db.session.commit()
+
+                db.session.refresh(job)
+                if job.status == "cancelled":
+                    logger.info(f"Webhook redrive job {job_id} cancelled")
+                    return True
+
+                # 依設定速率節流
+                delay = len(delivery_ids) / rate - (time.monotonic() - batch_started)
+                if delay > 0:
+                    self._stop_event.wait(delay)
+
+            db.session.refresh(job)
+            if job.status == "cancelled":
+                return True
+
+            if self._stop_event.is_set():
+                # 程序關閉時放回待執行，之後由任一程序接手
+                job.status = "pending"
+            else:
+                job.status = "completed"
+                job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+            logger.info(
+                f"Webhook redrive job {job_id} {job.status}: "
+                f"{job.redriven}/{job.processed} deliveries redriven"
+            )
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(WebhookRedriveJob, job_id)
+            job.status = "failed"
+            job.error_message = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            logger.error(f"Webhook redrive job {job_id} failed: {e}")
+
+        return True
+
+    def _pending_job_ids(self):
+        from src.models.webhook import WebhookRedriveJob
+
+        return [
+            job_id
+            for (job_id,) in WebhookRedriveJob.query.with_entities(WebhookRedriveJob.id)
+            .filter(WebhookRedriveJob.claimable())
+            .order_by(WebhookRedriveJob.id)
+        ]
+
+    def start(self, app):
+        """啟動背景執行緒"""
+        if self._thread is not None:
+            return
+        self._app = app
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run_loop, name="webhook-redrive", daemon=True
+        )
+        self._thread.start()
+        # 程序結束時將執行中的工作放回待執行，由其他程序接手
+        atexit.register(self.stop)
+
+    def stop(self):
+        """停止背景執行緒"""
+        self._stop_event.set()
+        self._queue.put(0)
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                job_ids = [self._queue.get(timeout=self.poll_interval)]
+            except queue.Empty:
+                job_ids = None
+
+            if self._stop_event.is_set():
+                return
+
+            try:
+                with self._app.app_context():
+                    # 也處理其他程序建立、尚未被認領或執行程序已結束的工作
+                    for job_id in job_ids or self._pending_job_ids():
+                        self.run_job(job_id)
+            except Exception as e:
+                logger.error(f"Error in webhook redrive runner: {e}")
+
+
+# 全域死信重送執行器實例
+redrive_runner = RedriveRunner(
+    batch_size=int(os.environ.get("WEBHOOK_REDRIVE_BATCH_SIZE", 100)),
+)
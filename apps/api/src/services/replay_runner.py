@@ -0,0 +1,199 @@
+"""
+事件重播工作執行器
+
+以 id 遞增的鍵集分頁從資料庫逐頁讀取事件 (每頁一個短交易，不把整個範圍載入記憶體)，
+建立傳送記錄並與檢查點一起提交，再以低權重的獨立佇列交給傳送排程器，
+避免重播佔滿工作執行緒而拖慢即時傳送。
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from src.database import db
+from src.services.delivery_scheduler import delivery_scheduler
+
+logger = logging.getLogger(__name__)
+
+# 重播佇列在傳送排程器中的權重 (即時傳送最低為 1)
+REPLAY_WEIGHT = 1
+
+
+def replay_queue_key(job_id: int) -> str:
+    """重播工作在傳送排程器中的佇列鍵"""
+    return f"replay:{job_id}"
+
+
+class ReplayRunner:
+    """事件重播工作執行器"""
+
+    def __init__(self, page_size: int = 100, poll_interval: float = 30.0):
+        self.page_size = page_size
+        self.poll_interval = poll_interval
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def enqueue(self, job_id: int):
+        """通知執行器有新的或恢復的工作"""
+        self._queue.put(job_id)
+
+    def run_job(self, job_id: int) -> bool:
+        """認領並執行一個重播工作 (包含心跳逾期的執行中工作)，未認領到時回傳 False"""
+        from src.models.webhook import JOB_LEASE_SECONDS, WebhookReplayJob
+        from src.services.webhook_service import webhook_service
+
+        table = WebhookReplayJob.__table__
+        now = datetime.utcnow()
+        # 以條件更新認領，多個程序同時輪詢時只會有一個執行
+        result = db.session.execute(
+            table.update()
+            .where(table.c.id == job_id, WebhookReplayJob.claimable(now))
+            .values(
+                status="running",
+                started_at=func.coalesce(table.c.started_at, now),
+                heartbeat_at=now,
+            )
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            return False
+
+        job = db.session.get(WebhookReplayJob, job_id)
+        webhook = job.webhook
+        rate = max(job.rate_per_second, 1)
+        page_size = min(self.page_size, rate)
+        queue_key = replay_queue_key(job_id)
+        last_heartbeat = time.monotonic()
+
+        try:
+            while not self._stop_event.is_set():
+                # 上一頁還在排程器中等待時先暫停，讓即時傳送優先
+                while (
+                    delivery_scheduler.pending_count(queue_key) >= page_size
+                    and not self._stop_event.is_set()
+                ):
+                    self._stop_event.wait(0.1)
+                    # 等待期間仍需更新心跳，避免被其他程序視為已結束而重複執行
+                    if time.monotonic() - last_heartbeat >= JOB_LEASE_SECONDS / 3:
+                        job.heartbeat_at = datetime.utcnow()
+                        db.session.commit()
+                        last_heartbeat = time.monotonic()
+
+                page_started = time.monotonic()
+                events = webhook_service.fetch_replay_events(job, webhook, page_size)
+                if not events:
+                    break
+
+                delivery_ids = webhook_service.create_replay_deliveries(webhook, events)
+                # 傳送記錄與檢查點在同一個交易中提交，恢復時不會重複或遺漏
+                job.last_event_id = events[-1].id
+                job.replayed += len(events)
+                job.heartbeat_at = datetime.utcnow()
+                db.session.commit()
+                last_heartbeat = time.monotonic()
+
+                for delivery_id in delivery_ids:
+                    delivery_scheduler.submit(
+                        tenant_id=queue_key,
+                        delivery_id=delivery_id,
+                        weight=REPLAY_WEIGHT,
+                    )
+
+                db.session.refresh(job)
+                if job.status != "running":
+                    logger.info(f"Replay job {job_id} {job.status}")
+                    return True
+
+                # 依目標的速率限制節流
+                delay = len(events) / rate - (time.monotonic() - page_started)
+                if delay > 0:
+                    self._stop_event.wait(delay)
+
+            db.session.refresh(job)
+            if job.status != "running":
+                return True
+
+            if self._stop_event.is_set():
+                # 程序關閉時放回待執行，之後從檢查點繼續
+                job.status = "pending"
+            else:
+                job.status = "completed"
+                job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+            logger.info(
+                f"Replay job {job_id} {job.status}: {job.replayed} events replayed"
+            )
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(WebhookReplayJob, job_id)
+            job.status = "failed"
+            job.error_message = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            logger.error(f"Replay job {job_id} failed: {e}")
+
+        return True
+
+    def _pending_job_ids(self):
+        from src.models.webhook import WebhookReplayJob
+
+        return [
+            job_id
+            for (job_id,) in WebhookReplayJob.query.with_entities(WebhookReplayJob.id)
+            .filter(WebhookReplayJob.claimable())
+            .order_by(WebhookReplayJob.id)
+        ]
+
+    def start(self, app):
+        """啟動背景執行緒"""
+        if self._thread is not None:
+            return
+        self._app = app
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run_loop, name="webhook-replay", daemon=True
+        )
+        self._thread.start()
+        # 程序結束時將執行中的工作放回待執行，由其他程序從檢查點繼續
+        atexit.register(self.stop)
+
+    def stop(self):
+        """停止背景執行緒"""
+        self._stop_event.set()
+        self._queue.put(0)
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                job_ids = [self._queue.get(timeout=self.poll_interval)]
+            except queue.Empty:
+                job_ids = None
+
+            if self._stop_event.is_set():
+                return
+
+            try:
+                with self._app.app_context():
+                    # 也處理其他程序建立或恢復、尚未被認領或執行程序已結束的工作
+                    for job_id in job_ids or self._pending_job_ids():
+                        self.run_job(job_id)
+            except Exception as e:
+                logger.error(f"Error in webhook replay runner: {e}")
+
+
+# 全域事件重播執行器實例
+replay_runner = ReplayRunner(
+    page_size=int(os.environ.get("WEBHOOK_REPLAY_PAGE_SIZE", 100)),
+)
@@ -0,0 +1,199 @@
+"""
+Webhook 重試排程器
+
+資料庫中的 (status, next_retry_at) 是重試的唯一真實來源。
+排程器只把未來一段時間窗口 (horizon) 內到期的重試載入記憶體中的最小堆積，
+在最早到期的時間點醒來並交給傳送排程器，不需要每秒輪詢資料庫。
+"""
+
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RetryScheduler:
+    """
+    以最小堆積實作的持久化重試排程器
+
+    - loader(until, limit) 從資料庫讀取 until 之前到期的 (delivery_id, due_at)
+    - dispatch_handler(delivery_ids) 認領並送出到期的傳送
+    - 記憶體中最多保留 max_in_memory 筆，超出窗口的重試留在資料庫中
+    """
+
+    def __init__(
+        self,
+        loader: Optional[Callable[[datetime, int], List[Tuple[int, datetime]]]] = None,
+        dispatch_handler: Optional[Callable[[List[int]], int]] = None,
+        horizon_seconds: int = 300,
+        max_in_memory: int = 10000,
+    ):
+        self.loader = loader
+        self.dispatch_handler = dispatch_handler
+        self.horizon = timedelta(seconds=horizon_seconds)
+        self.max_in_memory = max_in_memory
+
+        self._heap: List[Tuple[datetime, int]] = []
+        self._scheduled = {}  # delivery_id -> due_at
+        self._window_end: Optional[datetime] = None  # 已載入的時間窗口終點
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._app = None
+
+    def schedule(self, delivery_id: int, due_at: datetime):
+        """登記一筆重試；超出已載入窗口的重試留待之後從資料庫載入"""
+        with self._condition:
+            if self._window_end is None or due_at > self._window_end:
+                return
+            self._push(delivery_id, due_at)
+            self._condition.notify()
+
+    def _push(self, delivery_id: int, due_at: datetime):
+        """加入堆積 (呼叫者需持有鎖)"""
+        if self._scheduled.get(delivery_id) == due_at:
+            return
+        self._scheduled[delivery_id] = due_at
+        heapq.heappush(self._heap, (due_at, delivery_id))
+
+    def reload(self, now: Optional[datetime] = None):
+        """從資料庫載入下一個時間窗口內到期的重試"""
+        now = now or datetime.utcnow()
+        until = now + self.horizon
+        rows = self.loader(until, self.max_in_memory) if self.loader else []
+
+        with self._condition:
+            for delivery_id, due_at in rows:
+                self._push(delivery_id, due_at)
+
+            # 超出記憶體上限時，窗口只延伸到最後一筆載入的時間點
+            if len(rows) >= self.max_in_memory:
+                self._window_end = rows[-1][1]
+            else:
+                self._window_end = until
+            self._condition.notify()
+
+        return len(rows)
+
+    def pop_due(self, now: Optional[datetime] = None) -> List[int]:
+        """取出所有已到期的重試"""
+        now = now or datetime.utcnow()
+        due = []
+
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                due_at, delivery_id = heapq.heappop(self._heap)
+                if self._scheduled.get(delivery_id) != due_at:
+                    continue  # 已被較新的排程取代
+                del self._scheduled[delivery_id]
+                due.append(delivery_id)
+
+        return due
+
+    def next_wakeup(self, now: Optional[datetime] = None) -> float:
+        """距離下一次需要醒來的秒數 (最早到期或窗口結束)"""
+        now = now or datetime.utcnow()
+        with self._condition:
+            candidates = []
+            if self._heap:
+                candidates.append(self._heap[0][0])
+            if self._window_end is not None:
+                candidates.append(self._window_end)
+        if not candidates:
+            return 0
+        return max((min(candidates) - now).total_seconds(), 0)
+
+    def pending_count(self) -> int:
+        """記憶體中等待的重試數量"""
+        with self._condition:
+            return len(self._scheduled)
+
+    def start(self, app):
+        """啟動排程執行緒"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._app = app
+
+        self._thread = threading.Thread(
+            target=self._run_loop, name="webhook-retry-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止排程執行緒"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run_loop(self):
+        """在最早到期或窗口結束時醒來"""
+        while self._running:
+            try:
+                now = datetime.utcnow()
+                if self._window_end is None or now >= self._window_end:
+                    with self._app.app_context():
+                        self.reload(now)
+
+                due = self.pop_due()
+                if due and self.dispatch_handler:
+                    with self._app.app_context():
+                        self.dispatch_handler(due)
+
+                with self._condition:
+                    timeout = self.next_wakeup()
+                    if timeout > 0 and self._running:
+                        self._condition.wait(timeout)
+            except Exception as e:
+                logger.error(f"Error in webhook retry scheduler: {e}")
+                with self._condition:
+                    self._condition.wait(5)
+
+
+def _as_naive_utc(value: datetime) -> datetime:
+    """統一為不含時區的 UTC 時間，與 datetime.utcnow() 比較"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _load_due_retries(until: datetime, limit: int) -> List[Tuple[int, datetime]]:
+    from src.models.webhook import WebhookDelivery
+
+    # 使用 (status, next_retry_at) 索引依到期時間讀取
+    return [
+        (delivery_id, _as_naive_utc(next_retry_at))
+        for delivery_id, next_retry_at in WebhookDelivery.query.with_entities(
+            WebhookDelivery.id, WebhookDelivery.next_retry_at
+        )
+        .filter(
+            WebhookDelivery.status == "retrying",
+            WebhookDelivery.next_retry_at <= until,
+        )
+        .order_by(WebhookDelivery.next_retry_at)
+        .limit(limit)
+    ]
+
+
+def _dispatch_retries(delivery_ids: List[int]) -> int:
+    from src.services.webhook_service import webhook_service
+
+    return webhook_service.dispatch_retries(delivery_ids)
+
+
+# 全域重試排程器實例
+retry_scheduler = RetryScheduler(
+    loader=_load_due_retries,
+    dispatch_handler=_dispatch_retries,
+    horizon_seconds=int(os.environ.get("WEBHOOK_RETRY_HORIZON_SECONDS", 300)),
+    max_in_memory=int(os.environ.get("WEBHOOK_RETRY_MAX_IN_MEMORY", 10000)),
+)
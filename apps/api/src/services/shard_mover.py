@@ -0,0 +1,257 @@
+"""
+租戶分片線上搬移
+
+依序執行：
+1. 標記 copying，以 id 遞增分批把租戶的路由表資料複製到目標分片 (寫入仍在原分片)，
+   每批提交檢查點，中斷後重新執行會從檢查點繼續
+2. 追趕複製期間新增的資料列，直到剩餘量小於一批
+3. 標記 frozen 暫停該租戶的寫入，等待一個路由快取週期讓所有程序看到，
+   再比對兩邊的 id 補齊 (包括提交順序與 id 順序不一致的資料列)
+4. 切換路由到目標分片並解除凍結，再等待一個快取週期讓讀取離開原分片
+5. 最後補齊一次後分批刪除原分片中的資料列
+
+路由表的資料列寫入後不再更新，因此只需要複製新增的資料列。
+"""
+
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.schema import CreateIndex, CreateSchema, CreateTable
+
+from src.database import DEFAULT_SHARD, TENANT_ROUTED_TABLES, db, shard_router
+
+logger = logging.getLogger(__name__)
+
+
+class ShardMoveError(Exception):
+    """無法安全搬移租戶 (例如目標分片中的 id 已被其他租戶使用)"""
+
+
+def ensure_shard_schema(shard: str):
+    """在分片中建立路由表 (不含指向共用表的外鍵)"""
+    engine = shard_router.get_engine(shard)
+    schema = shard_router.get_schema(shard)
+    # 各分片以不重疊的 id 範圍新增資料列，搬移時才能保留原 id
+    id_start = shard_router.shards.get(shard, {}).get("id_start")
+
+    with engine.begin() as connection:
+        if schema and connection.dialect.name != "sqlite":
+            connection.execute(CreateSchema(schema, if_not_exists=True))
+        for table in _routed_tables():
+            if inspect(connection).has_table(table.name, schema=schema):
+                continue
+            connection.execute(CreateTable(table, include_foreign_key_constraints=[]))
+            for index in table.indexes:
+                connection.execute(CreateIndex(index))
+            if id_start:
+                _set_sequence(connection, table, schema, id_start)
+
+
+def _set_sequence(connection, table, schema: Optional[str], value):
+    """將 PostgreSQL 主鍵序列推進到至少 value (其他資料庫依現有最大 id 遞增)"""
+    if connection.dialect.name != "postgresql":
+        return
+    name = f"{schema}.{table.name}" if schema else table.name
+    sequence = func.pg_get_serial_sequence(name, "id")
+    connection.execute(
+        select(func.setval(sequence, func.greatest(value, func.nextval(sequence))))
+    )
+
+
+def _routed_tables():
+    return [
+        table
+        for name, table in db.metadata.tables.items()
+        if name in TENANT_ROUTED_TABLES
+    ]
+
+
+class TenantShardMover:
+    """將租戶的路由表資料在分片之間線上搬移"""
+
+    def __init__(self, batch_size: int = 500, max_catch_up_passes: int = 5):
+        self.batch_size = batch_size
+        self.max_catch_up_passes = max_catch_up_passes
+
+    def move(self, tenant_id: int, target: str) -> Dict:
+        """將租戶搬移到目標分片，回傳複製與刪除的資料列數"""
+        from src.models.tenant import Tenant, TenantShard
+
+        if target != DEFAULT_SHARD and target not in shard_router.shards:
+            raise ValueError(f"Unknown shard: {target}")
+        if db.session.get(Tenant, tenant_id) is None:
+            raise ValueError(f"Tenant {tenant_id} not found")
+
+        route = db.session.get(TenantShard, tenant_id)
+        source = route.shard if route else DEFAULT_SHARD
+        if route is not None and route.status != "active":
+            if route.target_shard != target:
+                raise ValueError(
+                    f"Tenant {tenant_id} is already moving to {route.target_shard}"
+                )
+        elif source == target:
+            return {"copied": 0, "deleted": 0}
+
+        if route is None:
+            route = TenantShard(tenant_id=tenant_id, shard=source, status="active")
+            db.session.add(route)
+
+        ensure_shard_schema(target)
+        logger.info(f"Moving tenant {tenant_id} from shard {source} to {target}")
+
+        if route.status == "active":
+            route.target_shard = target
+            route.copied_until_id = 0
+        if route.status != "frozen":
+            self._set_status(route, "copying")
+
+        # 1-2. 複製與追趕 (寫入仍在原分片)
+        copied = 0
+        for _ in range(1 + self.max_catch_up_passes):
+            count = self._copy(route, source, target, checkpoint=True)
+            copied += count
+            if count < self.batch_size:
+                break
+
+        # 3. 凍結寫入，等待所有程序的路由快取過期後補齊
+        self._set_status(route, "frozen")
+        time.sleep(shard_router.cache_ttl)
+        copied += self._copy(route, source, target, checkpoint=False)
+
+        # 4. 切換路由
+        route.shard = target
+        route.target_shard = None
+        route.copied_until_id = None
+        self._set_status(route, "active")
+        logger.info(f"Tenant {tenant_id} now routed to shard {target}")
+
+        # 5. 等待讀取離開原分片，補齊快取過期前寫入原分片的資料列後刪除
+        time.sleep(shard_router.cache_ttl)
+        copied += self._copy(route, source, target, checkpoint=False)
+        deleted = self._delete_source(tenant_id, source)
+
+        logger.info(
+            f"Moved tenant {tenant_id} to shard {target}: "
+            f"{copied} rows copied, {deleted} rows deleted from {source}"
+        )
+        return {"copied": copied, "deleted": deleted}
+
+    def abort(self, tenant_id: int) -> bool:
+        """放棄進行中的搬移，路由維持原分片 (目標分片中已複製的資料列不會刪除)"""
+        from src.models.tenant import TenantShard
+
+        route = db.session.get(TenantShard, tenant_id)
+        if route is None or route.status == "active":
+            return False
+        route.target_shard = None
+        route.copied_until_id = None
+        self._set_status(route, "active")
+        logger.info(f"Aborted shard move for tenant {tenant_id}")
+        return True
+
+    def _set_status(self, route, status: str):
+        route.status = status
+        route.updated_at = datetime.utcnow()
+        db.session.commit()
+        shard_router.invalidate(route.tenant_id)
+
+    def _copy(self, route, source: str, target: str, checkpoint: bool) -> int:
+        """
+        複製目標分片中沒有的資料列
+
+        checkpoint 為 True 時從檢查點之後複製並推進檢查點，
+        否則從頭比對兩邊的 id (凍結後與切換後的補齊)。
+        """
+        source_engine = shard_router.get_engine(source)
+        target_engine = shard_router.get_engine(target)
+        copied = 0
+
+        for table in _routed_tables():
+            after_id = (route.copied_until_id or 0) if checkpoint else 0
+            for ids in self._id_batches(
+                source_engine, table, route.tenant_id, after_id
+            ):
+                with target_engine.connect() as connection:
+                    existing = dict(
+                        connection.execute(
+                            select(table.c.id, table.c.tenant_id).where(
+                                table.c.id.in_(ids)
+                            )
+                        ).all()
+                    )
+                conflicts = [
+                    row_id
+                    for row_id, owner in existing.items()
+                    if owner != route.tenant_id
+                ]
+                if conflicts:
+                    raise ShardMoveError(
+                        f"{table.name} ids {conflicts[:10]} are already used by "
+                        f"other tenants in shard {target}"
+                    )
+                missing = [row_id for row_id in ids if row_id not in existing]
+                if missing:
+                    with source_engine.connect() as connection:
+                        rows = [
+                            dict(row)
+                            for row in connection.execute(
+                                select(table).where(table.c.id.in_(missing))
+                            ).mappings()
+                        ]
+                    with target_engine.begin() as connection:
+                        connection.execute(table.insert(), rows)
+                        self._advance_sequence(connection, table, target)
+                    copied += len(rows)
+
+                if checkpoint:
+                    route.copied_until_id = ids[-1]
+                    db.session.commit()
+
+        return copied
+
+    def _id_batches(
+        self, engine, table, tenant_id: int, after_id: int
+    ) -> Iterator[List[int]]:
+        while True:
+            with engine.connect() as connection:
+                ids = list(
+                    connection.execute(
+                        select(table.c.id)
+                        .where(table.c.tenant_id == tenant_id, table.c.id > after_id)
+                        .order_by(table.c.id)
+                        .limit(self.batch_size)
+                    ).scalars()
+                )
+            if not ids:
+                return
+            yield ids
+            after_id = ids[-1]
+
+    def _advance_sequence(self, connection, table, shard: str):
+        """以原 id 寫入後，讓序列跳過已使用的 id"""
+        _set_sequence(
+            connection,
+            table,
+            shard_router.get_schema(shard),
+            select(func.max(table.c.id)).scalar_subquery(),
+        )
+
+    def _delete_source(self, tenant_id: int, source: str) -> int:
+        engine = shard_router.get_engine(source)
+        deleted = 0
+        for table in _routed_tables():
+            for ids in self._id_batches(engine, table, tenant_id, 0):
+                with engine.begin() as connection:
+                    connection.execute(table.delete().where(table.c.id.in_(ids)))
+                deleted += len(ids)
+        return deleted
+
+
+# 全域租戶分片搬移工具實例
+tenant_shard_mover = TenantShardMover(
+    batch_size=int(os.environ.get("TENANT_SHARD_MOVE_BATCH_SIZE", 500)),
+)
@@ -0,0 +1,391 @@
+"""
+租戶儲存空間計量
+
+寫入租戶資料 (webhook 事件、傳送記錄) 時由 mapper 事件送出位元組增量，
+先暫存在 session 目前的交易中，提交後才累加到記憶體 (回滾則捨棄)，
+再定期批次寫回 tenant_storage_usage (依類別) 與 tenants.storage_bytes (總量)。
+讀取用量與配額檢查只讀 tenants 的欄位，不掃描租戶資料；校正工作分批從來源表
+重新計算，修正漏記或大量刪除造成的偏差。
+
+校正會記錄 reconciled_at，寫回時只計入在此之後提交的增量 (之前提交的已包含在
+重新計算的結果中)，其他程序尚未寫回的增量因此會疊加在校正結果上，而不會重複計入。
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.database import db, shard_context, shard_router
+
+logger = logging.getLogger(__name__)
+
+# 計入儲存空間的資料類別
+STORAGE_CATEGORIES = ["webhook_events", "webhook_deliveries"]
+
+# session.info 中暫存增量與新寫入 payload 大小的鍵
+_STAGED_KEY = "storage_meter_staged"
+_NEW_PAYLOADS_KEY = "storage_meter_new_payloads"
+
+
+def _real_transaction(transaction):
+    """flush 等子交易歸屬的真正交易 (savepoint 或最外層交易)"""
+    while transaction.parent is not None and not transaction.nested:
+        transaction = transaction.parent
+    return transaction
+
+
+def _current_transaction(session):
+    return session.get_nested_transaction() or session.get_transaction()
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class StorageMeter:
+    """記憶體中的儲存空間增量累加器"""
+
+    def __init__(self, flush_interval: float = 10.0, reconcile_batch_size: int = 500):
+        self.flush_interval = flush_interval
+        self.reconcile_batch_size = reconcile_batch_size
+        # (tenant_id, 類別) -> [(提交時間, 位元組增量)]
+        self._tenant_deltas: Dict[
+            Tuple[int, str], List[Tuple[datetime, int]]
+        ] = defaultdict(list)
+        # 傳送記錄只知道 webhook_id，寫回時再一次查出所屬租戶
+        self._webhook_deltas: Dict[int, List[Tuple[datetime, int]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def record(self, tenant_id: int, category: str, delta: int, committed_at=None):
+        """累加租戶某類別已提交的位元組增量"""
+        if tenant_id is None or not delta:
+            return
+        with self._lock:
+            self._tenant_deltas[(tenant_id, category)].append(
+                (committed_at or datetime.utcnow(), delta)
+            )
+
+    def record_webhook(self, webhook_id: int, delta: int, committed_at=None):
+        """累加某 webhook 傳送記錄已提交的位元組增量"""
+        if webhook_id is None or not delta:
+            return
+        with self._lock:
+            self._webhook_deltas[webhook_id].append(
+                (committed_at or datetime.utcnow(), delta)
+            )
+
+    def stage(self, session, tenant_id: int, category: str, delta: int):
+        """在 session 目前的交易中暫存增量，提交後才累加，回滾時捨棄"""
+        if tenant_id is None or not delta:
+            return
+        self._staged(session).append((self.record, tenant_id, category, delta))
+
+    def stage_webhook(self, session, webhook_id: int, delta: int):
+        """同 stage，用於只知道 webhook_id 的傳送記錄"""
+        if webhook_id is None or not delta:
+            return
+        self._staged(session).append((self.record_webhook, webhook_id, delta))
+
+    @staticmethod
+    def _staged(session) -> list:
+        staged = session.info.setdefault(_STAGED_KEY, {})
+        return staged.setdefault(_current_transaction(session), [])
+
+    @staticmethod
+    def note_new_payload(session, payload_hash: str, size: int):
+        """記錄本交易新寫入的 payload，由第一筆引用它的傳送記錄計入大小"""
+        session.info.setdefault(_NEW_PAYLOADS_KEY, {})[payload_hash] = size
+
+    @staticmethod
+    def take_new_payload(session, payload_hash: str) -> int:
+        """取出本交易新寫入的 payload 大小 (已被取出或非本交易寫入時為 0)"""
+        return session.info.get(_NEW_PAYLOADS_KEY, {}).pop(payload_hash, 0)
+
+    def clear(self):
+        """捨棄尚未寫回的增量"""
+        with self._lock:
+            self._tenant_deltas = defaultdict(list)
+            self._webhook_deltas = defaultdict(list)
+
+    def flush(self) -> int:
+        """將累積的增量寫回資料庫，回傳更新的 (租戶, 類別) 數量"""
+        with self._lock:
+            tenant_deltas, self._tenant_deltas = self._tenant_deltas, defaultdict(list)
+            webhook_deltas, self._webhook_deltas = self._webhook_deltas, defaultdict(
+                list
+            )
+
+        if not tenant_deltas and not webhook_deltas:
+            return 0
+
+        from src.models.webhook import Webhook
+
+        try:
+            deltas = defaultdict(list)
+            for key, entries in tenant_deltas.items():
+                deltas[key].extend(entries)
+            if webhook_deltas:
+                owners = Webhook.query.with_entities(
+                    Webhook.id, Webhook.tenant_id
+                ).filter(Webhook.id.in_(list(webhook_deltas)))
+                for webhook_id, tenant_id in owners:
+                    if tenant_id is not None:
+                        deltas[(tenant_id, "webhook_deliveries")].extend(
+                            webhook_deltas[webhook_id]
+                        )
+
+            reconciled = self._reconciled_at({tenant_id for tenant_id, _ in deltas})
+            totals = defaultdict(int)
+            # 固定順序，避免交錯鎖定造成死結
+            for (tenant_id, category), entries in sorted(deltas.items()):
+                # 校正之前提交的增量已包含在重新計算的結果中
+                since = reconciled.get((tenant_id, category))
+                delta = sum(
+                    value
+                    for committed_at, value in entries
+                    if since is None or committed_at > since
+                )
+                if delta:
+                    self._apply(tenant_id, category, delta, increment=True)
+                    totals[tenant_id] += delta
+            self._apply_totals(totals, increment=True)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to flush storage usage: {e}")
+            # 寫回失敗時把增量放回，待下次再寫
+            with self._lock:
+                for key, entries in tenant_deltas.items():
+                    self._tenant_deltas[key].extend(entries)
+                for webhook_id, entries in webhook_deltas.items():
+                    self._webhook_deltas[webhook_id].extend(entries)
+            return 0
+
+        return len(deltas)
+
+    def reconcile(self, batch_size: int = None) -> int:
+        """依租戶 id 分批從來源表重新計算用量，回傳處理的租戶數"""
+        from src.models.tenant import Tenant
+        from src.models.webhook import Webhook, WebhookDelivery, WebhookEvent
+
+        batch_size = batch_size or self.reconcile_batch_size
+        # 先寫回本程序尚未寫回的增量 (其他程序的增量由 reconciled_at 排除已計入的部分)
+        self.flush()
+
+        processed = 0
+        last_id = 0
+        while True:
+            tenant_ids = [
+                tenant_id
+                for (tenant_id,) in Tenant.query.with_entities(Tenant.id)
+                .filter(Tenant.id > last_id)
+                .order_by(Tenant.id)
+                .limit(batch_size)
+            ]
+            if not tenant_ids:
+                break
+
+            # 在讀取來源表之前取時間，之後提交的增量寫回時疊加在校正結果上
+            reconciled_at = datetime.utcnow()
+            usage = {
+                tenant_id: dict.fromkeys(STORAGE_CATEGORIES, 0)
+                for tenant_id in tenant_ids
+            }
+            # 事件依租戶分片路由，各分片分別加總
+            for shard, shard_tenant_ids in shard_router.group_by_shard(
+                tenant_ids
+            ).items():
+                with shard_context(shard):
+                    events = db.session.execute(
+                        select(
+                            WebhookEvent.tenant_id, func.sum(WebhookEvent.size_bytes)
+                        )
+                        .where(WebhookEvent.tenant_id.in_(shard_tenant_ids))
+                        .group_by(WebhookEvent.tenant_id)
+                    ).all()
+                for tenant_id, size in events:
+                    usage[tenant_id]["webhook_events"] = int(size or 0)
+
+            deliveries = db.session.execute(
+                select(Webhook.tenant_id, func.sum(WebhookDelivery.size_bytes))
+                .join(WebhookDelivery, WebhookDelivery.webhook_id == Webhook.id)
+                .where(Webhook.tenant_id.in_(tenant_ids))
+                .group_by(Webhook.tenant_id)
+            )
+            for tenant_id, size in deliveries:
+                usage[tenant_id]["webhook_deliveries"] = int(size or 0)
+
+            for tenant_id in tenant_ids:
+                for category, size in usage[tenant_id].items():
+                    self._apply(
+                        tenant_id,
+                        category,
+                        size,
+                        increment=False,
+                        reconciled_at=reconciled_at,
+                    )
+            self._apply_totals(
+                {
+                    tenant_id: sum(categories.values())
+                    for tenant_id, categories in usage.items()
+                },
+                increment=False,
+            )
+            db.session.commit()
+
+            processed += len(tenant_ids)
+            last_id = tenant_ids[-1]
+
+        logger.info(f"Reconciled storage usage for {processed} tenants")
+        return processed
+
+    def _reconciled_at(self, tenant_ids) -> Dict[Tuple[int, str], datetime]:
+        """各 (租戶, 類別) 最近一次校正的時間"""
+        from src.models.tenant import TenantStorageUsage
+
+        if not tenant_ids:
+            return {}
+        rows = TenantStorageUsage.query.with_entities(
+            TenantStorageUsage.tenant_id,
+            TenantStorageUsage.category,
+            TenantStorageUsage.reconciled_at,
+        ).filter(
+            TenantStorageUsage.tenant_id.in_(sorted(tenant_ids)),
+            TenantStorageUsage.reconciled_at.isnot(None),
+        )
+        return {
+            (tenant_id, category): _naive_utc(reconciled_at)
+            for tenant_id, category, reconciled_at in rows
+        }
+
+    def _apply(
+        self,
+        tenant_id: int,
+        category: str,
+        value: int,
+        increment: bool,
+        reconciled_at: datetime = None,
+    ):
+        """更新類別用量列，不存在時建立"""
+        from src.models.tenant import TenantStorageUsage
+
+        table = TenantStorageUsage.__table__
+        where = (table.c.tenant_id == tenant_id) & (table.c.category == category)
+        values = {
+            "bytes": table.c.bytes + value if increment else value,
+            "updated_at": datetime.utcnow(),
+        }
+        if reconciled_at is not None:
+            values["reconciled_at"] = reconciled_at
+
+        if db.session.execute(table.update().where(where).values(**values)).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    table.insert().values(
+                        tenant_id=tenant_id,
+                        category=category,
+                        bytes=value,
+                        updated_at=values["updated_at"],
+                        reconciled_at=reconciled_at,
+                    )
+                )
+        except IntegrityError:
+            # 其他程序剛建立同一列
+            db.session.execute(table.update().where(where).values(**values))
+
+    def _apply_totals(self, totals: Dict[int, int], increment: bool):
+        from src.models.tenant import Tenant
+
+        table = Tenant.__table__
+        for tenant_id in sorted(totals):
+            value = totals[tenant_id]
+            if increment and not value:
+                continue
+            db.session.execute(
+                table.update()
+                .where(table.c.id == tenant_id)
+                .values(
+                    storage_bytes=table.c.storage_bytes + value if increment else value
+                )
+            )
+
+    def start(self, app):
+        """啟動定期寫回的背景執行緒"""
+        if self._thread is not None:
+            return
+        self._app = app
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._flush_loop, name="storage-meter", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止背景執行緒並寫回剩餘的增量"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._app is not None:
+            with self._app.app_context():
+                self.flush()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Error in storage meter flush loop: {e}")
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_staged(session):
+    staged = session.info.get(_STAGED_KEY)
+    if not staged:
+        return
+    transaction = _current_transaction(session)
+    entries = staged.pop(transaction, [])
+    if transaction.nested:
+        # savepoint 提交後併入外層交易，待最外層交易提交才計入
+        staged.setdefault(_real_transaction(transaction.parent), []).extend(entries)
+        return
+    committed_at = datetime.utcnow()
+    for record, *args in entries:
+        record(*args, committed_at=committed_at)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_staged(session):
+    staged = session.info.get(_STAGED_KEY)
+    if staged:
+        staged.pop(_current_transaction(session), None)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _clear_staged(session, transaction):
+    # 最外層交易結束 (含未提交即關閉) 時清掉殘留的暫存
+    if transaction.parent is None:
+        session.info.pop(_STAGED_KEY, None)
+        session.info.pop(_NEW_PAYLOADS_KEY, None)
+
+
+# 全域儲存空間計量實例
+storage_meter = StorageMeter(
+    flush_interval=float(os.environ.get("STORAGE_METER_FLUSH_SECONDS", 10)),
+    reconcile_batch_size=int(os.environ.get("STORAGE_RECONCILE_BATCH_SIZE", 500)),
+)
@@ -0,0 +1,219 @@
+"""
+租戶解析快取
+
+將請求的 Host (自訂網域或平台子網域) 或路徑中的 slug 對應到租戶。
+結果 (包含查無租戶的負向結果) 以 TTL 快取在程序內，命中時不需查詢資料庫；
+租戶的網域、slug、方案或啟用狀態變更時由路由主動失效。
+
+快取只存在各程序內：失效時同時遞增資料庫中的快取版本 (tenant_cache_version)，
+其他程序命中快取時每 version_check_interval 秒比對一次版本，版本改變即清空快取，
+因此其他程序最多在 version_check_interval 秒內仍使用變更前的租戶資料。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResolvedTenant(NamedTuple):
+    """快取中的租戶快照 (不持有 ORM 物件，可跨請求與執行緒共用)"""
+
+    id: int
+    slug: str
+    domain: Optional[str]
+    plan: str
+
+
+class TenantResolver:
+    """
+    以 TTL 快取的租戶解析器
+
+    - ttl: 找到租戶時的快取秒數
+    - negative_ttl: 查無租戶時的快取秒數
+    - max_size: 快取項目上限，超過時淘汰最久未使用的項目
+    - base_domain: 平台網域，<slug>.<base_domain> 的 Host 依 slug 解析
+    - version_check_interval: 命中快取時比對資料庫快取版本的間隔秒數
+    """
+
+    def __init__(
+        self,
+        ttl: float = 60.0,
+        negative_ttl: float = 10.0,
+        max_size: int = 10000,
+        base_domain: Optional[str] = None,
+        version_check_interval: float = 2.0,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.base_domain = base_domain.lower().strip(".") if base_domain else None
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.version_check_interval = version_check_interval
+        # 最後一次看到的資料庫快取版本與比對時間 (None 表示尚未比對)
+        self._version = None
+        self._version_checked_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    def resolve_host(self, host: Optional[str]) -> Optional[ResolvedTenant]:
+        """依 Host 標頭解析租戶"""
+        if not host:
+            return None
+        host = host.split(":", 1)[0].lower().rstrip(".")
+
+        if self.base_domain and host.endswith(f".{self.base_domain}"):
+            slug = host[: -len(self.base_domain) - 1]
+            if "." not in slug:
+                return self.resolve_slug(slug)
+
+        return self._resolve(f"domain:{host}", lambda: self._load("domain", host))
+
+    def resolve_slug(self, slug: Optional[str]) -> Optional[ResolvedTenant]:
+        """依 slug 解析租戶"""
+        if not slug:
+            return None
+        return self._resolve(f"slug:{slug}", lambda: self._load("slug", slug))
+
+    def resolve_id(self, tenant_id: Optional[int]) -> Optional[ResolvedTenant]:
+        """依租戶 id 解析租戶 (例如來自 JWT 的 tenant_id 聲明)"""
+        if not tenant_id:
+            return None
+        return self._resolve(f"id:{tenant_id}", lambda: self._load("id", tenant_id))
+
+    def invalidate(
+        self,
+        slug: Optional[str] = None,
+        domain: Optional[str] = None,
+        tenant_id: Optional[int] = None,
+    ):
+        """移除指定 slug、網域或租戶 id 的快取項目 (包括負向結果)，並通知其他程序"""
+        keys = []
+        if tenant_id:
+            keys.append(f"id:{tenant_id}")
+        if slug:
+            keys.append(f"slug:{slug}")
+        if domain:
+            keys.append(f"domain:{domain.lower()}")
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._cache.pop(key, None)
+
+        from src.database import db
+        from src.models.tenant import TenantCacheVersion
+
+        try:
+            TenantCacheVersion.bump()
+        except Exception as e:
+            # 其他程序的快取改為在 TTL 到期後才更新
+            db.session.rollback()
+            logger.error(f"Failed to bump tenant cache version: {e}")
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def get_stats(self):
+        """取得快取統計"""
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _resolve(self, key, loader) -> Optional[ResolvedTenant]:
+        now = time.monotonic()
+        if self._version_check_due(key, now):
+            self._check_version()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > now:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        # 查詢時不持有鎖；查詢期間若有失效，不寫入可能過時的結果
+        tenant = loader()
+        ttl = self.ttl if tenant is not None else self.negative_ttl
+
+        with self._lock:
+            if generation != self._generation:
+                return tenant
+            self._cache[key] = (now + ttl, tenant)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return tenant
+
+    def _version_check_due(self, key, now) -> bool:
+        """命中快取且距上次比對超過 version_check_interval 時比對版本 (只讓一個執行緒比對)"""
+        with self._lock:
+            if self._version_checked_at is None:
+                self._version_checked_at = now
+            entry = self._cache.get(key)
+            if entry is None or entry[0] <= now:
+                return False
+            if now - self._version_checked_at < self.version_check_interval:
+                return False
+            self._version_checked_at = now
+            return True
+
+    def _check_version(self):
+        """比對資料庫快取版本，版本改變 (其他程序失效過快取) 時清空快取"""
+        from src.database import db
+        from src.models.tenant import TenantCacheVersion
+
+        try:
+            version = TenantCacheVersion.current()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Failed to check tenant cache version: {e}")
+            return
+
+        with self._lock:
+            if version == self._version:
+                return
+            # 第一次比對時無法得知之前的快取是否過時，同樣清空
+            self._version = version
+            self._generation += 1
+            self._cache.clear()
+
+    def _load(self, field, value) -> Optional[ResolvedTenant]:
+        from src.models.tenant import Tenant
+
+        if field == "domain":
+            tenant = Tenant.get_by_domain(value)
+        elif field == "id":
+            tenant = Tenant.query.filter_by(id=value, is_active=True).first()
+        else:
+            tenant = Tenant.get_by_slug(value)
+
+        if tenant is None:
+            return None
+        return ResolvedTenant(tenant.id, tenant.slug, tenant.domain, tenant.plan)
+
+
+# 全域租戶解析器實例
+tenant_resolver = TenantResolver(
+    ttl=float(os.environ.get("TENANT_CACHE_TTL_SECONDS", 60)),
+    negative_ttl=float(os.environ.get("TENANT_CACHE_NEGATIVE_TTL_SECONDS", 10)),
+    max_size=int(os.environ.get("TENANT_CACHE_MAX_SIZE", 10000)),
+    base_domain=os.environ.get("TENANT_BASE_DOMAIN"),
+    version_check_interval=float(
+        os.environ.get("TENANT_CACHE_VERSION_CHECK_SECONDS", 2)
+    ),
+)
@@ -6,6 +6,7 @@ Two Factor Authentication Service Module
 
 import base64
 import hashlib
+import logging
 import os
 import secrets
 from abc import ABC, abstractmethod
@@ -15,6 +16,8 @@ from typing import List, Optional, Tuple
 import pyotp
 import qrcode
 
+logger = logging.getLogger(__name__)
+
 
 class TwoFactorServiceInterface(ABC):
     """2FA 服務介面"""
@@ -68,7 +71,8 @@ class TwoFactorService(TwoFactorServiceInterface):
             totp = pyotp.TOTP(secret)
             provisioning_uri = totp.provisioning_uri(name=username, issuer_name=issuer)
 
-            print(f"[2FA_SERVICE] Generating QR code for URI: {provisioning_uri}")
+            # provisioning URI 含有 TOTP 密鑰，不寫入日誌
+            logger.debug(f"Generating QR code for {username}")
 
             # 生成 QR code
             qr = qrcode.QRCode(
@@ -90,17 +94,12 @@ class TwoFactorService(TwoFactorServiceInterface):
             img_bytes = buffer.getvalue()
             img_str = base64.b64encode(img_bytes).decode("utf-8")
 
-            print(
-                f"[2FA_SERVICE] QR code generated successfully, length: {len(img_str)}"
-            )
+            logger.debug(f"QR code generated successfully, length: {len(img_str)}")
 
             return f"data:image/png;base64,{img_str}"
 
         except Exception as e:
-            print(f"[2FA_SERVICE] Failed to generate QR code: {e}")
-            import traceback
-
-            traceback.print_exc()
+            logger.exception(f"Failed to generate QR code: {e}")
             return ""
 
     def verify_otp(self, secret: str, otp_code: str) -> bool:
@@ -113,7 +112,7 @@ class TwoFactorService(TwoFactorServiceInterface):
             return totp.verify(otp_code, valid_window=1)
 
         except Exception as e:
-            print(f"[2FA_SERVICE] Failed to verify OTP: {e}")
+            logger.error(f"Failed to verify OTP: {e}")
             return False
 
     def generate_backup_codes(self, count: int = 10) -> List[str]:
@@ -0,0 +1,179 @@
+"""
+Webhook 批次傳送緩衝區
+
+開啟批次模式的 webhook 會將事件暫存在記憶體中，
+累積到 N 筆、B 位元組或等待超過 T 毫秒時合併成一次 POST。
+每個事件同時寫入 webhook_batch_items，批次送出時刪除；程序正常結束時送出剩餘的批次，
+異常結束時遺留的項目由 webhook_service.recover_batch_items 重新加入批次。
+"""
+
+import atexit
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingBatch:
+    """單一 webhook 尚未送出的批次"""
+
+    __slots__ = ("webhook_id", "tenant_id", "plan", "items", "size", "deadline")
+
+    def __init__(self, webhook_id, tenant_id, plan, deadline):
+        self.webhook_id = webhook_id
+        self.tenant_id = tenant_id
+        self.plan = plan
+        self.items: List[str] = []
+        self.size = 2  # JSON 陣列的 "[" 與 "]"
+        self.deadline = deadline
+
+
+class WebhookBatcher:
+    """
+    依 webhook 累積事件 payload 的批次緩衝區
+
+    數量或大小達到上限時由呼叫端立即送出；
+    等待時間到期的批次由背景執行緒呼叫 flush_handler 送出。
+    """
+
+    def __init__(self, flush_handler: Optional[Callable] = None):
+        self.flush_handler = flush_handler
+        self._batches: Dict[int, _PendingBatch] = {}
+        self._deadlines = []  # (deadline, webhook_id) min-heap
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._app = None
+
+    def add(
+        self,
+        webhook_id: int,
+        payload_json: str,
+        max_events: int,
+        max_bytes: int,
+        max_wait_ms: int,
+        tenant_id: Optional[int] = None,
+        plan: Optional[str] = None,
+    ) -> List[List[str]]:
+        """
+        加入一筆事件 payload
+
+        Returns:
+            需要立即送出的批次 (每個批次是 payload JSON 字串的列表)
+        """
+        ready = []
+        item_size = len(payload_json.encode("utf-8")) + 1  # 含分隔逗號
+
+        with self._condition:
+            batch = self._batches.get(webhook_id)
+
+            # 加入後會超過大小上限時，先送出目前的批次
+            if batch and batch.items and batch.size + item_size > max_bytes:
+                ready.append(self._pop(webhook_id))
+                batch = None
+
+            if batch is None:
+                deadline = time.monotonic() + max_wait_ms / 1000.0
+                batch = _PendingBatch(webhook_id, tenant_id, plan, deadline)
+                self._batches[webhook_id] = batch
+                heapq.heappush(self._deadlines, (deadline, webhook_id))
+                self._condition.notify()
+
+            batch.items.append(payload_json)
+            batch.size += item_size
+
+            if len(batch.items) >= max_events or batch.size >= max_bytes:
+                ready.append(self._pop(webhook_id))
+
+        return ready
+
+    def _pop(self, webhook_id: int) -> List[str]:
+        """移除並回傳批次內容 (呼叫者需持有鎖)"""
+        return self._batches.pop(webhook_id).items
+
+    def pop_expired(self, now: Optional[float] = None) -> List[_PendingBatch]:
+        """取出所有已到期的批次"""
+        now = time.monotonic() if now is None else now
+        expired = []
+
+        with self._condition:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, webhook_id = heapq.heappop(self._deadlines)
+                batch = self._batches.get(webhook_id)
+                # 批次可能已因數量上限提前送出並重新建立
+                if batch is not None and batch.deadline == deadline:
+                    expired.append(self._batches.pop(webhook_id))
+
+        return expired
+
+    def pending_count(self) -> int:
+        """目前暫存中的事件數量"""
+        with self._condition:
+            return sum(len(batch.items) for batch in self._batches.values())
+
+    def start(self, app):
+        """啟動到期批次的背景送出執行緒"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._app = app
+
+        self._thread = threading.Thread(
+            target=self._flush_loop, name="webhook-batcher", daemon=True
+        )
+        self._thread.start()
+        # 程序結束 (例如 gunicorn worker 重啟) 時送出剩餘的批次
+        atexit.register(self.stop)
+
+    def stop(self):
+        """停止背景執行緒並送出剩餘的批次"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+        self._flush(self.pop_expired(now=float("inf")))
+
+    def _flush_loop(self):
+        """等待最早到期的批次並送出"""
+        while self._running:
+            with self._condition:
+                timeout = 1.0
+                if self._deadlines:
+                    timeout = max(self._deadlines[0][0] - time.monotonic(), 0)
+                if timeout > 0:
+                    self._condition.wait(min(timeout, 1.0))
+
+            self._flush(self.pop_expired())
+
+    def _flush(self, batches: List[_PendingBatch]):
+        if not batches or self.flush_handler is None:
+            return
+
+        for batch in batches:
+            try:
+                with self._app.app_context():
+                    self.flush_handler(
+                        batch.webhook_id, batch.items, batch.tenant_id, batch.plan
+                    )
+            except Exception as e:
+                logger.error(
+                    f"Failed to flush webhook batch for webhook {batch.webhook_id}: {e}"
+                )
+
+
+def _flush_batch(webhook_id, items, tenant_id, plan):
+    from src.services.webhook_service import webhook_service
+
+    return webhook_service.deliver_batch(webhook_id, items, tenant_id, plan)
+
+
+# 全域批次緩衝區實例
+webhook_batcher = WebhookBatcher(flush_handler=_flush_batch)
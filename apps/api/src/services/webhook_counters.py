@@ -0,0 +1,162 @@
+"""
+Webhook 呼叫次數累加器
+
+傳送結果先累加在記憶體中，定期以原子的
+UPDATE webhooks SET x = x + n 批次寫回，
+避免熱門 webhook 的每次傳送都對同一列做讀取-修改-寫入。
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from src.database import db
+
+logger = logging.getLogger(__name__)
+
+
+class _CounterDelta:
+    """單一 webhook 尚未寫回的增量"""
+
+    __slots__ = ("total_calls", "successful_calls", "failed_calls", "last_triggered_at")
+
+    def __init__(self):
+        self.total_calls = 0
+        self.successful_calls = 0
+        self.failed_calls = 0
+        self.last_triggered_at: Optional[datetime] = None
+
+
+class WebhookCounterAccumulator:
+    """記憶體中的 webhook 計數累加器"""
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self._deltas: Dict[int, _CounterDelta] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def record(
+        self,
+        webhook_id: int,
+        total: int = 0,
+        successful: int = 0,
+        failed: int = 0,
+        triggered_at: Optional[datetime] = None,
+    ):
+        """累加 webhook 的呼叫次數"""
+        with self._lock:
+            delta = self._deltas.get(webhook_id)
+            if delta is None:
+                delta = self._deltas[webhook_id] = _CounterDelta()
+            delta.total_calls += total
+            delta.successful_calls += successful
+            delta.failed_calls += failed
+            if triggered_at and (
+                delta.last_triggered_at is None
+                or triggered_at > delta.last_triggered_at
+            ):
+                delta.last_triggered_at = triggered_at
+
+    def pending(self, webhook_id: int) -> Dict:
+        """取得尚未寫回的增量"""
+        with self._lock:
+            delta = self._deltas.get(webhook_id)
+            if delta is None:
+                return {"total_calls": 0, "successful_calls": 0, "failed_calls": 0}
+            return {
+                "total_calls": delta.total_calls,
+                "successful_calls": delta.successful_calls,
+                "failed_calls": delta.failed_calls,
+            }
+
+    def flush(self) -> int:
+        """將累積的增量以原子更新寫回資料庫"""
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+
+        if not deltas:
+            return 0
+
+        from src.models.webhook import Webhook
+
+        table = Webhook.__table__
+        try:
+            for webhook_id in sorted(deltas):  # 固定順序，避免交錯鎖定造成死結
+                delta = deltas[webhook_id]
+                values = {
+                    "total_calls": table.c.total_calls + delta.total_calls,
+                    "successful_calls": table.c.successful_calls
+                    + delta.successful_calls,
+                    "failed_calls": table.c.failed_calls + delta.failed_calls,
+                }
+                if delta.last_triggered_at is not None:
+                    values["last_triggered_at"] = delta.last_triggered_at
+                db.session.execute(
+                    table.update().where(table.c.id == webhook_id).values(**values)
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to flush webhook counters: {e}")
+            # 寫回失敗時把增量放回，待下次再寫
+            with self._lock:
+                for webhook_id, delta in deltas.items():
+                    self._merge(webhook_id, delta)
+            return 0
+
+        return len(deltas)
+
+    def _merge(self, webhook_id: int, delta: _CounterDelta):
+        """將增量合併回累加器 (呼叫者需持有鎖)"""
+        current = self._deltas.get(webhook_id)
+        if current is None:
+            self._deltas[webhook_id] = delta
+            return
+        current.total_calls += delta.total_calls
+        current.successful_calls += delta.successful_calls
+        current.failed_calls += delta.failed_calls
+        if delta.last_triggered_at and (
+            current.last_triggered_at is None
+            or delta.last_triggered_at > current.last_triggered_at
+        ):
+            current.last_triggered_at = delta.last_triggered_at
+
+    def start(self, app):
+        """啟動定期寫回的背景執行緒"""
+        if self._thread is not None:
+            return
+        self._app = app
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._flush_loop, name="webhook-counters", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止背景執行緒並寫回剩餘的增量"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._app is not None:
+            with self._app.app_context():
+                self.flush()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Error in webhook counter flush loop: {e}")
+
+
+# 全域 webhook 計數累加器實例
+webhook_counters = WebhookCounterAccumulator(
+    flush_interval=float(os.environ.get("WEBHOOK_COUNTER_FLUSH_SECONDS", 5))
+)
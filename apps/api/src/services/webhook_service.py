@@ -1,20 +1,54 @@
 import json
 import logging
+import os
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
 import requests
-from celery import Celery
-from sqlalchemy.orm import sessionmaker
-
-from src.database import db
-from src.models.webhook import WEBHOOK_EVENTS, Webhook, WebhookDelivery, WebhookEvent
+from sqlalchemy import case, exists, func, or_
+from sqlalchemy.orm import joinedload, sessionmaker
+
+from src.database import DEFAULT_SHARD, db, shard_context, shard_router, tenant_context
+from src.models.tenant import Tenant
+from src.models.webhook import (
+    LATENCY_BUCKETS_MS,
+    WEBHOOK_EVENTS,
+    Webhook,
+    WebhookBatchItem,
+    WebhookDelivery,
+    WebhookEvent,
+    WebhookEventFanout,
+    WebhookPayload,
+    WebhookRedriveJob,
+    WebhookReplayJob,
+)
+from src.services.delivery_scheduler import delivery_scheduler
+from src.services.retry_scheduler import retry_scheduler
+from src.services.storage_meter import storage_meter
+from src.services.webhook_batcher import webhook_batcher
+from src.services.webhook_counters import webhook_counters
 
 # 設定日誌
 logger = logging.getLogger(__name__)
 
-# Celery 配置 (用於非同步處理)
-celery_app = Celery("webhook_service")
+# 傳送與批次暫存項目的租約 (秒)，逾期仍未完成時由排程工作重新送出
+DELIVERY_LEASE_SECONDS = int(os.environ.get("WEBHOOK_DELIVERY_LEASE_SECONDS", 600))
+# 批次最長等待時間須遠小於租約，否則仍在記憶體中的批次會被重建而重複傳送
+MAX_BATCH_WAIT_MS = DELIVERY_LEASE_SECONDS * 1000 // 2
+BATCH_SETTINGS = ["batch_max_events", "batch_max_bytes", "batch_max_wait_ms"]
+
+
+def _validate_batch_settings(settings: Dict):
+    """批次設定須為正整數，且等待時間不得超過 MAX_BATCH_WAIT_MS"""
+    for field in BATCH_SETTINGS:
+        if field not in settings:
+            continue
+        value = settings[field]
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            raise ValueError(f"{field} must be a positive integer")
+    if settings.get("batch_max_wait_ms", 0) > MAX_BATCH_WAIT_MS:
+        raise ValueError(f"batch_max_wait_ms must not exceed {MAX_BATCH_WAIT_MS}")
 
 
 class WebhookService:
@@ -34,6 +68,10 @@ class WebhookService:
         secret: Optional[str] = None,
         max_retries: int = 3,
         retry_delay: int = 60,
+        batch_enabled: bool = False,
+        batch_max_events: int = 100,
+        batch_max_bytes: int = 262144,
+        batch_max_wait_ms: int = 1000,
     ) -> Webhook:
         """建立新的 webhook"""
 
@@ -41,6 +79,13 @@ class WebhookService:
         invalid_events = [event for event in events if event not in WEBHOOK_EVENTS]
         if invalid_events:
             raise ValueError(f"Invalid event types: {invalid_events}")
+        _validate_batch_settings(
+            {
+                "batch_max_events": batch_max_events,
+                "batch_max_bytes": batch_max_bytes,
+                "batch_max_wait_ms": batch_max_wait_ms,
+            }
+        )
 
         webhook = Webhook(
             tenant_id=tenant_id,
@@ -50,6 +95,10 @@ class WebhookService:
             secret=secret,
             max_retries=max_retries,
             retry_delay=retry_delay,
+            batch_enabled=batch_enabled,
+            batch_max_events=batch_max_events,
+            batch_max_bytes=batch_max_bytes,
+            batch_max_wait_ms=batch_max_wait_ms,
         )
 
         self.session.add(webhook)
@@ -73,7 +122,13 @@ class WebhookService:
             "is_active",
             "max_retries",
             "retry_delay",
+            "batch_enabled",
+            "batch_max_events",
+            "batch_max_bytes",
+            "batch_max_wait_ms",
         ]
+        # 先驗證再修改，避免驗證失敗時 session 中留下改到一半的 webhook
+        _validate_batch_settings(kwargs)
         for field, value in kwargs.items():
             if field in allowed_fields:
                 if field == "events":
@@ -117,6 +172,25 @@ class WebhookService:
         if event_type not in WEBHOOK_EVENTS:
             raise ValueError(f"Invalid event type: {event_type}")
 
+        # 事件記錄寫入租戶所在的分片
+        with tenant_context(tenant_id, write=True) as shard:
+            event = self._trigger_event(
+                event_type, event_data, tenant_id, triggered_by_user_id, source, shard
+            )
+            if shard not in (None, DEFAULT_SHARD):
+                # 提交後屬性已過期，離開區塊前從分片重新載入
+                self.session.refresh(event)
+        return event
+
+    def _trigger_event(
+        self,
+        event_type: str,
+        event_data: Dict,
+        tenant_id: Optional[int],
+        triggered_by_user_id: Optional[int],
+        source: Optional[str],
+        shard: Optional[str] = None,
+    ) -> WebhookEvent:
         # 建立事件記錄
         event = WebhookEvent(
             tenant_id=tenant_id,
@@ -127,10 +201,29 @@ class WebhookService:
         )
 
         self.session.add(event)
-        self.session.flush()  # 取得 event.id
+        if shard not in (None, DEFAULT_SHARD):
+            # 事件與傳送記錄位於不同資料庫，無法在同一個交易中提交：先提交事件
+            # (processed_at 為空)，傳送記錄未能提交時由 complete_unprocessed_events 補齊
+            self.session.commit()
+        else:
+            self.session.flush()  # 取得 event.id
+
+        self._fan_out(event, shard)
+        return event
 
-        # 找到需要觸發的 webhooks
-        query = Webhook.query.filter(Webhook.is_active == True)
+    def _fan_out(self, event: WebhookEvent, shard: Optional[str] = None):
+        """為事件建立傳送記錄或加入批次，並標記事件已處理"""
+        event_type = event.event_type
+        tenant_id = event.tenant_id
+
+        if shard not in (None, DEFAULT_SHARD):
+            # 標記與傳送記錄一起提交；批次送出後暫存項目即刪除，無法再以 payload 比對
+            self.session.add(WebhookEventFanout(tenant_id=tenant_id, event_id=event.id))
+
+        # 找到需要觸發的 webhooks (一併載入租戶以取得方案)
+        query = Webhook.query.options(joinedload(Webhook.tenant)).filter(
+            Webhook.is_active == True
+        )
 
         # 如果是租戶特定事件，只觸發該租戶的 webhooks 和全域 webhooks
         if tenant_id:
@@ -152,19 +245,159 @@ class WebhookService:
 
         logger.info(f"Event {event_type} triggered {len(triggered_webhooks)} webhooks")
 
-        # 非同步處理 webhook 傳送
+        payload_json = self._build_event_payload(event)
+        payload_hash = WebhookPayload.compute_hash(payload_json)
+        payload_ref = None  # 同一事件的傳送記錄共用一份 payload
+
+        # 批次模式的 webhook 先暫存，其餘立即建立傳送記錄
+        deliveries = []
+        batched = []
         for webhook in triggered_webhooks:
-            self._schedule_webhook_delivery(webhook, event)
+            plan = webhook.tenant.plan if webhook.tenant else None
+            if webhook.batch_enabled:
+                # 暫存項目與事件一起提交，程序結束時未送出的批次可從資料庫重建
+                self.session.add(
+                    WebhookBatchItem(
+                        webhook_id=webhook.id,
+                        payload_hash=payload_hash,
+                        payload=payload_json,
+                    )
+                )
+                batched.append(
+                    (
+                        webhook.id,
+                        webhook.tenant_id,
+                        plan,
+                        {
+                            "max_events": webhook.batch_max_events,
+                            "max_bytes": webhook.batch_max_bytes,
+                            "max_wait_ms": webhook.batch_max_wait_ms,
+                        },
+                    )
+                )
+            else:
+                if payload_ref is None:
+                    payload_ref = WebhookPayload.for_payload(payload_json)
+                delivery = self._schedule_webhook_delivery(webhook, event, payload_ref)
+                deliveries.append((webhook.id, webhook.tenant_id, plan, delivery.id))
 
         event.processed_at = datetime.utcnow()
         self.session.commit()
 
-        return event
+        # 提交後才交給排程器，確保工作執行緒讀得到傳送記錄
+        for webhook_id, webhook_tenant_id, plan, delivery_id in deliveries:
+            webhook_counters.record(webhook_id, total=1)
+            delivery_scheduler.submit(
+                tenant_id=webhook_tenant_id, delivery_id=delivery_id, plan=plan
+            )
+
+        for webhook_id, webhook_tenant_id, plan, limits in batched:
+            ready = webhook_batcher.add(
+                webhook_id,
+                payload_json,
+                tenant_id=webhook_tenant_id,
+                plan=plan,
+                **limits,
+            )
+            for items in ready:
+                self.deliver_batch(webhook_id, items, webhook_tenant_id, plan)
+
+    def complete_unprocessed_events(
+        self, grace_seconds: int = 300, limit: int = 500
+    ) -> int:
+        """補齊分片上已提交、但傳送記錄未能提交的事件"""
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        completed = 0
+
+        for shard in shard_router.shards:
+            with shard_context(shard):
+                events = (
+                    WebhookEvent.query.filter(
+                        WebhookEvent.processed_at.is_(None),
+                        WebhookEvent.created_at < cutoff,
+                    )
+                    .order_by(WebhookEvent.id)
+                    .limit(limit)
+                    .all()
+                )
+                for event in events:
+                    # 以條件更新認領，多個程序同時補齊時只會有一個處理
+                    table = WebhookEvent.__table__
+                    result = self.session.execute(
+                        table.update()
+                        .where(table.c.id == event.id, table.c.processed_at.is_(None))
+                        .values(processed_at=datetime.utcnow())
+                    )
+                    self.session.commit()
+                    if result.rowcount != 1:
+                        continue
 
-    def _schedule_webhook_delivery(self, webhook: Webhook, event: WebhookEvent):
-        """安排 webhook 傳送"""
+                    # 傳送記錄已提交、只有事件的 processed_at 未提交時不重複建立
+                    fanned_out = self.session.get(
+                        WebhookEventFanout, (event.tenant_id, event.id)
+                    )
+                    if fanned_out is None:
+                        self._fan_out(event, shard)
+                    completed += 1
+
+        if completed:
+            logger.warning(f"Completed fan-out for {completed} unprocessed events")
+        return completed
+
+    def recover_batch_items(self, lease_seconds: int = 600, limit: int = 1000) -> int:
+        """將租約逾期仍未送出的批次暫存項目重新加入批次 (例如程序重啟時留在記憶體中的批次)"""
+        cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+        stale = WebhookBatchItem.claimed_at < cutoff
+
+        item_ids = [
+            item_id
+            for (item_id,) in WebhookBatchItem.query.with_entities(WebhookBatchItem.id)
+            .filter(stale)
+            .order_by(WebhookBatchItem.id)
+            .limit(limit)
+        ]
+        if not item_ids:
+            return 0
+
+        # 多個程序同時重建時，條件更新確保每筆只被一個程序加入
+        items = WebhookBatchItem.__table__
+        claimed = [
+            item_id
+            for (item_id,) in self.session.execute(
+                items.update()
+                .where(items.c.id.in_(item_ids), stale)
+                .values(claimed_at=datetime.utcnow())
+                .returning(items.c.id)
+            )
+        ]
+        self.session.commit()
 
-        # 準備 payload
+        rows = (
+            self.session.query(WebhookBatchItem, Webhook, Tenant.plan)
+            .join(Webhook, WebhookBatchItem.webhook_id == Webhook.id)
+            .outerjoin(Tenant, Webhook.tenant_id == Tenant.id)
+            .filter(WebhookBatchItem.id.in_(claimed))
+            .order_by(WebhookBatchItem.id)
+            .all()
+        )
+        for item, webhook, plan in rows:
+            ready = webhook_batcher.add(
+                webhook.id,
+                item.payload,
+                max_events=webhook.batch_max_events,
+                max_bytes=webhook.batch_max_bytes,
+                max_wait_ms=webhook.batch_max_wait_ms,
+                tenant_id=webhook.tenant_id,
+                plan=plan,
+            )
+            for batch_items in ready:
+                self.deliver_batch(webhook.id, batch_items, webhook.tenant_id, plan)
+
+        logger.warning(f"Recovered {len(rows)} unflushed webhook batch items")
+        return len(rows)
+
+    def _build_event_payload(self, event: WebhookEvent) -> str:
+        """產生事件的 JSON payload"""
         payload = {
             "event": {
                 "id": event.id,
@@ -177,28 +410,69 @@ class WebhookService:
             "source": event.source,
         }
 
-        payload_json = json.dumps(payload, ensure_ascii=False)
+        return json.dumps(payload, ensure_ascii=False)
+
+    def deliver_batch(
+        self,
+        webhook_id: int,
+        items: List[str],
+        tenant_id: Optional[int] = None,
+        plan: Optional[str] = None,
+    ) -> Optional[WebhookDelivery]:
+        """將多個事件 payload 合併為一筆傳送記錄並排程"""
+        webhook = Webhook.query.get(webhook_id)
+        if not webhook or not items:
+            return None
+
+        delivery = WebhookDelivery(
+            webhook_id=webhook.id,
+            event_type="batch",
+            payload="[" + ",".join(items) + "]",
+            event_count=len(items),
+            max_attempts=webhook.max_retries + 1,  # 包含初始嘗試
+        )
+
+        self.session.add(delivery)
+        # 批次內的暫存項目與傳送記錄在同一個交易中提交與刪除
+        WebhookBatchItem.query.filter(
+            WebhookBatchItem.webhook_id == webhook.id,
+            WebhookBatchItem.payload_hash.in_(
+                [WebhookPayload.compute_hash(item) for item in items]
+            ),
+        ).delete(synchronize_session=False)
+        self.session.commit()
+        webhook_counters.record(webhook.id, total=1)
+
+        delivery_scheduler.submit(
+            tenant_id=tenant_id, delivery_id=delivery.id, plan=plan
+        )
+
+        logger.info(
+            f"Scheduled batch delivery {delivery.id} with {len(items)} events "
+            f"for webhook {webhook_id}"
+        )
+        return delivery
+
+    def _schedule_webhook_delivery(
+        self, webhook: Webhook, event: WebhookEvent, payload_ref: WebhookPayload
+    ) -> WebhookDelivery:
+        """建立 webhook 傳送記錄"""
 
         # 建立傳送記錄
         delivery = WebhookDelivery(
             webhook_id=webhook.id,
             event_type=event.event_type,
-            payload=payload_json,
+            payload_ref=payload_ref,
             max_attempts=webhook.max_retries + 1,  # 包含初始嘗試
         )
 
         self.session.add(delivery)
         self.session.flush()  # 取得 delivery.id
 
-        # 更新 webhook 統計
-        webhook.total_calls += 1
-
-        # 使用 Celery 非同步處理
-        deliver_webhook_task.delay(delivery.id)
-
         logger.info(
             f"Scheduled webhook delivery {delivery.id} for webhook {webhook.id}"
         )
+        return delivery
 
     def deliver_webhook_sync(self, delivery_id: int) -> bool:
         """同步傳送 webhook (用於測試或立即傳送)"""
@@ -206,6 +480,10 @@ class WebhookService:
         if not delivery:
             logger.error(f"Webhook delivery {delivery_id} not found")
             return False
+        if delivery.status != "pending":
+            # 租約逾期後被重新送出，但原本的傳送已完成
+            logger.info(f"Webhook delivery {delivery_id} already {delivery.status}")
+            return delivery.status == "success"
 
         return self._execute_webhook_delivery(delivery)
 
@@ -222,24 +500,34 @@ class WebhookService:
                 "X-Webhook-Delivery": str(delivery.id),
                 "X-Webhook-Timestamp": str(int(datetime.utcnow().timestamp())),
             }
+            if delivery.event_type == "batch":
+                headers["X-Webhook-Batch-Size"] = str(delivery.event_count)
+            if delivery.is_replay:
+                headers["X-Webhook-Replay"] = "true"
+
+            payload = delivery.payload
 
             # 添加簽名
             if webhook.secret:
-                signature = webhook.generate_signature(delivery.payload)
+                signature = webhook.generate_signature(payload)
                 if signature:
                     headers["X-Webhook-Signature"] = signature
 
             delivery.request_headers = headers
             delivery.attempt_count += 1
 
-            # 發送請求
-            response = requests.post(
-                webhook.url,
-                data=delivery.payload,
-                headers=headers,
-                timeout=30,  # 30 秒超時
-                allow_redirects=False,
-            )
+            # 發送請求並記錄本次嘗試的耗時
+            started_at = time.monotonic()
+            try:
+                response = requests.post(
+                    webhook.url,
+                    data=payload,
+                    headers=headers,
+                    timeout=30,  # 30 秒超時
+                    allow_redirects=False,
+                )
+            finally:
+                delivery.duration_ms = int((time.monotonic() - started_at) * 1000)
 
             # 處理回應
             if 200 <= response.status_code < 300:
@@ -249,20 +537,25 @@ class WebhookService:
                     response_body=response.text[:1000],  # 限制回應內容長度
                 )
                 self.session.commit()
+                webhook_counters.record(
+                    delivery.webhook_id,
+                    successful=1,
+                    triggered_at=delivery.delivered_at,
+                )
 
                 logger.info(f"Webhook delivery {delivery.id} succeeded")
                 return True
             else:
                 error_message = f"HTTP {response.status_code}: {response.text[:500]}"
+                delivery.error_class = f"http_{response.status_code // 100}xx"
 
-                if delivery.can_retry():
+                if delivery.has_attempts_left():
+                    delivery.error_message = error_message
                     delivery.schedule_retry()
                     self.session.commit()
 
                     # 安排重試
-                    deliver_webhook_task.apply_async(
-                        args=[delivery.id], eta=delivery.next_retry_at
-                    )
+                    retry_scheduler.schedule(delivery.id, delivery.next_retry_at)
 
                     logger.warning(
                         f"Webhook delivery {delivery.id} failed, scheduled retry"
@@ -275,6 +568,7 @@ class WebhookService:
                         response_body=response.text[:1000],
                     )
                     self.session.commit()
+                    webhook_counters.record(delivery.webhook_id, failed=1)
 
                     logger.error(f"Webhook delivery {delivery.id} failed permanently")
 
@@ -282,15 +576,15 @@ class WebhookService:
 
         except requests.exceptions.RequestException as e:
             error_message = f"Request failed: {str(e)}"
+            delivery.error_class = _classify_request_exception(e)
 
-            if delivery.can_retry():
+            if delivery.has_attempts_left():
+                delivery.error_message = error_message
                 delivery.schedule_retry()
                 self.session.commit()
 
                 # 安排重試
-                deliver_webhook_task.apply_async(
-                    args=[delivery.id], eta=delivery.next_retry_at
-                )
+                retry_scheduler.schedule(delivery.id, delivery.next_retry_at)
 
                 logger.warning(
                     f"Webhook delivery {delivery.id} failed with exception, scheduled retry: {e}"
@@ -298,6 +592,7 @@ class WebhookService:
             else:
                 delivery.mark_as_failed(error_message=error_message)
                 self.session.commit()
+                webhook_counters.record(delivery.webhook_id, failed=1)
 
                 logger.error(
                     f"Webhook delivery {delivery.id} failed permanently with exception: {e}"
@@ -307,8 +602,10 @@ class WebhookService:
 
         except Exception as e:
             error_message = f"Unexpected error: {str(e)}"
+            delivery.error_class = "unexpected"
             delivery.mark_as_failed(error_message=error_message)
             self.session.commit()
+            webhook_counters.record(delivery.webhook_id, failed=1)
 
             logger.error(
                 f"Webhook delivery {delivery.id} failed with unexpected error: {e}"
@@ -328,22 +625,65 @@ class WebhookService:
         )
 
     def get_webhook_stats(self, webhook_id: int, days: int = 30) -> Dict:
-        """取得 webhook 統計資料"""
+        """取得 webhook 統計資料 (單一分組聚合查詢)"""
         webhook = Webhook.query.get(webhook_id)
         if not webhook:
             return {}
 
         since = datetime.utcnow() - timedelta(days=days)
 
-        deliveries = WebhookDelivery.query.filter(
-            WebhookDelivery.webhook_id == webhook_id,
-            WebhookDelivery.created_at >= since,
-        ).all()
+        # 依狀態與延遲區間分組，結果列數與傳送量無關
+        duration = WebhookDelivery.duration_ms
+        latency_bucket = case(
+            (duration.is_(None), -1),
+            *[
+                (duration < upper_bound, index)
+                for index, upper_bound in enumerate(LATENCY_BUCKETS_MS)
+            ],
+            else_=len(LATENCY_BUCKETS_MS),
+        ).label("latency_bucket")
+
+        rows = (
+            self.session.query(
+                WebhookDelivery.status,
+                latency_bucket,
+                func.count(WebhookDelivery.id),
+                func.sum(duration),
+                func.max(duration),
+                func.max(WebhookDelivery.created_at),
+            )
+            .filter(
+                WebhookDelivery.webhook_id == webhook_id,
+                WebhookDelivery.created_at >= since,
+            )
+            .group_by(WebhookDelivery.status, latency_bucket)
+            .all()
+        )
 
-        total = len(deliveries)
-        successful = len([d for d in deliveries if d.status == "success"])
-        failed = len([d for d in deliveries if d.status == "failed"])
-        pending = len([d for d in deliveries if d.status in ["pending", "retrying"]])
+        status_counts = {}
+        histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        duration_sum = 0
+        duration_count = 0
+        max_duration = None
+        last_delivery_at = None
+
+        for status, bucket, count, bucket_sum, bucket_max, bucket_last in rows:
+            status_counts[status] = status_counts.get(status, 0) + count
+            if bucket >= 0:
+                histogram[bucket] += count
+                duration_sum += bucket_sum or 0
+                duration_count += count
+                if max_duration is None or bucket_max > max_duration:
+                    max_duration = bucket_max
+            if bucket_last and (
+                last_delivery_at is None or bucket_last > last_delivery_at
+            ):
+                last_delivery_at = bucket_last
+
+        total = sum(status_counts.values())
+        successful = status_counts.get("success", 0)
+        failed = status_counts.get("failed", 0)
+        pending = status_counts.get("pending", 0) + status_counts.get("retrying", 0)
 
         return {
             "total_deliveries": total,
@@ -351,19 +691,25 @@ class WebhookService:
             "failed_deliveries": failed,
             "pending_deliveries": pending,
             "success_rate": round((successful / total * 100) if total > 0 else 0, 2),
-            "average_response_time": 0,  # TODO: 實作回應時間統計
+            "average_response_time": (
+                round(duration_sum / duration_count, 2) if duration_count else 0
+            ),
+            "response_time_percentiles": {
+                "p50": histogram_percentile(histogram, 50, max_duration),
+                "p95": histogram_percentile(histogram, 95, max_duration),
+                "p99": histogram_percentile(histogram, 99, max_duration),
+                "max": max_duration or 0,
+            },
             "last_delivery_at": (
-                max([d.created_at for d in deliveries]).isoformat()
-                if deliveries
-                else None
+                last_delivery_at.isoformat() if last_delivery_at else None
             ),
         }
 
     def retry_failed_deliveries(
         self, webhook_id: Optional[int] = None, limit: int = 100
     ):
-        """重試失敗的傳送"""
-        query = WebhookDelivery.query.filter(
+        """立即送出已到期的重試"""
+        query = WebhookDelivery.query.with_entities(WebhookDelivery.id).filter(
             WebhookDelivery.status == "retrying",
             WebhookDelivery.next_retry_at <= datetime.utcnow(),
         )
@@ -371,30 +717,387 @@ class WebhookService:
         if webhook_id:
             query = query.filter(WebhookDelivery.webhook_id == webhook_id)
 
-        failed_deliveries = query.limit(limit).all()
+        delivery_ids = [delivery_id for (delivery_id,) in query.limit(limit).all()]
+        return self.dispatch_retries(delivery_ids)
 
-        for delivery in failed_deliveries:
-            deliver_webhook_task.delay(delivery.id)
+    def dispatch_retries(self, delivery_ids: List[int]) -> int:
+        """認領到期的重試並交給傳送排程器"""
+        if not delivery_ids:
+            return 0
+
+        # 以條件更新認領並取得租約，避免多個程序重複送出同一筆重試；
+        # 程序在傳送完成前結束時，租約逾期後由 resubmit_stale_deliveries 重新送出
+        claimed = self._claim_deliveries(
+            delivery_ids, WebhookDelivery.status == "retrying", status="pending"
+        )
+        self._submit_deliveries(claimed)
+
+        logger.info(f"Scheduled {len(claimed)} failed deliveries for retry")
+        return len(claimed)
+
+    def _claim_deliveries(self, delivery_ids: List[int], *conditions, **values):
+        """以單一條件更新認領傳送並更新租約，回傳實際認領的 id"""
+        if not delivery_ids:
+            return []
+
+        deliveries = WebhookDelivery.__table__
+        result = self.session.execute(
+            deliveries.update()
+            .where(deliveries.c.id.in_(delivery_ids), *conditions)
+            .values(claimed_at=datetime.utcnow(), **values)
+            .returning(deliveries.c.id)
+        )
+        claimed = [delivery_id for (delivery_id,) in result]
+        self.session.commit()
+        return claimed
+
+    def resubmit_stale_deliveries(
+        self, lease_seconds: int = 600, limit: int = 1000
+    ) -> int:
+        """重新送出租約逾期仍為 pending 的傳送 (例如程序重啟時留在記憶體佇列中的傳送)"""
+        cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+        stale = (WebhookDelivery.status == "pending") & or_(
+            WebhookDelivery.claimed_at.is_(None), WebhookDelivery.claimed_at < cutoff
+        )
 
-        logger.info(f"Scheduled {len(failed_deliveries)} failed deliveries for retry")
-        return len(failed_deliveries)
+        delivery_ids = [
+            delivery_id
+            for (delivery_id,) in WebhookDelivery.query.with_entities(
+                WebhookDelivery.id
+            )
+            .filter(stale)
+            .order_by(WebhookDelivery.id)
+            .limit(limit)
+        ]
+        # 多個程序同時清掃時，條件更新確保每筆只被一個程序重新送出
+        claimed = self._claim_deliveries(delivery_ids, stale)
+        self._submit_deliveries(claimed)
+
+        if claimed:
+            logger.warning(f"Resubmitted {len(claimed)} stale webhook deliveries")
+        return len(claimed)
+
+    def _submit_deliveries(self, delivery_ids: List[int]):
+        """依所屬租戶與方案將傳送交給傳送排程器"""
+        if not delivery_ids:
+            return
+
+        rows = (
+            self.session.query(WebhookDelivery.id, Webhook.tenant_id, Tenant.plan)
+            .join(Webhook, WebhookDelivery.webhook_id == Webhook.id)
+            .outerjoin(Tenant, Webhook.tenant_id == Tenant.id)
+            .filter(WebhookDelivery.id.in_(delivery_ids))
+            .all()
+        )
+        for delivery_id, tenant_id, plan in rows:
+            delivery_scheduler.submit(
+                tenant_id=tenant_id, delivery_id=delivery_id, plan=plan
+            )
 
+    def redrive_deliveries(self, delivery_ids: List[int]) -> int:
+        """重送永久失敗的傳送 (重置嘗試次數後交給傳送排程器)"""
+        if not delivery_ids:
+            return 0
+
+        # 以條件更新認領並取得租約，避免與其他重送工作重複送出
+        claimed = self._claim_deliveries(
+            delivery_ids,
+            WebhookDelivery.status == "failed",
+            status="pending",
+            attempt_count=0,
+            next_retry_at=None,
+            failed_at=None,
+            error_message=None,
+            error_class=None,
+        )
+        self._submit_deliveries(claimed)
+        return len(claimed)
+
+    def _dead_letter_query(self, filters: Dict, tenant_id: Optional[int] = None):
+        """依篩選條件查詢死信 (永久失敗的傳送)"""
+        query = WebhookDelivery.query.filter(WebhookDelivery.status == "failed")
+
+        if tenant_id is not None:
+            query = query.join(
+                Webhook, WebhookDelivery.webhook_id == Webhook.id
+            ).filter(Webhook.tenant_id == tenant_id)
+        if filters.get("webhook_id"):
+            query = query.filter(WebhookDelivery.webhook_id == filters["webhook_id"])
+        if filters.get("since"):
+            query = query.filter(
+                WebhookDelivery.failed_at >= datetime.fromisoformat(filters["since"])
+            )
+        if filters.get("until"):
+            query = query.filter(
+                WebhookDelivery.failed_at < datetime.fromisoformat(filters["until"])
+            )
+        if filters.get("error_class"):
+            query = query.filter(WebhookDelivery.error_class == filters["error_class"])
+
+        return query
+
+    def get_dead_letter_summary(
+        self, filters: Dict, tenant_id: Optional[int] = None, limit: int = 50
+    ) -> Dict:
+        """取得依 webhook 與失敗原因彙整的死信統計，以及最近的死信"""
+        query = self._dead_letter_query(filters, tenant_id)
+
+        reasons = (
+            query.with_entities(
+                WebhookDelivery.webhook_id,
+                WebhookDelivery.error_class,
+                WebhookDelivery.response_status_code,
+                func.count(WebhookDelivery.id),
+                func.min(WebhookDelivery.failed_at),
+                func.max(WebhookDelivery.failed_at),
+                func.max(WebhookDelivery.error_message),
+            )
+            .group_by(
+                WebhookDelivery.webhook_id,
+                WebhookDelivery.error_class,
+                WebhookDelivery.response_status_code,
+            )
+            .order_by(func.count(WebhookDelivery.id).desc())
+            .all()
+        )
 
-# Celery 任務
-@celery_app.task(bind=True, max_retries=3)
-def deliver_webhook_task(self, delivery_id: int):
-    """Celery 任務：傳送 webhook"""
-    try:
-        service = WebhookService()
-        success = service.deliver_webhook_sync(delivery_id)
+        recent = query.order_by(WebhookDelivery.id.desc()).limit(limit).all()
 
-        if not success:
-            # 如果傳送失敗，任務也不需要重試，因為重試邏輯在 service 中處理
-            pass
+        return {
+            "total": sum(row[3] for row in reasons),
+            "by_reason": [
+                {
+                    "webhook_id": webhook_id,
+                    "error_class": error_class,
+                    "response_status_code": status_code,
+                    "count": count,
+                    "first_failed_at": first.isoformat() if first else None,
+                    "last_failed_at": last.isoformat() if last else None,
+                    "sample_error": sample_error,
+                }
+                for (
+                    webhook_id,
+                    error_class,
+                    status_code,
+                    count,
+                    first,
+                    last,
+                    sample_error,
+                ) in reasons
+            ],
+            "deliveries": [delivery.to_dict() for delivery in recent],
+        }
 
-    except Exception as e:
-        logger.error(f"Webhook delivery task failed for delivery {delivery_id}: {e}")
-        raise self.retry(countdown=60, exc=e)
+    def find_dead_letter_ids(
+        self,
+        filters: Dict,
+        tenant_id: Optional[int] = None,
+        after_id: int = 0,
+        limit: int = 100,
+    ) -> List[int]:
+        """依 id 遞增分頁取得符合條件的死信 id"""
+        return [
+            delivery_id
+            for (delivery_id,) in self._dead_letter_query(filters, tenant_id)
+            .with_entities(WebhookDelivery.id)
+            .filter(WebhookDelivery.id > after_id)
+            .order_by(WebhookDelivery.id)
+            .limit(limit)
+        ]
+
+    def create_redrive_job(
+        self,
+        filters: Dict,
+        tenant_id: Optional[int] = None,
+        created_by_user_id: Optional[int] = None,
+        rate_per_second: int = 50,
+    ) -> WebhookRedriveJob:
+        """建立死信重送工作，由背景的 redrive_runner 執行"""
+        job = WebhookRedriveJob(
+            tenant_id=tenant_id,
+            created_by_user_id=created_by_user_id,
+            filters=filters,
+            rate_per_second=rate_per_second,
+            total=self._dead_letter_query(filters, tenant_id).count(),
+        )
+        self.session.add(job)
+        self.session.commit()
+
+        logger.info(f"Created webhook redrive job {job.id} for {job.total} deliveries")
+        return job
+
+    def purge_delivery_history(
+        self, retention_days: int = 30, batch_size: int = 1000
+    ) -> Dict:
+        """刪除超過保留期限且已完成的傳送記錄，以及不再被引用的 payload"""
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+        # 分批刪除，避免長時間鎖定傳送記錄表
+        deleted_deliveries = 0
+        while True:
+            delivery_ids = [
+                delivery_id
+                for (delivery_id,) in WebhookDelivery.query.with_entities(
+                    WebhookDelivery.id
+                )
+                .filter(
+                    WebhookDelivery.created_at < cutoff,
+                    WebhookDelivery.status.in_(["success", "failed"]),
+                )
+                .limit(batch_size)
+            ]
+            if not delivery_ids:
+                break
+
+            # 大量刪除不觸發 mapper 事件，先彙整這批釋放的儲存空間
+            freed = (
+                WebhookDelivery.query.with_entities(
+                    WebhookDelivery.webhook_id, func.sum(WebhookDelivery.size_bytes)
+                )
+                .filter(WebhookDelivery.id.in_(delivery_ids))
+                .group_by(WebhookDelivery.webhook_id)
+                .all()
+            )
+            WebhookDelivery.query.filter(WebhookDelivery.id.in_(delivery_ids)).delete(
+                synchronize_session=False
+            )
+            self.session.commit()
+            for webhook_id, size in freed:
+                storage_meter.record_webhook(webhook_id, -int(size or 0))
+            deleted_deliveries += len(delivery_ids)
+
+        # 扇出標記只在事件標記已處理前有用，隨傳送記錄一起清除
+        WebhookEventFanout.query.filter(WebhookEventFanout.created_at < cutoff).delete(
+            synchronize_session=False
+        )
+
+        deleted_payloads = WebhookPayload.query.filter(
+            WebhookPayload.created_at < cutoff,
+            ~exists().where(WebhookDelivery.payload_hash == WebhookPayload.hash),
+        ).delete(synchronize_session=False)
+        self.session.commit()
+
+        logger.info(
+            f"Purged {deleted_deliveries} webhook deliveries and "
+            f"{deleted_payloads} payloads older than {retention_days} days"
+        )
+        return {"deliveries": deleted_deliveries, "payloads": deleted_payloads}
+
+    def _replay_event_query(self, job: WebhookReplayJob, webhook: Webhook):
+        """重播範圍內 webhook 有訂閱的事件"""
+        query = WebhookEvent.query.filter(WebhookEvent.event_type.in_(webhook.events))
+
+        # 與 trigger_event 相同：租戶 webhook 只收該租戶的事件，全域 webhook 收全部
+        if webhook.tenant_id is not None:
+            query = query.filter(WebhookEvent.tenant_id == webhook.tenant_id)
+        if job.since:
+            query = query.filter(WebhookEvent.created_at >= job.since)
+        if job.until:
+            query = query.filter(WebhookEvent.created_at < job.until)
+        if job.from_event_id:
+            query = query.filter(WebhookEvent.id >= job.from_event_id)
+        if job.to_event_id:
+            query = query.filter(WebhookEvent.id <= job.to_event_id)
+
+        return query
+
+    def create_replay_job(
+        self,
+        webhook: Webhook,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        from_event_id: Optional[int] = None,
+        to_event_id: Optional[int] = None,
+        rate_per_second: int = 10,
+        created_by_user_id: Optional[int] = None,
+    ) -> WebhookReplayJob:
+        """建立事件重播工作，由背景的 replay_runner 執行"""
+        job = WebhookReplayJob(
+            webhook_id=webhook.id,
+            since=since,
+            until=until,
+            from_event_id=from_event_id,
+            to_event_id=to_event_id,
+            rate_per_second=rate_per_second,
+            created_by_user_id=created_by_user_id,
+        )
+        with tenant_context(webhook.tenant_id):
+            job.total = self._replay_event_query(job, webhook).count()
+
+        self.session.add(job)
+        self.session.commit()
+
+        logger.info(
+            f"Created replay job {job.id} for webhook {webhook.id} "
+            f"with {job.total} events"
+        )
+        return job
+
+    def fetch_replay_events(
+        self, job: WebhookReplayJob, webhook: Webhook, limit: int = 100
+    ) -> List[WebhookEvent]:
+        """從檢查點之後依 id 順序取得下一頁要重播的事件"""
+        with tenant_context(webhook.tenant_id):
+            query = self._replay_event_query(job, webhook)
+            if job.last_event_id:
+                query = query.filter(WebhookEvent.id > job.last_event_id)
+            return query.order_by(WebhookEvent.id).limit(limit).all()
+
+    def create_replay_deliveries(
+        self, webhook: Webhook, events: List[WebhookEvent]
+    ) -> List[int]:
+        """為重播的事件建立傳送記錄 (由呼叫者與檢查點一起提交)"""
+        deliveries = []
+        for event in events:
+            delivery = WebhookDelivery(
+                webhook_id=webhook.id,
+                event_type=event.event_type,
+                payload_ref=WebhookPayload.for_payload(
+                    self._build_event_payload(event)
+                ),
+                max_attempts=webhook.max_retries + 1,  # 包含初始嘗試
+                is_replay=True,
+            )
+            self.session.add(delivery)
+            deliveries.append(delivery)
+
+        self.session.flush()
+        return [delivery.id for delivery in deliveries]
+
+
+def _classify_request_exception(error: Exception) -> str:
+    """將請求例外分類為失敗原因"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"
+    return "request_error"
+
+
+def histogram_percentile(
+    histogram: List[int], percentile: float, max_value: Optional[float] = None
+) -> float:
+    """由延遲區間直方圖估算百分位數 (區間內線性內插)"""
+    total = sum(histogram)
+    if total == 0:
+        return 0
+
+    rank = total * percentile / 100.0
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            lower = LATENCY_BUCKETS_MS[index - 1] if index > 0 else 0
+            if index < len(LATENCY_BUCKETS_MS):
+                upper = LATENCY_BUCKETS_MS[index]
+            else:
+                upper = max_value if max_value is not None else lower
+            if max_value is not None:
+                upper = min(upper, max_value)
+            value = lower + (upper - lower) * (rank - cumulative) / count
+            return round(value, 2)
+        cumulative += count
+
+    return max_value or 0
 
 
 # 全域 webhook 服務實例
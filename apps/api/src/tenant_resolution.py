@@ -0,0 +1,29 @@
+"""
+租戶解析中介層 - 在每個請求開始時依路徑 slug 或 Host 標頭解析目前租戶
+"""
+
+from flask import g, request
+
+from src.services.tenant_resolver import tenant_resolver
+
+# 路由中代表租戶 slug 的 URL 參數名稱
+TENANT_SLUG_ARG = "tenant_slug"
+
+# 不需要解析租戶的端點 (健康檢查須在資料庫不可用時仍能回應)
+EXEMPT_ENDPOINTS = {"health_check", "static"}
+
+
+def init_tenant_resolution(app):
+    """註冊租戶解析中介層，結果放在 g.tenant (查無租戶時為 None)"""
+
+    @app.before_request
+    def resolve_tenant():
+        g.tenant = None
+        if request.endpoint in EXEMPT_ENDPOINTS:
+            return
+
+        slug = (request.view_args or {}).get(TENANT_SLUG_ARG)
+        if slug:
+            g.tenant = tenant_resolver.resolve_slug(slug)
+        else:
+            g.tenant = tenant_resolver.resolve_host(request.host)
@@ -0,0 +1,160 @@
+"""
+租戶 API 用量計量與配額測試
+"""
+
+import threading
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from src.database import db
+from src.main import app
+from src.models.tenant import Tenant, TenantApiUsage
+from src.models.user import User
+from src.services.api_usage import ApiUsageMeter, api_usage_meter
+from src.services.tenant_resolver import tenant_resolver
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    api_usage_meter.clear()
+    tenant_resolver.clear()
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+    api_usage_meter.clear()
+    tenant_resolver.clear()
+
+
+@pytest.fixture
+def member(client):
+    """租戶成員與其 token"""
+    with app.app_context():
+        tenant = Tenant(name="Acme", slug="acme", plan="free")
+        db.session.add(tenant)
+        db.session.flush()
+        user = User(username="member", email="member@example.com", tenant=tenant)
+        user.set_password("Password123!")
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+        return tenant.id, {"Authorization": f"Bearer {token}"}
+
+
+class TestApiUsageMeter:
+    """計數器寫回測試"""
+
+    def test_per_thread_counters_flush_deltas(self, client):
+        meter = ApiUsageMeter()
+        with app.app_context():
+            tenant = Tenant(name="Acme", slug="acme")
+            db.session.add(tenant)
+            db.session.commit()
+            tenant_id = tenant.id
+
+            def worker():
+                for _ in range(50):
+                    meter.record(tenant_id, "webhook", 200)
+
+            threads = [threading.Thread(target=worker) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            meter.record(tenant.id, "webhook", 404)
+
+            assert meter.flush() == 201
+            assert meter.flush() == 0
+
+            meter.record(tenant.id, "webhook", 201)
+            assert meter.flush() == 1
+
+            rows = {
+                row.status_class: row.request_count
+                for row in TenantApiUsage.query.filter_by(tenant_id=tenant.id)
+            }
+            assert rows == {"2xx": 201, "4xx": 1}
+            assert meter.get_daily_usage(tenant.id) == 202
+
+
+class TestApiMetering:
+    """中介層計量與配額測試"""
+
+    def test_requests_are_metered_and_reported(self, client, member):
+        tenant_id, headers = member
+        for _ in range(3):
+            client.get(f"/api/tenants/{tenant_id}", headers=headers)
+
+        with app.app_context():
+            assert api_usage_meter.flush() == 3
+
+        response = client.get(f"/api/tenants/{tenant_id}/api-usage", headers=headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["total_requests"] == 3
+        assert data["by_route"] == [
+            {"route_class": "tenant", "status_class": "2xx", "requests": 3}
+        ]
+        assert data["daily_quota"]["used"] == 3
+
+    def test_usage_charged_to_users_current_tenant(self, client, member):
+        tenant_id, _ = member
+        with app.app_context():
+            other = Tenant(name="Other", slug="other", plan="free")
+            db.session.add(other)
+            db.session.commit()
+            other_id = other.id
+            user = User.query.filter_by(username="member").one()
+            # 舊 token 的 tenant_id 聲明不可信，以使用者資料列為準
+            token = create_access_token(
+                identity=str(user.id), additional_claims={"tenant_id": other_id}
+            )
+
+        client.get(
+            f"/api/tenants/{tenant_id}",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+        with app.app_context():
+            assert api_usage_meter.flush() == 1
+            assert api_usage_meter.get_daily_usage(tenant_id) == 1
+            assert api_usage_meter.get_daily_usage(other_id) == 0
+
+    def test_quota_exceeded_returns_429(self, client, member, monkeypatch):
+        monkeypatch.setenv("API_DAILY_QUOTA_FREE", "2")
+        tenant_id, headers = member
+
+        for _ in range(2):
+            response = client.get(f"/api/tenants/{tenant_id}", headers=headers)
+            assert response.status_code == 200
+        with app.app_context():
+            api_usage_meter.flush()
+
+        response = client.get(f"/api/tenants/{tenant_id}", headers=headers)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) > 0
+        assert response.headers["X-Quota-Remaining"] == "0"
+
+    def test_enterprise_plan_is_unlimited(self, client, member, monkeypatch):
+        monkeypatch.setenv("API_DAILY_QUOTA_FREE", "1")
+        tenant_id, headers = member
+        with app.app_context():
+            db.session.get(Tenant, tenant_id).plan = "enterprise"
+            db.session.commit()
+
+        for _ in range(3):
+            response = client.get(f"/api/tenants/{tenant_id}", headers=headers)
+            assert response.status_code == 200
+            assert "X-Quota-Limit" not in response.headers
+            with app.app_context():
+                api_usage_meter.flush()
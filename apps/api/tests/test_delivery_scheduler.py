@@ -0,0 +1,83 @@
+"""
+Webhook 租戶公平排程器測試
+"""
+
+from src.services.delivery_scheduler import FairDeliveryScheduler
+
+
+def drain(scheduler, release=True):
+    """依序取出所有可執行的傳送"""
+    order = []
+    while True:
+        item = scheduler.acquire(timeout=0)
+        if item is None:
+            return order
+        order.append(item)
+        if release:
+            scheduler.release(item[0])
+
+
+class TestFairDeliveryScheduler:
+    """DRR 排程測試"""
+
+    def test_small_tenant_not_starved_by_noisy_neighbor(self):
+        """大量事件的租戶不會讓小租戶排在最後"""
+        scheduler = FairDeliveryScheduler(max_in_flight_per_tenant=10)
+        for delivery_id in range(1000):
+            scheduler.submit(1, delivery_id, plan="free")
+        scheduler.submit(2, 5000, plan="free")
+
+        order = drain(scheduler)
+
+        assert len(order) == 1001
+        assert order.index((2, 5000)) <= 2
+
+    def test_weights_follow_plan(self):
+        """權重較高的方案每輪可傳送較多"""
+        scheduler = FairDeliveryScheduler(max_in_flight_per_tenant=100)
+        for delivery_id in range(100):
+            scheduler.submit(1, delivery_id, plan="free")
+            scheduler.submit(2, 1000 + delivery_id, plan="enterprise")
+
+        first_round = [tenant_id for tenant_id, _ in drain(scheduler)[:18]]
+
+        assert first_round.count(2) == 16
+        assert first_round.count(1) == 2
+
+    def test_in_flight_cap_per_tenant(self):
+        """租戶進行中的傳送數量不超過上限"""
+        scheduler = FairDeliveryScheduler(max_in_flight_per_tenant=2)
+        for delivery_id in range(5):
+            scheduler.submit(1, delivery_id, plan="enterprise")
+
+        order = drain(scheduler, release=False)
+        assert len(order) == 2
+
+        scheduler.release(1)
+        assert scheduler.acquire(timeout=0) == (1, 2)
+
+    def test_fifo_within_tenant(self):
+        """同一租戶內維持先進先出"""
+        scheduler = FairDeliveryScheduler()
+        for delivery_id in range(5):
+            scheduler.submit(None, delivery_id)
+
+        assert [d for _, d in drain(scheduler)] == [0, 1, 2, 3, 4]
+
+    def test_queue_stats(self):
+        """回報每個租戶的佇列深度"""
+        scheduler = FairDeliveryScheduler(max_in_flight_per_tenant=1)
+        for delivery_id in range(3):
+            scheduler.submit(7, delivery_id, plan="basic")
+        scheduler.acquire(timeout=0)
+
+        stats = scheduler.get_queue_stats()
+
+        assert stats["total_queued"] == 2
+        assert stats["total_in_flight"] == 1
+        assert stats["tenants"]["7"]["queue_depth"] == 2
+        assert stats["tenants"]["7"]["weight"] == 2
+
+        scheduler.release(7)
+        drain(scheduler)
+        assert scheduler.get_queue_stats()["tenants"] == {}
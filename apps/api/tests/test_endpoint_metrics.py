@@ -0,0 +1,105 @@
+"""
+端點維度指標與基數限制測試
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "..", "monitoring"))
+
+from endpoint_metrics import OTHER_ENDPOINT, EndpointLimiter  # noqa: E402
+from metrics_config import MetricsCollector  # noqa: E402
+
+
+class FakeClock:
+    """可手動推進的時鐘"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestEndpointLimiter:
+    """端點基數限制器測試"""
+
+    def test_dynamic_and_unmatched_endpoints_fold_to_other(self):
+        limiter = EndpointLimiter(max_endpoints=10)
+
+        assert limiter.resolve("/api/tenants/<int:tenant_id>", "get") == (
+            "/api/tenants/<int:tenant_id>",
+            "GET",
+        )
+        assert limiter.resolve("/api/users/12345", "GET") == (OTHER_ENDPOINT, "GET")
+        assert limiter.resolve(
+            "/files/3f2b8c1e-1d2a-4c7b-9e8f-0a1b2c3d4e5f", "GET"
+        ) == (OTHER_ENDPOINT, "GET")
+        assert limiter.resolve(None, "POST") == (OTHER_ENDPOINT, "POST")
+        assert limiter.resolve("/api/health", "BREW") == ("/api/health", "OTHER")
+        assert limiter.folded == 3
+
+    def test_cap_bounds_tracked_endpoints(self):
+        limiter = EndpointLimiter(max_endpoints=5)
+
+        for index in range(1000):
+            limiter.resolve(f"/scan/path-{index}", "GET")
+
+        assert limiter.tracked == 5
+        assert limiter.folded == 995
+        assert limiter.resolve("/scan/path-0", "GET") == ("/scan/path-0", "GET")
+
+
+class TestEndpointMetrics:
+    """端點指標測試"""
+
+    def test_breakdown_by_endpoint_method_and_status_class(self):
+        clock = FakeClock()
+        collector = MetricsCollector(window_size_minutes=1, clock=clock)
+
+        for _ in range(8):
+            collector.record_request(20, 200, "/api/tenants", "GET")
+        for _ in range(2):
+            collector.record_request(30, 404, "/api/tenants", "GET")
+        for _ in range(5):
+            collector.record_request(900, 201, "/api/tenants", "POST")
+        collector.record_request(5, 404, None, "GET")
+
+        rows = {
+            (row["endpoint"], row["method"]): row
+            for row in collector.get_endpoint_metrics()
+        }
+
+        listing = rows[("/api/tenants", "GET")]
+        assert listing["requests"] == 10
+        assert listing["error_rate_percent"] == 20.0
+        assert listing["status_counts"] == {"2xx": 8, "4xx": 2}
+        assert rows[("/api/tenants", "POST")]["latency_ms"]["p95"] == 900
+        assert rows[(OTHER_ENDPOINT, "GET")]["requests"] == 1
+
+    def test_slowest_endpoints_in_all_metrics(self):
+        clock = FakeClock()
+        collector = MetricsCollector(window_size_minutes=1, clock=clock)
+
+        for index, latency in enumerate([10, 500, 50, 2000]):
+            collector.record_request(latency, 200, f"/api/e{index}", "GET")
+
+        metrics = collector.get_all_metrics(top_endpoints=2)
+
+        assert [row["endpoint"] for row in metrics["slowest_endpoints"]] == [
+            "/api/e3",
+            "/api/e1",
+        ]
+        assert metrics["endpoint_cardinality"]["tracked"] == 4
+
+    def test_endpoint_slots_expire_with_window(self):
+        clock = FakeClock()
+        collector = MetricsCollector(window_size_minutes=1, clock=clock)
+
+        collector.record_request(100, 200, "/api/old", "GET")
+        clock.now += 75
+        collector.record_request(100, 200, "/api/new", "GET")
+
+        endpoints = [row["endpoint"] for row in collector.get_endpoint_metrics()]
+        assert endpoints == ["/api/new"]
+        assert collector.get_latency_percentiles("/api/old")["count"] == 0
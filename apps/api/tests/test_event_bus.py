@@ -0,0 +1,107 @@
+"""
+領域事件匯流排測試
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from src.database import db
+from src.main import app
+from src.models.webhook import Webhook, WebhookEvent
+from src.services.event_bus import EventBus, _trigger_webhooks
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+class TestEventBus:
+    """事件發布與分派測試"""
+
+    def test_publish_does_not_dispatch_synchronously(self):
+        bus = EventBus()
+        received = []
+        bus.subscribe("user.login", received.append)
+
+        assert bus.publish("user.login", {"user_id": 1}) is True
+        assert received == []
+
+        assert bus.drain() == 1
+        assert [event.event_type for event in received] == ["user.login"]
+
+    def test_full_queue_drops_events(self):
+        bus = EventBus(max_queue_size=2)
+
+        assert bus.publish("user.login", {}) is True
+        assert bus.publish("user.login", {}) is True
+        assert bus.publish("user.login", {}) is False
+
+        stats = bus.get_stats()
+        assert stats["queue_size"] == 2
+        assert stats["dropped"] == 1
+
+    def test_handler_failure_does_not_stop_other_handlers(self):
+        bus = EventBus()
+        received = []
+
+        def failing(event):
+            raise RuntimeError("boom")
+
+        bus.subscribe("*", failing)
+        bus.subscribe("*", received.append)
+        bus.publish("user.logout", {})
+        bus.drain()
+
+        assert len(received) == 1
+        assert bus.get_stats()["handler_failures"] == 1
+
+
+class TestEventBusWebhooks:
+    """路由發布事件並觸發 webhook 測試"""
+
+    def test_register_publishes_user_created(self, client):
+        with patch("src.routes.auth.event_bus") as bus:
+            response = client.post(
+                "/api/register",
+                json={
+                    "username": "alice",
+                    "email": "alice@example.com",
+                    "password": "Password123!",
+                },
+            )
+
+        assert response.status_code == 201
+        bus.publish.assert_called_once()
+        assert bus.publish.call_args[0][0] == "user.created"
+
+    def test_dispatch_triggers_webhook_event(self, client):
+        bus = EventBus()
+        bus.subscribe("*", _trigger_webhooks)
+
+        with app.app_context():
+            db.session.add(
+                Webhook(name="hook", url="https://example.com", events=["user.login"])
+            )
+            db.session.commit()
+
+            with patch("src.services.webhook_service.delivery_scheduler") as scheduler:
+                bus.publish("user.login", {"user_id": 1}, triggered_by_user_id=1)
+                bus.publish("custom.unknown", {})
+                bus.drain()
+
+            assert WebhookEvent.query.count() == 1
+            assert scheduler.submit.call_count == 1
@@ -0,0 +1,97 @@
+"""
+串流延遲分位數 sketch 測試
+"""
+
+import json
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "..", "monitoring"))
+
+from latency_sketch import LatencySketch, merge_sketches  # noqa: E402
+from metrics_config import MetricsCollector  # noqa: E402
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+class TestLatencySketch:
+    """延遲 sketch 測試"""
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(42)
+        values = [rng.lognormvariate(4, 1) for _ in range(20000)]
+        sketch = LatencySketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        for q in (0.5, 0.9, 0.95, 0.99):
+            expected = exact_quantile(values, q)
+            assert abs(sketch.quantile(q) - expected) <= expected * 0.01 + 1e-9
+        assert sketch.summary()["max"] == round(max(values), 2)
+
+    def test_merge_matches_single_sketch(self):
+        rng = random.Random(7)
+        values = [rng.uniform(1, 5000) for _ in range(5000)]
+        whole = LatencySketch()
+        parts = [LatencySketch() for _ in range(4)]
+        for index, value in enumerate(values):
+            whole.add(value)
+            parts[index % 4].add(value)
+
+        merged = merge_sketches(parts)
+
+        assert merged.buckets == whole.buckets
+        assert merged.count == whole.count
+        assert merged.summary() == whole.summary()
+
+    def test_serialization_round_trip(self):
+        sketch = LatencySketch()
+        for value in (0, 1.5, 20, 300, 4000):
+            sketch.add(value)
+
+        restored = LatencySketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+        assert restored.summary() == sketch.summary()
+        assert restored.quantile(0) == 0
+
+    def test_memory_bounded_by_value_range(self):
+        sketch = LatencySketch(max_value=60_000)
+        for value in range(1, 200_000, 7):
+            sketch.add(float(value))
+
+        assert len(sketch.buckets) < 1000
+        assert sketch.quantile(1.0) == sketch.max
+
+    def test_empty_sketch(self):
+        assert LatencySketch().summary() == {
+            "count": 0,
+            "p50": 0.0,
+            "p90": 0.0,
+            "p95": 0.0,
+            "p99": 0.0,
+            "max": 0.0,
+        }
+
+
+class TestCollectorLatency:
+    """收集器延遲分位數測試"""
+
+    def test_per_endpoint_percentiles(self):
+        collector = MetricsCollector(window_size_minutes=1)
+
+        for _ in range(100):
+            collector.record_request(10, 200, "fast")
+            collector.record_request(1000, 200, "slow")
+
+        assert collector.get_latency_percentiles("fast")["p99"] == 10
+        assert collector.get_latency_percentiles("slow")["p50"] == 1000
+        assert collector.get_latency_percentiles("missing")["count"] == 0
+
+        metrics = collector.get_all_metrics()
+        assert metrics["latency_ms"]["count"] == 200
+        assert metrics["latency_ms"]["max"] == 1000
+        assert metrics["p95_latency_ms"] == metrics["latency_ms"]["p95"]
@@ -0,0 +1,128 @@
+"""
+非阻塞日誌：JSON 格式、有界佇列捨棄策略與取樣測試
+"""
+
+import json
+import logging
+import queue
+
+from src.logging_config import (
+    BoundedQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    _DropReportingListener,
+    parse_sample_rates,
+)
+
+
+class CollectingHandler(logging.Handler):
+    """收集寫出的紀錄"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_record(name="test", level=logging.INFO, msg="hello", args=None, **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestJsonFormatter:
+    """JSON 格式測試"""
+
+    def test_output_is_valid_json_with_extras(self):
+        record = make_record(
+            msg='quote " and\nnewline %s', args=("arg",), endpoint="/api/x", took=1.5
+        )
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        assert entry["message"] == 'quote " and\nnewline arg'
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "test"
+        assert entry["endpoint"] == "/api/x"
+        assert entry["took"] == 1.5
+
+    def test_exception_included(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger = logging.getLogger("test.exception")
+            record = logger.makeRecord(
+                "test.exception", logging.ERROR, __file__, 1, "failed", None, None
+            )
+            import sys
+
+            record.exc_info = sys.exc_info()
+
+        entry = json.loads(JsonFormatter().format(record))
+        assert "ValueError: boom" in entry["exception"]
+
+
+class TestBoundedQueueHandler:
+    """有界佇列 handler 測試"""
+
+    def test_full_queue_drops_info_without_blocking(self):
+        log_queue = queue.Queue(2)
+        handler = BoundedQueueHandler(log_queue)
+
+        for index in range(5):
+            handler.emit(make_record(msg=f"info {index}"))
+
+        assert log_queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_warning_evicts_oldest_record(self):
+        log_queue = queue.Queue(2)
+        handler = BoundedQueueHandler(log_queue)
+        handler.emit(make_record(msg="first"))
+        handler.emit(make_record(msg="second"))
+
+        handler.emit(make_record(level=logging.ERROR, msg="error"))
+
+        messages = [log_queue.get_nowait().msg for _ in range(2)]
+        assert messages == ["second", "error"]
+        assert handler.dropped == 1
+
+    def test_prepare_merges_args(self):
+        handler = BoundedQueueHandler(queue.Queue())
+        record = handler.prepare(make_record(msg="user %s", args=(42,)))
+
+        assert record.msg == "user 42"
+        assert record.args is None
+
+    def test_listener_reports_dropped_records(self):
+        log_queue = queue.Queue(1)
+        handler = BoundedQueueHandler(log_queue)
+        output = CollectingHandler()
+        listener = _DropReportingListener(log_queue, handler, output)
+
+        handler.emit(make_record(msg="kept"))
+        handler.emit(make_record(msg="dropped"))
+        listener.start()
+        listener.stop()
+
+        messages = [record.getMessage() for record in output.records]
+        assert messages == ["kept", "Log queue full, dropped 1 records"]
+        assert output.records[1].levelno == logging.WARNING
+
+
+class TestSamplingFilter:
+    """取樣測試"""
+
+    def test_samples_below_warning_per_logger(self):
+        sampling = SamplingFilter(parse_sample_rates("hot=0.1, off=0"))
+
+        kept = sum(
+            sampling.filter(make_record(name="hot.child", level=logging.DEBUG))
+            for _ in range(100)
+        )
+        assert kept == 10
+        assert sampling.filter(make_record(name="hot", level=logging.WARNING))
+        assert not sampling.filter(make_record(name="off"))
+        assert all(sampling.filter(make_record(name="other")) for _ in range(5))
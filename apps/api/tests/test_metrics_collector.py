@@ -0,0 +1,103 @@
+"""
+環形緩衝區指標收集器測試
+"""
+
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "..", "monitoring"))
+
+from metrics_config import MetricsCollector  # noqa: E402
+
+
+class FakeClock:
+    """可手動推進的時鐘"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_collector(clock, window_size_minutes=1):
+    return MetricsCollector(window_size_minutes=window_size_minutes, clock=clock)
+
+
+class TestMetricsCollector:
+    """指標收集器測試"""
+
+    def test_qps_and_error_rate_over_window(self):
+        clock = FakeClock()
+        collector = make_collector(clock)
+
+        for second in range(10):
+            for index in range(5):
+                collector.record_request(100, 500 if index == 0 else 200)
+            clock.now += 1
+
+        metrics = collector.get_all_metrics()
+        assert metrics["data_points"]["requests"] == 50
+        assert metrics["qps"] == 5.0
+        assert metrics["error_rate_percent"] == 20.0
+
+    def test_old_buckets_leave_window(self):
+        clock = FakeClock()
+        collector = make_collector(clock)
+
+        collector.record_request(100, 500)
+        collector.record_queue_size(42)
+        collector.record_external_call(False, "database")
+        clock.now += 61
+        collector.record_request(100, 200)
+
+        metrics = collector.get_all_metrics()
+        assert metrics["data_points"]["requests"] == 1
+        assert metrics["error_rate_percent"] == 0.0
+        assert metrics["max_queue_size"] == 0
+        assert metrics["external_failure_rate_percent"] == 0.0
+
+    def test_ring_slot_reused_after_wraparound(self):
+        clock = FakeClock()
+        collector = make_collector(clock)
+
+        for _ in range(3):
+            collector.record_request(100, 200)
+        clock.now += 60  # 同一個環形位置
+        collector.record_request(100, 200)
+
+        assert collector.get_all_metrics()["data_points"]["requests"] == 1
+
+    def test_p95_from_histogram(self):
+        clock = FakeClock()
+        collector = make_collector(clock)
+
+        for _ in range(95):
+            collector.record_request(20, 200)
+        for _ in range(5):
+            collector.record_request(3000, 200)
+
+        assert 10 <= collector.get_p95_latency() <= 25
+        for _ in range(10):
+            collector.record_request(3000, 200)
+        assert 2000 <= collector.get_p95_latency() <= 3000
+
+    def test_concurrent_writers_lose_no_counts(self):
+        clock = FakeClock()
+        collector = make_collector(clock)
+
+        def worker():
+            for _ in range(1000):
+                collector.record_request(50, 200)
+                collector.record_external_call(True, "database")
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        metrics = collector.get_all_metrics()
+        assert metrics["data_points"]["requests"] == 8000
+        assert metrics["data_points"]["external_calls"] == 8000
@@ -0,0 +1,206 @@
+"""
+Prometheus 匯出與多 worker 指標合併測試
+"""
+
+import json
+import os
+import sys
+
+from flask import Flask
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "..", "monitoring"))
+
+from metrics_config import MetricsCollector  # noqa: E402
+from prometheus_export import METRIC_PREFIX, render_prometheus  # noqa: E402
+from worker_snapshots import (  # noqa: E402
+    SnapshotWriter,
+    collect_cluster_snapshot,
+    merge_snapshots,
+    read_snapshots,
+)
+
+import src.monitoring_integration as monitoring_integration  # noqa: E402
+
+
+class FakeClock:
+    """可手動推進的時鐘"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def worker_snapshot(pid, clock, requests):
+    """模擬一個 worker：記錄請求後回傳其快照"""
+    collector = MetricsCollector(window_size_minutes=1, clock=clock)
+    for endpoint, status_code, latency_ms in requests:
+        collector.record_request(latency_ms, status_code, endpoint, "GET")
+    collector.record_external_call(False, "smtp")
+    collector.record_queue_size(3, "email")
+    snapshot = collector.snapshot()
+    snapshot["pid"] = pid
+    return snapshot
+
+
+def sample(text, line_prefix):
+    """取出某一行樣本的值"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_prefix} not found")
+
+
+class TestWorkerSnapshots:
+    """多 worker 快照合併測試"""
+
+    def test_counters_sum_and_gauges_skip_dead_workers(self):
+        clock = FakeClock()
+        first = worker_snapshot(1, clock, [("/api/a", 200, 20)] * 3)
+        second = worker_snapshot(2, clock, [("/api/a", 500, 200), ("/api/b", 200, 5)])
+
+        cluster = merge_snapshots([first, second], clock.now, 60, live_pids={1})
+
+        rows = {row["endpoint"]: row for row in cluster["endpoints"]}
+        assert rows["/api/a"]["status_counts"] == {"2xx": 3, "5xx": 1}
+        assert rows["/api/a"]["count"] == 4
+        assert rows["/api/b"]["count"] == 1
+        assert cluster["external_calls"] == {"smtp": [0, 2]}
+        assert cluster["queue_sizes"] == {"email": 3}
+        assert cluster["workers"] == 1
+        assert cluster["window_latency"].count == 3
+
+    def test_stale_snapshots_leave_window_quantiles(self):
+        clock = FakeClock()
+        snapshot = worker_snapshot(1, clock, [("/api/a", 200, 20)])
+
+        cluster = merge_snapshots([snapshot], clock.now + 120, 60, live_pids={1})
+
+        assert cluster["window_latency"].count == 0
+        assert cluster["endpoints"][0]["count"] == 1
+
+    def test_writer_and_cluster_collection(self, tmp_path):
+        clock = FakeClock()
+        other = MetricsCollector(window_size_minutes=1, clock=clock)
+        other.record_request(10, 200, "/api/a", "GET")
+        SnapshotWriter(other, str(tmp_path)).write_now()
+
+        # 模擬另一個 worker 的檔案 (不同 pid，行程仍存活)
+        (path,) = tmp_path.glob(f"worker-{os.getpid()}-*.json")
+        data = json.loads(path.read_text())
+        data["pid"] = os.getppid()
+        (tmp_path / f"worker-{os.getppid()}-1.json").write_text(json.dumps(data))
+        (tmp_path / "worker-broken.json").write_text("{")
+
+        # 本 worker 的即時數據取代自己寫出的檔案
+        local = MetricsCollector(window_size_minutes=1, clock=clock)
+        local.started_at = other.started_at
+        local.record_request(30, 200, "/api/a", "GET")
+
+        assert len(read_snapshots(str(tmp_path), exclude_pid=os.getpid())) == 1
+        cluster = collect_cluster_snapshot(local, str(tmp_path))
+        assert cluster["endpoints"][0]["count"] == 2
+        assert cluster["workers"] == 2
+
+    def test_reused_pid_keeps_dead_worker_totals(self, tmp_path):
+        clock = FakeClock()
+        dead = MetricsCollector(window_size_minutes=1, clock=clock)
+        dead.record_request(10, 200, "/api/a", "GET")
+        dead.record_queue_size(7, "email")
+        SnapshotWriter(dead, str(tmp_path)).write_now()
+
+        # 新 worker 沿用同一 pid，不覆寫舊 worker 的檔案
+        reused = MetricsCollector(window_size_minutes=1, clock=clock)
+        reused.started_at = dead.started_at + 1
+        reused.record_request(10, 200, "/api/a", "GET")
+        reused.record_queue_size(2, "email")
+        SnapshotWriter(reused, str(tmp_path)).write_now()
+
+        snapshots = read_snapshots(str(tmp_path))
+        assert len(snapshots) == 2
+        cluster = merge_snapshots(snapshots, clock.now, 60, live_pids={os.getpid()})
+        assert cluster["endpoints"][0]["count"] == 2
+        assert cluster["queue_sizes"] == {"email": 2}
+        assert cluster["workers"] == 1
+
+        local = collect_cluster_snapshot(reused, str(tmp_path))
+        assert local["endpoints"][0]["count"] == 2
+
+    def test_stop_writes_final_snapshot(self, tmp_path):
+        collector = MetricsCollector(window_size_minutes=1)
+        writer = SnapshotWriter(collector, str(tmp_path), interval=3600).start()
+        collector.record_request(10, 200, "/api/a", "GET")
+
+        writer.stop()
+
+        (snapshot,) = read_snapshots(str(tmp_path))
+        assert snapshot["endpoints"][0]["count"] == 1
+
+
+class TestPrometheusExport:
+    """Prometheus 文字格式測試"""
+
+    def test_render_histogram_and_counters(self):
+        clock = FakeClock()
+        snapshot = worker_snapshot(
+            1, clock, [("/api/a", 200, 3), ("/api/a", 200, 40), ("/api/a", 404, 700)]
+        )
+        cluster = merge_snapshots([snapshot], clock.now, 60, live_pids={1})
+
+        text = render_prometheus(cluster)
+        labels = 'endpoint="/api/a",method="GET"'
+
+        assert f"# TYPE {METRIC_PREFIX}_http_requests_total counter" in text
+        assert (
+            sample(
+                text, f'{METRIC_PREFIX}_http_requests_total{{{labels},status="4xx"}}'
+            )
+            == 1
+        )
+        histogram = f"{METRIC_PREFIX}_http_request_duration_seconds"
+        assert sample(text, f'{histogram}_bucket{{{labels},le="0.005"}}') == 1
+        assert sample(text, f'{histogram}_bucket{{{labels},le="0.05"}}') == 2
+        assert sample(text, f'{histogram}_bucket{{{labels},le="+Inf"}}') == 3
+        assert sample(text, f"{histogram}_count{{{labels}}}") == 3
+        assert (
+            sample(
+                text,
+                f'{METRIC_PREFIX}_external_calls_total{{service="smtp",result="failure"}}',
+            )
+            == 1
+        )
+        assert sample(text, f'{METRIC_PREFIX}_queue_size{{queue="email"}}') == 3
+
+    def test_label_values_are_escaped(self):
+        clock = FakeClock()
+        snapshot = worker_snapshot(1, clock, [('/api/"quoted"', 200, 3)])
+        cluster = merge_snapshots([snapshot], clock.now, 60, live_pids={1})
+
+        assert 'endpoint="/api/\\"quoted\\""' in render_prometheus(cluster)
+
+    def test_metrics_route(self, monkeypatch):
+        collector = MetricsCollector(window_size_minutes=1)
+        monkeypatch.setattr(monitoring_integration, "metrics_collector", collector)
+        monkeypatch.delenv("METRICS_MULTIPROC_DIR", raising=False)
+
+        app = Flask(__name__)
+        with app.app_context():
+            monitoring_integration.init_monitoring(app)
+
+        @app.route("/api/items/<int:item_id>")
+        def get_item(item_id):
+            return {"id": item_id}
+
+        client = app.test_client()
+        client.get("/api/items/1")
+        client.get("/api/items/2")
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        text = response.get_data(as_text=True)
+        assert (
+            f"{METRIC_PREFIX}_http_requests_total"
+            '{endpoint="/api/items/<int:item_id>",method="GET",status="2xx"} 2'
+        ) in text
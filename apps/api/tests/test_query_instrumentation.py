@@ -0,0 +1,151 @@
+"""
+SQL 查詢檢測：語句形狀、慢查詢記錄與 N+1 偵測測試
+"""
+
+import logging
+import os
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy.orm import joinedload
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "..", "monitoring"))
+
+from metrics_config import MetricsCollector  # noqa: E402
+
+import src.monitoring_integration as monitoring_integration  # noqa: E402
+import src.query_instrumentation as query_instrumentation  # noqa: E402
+from src.database import db  # noqa: E402
+from src.models.audit_log import AuditLog  # noqa: E402
+from src.models.tenant import Tenant  # noqa: E402,F401
+from src.models.user import User  # noqa: E402
+from src.query_instrumentation import (  # noqa: E402
+    QueryReport,
+    parameter_shape,
+    query_report,
+    statement_shape,
+)
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    collector = MetricsCollector(window_size_minutes=1)
+    monkeypatch.setattr(monitoring_integration, "metrics_collector", collector)
+    return collector
+
+
+@pytest.fixture
+def app(collector):
+    query_report.clear()
+    app = Flask(__name__)
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    db.init_app(app)
+    monitoring_integration.init_monitoring(app)
+
+    @app.route("/api/logs/naive")
+    def naive_logs():
+        return {"logs": [log.to_dict() for log in AuditLog.query.all()]}
+
+    @app.route("/api/logs/joined")
+    def joined_logs():
+        logs = AuditLog.query.options(joinedload(AuditLog.user)).all()
+        return {"logs": [log.to_dict() for log in logs]}
+
+    with app.app_context():
+        db.create_all()
+        for index in range(6):
+            user = User(username=f"user{index}", email=f"user{index}@example.com")
+            user.set_password("password123")
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(AuditLog(action="login", user_id=user.id))
+        db.session.commit()
+        # 清空 identity map，讓關聯延遲載入真的發出查詢
+        db.session.remove()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+class TestShapes:
+    """語句與參數形狀測試"""
+
+    def test_statement_shape_strips_literals_and_in_lists(self):
+        first = statement_shape(
+            "SELECT * FROM users\n WHERE id IN (?, ?, ?) AND name = 'bob' LIMIT 10"
+        )
+        second = statement_shape(
+            "SELECT * FROM users WHERE id IN (?, ?) AND name = 'o''neil' LIMIT 20"
+        )
+
+        assert first == second
+        assert first == "SELECT * FROM users WHERE id IN (?...) AND name = ? LIMIT ?"
+
+    def test_pyformat_placeholders(self):
+        assert statement_shape(
+            "SELECT users.id FROM users WHERE users.id = %(pk_1)s"
+        ) == ("SELECT users.id FROM users WHERE users.id = ?")
+
+    def test_parameter_shape_has_types_not_values(self):
+        assert parameter_shape((1, "secret", None)) == "(int, str, null)"
+        assert parameter_shape({"pk_1": 3}) == "{pk_1: int}"
+        assert parameter_shape([(1, "a"), (2, "b")], executemany=True) == "2×(int, str)"
+
+
+class TestNPlusOne:
+    """N+1 偵測測試"""
+
+    def test_lazy_loads_flagged(self, app, collector, caplog):
+        with caplog.at_level(logging.WARNING, logger=query_instrumentation.__name__):
+            response = app.test_client().get("/api/logs/naive")
+
+        assert response.status_code == 200
+        assert "N+1" in response.headers["Server-Timing"]
+        assert any("Possible N+1" in record.message for record in caplog.records)
+
+        report = query_report.snapshot()["n_plus_one"]
+        assert report[0]["endpoint"] == "/api/logs/naive"
+        assert report[0]["max_repeats"] == 6
+        assert "FROM users" in report[0]["statement"]
+
+        row = collector.get_endpoint_metrics()[0]
+        assert row["queries_per_request"] == 7
+        assert row["n_plus_one_requests"] == 1
+
+    def test_eager_load_not_flagged(self, app, collector):
+        response = app.test_client().get("/api/logs/joined")
+
+        assert "N+1" not in response.headers["Server-Timing"]
+        assert 'desc="Database (1 queries)"' in response.headers["Server-Timing"]
+        assert query_report.snapshot()["n_plus_one"] == []
+        assert collector.get_endpoint_metrics()[0]["n_plus_one_requests"] == 0
+
+
+class TestSlowQueries:
+    """慢查詢記錄測試"""
+
+    def test_slow_queries_logged_and_reported(self, app, monkeypatch, caplog):
+        monkeypatch.setattr(query_instrumentation, "SLOW_QUERY_MS", 0)
+
+        with caplog.at_level(logging.WARNING, logger=query_instrumentation.__name__):
+            app.test_client().get("/api/logs/joined")
+
+        slow = [record for record in caplog.records if "Slow query" in record.message]
+        assert slow and slow[0].endpoint == "/api/logs/joined"
+        assert "example.com" not in slow[0].message
+
+        response = app.test_client().get("/api/metrics/queries")
+        statements = response.get_json()["queries"]["slow_queries"]
+        assert any("FROM audit_logs" in row["statement"] for row in statements)
+
+    def test_report_keeps_slowest_when_full(self):
+        report = QueryReport(max_statements=2)
+        report.record_slow("SELECT a", "()", 300, None)
+        report.record_slow("SELECT b", "()", 500, None)
+        report.record_slow("SELECT c", "()", 100, None)
+        report.record_slow("SELECT d", "()", 400, None)
+
+        statements = [row["statement"] for row in report.snapshot()["slow_queries"]]
+        assert statements == ["SELECT b", "SELECT d"]
@@ -0,0 +1,193 @@
+"""
+請求階段計時與 Server-Timing 標頭測試
+"""
+
+import os
+import sys
+
+import jwt
+import pytest
+from flask import Flask, abort, jsonify, request
+from sqlalchemy import text
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "..", "monitoring"))
+
+from metrics_config import MetricsCollector  # noqa: E402
+from prometheus_export import METRIC_PREFIX, render_prometheus  # noqa: E402
+from worker_snapshots import merge_snapshots  # noqa: E402
+
+import src.monitoring_integration as monitoring_integration  # noqa: E402
+import src.request_timing as request_timing  # noqa: E402
+from src.database import db  # noqa: E402
+from src.decorators import token_required  # noqa: E402
+from src.models.tenant import Tenant  # noqa: E402,F401
+from src.models.user import User  # noqa: E402
+from src.request_timing import RequestTimer, phase  # noqa: E402
+
+
+class FakeTime:
+    """可手動推進的 perf_counter"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+
+def server_timing(response):
+    """解析 Server-Timing 標頭為 {名稱: 毫秒}"""
+    entries = {}
+    for entry in response.headers["Server-Timing"].split(", "):
+        name, duration = entry.split(";")[:2]
+        entries[name] = float(duration[len("dur=") :])
+    return entries
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    collector = MetricsCollector(window_size_minutes=1)
+    monkeypatch.setattr(monitoring_integration, "metrics_collector", collector)
+    return collector
+
+
+@pytest.fixture
+def app(collector):
+    app = Flask(__name__)
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    app.config["JWT_SECRET_KEY"] = "test-secret-key"
+    db.init_app(app)
+    monitoring_integration.init_monitoring(app)
+
+    @app.route("/api/items/<int:item_id>")
+    def get_item(item_id):
+        db.session.execute(text("SELECT 1"))
+        return {"id": item_id}
+
+    @app.route("/api/me")
+    @token_required
+    def get_me():
+        return jsonify({"email": request.current_user.email})
+
+    @app.route("/api/forbidden")
+    def forbidden():
+        abort(403)
+
+    @app.route("/api/broken")
+    def broken():
+        raise RuntimeError("boom")
+
+    with app.app_context():
+        db.create_all()
+        user = User(username="timer", email="timer@example.com", is_active=True)
+        user.set_password("password123")
+        db.session.add(user)
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+class TestRequestTimer:
+    """階段堆疊計時測試"""
+
+    def test_nested_phases_are_exclusive(self, monkeypatch):
+        clock = FakeTime()
+        monkeypatch.setattr(request_timing, "time", clock)
+        timer = RequestTimer()
+
+        timer.enter("view")
+        clock.now += 0.010
+        timer.enter("serialize")
+        clock.now += 0.004
+        timer.exit()
+        clock.now += 0.002
+        timer.exit()
+        timer.add("db", 3.0)
+
+        assert timer.phases["view"] == pytest.approx(12.0)
+        assert timer.phases["serialize"] == pytest.approx(4.0)
+        assert timer.server_timing(20.0) == (
+            'view;dur=12.00;desc="View function", db;dur=3.00;desc="Database", '
+            'serialize;dur=4.00;desc="JSON serialization", total;dur=20.00'
+        )
+
+    def test_phase_outside_request_is_noop(self):
+        with phase("view"):
+            pass
+
+
+class TestServerTiming:
+    """Server-Timing 標頭與指標測試"""
+
+    def test_view_db_and_serialize_phases(self, app, collector):
+        response = app.test_client().get("/api/items/7")
+
+        assert response.status_code == 200
+        timings = server_timing(response)
+        assert {"view", "db", "serialize", "total"} <= set(timings)
+        assert "auth" not in timings
+
+        row = collector.get_endpoint_metrics()[0]
+        assert row["endpoint"] == "/api/items/<int:item_id>"
+        assert {"view", "db", "serialize"} <= set(row["phase_ms"])
+
+    def test_auth_phases_from_token_decorator(self, app):
+        token = jwt.encode(
+            {"user_id": 1, "jti": "timing-jti"}, "test-secret-key", algorithm="HS256"
+        )
+
+        response = app.test_client().get(
+            "/api/me", headers={"Authorization": f"Bearer {token}"}
+        )
+
+        assert response.status_code == 200
+        assert {"auth", "blacklist", "principal", "view"} <= set(
+            server_timing(response)
+        )
+
+    def test_http_errors_keep_their_status(self, app, collector):
+        client = app.test_client()
+
+        assert client.get("/api/forbidden").status_code == 403
+        assert client.get("/api/missing").status_code == 404
+
+        statuses = {
+            row["endpoint"]: row["status_counts"]
+            for row in collector.get_endpoint_metrics()
+        }
+        assert statuses["/api/forbidden"] == {"4xx": 1}
+        assert statuses["other"] == {"4xx": 1}
+
+    def test_unhandled_exception_recorded_once(self, app, collector):
+        app.config["PROPAGATE_EXCEPTIONS"] = False
+
+        response = app.test_client().get("/api/broken")
+
+        assert response.status_code == 500
+        row = collector.get_endpoint_metrics()[0]
+        assert row["endpoint"] == "/api/broken"
+        assert row["status_counts"] == {"5xx": 1}
+        assert "Server-Timing" in response.headers
+
+    def test_header_can_be_disabled(self, app, monkeypatch):
+        monkeypatch.setattr(monitoring_integration, "SERVER_TIMING_ENABLED", False)
+
+        response = app.test_client().get("/api/items/1")
+
+        assert "Server-Timing" not in response.headers
+
+    def test_phase_totals_exported_to_prometheus(self, app, collector):
+        app.test_client().get("/api/items/1")
+
+        snapshot = collector.snapshot()
+        cluster = merge_snapshots(
+            [snapshot], snapshot["written_at"], 60, live_pids={snapshot["pid"]}
+        )
+        text_output = render_prometheus(cluster)
+
+        assert (
+            f"{METRIC_PREFIX}_http_request_phase_seconds_total"
+            '{endpoint="/api/items/<int:item_id>",method="GET",phase="db"}'
+        ) in text_output
@@ -0,0 +1,178 @@
+"""
+Webhook 重試排程器測試
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from src.database import db
+from src.main import app
+from src.models.webhook import Webhook, WebhookDelivery
+from src.services.retry_scheduler import RetryScheduler
+from src.services.webhook_service import webhook_service
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+class TestRetryScheduler:
+    """最小堆積重試排程測試"""
+
+    def test_pop_due_in_order(self):
+        now = datetime(2025, 1, 1, 12, 0, 0)
+        rows = [
+            (1, now - timedelta(seconds=5)),
+            (2, now + timedelta(seconds=10)),
+            (3, now - timedelta(seconds=1)),
+        ]
+        scheduler = RetryScheduler(
+            loader=lambda until, limit: sorted(rows, key=lambda r: r[1])
+        )
+        scheduler.reload(now)
+
+        assert scheduler.pop_due(now) == [1, 3]
+        assert scheduler.next_wakeup(now) == 10
+        assert scheduler.pop_due(now + timedelta(seconds=10)) == [2]
+
+    def test_schedule_outside_window_left_in_database(self):
+        now = datetime(2025, 1, 1, 12, 0, 0)
+        scheduler = RetryScheduler(loader=lambda until, limit: [], horizon_seconds=60)
+        scheduler.reload(now)
+
+        scheduler.schedule(1, now + timedelta(seconds=30))
+        scheduler.schedule(2, now + timedelta(hours=1))
+
+        assert scheduler.pending_count() == 1
+
+    def test_window_shrinks_when_memory_limit_reached(self):
+        now = datetime(2025, 1, 1, 12, 0, 0)
+        rows = [(i, now + timedelta(seconds=i)) for i in range(1, 4)]
+        scheduler = RetryScheduler(
+            loader=lambda until, limit: rows[:limit], max_in_memory=3
+        )
+        scheduler.reload(now)
+
+        # 窗口只延伸到最後一筆載入的時間點，之後的重試由下次載入處理
+        scheduler.schedule(99, now + timedelta(seconds=60))
+        assert scheduler.pending_count() == 3
+        assert scheduler.next_wakeup(now) == 1
+
+
+class TestRetryBackoff:
+    """重試退避與認領測試"""
+
+    def test_jittered_exponential_backoff(self, client):
+        with app.app_context():
+            webhook = Webhook(
+                name="hook", url="https://example.com", events=[], retry_delay=60
+            )
+            delivery = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload="{}",
+                attempt_count=3,
+                max_attempts=5,
+            )
+
+            before = datetime.utcnow()
+            assert delivery.schedule_retry() is True
+
+            delay = (delivery.next_retry_at - before).total_seconds()
+            assert delivery.status == "retrying"
+            assert delivery.attempt_count == 3
+            assert 120 <= delay <= 241
+
+    def test_dispatch_retries_claims_once(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            delivery = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload="{}",
+                status="retrying",
+                next_retry_at=datetime.utcnow(),
+            )
+            db.session.add(delivery)
+            db.session.commit()
+
+            with patch("src.services.webhook_service.delivery_scheduler") as scheduler:
+                assert webhook_service.dispatch_retries([delivery.id]) == 1
+                assert webhook_service.dispatch_retries([delivery.id]) == 0
+
+            assert scheduler.submit.call_count == 1
+            claimed = db.session.get(WebhookDelivery, delivery.id)
+            assert claimed.status == "pending"
+            assert claimed.claimed_at is not None
+
+    def test_claimed_retry_resubmitted_after_lease_expires(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            delivery = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload="{}",
+                status="retrying",
+                next_retry_at=datetime.utcnow(),
+            )
+            db.session.add(delivery)
+            db.session.commit()
+
+            # 認領後程序結束，記憶體中的傳送遺失
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                webhook_service.dispatch_retries([delivery.id])
+
+            with patch("src.services.webhook_service.delivery_scheduler") as scheduler:
+                assert webhook_service.resubmit_stale_deliveries(lease_seconds=600) == 0
+                assert webhook_service.resubmit_stale_deliveries(lease_seconds=0) == 1
+
+            assert scheduler.submit.call_count == 1
+
+
+class TestStaleDeliveries:
+    """租約逾期傳送的清掃測試"""
+
+    def test_resubmits_only_expired_pending_once(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            stale = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload='{"n": 1}',
+                claimed_at=datetime.utcnow() - timedelta(hours=1),
+            )
+            fresh = WebhookDelivery(
+                webhook=webhook, event_type="user.login", payload='{"n": 2}'
+            )
+            done = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload='{"n": 3}',
+                status="success",
+                claimed_at=datetime.utcnow() - timedelta(hours=1),
+            )
+            db.session.add_all([stale, fresh, done])
+            db.session.commit()
+
+            with patch("src.services.webhook_service.delivery_scheduler") as scheduler:
+                assert webhook_service.resubmit_stale_deliveries(lease_seconds=600) == 1
+                assert webhook_service.resubmit_stale_deliveries(lease_seconds=600) == 0
+
+            scheduler.submit.assert_called_once_with(
+                tenant_id=None, delivery_id=stale.id, plan=None
+            )
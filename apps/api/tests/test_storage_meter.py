@@ -0,0 +1,221 @@
+"""
+租戶儲存空間計量測試
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from src.database import db
+from src.main import app
+from src.models.tenant import Tenant, TenantStorageUsage
+from src.models.user import User
+from src.models.webhook import (
+    Webhook,
+    WebhookDelivery,
+    WebhookEvent,
+    WebhookPayload,
+)
+from src.services.storage_meter import storage_meter
+from src.services.webhook_service import webhook_service
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            storage_meter.clear()
+
+        yield client
+
+        with app.app_context():
+            storage_meter.clear()
+            db.drop_all()
+
+
+def create_tenant_with_webhook(slug):
+    tenant = Tenant(name=slug, slug=slug)
+    db.session.add(tenant)
+    db.session.flush()
+    db.session.add(
+        Webhook(
+            tenant_id=tenant.id,
+            name=f"{slug}-hook",
+            url="https://example.com",
+            events=["user.login"],
+        )
+    )
+    db.session.commit()
+    return tenant
+
+
+def source_bytes(tenant_id):
+    events = sum(
+        event.size_bytes for event in WebhookEvent.query.filter_by(tenant_id=tenant_id)
+    )
+    deliveries = sum(
+        delivery.size_bytes
+        for delivery in WebhookDelivery.query.join(Webhook).filter(
+            Webhook.tenant_id == tenant_id
+        )
+    )
+    return events, deliveries
+
+
+class TestStorageMeter:
+    """儲存空間計量測試"""
+
+    def test_writes_are_metered_and_flushed(self, client):
+        with app.app_context():
+            tenant = create_tenant_with_webhook("acme")
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                for index in range(3):
+                    webhook_service.trigger_event(
+                        "user.login", {"user_id": index}, tenant_id=tenant.id
+                    )
+
+            delivery = WebhookDelivery.query.first()
+            delivery.mark_as_failed(
+                "HTTP 500", 500, response_headers={}, response_body="error " * 50
+            )
+            db.session.commit()
+
+            assert storage_meter.flush() == 2
+            db.session.expire_all()
+
+            events, deliveries = source_bytes(tenant.id)
+            assert events > 0 and deliveries > 0
+            assert tenant.storage_bytes == events + deliveries
+            usage = {
+                row.category: row.bytes
+                for row in TenantStorageUsage.query.filter_by(tenant_id=tenant.id)
+            }
+            assert usage == {
+                "webhook_events": events,
+                "webhook_deliveries": deliveries,
+            }
+
+    def test_purge_releases_storage(self, client):
+        with app.app_context():
+            tenant = create_tenant_with_webhook("acme")
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                webhook_service.trigger_event("user.login", {}, tenant_id=tenant.id)
+            delivery = WebhookDelivery.query.first()
+            delivery.mark_as_success(200, {}, "ok")
+            delivery.created_at = datetime.utcnow() - timedelta(days=60)
+            db.session.commit()
+            storage_meter.flush()
+
+            webhook_service.purge_delivery_history(retention_days=30)
+            storage_meter.flush()
+            db.session.expire_all()
+
+            events, _ = source_bytes(tenant.id)
+            assert tenant.storage_bytes == events
+
+    def test_reconcile_corrects_drift_in_batches(self, client):
+        with app.app_context():
+            tenants = [create_tenant_with_webhook(slug) for slug in ["a", "b", "c"]]
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                for tenant in tenants:
+                    webhook_service.trigger_event(
+                        "user.login", {"user_id": 1}, tenant_id=tenant.id
+                    )
+            storage_meter.clear()  # 模擬漏記的增量
+
+            assert storage_meter.reconcile(batch_size=2) == 3
+            db.session.expire_all()
+
+            for tenant in tenants:
+                assert tenant.storage_bytes == sum(source_bytes(tenant.id))
+
+    def test_rolled_back_writes_not_metered(self, client):
+        with app.app_context():
+            tenant = create_tenant_with_webhook("acme")
+            db.session.add(
+                WebhookEvent(
+                    tenant_id=tenant.id, event_type="user.login", event_data={}
+                )
+            )
+            db.session.flush()
+            db.session.rollback()
+
+            assert storage_meter.flush() == 0
+            assert db.session.get(Tenant, tenant.id).storage_bytes == 0
+
+    def test_shared_payload_counted_once(self, client):
+        with app.app_context():
+            tenant = create_tenant_with_webhook("acme")
+            db.session.add(
+                Webhook(
+                    tenant_id=tenant.id,
+                    name="second-hook",
+                    url="https://example.org",
+                    events=["user.login"],
+                )
+            )
+            db.session.commit()
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                webhook_service.trigger_event("user.login", {}, tenant_id=tenant.id)
+            storage_meter.flush()
+            db.session.expire_all()
+
+            payload = WebhookPayload.query.one()
+            assert WebhookDelivery.query.count() == 2
+            events, deliveries = source_bytes(tenant.id)
+            assert deliveries == payload.size_bytes
+            assert tenant.storage_bytes == events + deliveries
+
+    def test_reconcile_keeps_other_workers_unflushed_deltas(self, client):
+        with app.app_context():
+            tenant = create_tenant_with_webhook("acme")
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                webhook_service.trigger_event("user.login", {}, tenant_id=tenant.id)
+
+            # 模擬其他程序：校正時其增量尚未寫回
+            with patch.object(storage_meter, "flush"):
+                storage_meter.reconcile()
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                webhook_service.trigger_event("user.login", {}, tenant_id=tenant.id)
+            storage_meter.flush()
+            db.session.expire_all()
+
+            assert tenant.storage_bytes == sum(source_bytes(tenant.id))
+
+    def test_quota_blocks_new_webhooks(self, client):
+        with app.app_context():
+            tenant = Tenant(name="Full", slug="full", max_storage_gb=1)
+            tenant.storage_bytes = 1024**3
+            db.session.add(tenant)
+            db.session.flush()
+            user = User(
+                username="owner",
+                email="owner@example.com",
+                tenant_id=tenant.id,
+                tenant_role="owner",
+            )
+            user.set_password("Password123!")
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id))
+
+            assert tenant.get_usage_stats()["storage"]["percentage"] == 100
+
+        response = client.post(
+            "/api/webhooks",
+            json={
+                "name": "hook",
+                "url": "https://example.com",
+                "events": ["user.login"],
+            },
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 403
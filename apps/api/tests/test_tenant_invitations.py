@@ -0,0 +1,388 @@
+"""
+租戶批次邀請、邀請過期掃描與郵件發送佇列測試
+"""
+
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+import src.routes.tenant as tenant_routes
+from src.database import db
+from src.main import app
+from src.models.tenant import Tenant, TenantInvitation
+from src.models.user import User
+from src.services.email_outbox import EmailOutbox
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """未啟動的郵件佇列，只收集放入的郵件"""
+    outbox = EmailOutbox(connection_factory=lambda: None)
+    monkeypatch.setattr(tenant_routes, "email_outbox", outbox)
+    return outbox
+
+
+@pytest.fixture
+def tenant(client):
+    """建立租戶與擁有者，回傳 (租戶 id, 擁有者 id, 請求標頭)"""
+    with app.app_context():
+        tenant = Tenant(name="Acme", slug="acme", max_users=10)
+        db.session.add(tenant)
+        db.session.flush()
+
+        owner = User(
+            username="owner",
+            email="owner@acme.test",
+            tenant_id=tenant.id,
+            tenant_role="owner",
+        )
+        owner.set_password("Password123!")
+        db.session.add(owner)
+        db.session.commit()
+
+        token = create_access_token(identity=str(owner.id))
+        return tenant.id, owner.id, {"Authorization": f"Bearer {token}"}
+
+
+class FakeConnection:
+    """記錄送出郵件的假 SMTP 連線"""
+
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.sent = []
+        self.closed = False
+
+    def send_message(self, message):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise smtplib.SMTPServerDisconnected("connection lost")
+        self.sent.append(message["To"])
+
+    def quit(self):
+        self.closed = True
+
+
+class RefusingConnection(FakeConnection):
+    """拒絕所有收件者的假 SMTP 連線"""
+
+    def send_message(self, message):
+        raise smtplib.SMTPRecipientsRefused({message["To"]: (550, b"no such user")})
+
+
+class TestBulkInvitations:
+    """批次邀請測試"""
+
+    def test_bulk_invite_skips_members_invited_and_invalid(
+        self, client, tenant, outbox
+    ):
+        tenant_id, owner_id, headers = tenant
+        with app.app_context():
+            db.session.add(
+                TenantInvitation(
+                    tenant_id=tenant_id,
+                    email="pending@acme.test",
+                    token="existing-token",
+                    invited_by_user_id=owner_id,
+                    expires_at=datetime.utcnow() + timedelta(days=1),
+                )
+            )
+            db.session.commit()
+
+        response = client.post(
+            f"/api/tenants/{tenant_id}/invitations/bulk",
+            json={
+                "emails": [
+                    "New1@Acme.test",
+                    "new1@acme.test",
+                    "new2@acme.test",
+                    "OWNER@acme.test",
+                    "Pending@acme.test",
+                    "not-an-email",
+                ]
+            },
+            headers=headers,
+        )
+
+        assert response.status_code == 201, response.get_json()
+        data = response.get_json()
+        assert data["invited"] == 2
+        assert data["emails_queued"] == 2
+        assert data["skipped"] == {
+            "already_member": ["owner@acme.test"],
+            "already_invited": ["pending@acme.test"],
+            "invalid": ["not-an-email"],
+            "duplicates": 1,
+        }
+        assert outbox.get_stats()["pending"] == 2
+
+        with app.app_context():
+            emails = {
+                invitation.email
+                for invitation in TenantInvitation.query.filter_by(role="member")
+            }
+            assert emails == {"new1@acme.test", "new2@acme.test"}
+
+    def test_bulk_invite_respects_seat_limit(self, client, tenant, outbox):
+        tenant_id, _, headers = tenant
+
+        response = client.post(
+            f"/api/tenants/{tenant_id}/invitations/bulk",
+            json={"emails": [f"user{i}@acme.test" for i in range(10)]},
+            headers=headers,
+        )
+
+        assert response.status_code == 400
+        assert response.get_json()["requested"] == 10
+        assert response.get_json()["available"] == 9
+        with app.app_context():
+            assert TenantInvitation.query.count() == 0
+        assert outbox.get_stats()["pending"] == 0
+
+    def test_bulk_invite_rejects_bad_payload(self, client, tenant, outbox):
+        tenant_id, _, headers = tenant
+
+        for payload in [{}, {"emails": []}, {"emails": ["a@b.test"], "role": "owner"}]:
+            response = client.post(
+                f"/api/tenants/{tenant_id}/invitations/bulk",
+                json=payload,
+                headers=headers,
+            )
+            assert response.status_code == 400, payload
+
+
+class TestInvitationExpiry:
+    """邀請過期掃描測試"""
+
+    def test_expire_overdue_in_batches(self, client, tenant):
+        tenant_id, owner_id, _ = tenant
+        now = datetime.utcnow()
+
+        with app.app_context():
+            for index in range(5):
+                db.session.add(
+                    TenantInvitation(
+                        tenant_id=tenant_id,
+                        email=f"old{index}@acme.test",
+                        token=f"old-{index}",
+                        invited_by_user_id=owner_id,
+                        expires_at=now - timedelta(hours=1),
+                    )
+                )
+            db.session.add(
+                TenantInvitation(
+                    tenant_id=tenant_id,
+                    email="fresh@acme.test",
+                    token="fresh",
+                    invited_by_user_id=owner_id,
+                    expires_at=now + timedelta(days=1),
+                )
+            )
+            db.session.commit()
+
+            assert TenantInvitation.expire_overdue(batch_size=2, now=now) == 5
+            assert TenantInvitation.query.filter_by(is_expired=True).count() == 5
+            assert TenantInvitation.get_by_token("fresh") is not None
+            assert TenantInvitation.expire_overdue(batch_size=2, now=now) == 0
+
+
+class TestInvitationEmails:
+    """邀請郵件寄出記錄與補寄測試"""
+
+    def test_sent_emails_recorded_on_invitation(self, client, tenant, outbox):
+        tenant_id, _, headers = tenant
+
+        response = client.post(
+            f"/api/tenants/{tenant_id}/invitations/bulk",
+            json={"emails": ["new1@acme.test", "new2@acme.test"]},
+            headers=headers,
+        )
+        assert response.status_code == 201
+        with app.app_context():
+            invitations = TenantInvitation.query.all()
+            assert all(invitation.email_queued_at for invitation in invitations)
+            assert not any(invitation.email_sent_at for invitation in invitations)
+
+        outbox._connection_factory = FakeConnection
+        outbox.start()
+        outbox.stop()
+
+        with app.app_context():
+            assert all(
+                invitation.email_sent_at for invitation in TenantInvitation.query
+            )
+
+    def test_unsent_emails_requeued_after_lease(self, client, tenant, outbox):
+        tenant_id, owner_id, _ = tenant
+        now = datetime.utcnow()
+
+        with app.app_context():
+            for token, queued_at, sent_at in [
+                ("lost", now - timedelta(hours=1), None),
+                ("in-flight", now, None),
+                ("sent", now - timedelta(hours=1), now),
+            ]:
+                db.session.add(
+                    TenantInvitation(
+                        tenant_id=tenant_id,
+                        email=f"{token}@acme.test",
+                        token=token,
+                        invited_by_user_id=owner_id,
+                        expires_at=now + timedelta(days=1),
+                        email_queued_at=queued_at,
+                        email_sent_at=sent_at,
+                    )
+                )
+            db.session.commit()
+
+            assert tenant_routes.resend_unsent_invitation_emails(lease_seconds=600) == 1
+            assert tenant_routes.resend_unsent_invitation_emails(lease_seconds=600) == 0
+
+        message, on_sent, _ = outbox._queue.get_nowait()
+        assert message["To"] == "lost@acme.test"
+        assert outbox.get_stats()["pending"] == 0
+
+        on_sent()
+        with app.app_context():
+            assert TenantInvitation.get_by_token("lost").email_sent_at is not None
+
+    def test_failed_emails_recorded_and_not_requeued(self, client, tenant, outbox):
+        tenant_id, owner_id, _ = tenant
+        now = datetime.utcnow()
+
+        with app.app_context():
+            db.session.add(
+                TenantInvitation(
+                    tenant_id=tenant_id,
+                    email="refused@acme.test",
+                    token="refused",
+                    invited_by_user_id=owner_id,
+                    expires_at=now + timedelta(days=1),
+                    email_queued_at=now - timedelta(hours=1),
+                )
+            )
+            db.session.commit()
+
+            assert tenant_routes.resend_unsent_invitation_emails(lease_seconds=600) == 1
+
+        outbox._connection_factory = RefusingConnection
+        outbox.start()
+        outbox.stop()
+
+        with app.app_context():
+            invitation = TenantInvitation.get_by_token("refused")
+            assert invitation.email_sent_at is None
+            assert invitation.email_failed_at is not None
+            assert (
+                TenantInvitation.claim_unsent_emails(
+                    lease_seconds=0, now=now + timedelta(hours=1)
+                )
+                == []
+            )
+
+
+class TestEmailOutbox:
+    """郵件發送佇列測試"""
+
+    def test_stop_drains_queue_and_reports_sent(self):
+        connections = []
+        sent = []
+
+        def connect():
+            connections.append(FakeConnection())
+            return connections[-1]
+
+        outbox = EmailOutbox(connection_factory=connect, pool_size=1)
+        outbox.enqueue_many(
+            (f"user{i}@acme.test", "Hi", "Body", lambda i=i: sent.append(i))
+            for i in range(3)
+        )
+        outbox.start()
+        outbox.stop()
+
+        assert len(connections[0].sent) == 3
+        assert sorted(sent) == [0, 1, 2]
+
+    def test_worker_reuses_connection(self):
+        connections = []
+
+        def connect():
+            connections.append(FakeConnection())
+            return connections[-1]
+
+        outbox = EmailOutbox(connection_factory=connect, pool_size=1)
+        outbox.start()
+        try:
+            outbox.enqueue_many((f"user{i}@acme.test", "Hi", "Body") for i in range(5))
+            outbox.join()
+        finally:
+            outbox.stop()
+
+        assert len(connections) == 1
+        assert len(connections[0].sent) == 5
+        assert connections[0].closed
+        assert outbox.get_stats()["sent"] == 5
+
+    def test_failed_send_reconnects_and_retries(self):
+        connections = []
+
+        def connect():
+            connections.append(FakeConnection(fail_times=1 if not connections else 0))
+            return connections[-1]
+
+        outbox = EmailOutbox(connection_factory=connect, pool_size=1)
+        outbox._stop_event.wait = lambda timeout: None
+        outbox.enqueue("user@acme.test", "Hi", "Body")
+        message, _, _ = outbox._queue.get_nowait()
+
+        connection = outbox._deliver(None, message)
+
+        assert len(connections) == 2
+        assert connection is connections[1]
+        assert connections[1].sent == ["user@acme.test"]
+        assert outbox.get_stats()["failed"] == 0
+
+    def test_exhausted_retries_report_failure(self):
+        sent, failed = [], []
+        outbox = EmailOutbox(
+            connection_factory=lambda: FakeConnection(fail_times=1), max_attempts=2
+        )
+        outbox._stop_event.wait = lambda timeout: None
+        outbox.enqueue(
+            "user@acme.test",
+            "Hi",
+            "Body",
+            on_sent=lambda: sent.append(1),
+            on_failed=lambda: failed.append(1),
+        )
+
+        outbox._deliver(None, *outbox._queue.get_nowait())
+
+        assert sent == []
+        assert failed == [1]
+        assert outbox.get_stats()["failed"] == 1
+
+    def test_full_queue_drops(self):
+        outbox = EmailOutbox(connection_factory=lambda: None, max_queue_size=1)
+
+        assert outbox.enqueue("a@acme.test", "Hi", "Body")
+        assert not outbox.enqueue("b@acme.test", "Hi", "Body")
+        assert outbox.get_stats()["dropped"] == 1
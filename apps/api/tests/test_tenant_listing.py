@@ -0,0 +1,131 @@
+"""
+租戶列表分頁與篩選測試
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from src.database import db
+from src.main import app
+from src.models.tenant import Tenant
+from src.models.user import User
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+@pytest.fixture
+def admin_headers(client):
+    with app.app_context():
+        admin = User(username="admin", email="admin@example.com", role="admin")
+        admin.set_password("Password123!")
+        db.session.add(admin)
+        db.session.commit()
+        token = create_access_token(identity=str(admin.id))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_tenants(count):
+    now = datetime.utcnow()
+    for index in range(count):
+        db.session.add(
+            Tenant(
+                name=f"Tenant {index:02d}",
+                slug=f"tenant-{index}",
+                plan="premium" if index % 2 else "free",
+                is_active=index % 3 != 0,
+                trial_ends_at=now + timedelta(days=index),
+            )
+        )
+    db.session.commit()
+
+
+def fetch_all(client, headers, query):
+    """依游標走訪所有頁面"""
+    pages = []
+    cursor = None
+    while True:
+        url = f"/api/tenants?{query}" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        pages.append(data["tenants"])
+        cursor = data["pagination"]["next_cursor"]
+        if not data["pagination"]["has_more"]:
+            assert cursor is None
+            return pages
+
+
+class TestTenantListing:
+    """租戶列表測試"""
+
+    def test_keyset_pages_cover_all_tenants(self, client, admin_headers):
+        with app.app_context():
+            create_tenants(7)
+
+        pages = fetch_all(client, admin_headers, "limit=3&sort=-name")
+
+        assert [len(page) for page in pages] == [3, 3, 1]
+        names = [tenant["name"] for page in pages for tenant in page]
+        assert names == sorted(names, reverse=True)
+        assert "usage" in pages[0][0]
+
+    def test_filters(self, client, admin_headers):
+        with app.app_context():
+            create_tenants(6)
+            cutoff = (datetime.utcnow() + timedelta(days=3, hours=12)).isoformat()
+
+        pages = fetch_all(
+            client,
+            admin_headers,
+            f"plan=premium&is_active=true&trial_expires_before={cutoff}",
+        )
+        slugs = [tenant["slug"] for page in pages for tenant in page]
+        assert slugs == ["tenant-1"]
+
+    def test_sort_by_member_count_breaks_ties_by_id(self, client, admin_headers):
+        with app.app_context():
+            create_tenants(4)
+            user = User(username="member", email="member@example.com")
+            user.set_password("Password123!")
+            user.tenant = Tenant.query.filter_by(slug="tenant-2").first()
+            db.session.add(user)
+            db.session.commit()
+
+        pages = fetch_all(client, admin_headers, "limit=1&sort=-member_count")
+        slugs = [page[0]["slug"] for page in pages]
+        assert slugs == ["tenant-2", "tenant-3", "tenant-1", "tenant-0"]
+
+    def test_invalid_parameters(self, client, admin_headers):
+        for query in ["sort=password", "cursor=not-a-cursor", "is_active=yes"]:
+            response = client.get(f"/api/tenants?{query}", headers=admin_headers)
+            assert response.status_code == 400
+
+    def test_requires_admin(self, client):
+        with app.app_context():
+            user = User(username="member", email="member@example.com")
+            user.set_password("Password123!")
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id))
+
+        response = client.get(
+            "/api/tenants", headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 403
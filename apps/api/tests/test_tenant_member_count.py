@@ -0,0 +1,105 @@
+"""
+租戶成員數量計數測試
+"""
+
+import pytest
+from sqlalchemy import event
+
+from src.database import db
+from src.main import app
+from src.models.tenant import Tenant
+from src.models.user import User
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+def make_user(name, **kwargs):
+    user = User(username=name, email=f"{name}@example.com", **kwargs)
+    user.set_password("Password123!")
+    return user
+
+
+class TestTenantMemberCount:
+    """成員數量在加入、離開與刪除時維護"""
+
+    def test_join_move_and_delete(self, client):
+        with app.app_context():
+            tenant_a = Tenant(name="A", slug="a", max_users=2)
+            tenant_b = Tenant(name="B", slug="b")
+            db.session.add_all([tenant_a, tenant_b])
+            db.session.commit()
+
+            alice = make_user("alice", tenant_id=tenant_a.id)
+            bob = make_user("bob")
+            bob.tenant = tenant_a
+            db.session.add_all([alice, bob])
+            db.session.commit()
+
+            assert tenant_a.member_count == 2
+            assert tenant_a.can_add_user() is False
+
+            bob.tenant_id = tenant_b.id
+            db.session.commit()
+            assert tenant_a.member_count == 1
+            assert tenant_b.member_count == 1
+
+            db.session.delete(alice)
+            db.session.commit()
+            assert tenant_a.member_count == 0
+            assert tenant_a.to_dict()["user_count"] == 0
+
+    def test_refresh_member_counts(self, client):
+        with app.app_context():
+            tenant = Tenant(name="A", slug="a")
+            db.session.add(tenant)
+            db.session.flush()
+            db.session.add_all(
+                [make_user(f"user{i}", tenant_id=tenant.id) for i in range(3)]
+            )
+            db.session.commit()
+
+            tenant.member_count = 0
+            db.session.commit()
+
+            Tenant.refresh_member_counts()
+            db.session.commit()
+            assert tenant.member_count == 3
+
+    def test_list_tenants_does_not_load_users(self, client):
+        with app.app_context():
+            for index in range(3):
+                tenant = Tenant(name=f"T{index}", slug=f"t{index}")
+                db.session.add(tenant)
+                db.session.flush()
+                db.session.add(make_user(f"user{index}", tenant_id=tenant.id))
+            db.session.commit()
+            db.session.expire_all()
+
+            statements = []
+
+            def record(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(db.engine, "before_cursor_execute", record)
+            try:
+                data = [tenant.to_dict() for tenant in Tenant.query.all()]
+            finally:
+                event.remove(db.engine, "before_cursor_execute", record)
+
+            assert [item["user_count"] for item in data] == [1, 1, 1]
+            assert len(statements) == 1
@@ -0,0 +1,169 @@
+"""
+租戶成員目錄分頁、搜尋與欄位選擇測試
+"""
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from src.database import db
+from src.main import app
+from src.models.tenant import Tenant
+from src.models.user import User
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+@pytest.fixture
+def directory(client):
+    """建立一個有 12 位成員的租戶與另一個租戶的成員，回傳 (租戶 id, 請求標頭)"""
+    with app.app_context():
+        tenant = Tenant(name="Acme", slug="acme", max_users=100)
+        other = Tenant(name="Other", slug="other")
+        db.session.add_all([tenant, other])
+        db.session.flush()
+
+        for index in range(12):
+            member = User(
+                username=f"user{index:02d}",
+                email=f"{'alice' if index < 3 else 'bob'}{index}@acme.test",
+                tenant_id=tenant.id,
+                tenant_role=["owner", "admin", "member"][min(index, 2)],
+                is_active=index != 11,
+            )
+            member.set_password("Password123!")
+            db.session.add(member)
+
+        outsider = User(
+            username="user_outsider",
+            email="alice@other.test",
+            tenant_id=other.id,
+        )
+        outsider.set_password("Password123!")
+        db.session.add(outsider)
+        db.session.commit()
+
+        owner = User.query.filter_by(username="user00").one()
+        token = create_access_token(identity=str(owner.id))
+        return tenant.id, {"Authorization": f"Bearer {token}"}
+
+
+def fetch_all(client, headers, url):
+    """依游標走訪所有頁面"""
+    members, cursor = [], None
+    while True:
+        query = f"&cursor={cursor}" if cursor else ""
+        response = client.get(f"{url}{query}", headers=headers)
+        assert response.status_code == 200, response.get_json()
+        data = response.get_json()
+        members.extend(data["members"])
+        cursor = data["pagination"]["next_cursor"]
+        if not cursor:
+            return members
+
+
+class TestMemberDirectory:
+    """成員目錄測試"""
+
+    def test_keyset_pages_cover_all_members(self, client, directory):
+        tenant_id, headers = directory
+
+        members = fetch_all(
+            client, headers, f"/api/tenants/{tenant_id}/members?limit=5&sort=-username"
+        )
+
+        usernames = [member["username"] for member in members]
+        assert usernames == sorted((f"user{i:02d}" for i in range(12)), reverse=True)
+
+    def test_prefix_search_matches_username_or_email(self, client, directory):
+        tenant_id, headers = directory
+
+        response = client.get(
+            f"/api/tenants/{tenant_id}/members?q=ALICE", headers=headers
+        )
+        emails = [member["email"] for member in response.get_json()["members"]]
+        assert emails == ["alice0@acme.test", "alice1@acme.test", "alice2@acme.test"]
+
+        response = client.get(
+            f"/api/tenants/{tenant_id}/members?q=user1", headers=headers
+        )
+        assert len(response.get_json()["members"]) == 2
+
+    def test_contains_search_escapes_wildcards(self, client, directory):
+        tenant_id, headers = directory
+
+        response = client.get(
+            f"/api/tenants/{tenant_id}/members?q=ob1&match=contains", headers=headers
+        )
+        assert [m["username"] for m in response.get_json()["members"]] == [
+            "user10",
+            "user11",
+        ]
+
+        response = client.get(
+            f"/api/tenants/{tenant_id}/members?q=user_&match=contains", headers=headers
+        )
+        assert response.get_json()["members"] == []
+
+    def test_role_and_status_filters(self, client, directory):
+        tenant_id, headers = directory
+
+        response = client.get(
+            f"/api/tenants/{tenant_id}/members?role=owner,admin", headers=headers
+        )
+        roles = [member["tenant_role"] for member in response.get_json()["members"]]
+        assert roles == ["owner", "admin"]
+
+        response = client.get(
+            f"/api/tenants/{tenant_id}/members?is_active=false", headers=headers
+        )
+        assert [m["username"] for m in response.get_json()["members"]] == ["user11"]
+
+    def test_sparse_fields(self, client, directory):
+        tenant_id, headers = directory
+
+        response = client.get(
+            f"/api/tenants/{tenant_id}/members?fields=username&limit=2&sort=email",
+            headers=headers,
+        )
+        data = response.get_json()
+        assert data["members"] == [{"username": "user00"}, {"username": "user01"}]
+        assert data["pagination"]["next_cursor"]
+
+    def test_invalid_parameters_rejected(self, client, directory):
+        tenant_id, headers = directory
+
+        for query in [
+            "fields=password_hash",
+            "role=superuser",
+            "sort=password_hash",
+            "match=regex&q=a",
+            "cursor=not-a-cursor",
+        ]:
+            response = client.get(
+                f"/api/tenants/{tenant_id}/members?{query}", headers=headers
+            )
+            assert response.status_code == 400, query
+
+    def test_other_tenant_forbidden(self, client, directory):
+        _, headers = directory
+
+        with app.app_context():
+            other_id = Tenant.query.filter_by(slug="other").one().id
+
+        response = client.get(f"/api/tenants/{other_id}/members", headers=headers)
+        assert response.status_code == 403
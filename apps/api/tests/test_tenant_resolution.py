@@ -0,0 +1,168 @@
+"""
+租戶解析快取與中介層測試
+"""
+
+import time
+from unittest.mock import patch
+
+import pytest
+from flask import g
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from src.database import db
+from src.main import app
+from src.models.tenant import Tenant
+from src.models.user import User
+from src.services.tenant_resolver import TenantResolver, tenant_resolver
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    tenant_resolver.clear()
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.add(Tenant(name="Acme", slug="acme", domain="acme.example.com"))
+            db.session.commit()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+    tenant_resolver.clear()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(db.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, "before_cursor_execute", self._record)
+
+    def _record(self, *args):
+        self.count += 1
+
+
+class TestTenantResolver:
+    """解析快取測試"""
+
+    def test_cached_resolution_costs_no_sql(self, client):
+        resolver = TenantResolver()
+        with app.app_context():
+            with QueryCounter() as queries:
+                first = resolver.resolve_host("ACME.example.com:443")
+                for _ in range(10):
+                    assert resolver.resolve_host("acme.example.com") == first
+            assert queries.count == 1
+            assert first.slug == "acme"
+
+    def test_negative_entries_expire(self, client):
+        resolver = TenantResolver(ttl=60, negative_ttl=5)
+        with app.app_context():
+            with QueryCounter() as queries:
+                assert resolver.resolve_host("unknown.example.com") is None
+                assert resolver.resolve_host("unknown.example.com") is None
+            assert queries.count == 1
+
+            now = time.monotonic()
+            with patch(
+                "src.services.tenant_resolver.time.monotonic", return_value=now + 6
+            ):
+                with QueryCounter() as queries:
+                    resolver.resolve_host("unknown.example.com")
+                assert queries.count == 1
+
+    def test_base_domain_subdomain_resolves_slug(self, client):
+        resolver = TenantResolver(base_domain="morningai.app")
+        with app.app_context():
+            tenant = resolver.resolve_host("acme.morningai.app")
+            assert tenant is not None and tenant.slug == "acme"
+            assert resolver.resolve_host("other.morningai.app") is None
+
+    def test_max_size_evicts_least_recently_used(self, client):
+        resolver = TenantResolver(max_size=2)
+        with app.app_context():
+            resolver.resolve_slug("acme")
+            resolver.resolve_slug("missing-1")
+            resolver.resolve_slug("missing-2")
+        assert resolver.get_stats()["size"] == 2
+
+
+class TestTenantResolutionMiddleware:
+    """中介層與失效測試"""
+
+    def test_request_host_sets_g_tenant(self, client):
+        with app.test_request_context(
+            "/api/tenants", base_url="http://acme.example.com"
+        ):
+            app.preprocess_request()
+            assert g.tenant.slug == "acme"
+
+    def test_update_tenant_invalidates_domain(self, client):
+        with app.app_context():
+            admin = User(username="admin", email="admin@example.com", role="admin")
+            admin.set_password("Password123!")
+            db.session.add(admin)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+            tenant_id = Tenant.query.filter_by(slug="acme").first().id
+
+            assert tenant_resolver.resolve_host("acme.example.com") is not None
+            assert tenant_resolver.resolve_host("new.example.com") is None
+
+        response = client.put(
+            f"/api/tenants/{tenant_id}",
+            json={"domain": "new.example.com"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 200
+
+        with app.app_context():
+            assert tenant_resolver.resolve_host("acme.example.com") is None
+            assert tenant_resolver.resolve_host("new.example.com").id == tenant_id
+
+        response = client.put(
+            f"/api/tenants/{tenant_id}",
+            json={"is_active": False},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 200
+
+        with app.app_context():
+            assert tenant_resolver.resolve_host("new.example.com") is None
+            assert tenant_resolver.resolve_slug("acme") is None
+
+    def test_invalidation_reaches_other_processes_after_version_check(self, client):
+        # 另一個解析器代表其他 worker 程序中的快取
+        other = TenantResolver(version_check_interval=5)
+        with app.app_context():
+            assert other.resolve_slug("acme") is not None
+
+            tenant = Tenant.query.filter_by(slug="acme").first()
+            tenant.is_active = False
+            db.session.commit()
+            tenant_resolver.invalidate(slug="acme", tenant_id=tenant.id)
+
+            # 比對間隔內仍使用快取，且不查詢資料庫
+            with QueryCounter() as queries:
+                assert other.resolve_slug("acme") is not None
+            assert queries.count == 0
+
+            now = time.monotonic()
+            with patch(
+                "src.services.tenant_resolver.time.monotonic", return_value=now + 6
+            ):
+                assert other.resolve_slug("acme") is None
+                with QueryCounter() as queries:
+                    assert other.resolve_slug("acme") is None
+                assert queries.count == 0
@@ -0,0 +1,370 @@
+"""
+租戶分片路由與線上搬移測試
+"""
+
+from unittest.mock import patch
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, func, select
+
+from src.database import (
+    TenantFrozenError,
+    db,
+    shard_context,
+    shard_router,
+    tenant_context,
+)
+from src.main import app
+from src.models.tenant import Tenant, TenantShard, TenantStorageUsage
+from src.models.user import User
+from src.models.webhook import (
+    Webhook,
+    WebhookBatchItem,
+    WebhookDelivery,
+    WebhookEvent,
+    WebhookEventFanout,
+)
+from src.services.shard_mover import (
+    ShardMoveError,
+    TenantShardMover,
+    ensure_shard_schema,
+)
+from src.services.storage_meter import storage_meter
+from src.services.webhook_service import webhook_service
+
+
+@pytest.fixture
+def client(tmp_path):
+    """測試客戶端 (另一個 SQLite 檔案作為分片 big)"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    cache_ttl, freeze_timeout = shard_router.cache_ttl, shard_router.freeze_timeout
+    shard_router.cache_ttl = 0
+    shard_router.freeze_timeout = 0.2
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            storage_meter.clear()
+            shard_router.configure({"big": f"sqlite:///{tmp_path / 'big.db'}"})
+            ensure_shard_schema("big")
+
+        yield client
+
+        with app.app_context():
+            storage_meter.clear()
+            db.drop_all()
+
+    shard_router.configure({})
+    shard_router.cache_ttl, shard_router.freeze_timeout = cache_ttl, freeze_timeout
+
+
+def create_tenant(slug, shard=None):
+    tenant = Tenant(name=slug, slug=slug)
+    db.session.add(tenant)
+    db.session.flush()
+    if shard:
+        db.session.add(TenantShard(tenant_id=tenant.id, shard=shard, status="active"))
+    db.session.commit()
+    return tenant
+
+
+def add_events(tenant_id, count):
+    with tenant_context(tenant_id, write=True):
+        for i in range(count):
+            db.session.add(
+                WebhookEvent(
+                    tenant_id=tenant_id, event_type="user.login", event_data={"i": i}
+                )
+            )
+        db.session.commit()
+
+
+def count_events(shard, tenant_id):
+    engine = shard_router.get_engine(shard)
+    with engine.connect() as connection:
+        return connection.execute(
+            select(func.count())
+            .select_from(WebhookEvent.__table__)
+            .where(WebhookEvent.__table__.c.tenant_id == tenant_id)
+        ).scalar()
+
+
+class TestShardRouting:
+    """查詢路由測試"""
+
+    def test_no_shards_configured_skips_routing_table(self, client):
+        with app.app_context():
+            tenant = create_tenant("acme")
+            shard_router.configure({})
+
+            statements = []
+
+            def listener(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                with tenant_context(tenant.id) as shard:
+                    WebhookEvent.query.filter_by(tenant_id=tenant.id).all()
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+
+            assert shard is None
+            assert not any("tenant_shards" in sql for sql in statements)
+
+    def test_events_written_and_read_on_tenant_shard(self, client):
+        with app.app_context():
+            shared = create_tenant("shared")
+            big = create_tenant("big", shard="big")
+
+            add_events(shared.id, 2)
+            event = webhook_service.trigger_event(
+                "user.login", {"user_id": 1}, tenant_id=big.id
+            )
+
+            assert event.id is not None
+            assert event.tenant_id == big.id
+            assert count_events("default", big.id) == 0
+            assert count_events("big", big.id) == 1
+            assert count_events("default", shared.id) == 2
+
+            with tenant_context(big.id):
+                events = WebhookEvent.query.filter_by(tenant_id=big.id).all()
+            assert [e.event_data for e in events] == [{"user_id": 1}]
+
+    def test_event_fan_out_completed_when_deliveries_not_committed(self, client):
+        with app.app_context():
+            big = create_tenant("big", shard="big")
+            db.session.add(
+                Webhook(
+                    tenant_id=big.id,
+                    name="hook",
+                    url="https://example.com",
+                    events=["user.login"],
+                )
+            )
+            db.session.commit()
+
+            # 事件已提交到分片，但傳送記錄在共用資料庫中未能提交
+            with patch.object(webhook_service, "_fan_out"):
+                webhook_service.trigger_event(
+                    "user.login", {"user_id": 1}, tenant_id=big.id
+                )
+            assert count_events("big", big.id) == 1
+            assert WebhookDelivery.query.count() == 0
+
+            with patch("src.services.webhook_service.delivery_scheduler") as scheduler:
+                assert (
+                    webhook_service.complete_unprocessed_events(grace_seconds=600) == 0
+                )
+                assert (
+                    webhook_service.complete_unprocessed_events(grace_seconds=-60) == 1
+                )
+                assert (
+                    webhook_service.complete_unprocessed_events(grace_seconds=-60) == 0
+                )
+
+            assert WebhookDelivery.query.count() == 1
+            assert scheduler.submit.call_count == 1
+            with tenant_context(big.id):
+                event = WebhookEvent.query.filter_by(tenant_id=big.id).one()
+                assert event.processed_at is not None
+
+    def test_batched_event_not_fanned_out_again_after_batch_sent(self, client):
+        with app.app_context():
+            big = create_tenant("big", shard="big")
+            db.session.add(
+                Webhook(
+                    tenant_id=big.id,
+                    name="hook",
+                    url="https://example.com",
+                    events=["user.login"],
+                    batch_enabled=True,
+                )
+            )
+            db.session.commit()
+
+            with patch("src.services.webhook_service.webhook_batcher") as batcher:
+                batcher.add.return_value = []
+                event_id = webhook_service.trigger_event(
+                    "user.login", {"user_id": 1}, tenant_id=big.id
+                ).id
+                assert batcher.add.call_count == 1
+
+                # 批次已送出 (暫存項目已刪除)，但事件的 processed_at 未能在分片提交
+                WebhookBatchItem.query.delete()
+                db.session.commit()
+                with shard_router.get_engine("big").begin() as connection:
+                    connection.execute(
+                        WebhookEvent.__table__.update()
+                        .where(WebhookEvent.__table__.c.id == event_id)
+                        .values(processed_at=None)
+                    )
+
+                assert (
+                    webhook_service.complete_unprocessed_events(grace_seconds=-60) == 1
+                )
+                assert batcher.add.call_count == 1
+
+            assert WebhookBatchItem.query.count() == 0
+            assert WebhookEventFanout.query.count() == 1
+
+    def test_same_ids_on_different_shards_do_not_collide(self, client):
+        with app.app_context():
+            shared = create_tenant("shared")
+            big = create_tenant("big", shard="big")
+            add_events(shared.id, 1)
+            add_events(big.id, 1)
+
+            shared_event = WebhookEvent.query.filter_by(tenant_id=shared.id).one()
+            with tenant_context(big.id):
+                big_event = WebhookEvent.query.filter_by(tenant_id=big.id).one()
+
+            assert shared_event.id == big_event.id
+            assert shared_event is not big_event
+            assert big_event.tenant_id == big.id
+
+    def test_recent_events_merge_tenant_shard_and_global_events(self, client):
+        with app.app_context():
+            tenant = create_tenant("big", shard="big")
+            user = User(
+                username="member",
+                email="member@example.com",
+                tenant_id=tenant.id,
+                tenant_role="member",
+            )
+            user.set_password("Password123!")
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id))
+            tenant_id = tenant.id
+
+            add_events(None, 1)
+            add_events(tenant_id, 2)
+
+        response = client.get(
+            "/api/webhook-events/recent?limit=2&offset=1",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 200
+        assert len(response.get_json()["events"]) == 2
+
+        response = client.get(
+            "/api/webhook-events/recent",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        events = response.get_json()["events"]
+        assert sorted(e["tenant_id"] or 0 for e in events) == [0, tenant_id, tenant_id]
+
+    def test_frozen_tenant_blocks_writes_not_reads(self, client):
+        with app.app_context():
+            tenant = create_tenant("acme", shard="big")
+            db.session.get(TenantShard, tenant.id).status = "frozen"
+            db.session.commit()
+
+            with tenant_context(tenant.id) as shard:
+                assert shard == "big"
+            with pytest.raises(TenantFrozenError):
+                with tenant_context(tenant.id, write=True):
+                    pass
+
+    def test_storage_reconcile_sums_events_per_shard(self, client):
+        with app.app_context():
+            shared = create_tenant("shared")
+            big = create_tenant("big", shard="big")
+            add_events(shared.id, 1)
+            add_events(big.id, 3)
+            storage_meter.clear()
+
+            storage_meter.reconcile()
+
+            with shard_context("big"):
+                expected = sum(
+                    e.size_bytes for e in WebhookEvent.query.filter_by(tenant_id=big.id)
+                )
+            usage = db.session.get(TenantStorageUsage, (big.id, "webhook_events"))
+            assert expected > 0
+            assert usage.bytes == expected
+
+
+class TestTenantShardMover:
+    """線上搬移測試"""
+
+    def test_move_copies_switches_and_deletes_source(self, client):
+        with app.app_context():
+            tenant = create_tenant("acme")
+            other = create_tenant("other")
+            add_events(tenant.id, 5)
+            add_events(other.id, 2)
+
+            result = TenantShardMover(batch_size=2).move(tenant.id, "big")
+
+            assert result == {"copied": 5, "deleted": 5}
+            route = db.session.get(TenantShard, tenant.id)
+            assert (route.shard, route.status, route.target_shard) == (
+                "big",
+                "active",
+                None,
+            )
+            assert count_events("default", tenant.id) == 0
+            assert count_events("big", tenant.id) == 5
+            assert count_events("default", other.id) == 2
+
+            # 搬移後的寫入延續原 id
+            add_events(tenant.id, 1)
+            with tenant_context(tenant.id):
+                ids = [
+                    e.id
+                    for e in WebhookEvent.query.filter_by(tenant_id=tenant.id)
+                    .order_by(WebhookEvent.id)
+                    .all()
+                ]
+            assert len(ids) == 6 and ids == sorted(set(ids))
+
+    def test_move_back_to_default(self, client):
+        with app.app_context():
+            tenant = create_tenant("acme", shard="big")
+            add_events(tenant.id, 3)
+
+            result = TenantShardMover().move(tenant.id, "default")
+
+            assert result == {"copied": 3, "deleted": 3}
+            assert count_events("default", tenant.id) == 3
+            assert count_events("big", tenant.id) == 0
+
+    def test_move_refuses_ids_used_by_other_tenants(self, client):
+        with app.app_context():
+            resident = create_tenant("resident", shard="big")
+            tenant = create_tenant("acme")
+            add_events(resident.id, 1)
+            add_events(tenant.id, 1)
+
+            with pytest.raises(ShardMoveError):
+                TenantShardMover().move(tenant.id, "big")
+
+            # 路由維持原分片，可放棄搬移
+            route = db.session.get(TenantShard, tenant.id)
+            assert (route.shard, route.status) == ("default", "copying")
+            assert TenantShardMover().abort(tenant.id)
+            assert db.session.get(TenantShard, tenant.id).status == "active"
+            assert count_events("default", tenant.id) == 1
+
+    def test_move_to_current_shard_is_noop(self, client):
+        with app.app_context():
+            tenant = create_tenant("acme")
+
+            assert TenantShardMover().move(tenant.id, "default") == {
+                "copied": 0,
+                "deleted": 0,
+            }
+            assert db.session.get(TenantShard, tenant.id) is None
+
+    def test_unknown_shard_rejected(self, client):
+        with app.app_context():
+            tenant = create_tenant("acme")
+
+            with pytest.raises(ValueError):
+                TenantShardMover().move(tenant.id, "missing")
@@ -0,0 +1,175 @@
+"""
+Webhook 批次傳送測試
+"""
+
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from src.database import db
+from src.main import app
+from src.models.webhook import WebhookBatchItem, WebhookDelivery
+from src.services.webhook_batcher import WebhookBatcher
+from src.services.webhook_service import MAX_BATCH_WAIT_MS, webhook_service
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+class TestWebhookBatcher:
+    """批次緩衝區測試"""
+
+    def test_flush_on_max_events(self):
+        """達到事件數量上限時立即送出"""
+        batcher = WebhookBatcher()
+
+        assert batcher.add(1, '{"a":1}', 2, 1024, 1000) == []
+        assert batcher.add(1, '{"a":2}', 2, 1024, 1000) == [['{"a":1}', '{"a":2}']]
+        assert batcher.pending_count() == 0
+
+    def test_flush_before_exceeding_max_bytes(self):
+        """加入後會超過大小上限時先送出既有批次"""
+        batcher = WebhookBatcher()
+        payload = json.dumps({"data": "x" * 40})
+
+        assert batcher.add(1, payload, 100, 100, 1000) == []
+        assert batcher.add(1, payload, 100, 100, 1000) == [[payload]]
+        assert batcher.pending_count() == 1
+
+    def test_pop_expired(self):
+        """等待時間到期的批次會被取出"""
+        batcher = WebhookBatcher()
+        batcher.add(1, "{}", 100, 1024, 0)
+        batcher.add(2, "{}", 100, 1024, 60000)
+
+        expired = batcher.pop_expired()
+
+        assert [batch.webhook_id for batch in expired] == [1]
+        assert batcher.pending_count() == 1
+
+
+class TestBatchedDelivery:
+    """批次模式的 webhook 傳送測試"""
+
+    def test_events_coalesced_into_one_delivery(self, client):
+        """多個事件合併為一筆傳送記錄"""
+        with app.app_context():
+            webhook = webhook_service.create_webhook(
+                tenant_id=None,
+                name="batched",
+                url="https://example.com/hook",
+                events=["user.login"],
+                secret="secret",
+                batch_enabled=True,
+                batch_max_events=3,
+                batch_max_wait_ms=60000,
+            )
+
+            with patch("src.services.webhook_service.delivery_scheduler") as scheduler:
+                for user_id in range(3):
+                    webhook_service.trigger_event("user.login", {"user_id": user_id})
+
+            deliveries = WebhookDelivery.query.filter_by(webhook_id=webhook.id).all()
+
+            assert len(deliveries) == 1
+            assert deliveries[0].event_type == "batch"
+            assert deliveries[0].event_count == 3
+            events = json.loads(deliveries[0].payload)
+            assert [e["event"]["data"]["user_id"] for e in events] == [0, 1, 2]
+            assert scheduler.submit.call_count == 1
+            assert WebhookBatchItem.query.count() == 0
+
+    def test_unflushed_batch_rebuilt_after_restart(self, client):
+        """程序結束時記憶體中的批次可從暫存項目重建"""
+        with app.app_context():
+            webhook = webhook_service.create_webhook(
+                tenant_id=None,
+                name="batched",
+                url="https://example.com/hook",
+                events=["user.login"],
+                batch_enabled=True,
+                batch_max_events=2,
+                batch_max_wait_ms=60000,
+            )
+
+            with patch(
+                "src.services.webhook_service.webhook_batcher", WebhookBatcher()
+            ):
+                webhook_service.trigger_event("user.login", {"user_id": 1})
+            assert WebhookBatchItem.query.count() == 1
+
+            # 新程序的批次緩衝區是空的，租約未逾期的項目不重建
+            with patch(
+                "src.services.webhook_service.webhook_batcher", WebhookBatcher()
+            ), patch("src.services.webhook_service.delivery_scheduler") as scheduler:
+                assert webhook_service.recover_batch_items(lease_seconds=600) == 0
+
+                WebhookBatchItem.query.update(
+                    {"claimed_at": datetime.utcnow() - timedelta(hours=1)}
+                )
+                db.session.commit()
+                assert webhook_service.recover_batch_items(lease_seconds=600) == 1
+                webhook_service.trigger_event("user.login", {"user_id": 2})
+
+            deliveries = WebhookDelivery.query.filter_by(webhook_id=webhook.id).all()
+            assert len(deliveries) == 1
+            events = json.loads(deliveries[0].payload)
+            assert [e["event"]["data"]["user_id"] for e in events] == [1, 2]
+            assert scheduler.submit.call_count == 1
+            assert WebhookBatchItem.query.count() == 0
+
+
+class TestBatchSettings:
+    """批次設定驗證測試"""
+
+    @pytest.mark.parametrize(
+        "field, value",
+        [
+            ("batch_max_events", "10"),
+            ("batch_max_events", None),
+            ("batch_max_bytes", 0),
+            ("batch_max_wait_ms", -1),
+            ("batch_max_wait_ms", True),
+            ("batch_max_wait_ms", MAX_BATCH_WAIT_MS + 1),
+        ],
+    )
+    def test_invalid_settings_rejected(self, client, field, value):
+        with app.app_context():
+            with pytest.raises(ValueError):
+                webhook_service.create_webhook(
+                    tenant_id=None,
+                    name="batched",
+                    url="https://example.com/hook",
+                    events=["user.login"],
+                    batch_enabled=True,
+                    **{field: value},
+                )
+
+            webhook = webhook_service.create_webhook(
+                tenant_id=None,
+                name="batched",
+                url="https://example.com/hook",
+                events=["user.login"],
+            )
+            with pytest.raises(ValueError):
+                webhook_service.update_webhook(
+                    webhook.id, name="renamed", **{field: value}
+                )
+            db.session.expire_all()
+            assert webhook.name == "batched"
@@ -0,0 +1,59 @@
+"""
+Webhook 壓測工具測試
+"""
+
+import requests
+from benchmarks.webhook_load import end_to_end_latencies, percentile
+from benchmarks.webhook_sink import SinkRequest, WebhookSink
+
+
+class TestWebhookSink:
+    """本地接收端測試"""
+
+    def test_records_requests_and_injects_errors(self):
+        sink = WebhookSink(error_rate=1.0)
+        url = sink.start()
+        try:
+            response = requests.post(url, data='{"event": {"id": 1}}', timeout=5)
+        finally:
+            sink.stop()
+
+        assert response.status_code == 500
+        recorded = sink.requests()
+        assert len(recorded) == 1
+        assert recorded[0].body == b'{"event": {"id": 1}}'
+
+    def test_timeout_drops_connection(self):
+        sink = WebhookSink(timeout_rate=1.0, timeout_hold_seconds=0.05)
+        url = sink.start()
+        try:
+            try:
+                requests.post(url, data="{}", timeout=5)
+                raised = False
+            except requests.exceptions.ConnectionError:
+                raised = True
+        finally:
+            sink.stop()
+
+        assert raised
+        assert sink.requests()[0].status is None
+
+
+class TestBenchmarkReport:
+    """報告計算測試"""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([], 50) is None
+
+    def test_end_to_end_latency_includes_batches(self):
+        requests_seen = [
+            SinkRequest(10.5, 200, {}, b'{"event": {"id": 1}}'),
+            SinkRequest(11.0, 200, {}, b'[{"event": {"id": 2}}, {"event": {"id": 3}}]'),
+            SinkRequest(12.0, 500, {}, b'{"event": {"id": 4}}'),
+        ]
+        triggered_at = {1: 10.0, 2: 10.0, 3: 10.5, 4: 10.0}
+
+        assert end_to_end_latencies(requests_seen, triggered_at) == [500, 1000, 500]
@@ -0,0 +1,74 @@
+"""
+Webhook 計數累加器測試
+"""
+
+import threading
+from datetime import datetime
+
+import pytest
+
+from src.database import db
+from src.main import app
+from src.models.webhook import Webhook
+from src.services.webhook_counters import WebhookCounterAccumulator
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+class TestWebhookCounterAccumulator:
+    """計數累加與寫回測試"""
+
+    def test_concurrent_records_not_lost(self):
+        counters = WebhookCounterAccumulator()
+
+        def worker():
+            for _ in range(1000):
+                counters.record(1, total=1, successful=1)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert counters.pending(1)["total_calls"] == 8000
+        assert counters.pending(1)["successful_calls"] == 8000
+
+    def test_flush_applies_atomic_increments(self, client):
+        with app.app_context():
+            webhook = Webhook(
+                name="hook", url="https://example.com", events=[], total_calls=10
+            )
+            db.session.add(webhook)
+            db.session.commit()
+
+            triggered_at = datetime(2025, 1, 1, 12, 0, 0)
+            counters = WebhookCounterAccumulator()
+            counters.record(webhook.id, total=3)
+            counters.record(webhook.id, successful=2, triggered_at=triggered_at)
+            counters.record(webhook.id, failed=1)
+
+            assert counters.flush() == 1
+            assert counters.flush() == 0
+
+            db.session.refresh(webhook)
+            assert webhook.total_calls == 13
+            assert webhook.successful_calls == 2
+            assert webhook.failed_calls == 1
+            assert webhook.last_triggered_at.replace(tzinfo=None) == triggered_at
+            assert counters.pending(webhook.id)["total_calls"] == 0
@@ -0,0 +1,169 @@
+"""
+Webhook 死信與批次重送測試
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from src.database import db
+from src.main import app
+from src.models.user import User
+from src.models.webhook import Webhook, WebhookDelivery, WebhookRedriveJob
+from src.services.redrive_runner import RedriveRunner
+from src.services.webhook_service import webhook_service
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+def create_dead_letters(webhook, error_class, count, status_code=None):
+    for _ in range(count):
+        db.session.add(
+            WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload="{}",
+                status="failed",
+                error_class=error_class,
+                error_message=f"HTTP {status_code}" if status_code else "timed out",
+                response_status_code=status_code,
+                attempt_count=4,
+                max_attempts=4,
+                failed_at=datetime.utcnow(),
+            )
+        )
+
+
+class TestDeadLetterSummary:
+    """死信彙整測試"""
+
+    def test_summary_groups_by_reason(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            create_dead_letters(webhook, "http_5xx", 3, status_code=503)
+            create_dead_letters(webhook, "timeout", 1)
+            db.session.commit()
+
+            summary = webhook_service.get_dead_letter_summary({})
+            assert summary["total"] == 4
+            assert summary["by_reason"][0]["error_class"] == "http_5xx"
+            assert summary["by_reason"][0]["count"] == 3
+
+            filtered = webhook_service.get_dead_letter_summary(
+                {"error_class": "timeout"}
+            )
+            assert filtered["total"] == 1
+
+
+class TestRedriveJob:
+    """背景重送工作測試"""
+
+    def test_job_redrives_matching_dead_letters(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            create_dead_letters(webhook, "http_5xx", 5, status_code=500)
+            create_dead_letters(webhook, "http_4xx", 2, status_code=404)
+            db.session.commit()
+
+            job = webhook_service.create_redrive_job(
+                {"error_class": "http_5xx"}, rate_per_second=1000
+            )
+            assert job.total == 5
+
+            runner = RedriveRunner(batch_size=2)
+            with patch("src.services.webhook_service.delivery_scheduler") as scheduler:
+                assert runner.run_job(job.id) is True
+                assert runner.run_job(job.id) is False
+
+            job = db.session.get(WebhookRedriveJob, job.id)
+            assert job.status == "completed"
+            assert job.processed == 5
+            assert job.redriven == 5
+            assert scheduler.submit.call_count == 5
+
+            pending = WebhookDelivery.query.filter_by(status="pending").all()
+            assert len(pending) == 5
+            assert all(delivery.attempt_count == 0 for delivery in pending)
+            assert WebhookDelivery.query.filter_by(status="failed").count() == 2
+
+            # 重送的傳送已取得租約，不會被逾期清掃重複送出
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                assert webhook_service.resubmit_stale_deliveries() == 0
+
+    def test_reclaims_running_job_with_expired_heartbeat(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            create_dead_letters(webhook, "timeout", 3)
+            db.session.commit()
+
+            job = webhook_service.create_redrive_job({}, rate_per_second=1000)
+            job.status = "running"
+            job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+
+            runner = RedriveRunner()
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                assert runner._pending_job_ids() == []
+                assert runner.run_job(job.id) is False
+
+                # 執行程序結束後心跳逾期
+                job.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+                db.session.commit()
+                assert runner.run_job(job.id) is True
+
+            job = db.session.get(WebhookRedriveJob, job.id)
+            assert job.status == "completed"
+            assert job.redriven == 3
+
+    def test_redrive_endpoint_returns_job_resource(self, client):
+        with app.app_context():
+            admin = User(username="admin", email="admin@example.com", role="admin")
+            admin.set_password("Password123!")
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            db.session.add(admin)
+            create_dead_letters(webhook, "connection", 2)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+            webhook_id = webhook.id
+
+        headers = {"Authorization": f"Bearer {token}"}
+        with patch("src.routes.webhook.redrive_runner") as runner:
+            response = client.post(
+                "/api/webhooks/dead-letters/redrive",
+                json={"webhook_id": webhook_id, "rate_per_second": 10},
+                headers=headers,
+            )
+
+        assert response.status_code == 202
+        job = response.get_json()["job"]
+        assert job["total"] == 2
+        assert job["status"] == "pending"
+        runner.enqueue.assert_called_once_with(job["id"])
+
+        response = client.get(response.headers["Location"], headers=headers)
+        assert response.status_code == 200
+        assert response.get_json()["job"]["id"] == job["id"]
+
+        response = client.post(
+            "/api/webhooks/dead-letters/redrive",
+            json={"error_class": "bogus"},
+            headers=headers,
+        )
+        assert response.status_code == 400
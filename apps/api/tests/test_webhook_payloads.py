@@ -0,0 +1,180 @@
+"""
+Webhook payload 去重與壓縮儲存測試
+"""
+
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from src.database import db
+from src.main import app
+from src.models.webhook import Webhook, WebhookDelivery, WebhookPayload
+from src.services.webhook_service import webhook_service
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+class TestPayloadDeduplication:
+    """payload 去重測試"""
+
+    def test_fan_out_shares_one_payload(self, client):
+        with app.app_context():
+            for index in range(3):
+                db.session.add(
+                    Webhook(
+                        name=f"hook-{index}",
+                        url="https://example.com",
+                        events=["user.login"],
+                    )
+                )
+            db.session.commit()
+
+            with patch("src.services.webhook_service.delivery_scheduler"):
+                webhook_service.trigger_event("user.login", {"user_id": 1})
+
+            deliveries = WebhookDelivery.query.all()
+            assert len(deliveries) == 3
+            assert WebhookPayload.query.count() == 1
+            assert len({delivery.payload_hash for delivery in deliveries}) == 1
+            assert '"user.login"' in deliveries[0].payload
+            assert deliveries[0].legacy_payload == ""
+
+    def test_concurrent_insert_of_same_payload_reused(self, client):
+        with app.app_context():
+            payload_hash = WebhookPayload.for_payload('{"a": 1}').hash
+            db.session.commit()
+            db.session.expunge_all()
+
+            # 模擬另一個交易在讀取之後、寫入之前寫入了相同內容
+            get = db.session.get
+            lookups = []
+
+            def get_after_concurrent_insert(*args, **kwargs):
+                lookups.append(args)
+                return None if len(lookups) == 1 else get(*args, **kwargs)
+
+            with patch.object(db.session, "get", get_after_concurrent_insert):
+                payload = WebhookPayload.for_payload('{"a": 1}')
+
+            assert len(lookups) == 2
+            assert payload.hash == payload_hash
+            assert payload.get_payload() == '{"a": 1}'
+            assert WebhookPayload.query.count() == 1
+
+    def test_legacy_payload_still_readable(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            delivery = WebhookDelivery(
+                webhook=webhook, event_type="user.login", legacy_payload='{"a": 1}'
+            )
+            db.session.add(delivery)
+            db.session.commit()
+
+            assert delivery.payload == '{"a": 1}'
+
+    def test_response_stored_compressed(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            delivery = WebhookDelivery(
+                webhook=webhook, event_type="user.login", payload="{}"
+            )
+            body = "error " * 200
+            delivery.mark_as_failed(
+                "HTTP 500", 500, response_headers={"X-A": "1"}, response_body=body
+            )
+            db.session.add(delivery)
+            db.session.commit()
+
+            assert delivery.response_body == body
+            assert delivery.response_headers == {"X-A": "1"}
+            assert delivery.legacy_response_body is None
+            assert len(delivery.response_data) < len(body)
+
+    def test_request_headers_stored_compressed_and_metered(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            delivery = WebhookDelivery(
+                webhook=webhook, event_type="user.login", payload="{}"
+            )
+            db.session.add(delivery)
+            db.session.commit()
+            size = delivery.size_bytes
+
+            headers = {"Content-Type": "application/json", "X-Long": "x" * 500}
+            delivery.request_headers = headers
+            db.session.commit()
+
+            assert delivery.request_headers == headers
+            assert delivery.legacy_request_headers is None
+            assert len(delivery.request_data) < len(json.dumps(headers))
+            assert delivery.size_bytes == size + len(delivery.request_data)
+
+    def test_legacy_request_headers_still_readable(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            delivery = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload="{}",
+                legacy_request_headers={"X-A": "1"},
+            )
+            db.session.add(delivery)
+            db.session.commit()
+
+            assert delivery.request_headers == {"X-A": "1"}
+
+
+class TestDeliveryRetention:
+    """傳送記錄保留期限測試"""
+
+    def test_purge_removes_old_deliveries_and_orphan_payloads(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            old_time = datetime.utcnow() - timedelta(days=40)
+            old = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload='{"old": true}',
+                status="success",
+                created_at=old_time,
+            )
+            old_retrying = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload='{"retrying": true}',
+                status="retrying",
+                created_at=old_time,
+            )
+            recent = WebhookDelivery(
+                webhook=webhook,
+                event_type="user.login",
+                payload='{"recent": true}',
+                status="success",
+            )
+            db.session.add_all([old, old_retrying, recent])
+            db.session.flush()
+            WebhookPayload.query.update({"created_at": old_time})
+            db.session.commit()
+
+            result = webhook_service.purge_delivery_history(retention_days=30)
+
+            assert result == {"deliveries": 1, "payloads": 1}
+            assert WebhookDelivery.query.count() == 2
+            assert WebhookPayload.query.count() == 2
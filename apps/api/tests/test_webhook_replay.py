@@ -0,0 +1,221 @@
+"""
+Webhook 事件重播測試
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from src.database import db
+from src.main import app
+from src.models.tenant import Tenant
+from src.models.user import User
+from src.models.webhook import (
+    Webhook,
+    WebhookDelivery,
+    WebhookEvent,
+    WebhookReplayJob,
+)
+from src.services.delivery_scheduler import FairDeliveryScheduler
+from src.services.replay_runner import ReplayRunner
+from src.services.webhook_service import webhook_service
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+def create_history():
+    """建立兩個租戶的歷史事件，回傳租戶 A 的 webhook"""
+    tenant_a = Tenant(name="A", slug="a")
+    tenant_b = Tenant(name="B", slug="b")
+    db.session.add_all([tenant_a, tenant_b])
+    db.session.flush()
+
+    webhook = Webhook(
+        tenant_id=tenant_a.id,
+        name="hook",
+        url="https://example.com",
+        events=["user.login"],
+    )
+    db.session.add(webhook)
+    for index in range(5):
+        db.session.add(
+            WebhookEvent(
+                tenant_id=tenant_a.id, event_type="user.login", event_data={"i": index}
+            )
+        )
+    db.session.add(
+        WebhookEvent(tenant_id=tenant_a.id, event_type="user.logout", event_data={})
+    )
+    db.session.add(
+        WebhookEvent(tenant_id=tenant_b.id, event_type="user.login", event_data={})
+    )
+    db.session.commit()
+    return webhook
+
+
+class TestReplayRunner:
+    """重播執行與檢查點測試"""
+
+    def test_replays_matching_events_in_order(self, client):
+        with app.app_context():
+            webhook = create_history()
+            job = webhook_service.create_replay_job(
+                webhook, from_event_id=1, rate_per_second=100
+            )
+            assert job.total == 5
+
+            runner = ReplayRunner(page_size=2)
+            with patch("src.services.replay_runner.delivery_scheduler") as scheduler:
+                scheduler.pending_count.return_value = 0
+                assert runner.run_job(job.id) is True
+
+            job = db.session.get(WebhookReplayJob, job.id)
+            assert job.status == "completed"
+            assert job.replayed == 5
+            assert job.last_event_id == 5
+
+            deliveries = WebhookDelivery.query.order_by(WebhookDelivery.id).all()
+            assert [d.is_replay for d in deliveries] == [True] * 5
+            assert [
+                '"i": %d' % index in d.payload for index, d in enumerate(deliveries)
+            ] == [True] * 5
+            assert scheduler.submit.call_args.kwargs["tenant_id"] == f"replay:{job.id}"
+
+    def test_resume_continues_from_checkpoint(self, client):
+        with app.app_context():
+            webhook = create_history()
+            job = webhook_service.create_replay_job(
+                webhook, from_event_id=1, rate_per_second=100
+            )
+            job.last_event_id = 3
+            db.session.commit()
+
+            runner = ReplayRunner(page_size=10)
+            with patch("src.services.replay_runner.delivery_scheduler") as scheduler:
+                scheduler.pending_count.return_value = 0
+                runner.run_job(job.id)
+
+            assert WebhookDelivery.query.count() == 2
+            assert db.session.get(WebhookReplayJob, job.id).replayed == 2
+
+    def test_reclaims_running_job_with_expired_heartbeat(self, client):
+        with app.app_context():
+            webhook = create_history()
+            job = webhook_service.create_replay_job(
+                webhook, from_event_id=1, rate_per_second=100
+            )
+            # 執行程序在處理完前三個事件後結束
+            job.status = "running"
+            job.last_event_id = 3
+            job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+
+            runner = ReplayRunner(page_size=10)
+            with patch("src.services.replay_runner.delivery_scheduler") as scheduler:
+                scheduler.pending_count.return_value = 0
+                assert runner.run_job(job.id) is False
+
+                job.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+                db.session.commit()
+                assert runner._pending_job_ids() == [job.id]
+                assert runner.run_job(job.id) is True
+
+            job = db.session.get(WebhookReplayJob, job.id)
+            assert job.status == "completed"
+            assert WebhookDelivery.query.count() == 2
+
+
+class TestReplayScheduling:
+    """重播不搶佔即時傳送測試"""
+
+    def test_low_weight_replay_queue_shares_workers(self):
+        scheduler = FairDeliveryScheduler(max_in_flight_per_tenant=10)
+        for delivery_id in range(100, 110):
+            scheduler.submit("replay:1", delivery_id, weight=1)
+        for delivery_id in range(1, 5):
+            scheduler.submit(1, delivery_id, plan="premium")
+
+        order = []
+        for _ in range(6):
+            tenant_id, delivery_id = scheduler.acquire(timeout=0)
+            order.append(tenant_id)
+
+        # premium 租戶 (權重 4) 不必等重播佇列清空
+        assert order.count(1) == 4
+        assert scheduler.pending_count("replay:1") == 10
+
+
+class TestReplayApi:
+    """重播 API 測試"""
+
+    def test_create_and_pause_replay(self, client):
+        with app.app_context():
+            webhook = create_history()
+            admin = User(username="admin", email="admin@example.com", role="admin")
+            admin.set_password("Password123!")
+            db.session.add(admin)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+            webhook_id = webhook.id
+
+        headers = {"Authorization": f"Bearer {token}"}
+        url = f"/api/webhooks/{webhook_id}/replays"
+        with patch("src.routes.webhook.replay_runner"):
+            response = client.post(url, json={"from_event_id": 2}, headers=headers)
+            assert response.status_code == 202
+            job = response.get_json()["job"]
+            assert job["total"] == 4
+
+            response = client.post(url, json={"from_event_id": 2}, headers=headers)
+            assert response.status_code == 409
+
+            response = client.post(f"{url}/{job['id']}/pause", headers=headers)
+            assert response.status_code == 200
+            assert response.get_json()["job"]["status"] == "paused"
+
+            response = client.post(url, json={}, headers=headers)
+            assert response.status_code == 400
+
+    def test_stale_running_replay_does_not_block_new_replay(self, client):
+        with app.app_context():
+            webhook = create_history()
+            admin = User(username="admin", email="admin@example.com", role="admin")
+            admin.set_password("Password123!")
+            db.session.add(admin)
+            db.session.add(
+                WebhookReplayJob(
+                    webhook_id=webhook.id,
+                    from_event_id=1,
+                    status="running",
+                    heartbeat_at=datetime.utcnow() - timedelta(hours=1),
+                )
+            )
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+            webhook_id = webhook.id
+
+        headers = {"Authorization": f"Bearer {token}"}
+        with patch("src.routes.webhook.replay_runner"):
+            response = client.post(
+                f"/api/webhooks/{webhook_id}/replays",
+                json={"from_event_id": 2},
+                headers=headers,
+            )
+        assert response.status_code == 202
@@ -0,0 +1,91 @@
+"""
+Webhook 統計資料測試
+"""
+
+import pytest
+
+from src.database import db
+from src.main import app
+from src.models.webhook import Webhook, WebhookDelivery
+from src.services.webhook_service import histogram_percentile, webhook_service
+
+
+@pytest.fixture
+def client():
+    """測試客戶端"""
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.drop_all()
+
+
+class TestHistogramPercentile:
+    """直方圖百分位數估算測試"""
+
+    def test_empty_histogram(self):
+        assert histogram_percentile([0] * 13, 95) == 0
+
+    def test_interpolates_within_bucket(self):
+        # 100 筆落在 [100, 250) 區間
+        histogram = [0] * 13
+        histogram[5] = 100
+
+        assert histogram_percentile(histogram, 50, max_value=240) == 170.0
+        assert histogram_percentile(histogram, 100, max_value=240) == 240
+
+    def test_overflow_bucket_uses_max(self):
+        histogram = [0] * 13
+        histogram[12] = 1
+
+        assert histogram_percentile(histogram, 99, max_value=45000) == 44850.0
+
+
+class TestWebhookStats:
+    """get_webhook_stats 測試"""
+
+    def test_stats_from_grouped_aggregate(self, client):
+        with app.app_context():
+            webhook = Webhook(name="hook", url="https://example.com", events=[])
+            db.session.add(webhook)
+            db.session.flush()
+
+            for duration in range(1, 101):
+                db.session.add(
+                    WebhookDelivery(
+                        webhook_id=webhook.id,
+                        event_type="user.login",
+                        payload="{}",
+                        status="success" if duration <= 90 else "failed",
+                        duration_ms=duration * 10,
+                    )
+                )
+            db.session.add(
+                WebhookDelivery(
+                    webhook_id=webhook.id,
+                    event_type="user.login",
+                    payload="{}",
+                    status="pending",
+                )
+            )
+            db.session.commit()
+
+            stats = webhook_service.get_webhook_stats(webhook.id)
+
+            assert stats["total_deliveries"] == 101
+            assert stats["successful_deliveries"] == 90
+            assert stats["failed_deliveries"] == 10
+            assert stats["pending_deliveries"] == 1
+            assert stats["average_response_time"] == 505.0
+            percentiles = stats["response_time_percentiles"]
+            assert percentiles["max"] == 1000
+            assert 400 <= percentiles["p50"] <= 600
+            assert 900 <= percentiles["p95"] <= 1000
+            assert stats["last_delivery_at"] is not None
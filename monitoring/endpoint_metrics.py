@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+端點維度指標 - 依 (Flask 路由規則, HTTP 方法) 統計請求數、各狀態類別計數與延遲 sketch
+
+端點數量由 EndpointLimiter 限制：未匹配路由、看起來含動態片段（數字 ID、UUID）
+或超過上限的端點一律歸入 "other"，因此路徑掃描流量不會讓記憶體無限成長。
+時間窗口切成固定長度的時段環形緩衝區，每個端點只存在於依雜湊選定的一條
+鎖分段中，記憶體上限為 max_endpoints × 時段數。另外為每個端點保留自行程啟動以來
+的累計計數與延遲直方圖，供 Prometheus 匯出。請求若附帶各階段耗時（認證、資料庫、
+序列化等）、SQL 查詢數與是否疑似 N+1，窗口內記錄平均值、累計值則記錄總和。
+"""
+
+import bisect
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from latency_sketch import LatencySketch
+
+OTHER_ENDPOINT = 'other'
+HTTP_METHODS = frozenset(['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS'])
+
+# 純數字、UUID 或長十六進位字串的路徑片段視為動態值
+_DYNAMIC_SEGMENT = re.compile(r'^(\d+|[0-9a-fA-F-]{16,})$')
+
+# 累計延遲直方圖的上界（秒），供 Prometheus histogram 使用
+DURATION_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+EndpointKey = Tuple[str, str]
+
+
+class EndpointLimiter:
+    """端點基數限制器"""
+
+    def __init__(self, max_endpoints: int = 200):
+        self.max_endpoints = max_endpoints
+        self._tracked = set()
+        self._lock = threading.Lock()
+        self.folded = 0
+
+    def resolve(self, endpoint: Optional[str], method: Optional[str]) -> EndpointKey:
+        """回傳要記錄的 (端點, 方法)，無法追蹤的端點歸入 other"""
+        method = (method or 'GET').upper()
+        if method not in HTTP_METHODS:
+            method = 'OTHER'
+        key = (endpoint, method)
+        if key in self._tracked:
+            return key
+
+        if endpoint and not any(
+            _DYNAMIC_SEGMENT.match(segment) for segment in endpoint.split('/')
+        ):
+            with self._lock:
+                if key in self._tracked:
+                    return key
+                if len(self._tracked) < self.max_endpoints:
+                    self._tracked.add(key)
+                    return key
+
+        self.folded += 1
+        return (OTHER_ENDPOINT, method)
+
+    @property
+    def tracked(self) -> int:
+        return len(self._tracked)
+
+
+class _EndpointStats:
+    """一個端點在一個時段內的彙總"""
+
+    __slots__ = ('requests', 'errors', 'status_counts', 'latency', 'phase_ms', 'queries',
+                 'n_plus_one')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.status_counts: Dict[str, int] = {}
+        self.latency = LatencySketch()
+        self.phase_ms: Dict[str, float] = {}
+        self.queries = 0
+        self.n_plus_one = 0
+
+    def merge(self, other: '_EndpointStats'):
+        self.requests += other.requests
+        self.errors += other.errors
+        for status_class, count in other.status_counts.items():
+            self.status_counts[status_class] = self.status_counts.get(status_class, 0) + count
+        self.latency.merge(other.latency)
+        for phase, elapsed_ms in other.phase_ms.items():
+            self.phase_ms[phase] = self.phase_ms.get(phase, 0.0) + elapsed_ms
+        self.queries += other.queries
+        self.n_plus_one += other.n_plus_one
+
+
+class _EndpointTotals:
+    """一個端點自行程啟動以來的累計值（只增不減，供 Prometheus counter / histogram）"""
+
+    __slots__ = ('status_counts', 'bucket_counts', 'sum_seconds', 'count', 'phase_seconds',
+                 'queries', 'n_plus_one')
+
+    def __init__(self):
+        self.status_counts: Dict[str, int] = {}
+        self.bucket_counts = [0] * (len(DURATION_BUCKETS_SECONDS) + 1)
+        self.sum_seconds = 0.0
+        self.count = 0
+        self.phase_seconds: Dict[str, float] = {}
+        self.queries = 0
+        self.n_plus_one = 0
+
+
+class _EndpointSlot:
+    __slots__ = ('slot', 'stats')
+
+    def __init__(self):
+        self.slot = -1
+        self.stats: Dict[EndpointKey, _EndpointStats] = {}
+
+
+class EndpointWindow:
+    """時間窗口內的端點指標"""
+
+    def __init__(self, window_size: int, slot_seconds: int = 10, lock_stripes: int = 8,
+                 max_endpoints: int = 200):
+        self.window_size = window_size
+        self.slot_seconds = slot_seconds
+        self.limiter = EndpointLimiter(max_endpoints)
+        # 多留一個時段，讓部分落在窗口內的最舊時段不會被當前時段覆蓋
+        slot_count = window_size // slot_seconds + 1
+        self._stripes = [
+            (threading.Lock(), [_EndpointSlot() for _ in range(slot_count)], {})
+            for _ in range(lock_stripes)
+        ]
+
+    def record(self, timestamp: float, endpoint: Optional[str], method: Optional[str],
+               status_code: int, response_time_ms: float,
+               phases: Optional[Dict[str, float]] = None, queries: int = 0,
+               n_plus_one: bool = False):
+        key = self.limiter.resolve(endpoint, method)
+        status_class = f"{status_code // 100}xx"
+        slot_id = int(timestamp) // self.slot_seconds
+        seconds = response_time_ms / 1000
+        bucket_index = bisect.bisect_left(DURATION_BUCKETS_SECONDS, seconds)
+        lock, slots, totals = self._stripes[hash(key) % len(self._stripes)]
+        with lock:
+            slot = slots[slot_id % len(slots)]
+            if slot.slot != slot_id:
+                slot.slot = slot_id
+                slot.stats.clear()
+            stats = slot.stats.get(key)
+            if stats is None:
+                stats = slot.stats[key] = _EndpointStats()
+            stats.requests += 1
+            if status_code >= 400:
+                stats.errors += 1
+            stats.status_counts[status_class] = stats.status_counts.get(status_class, 0) + 1
+            stats.latency.add(response_time_ms)
+            if phases:
+                for phase, elapsed_ms in phases.items():
+                    stats.phase_ms[phase] = stats.phase_ms.get(phase, 0.0) + elapsed_ms
+            stats.queries += queries
+            stats.n_plus_one += n_plus_one
+
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = _EndpointTotals()
+            total.status_counts[status_class] = total.status_counts.get(status_class, 0) + 1
+            total.bucket_counts[bucket_index] += 1
+            total.sum_seconds += seconds
+            total.count += 1
+            if phases:
+                for phase, elapsed_ms in phases.items():
+                    total.phase_seconds[phase] = (
+                        total.phase_seconds.get(phase, 0.0) + elapsed_ms / 1000
+                    )
+            total.queries += queries
+            total.n_plus_one += n_plus_one
+
+    def snapshot(self, now: float, endpoint: Optional[str] = None) -> Dict[EndpointKey, _EndpointStats]:
+        """合併窗口內各時段的端點統計（可只取一個端點）"""
+        oldest = now - self.window_size
+        current = int(now) // self.slot_seconds
+        merged: Dict[EndpointKey, _EndpointStats] = {}
+        for lock, slots, _ in self._stripes:
+            with lock:
+                for slot in slots:
+                    if slot.slot > current or (slot.slot + 1) * self.slot_seconds <= oldest:
+                        continue
+                    for key, stats in slot.stats.items():
+                        if endpoint is not None and key[0] != endpoint:
+                            continue
+                        total = merged.get(key)
+                        if total is None:
+                            total = merged[key] = _EndpointStats()
+                        total.merge(stats)
+        return merged
+
+    def get_endpoint_metrics(self, now: float, top: Optional[int] = None,
+                             sort_by: str = 'p95') -> List[Dict]:
+        """各端點的請求數、錯誤率、狀態類別、延遲、各階段平均耗時與查詢數，依延遲分位數由慢到快排序"""
+        rows = []
+        for (endpoint, method), stats in self.snapshot(now).items():
+            rows.append({
+                'endpoint': endpoint,
+                'method': method,
+                'requests': stats.requests,
+                'error_rate_percent': round(stats.errors / stats.requests * 100, 2),
+                'status_counts': dict(sorted(stats.status_counts.items())),
+                'latency_ms': stats.latency.summary(),
+                'phase_ms': {
+                    phase: round(elapsed_ms / stats.requests, 2)
+                    for phase, elapsed_ms in sorted(stats.phase_ms.items())
+                },
+                'queries_per_request': round(stats.queries / stats.requests, 2),
+                'n_plus_one_requests': stats.n_plus_one,
+            })
+        rows.sort(key=lambda row: row['latency_ms'][sort_by], reverse=True)
+        return rows[:top] if top is not None else rows
+
+    def totals(self) -> List[Dict]:
+        """各端點的累計請求數與延遲直方圖（JSON 相容，供跨 worker 合併）"""
+        rows = []
+        for lock, _, totals in self._stripes:
+            with lock:
+                for (endpoint, method), total in totals.items():
+                    rows.append({
+                        'endpoint': endpoint,
+                        'method': method,
+                        'status_counts': dict(total.status_counts),
+                        'bucket_counts': list(total.bucket_counts),
+                        'sum_seconds': total.sum_seconds,
+                        'count': total.count,
+                        'phase_seconds': dict(total.phase_seconds),
+                        'queries': total.queries,
+                        'n_plus_one': total.n_plus_one,
+                    })
+        return rows
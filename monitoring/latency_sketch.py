@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+可合併的串流延遲分位數 sketch（對數分桶的 HDR 式直方圖）
+
+每個值落在 gamma = (1 + a) / (1 - a) 的對數區間，區間代表值與實際值的
+相對誤差不超過 a（預設 1%）。桶數只與數值範圍有關，與樣本數無關；
+合併只是把相同區間的計數相加，因此各時間桶、各 worker、各節點的
+sketch 可以任意合併而誤差不會累積。
+"""
+
+import math
+from typing import Dict, Iterable, Optional
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class LatencySketch:
+    """對數分桶延遲 sketch（毫秒）"""
+
+    __slots__ = (
+        'relative_accuracy', 'min_value', 'max_value', '_gamma', '_log_gamma',
+        'buckets', 'zero_count', 'count', 'sum', 'min', 'max'
+    )
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 0.001,
+                 max_value: float = 3_600_000.0):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value  # 小於此值的樣本計入零桶
+        self.max_value = max_value  # 大於此值的樣本壓到最高區間，限制桶數
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.clear()
+
+    def clear(self):
+        """清空所有樣本（保留配置）"""
+        self.buckets.clear()
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(min(value, self.max_value)) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        """區間代表值，與區間內任何值的相對誤差不超過 relative_accuracy"""
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        """加入一個樣本"""
+        if value <= self.min_value:
+            self.zero_count += count
+        else:
+            index = self._index(value)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencySketch'):
+        """合併另一個相同精度的 sketch"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        if not other.count:
+            return
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> 'LatencySketch':
+        sketch = LatencySketch(self.relative_accuracy, self.min_value, self.max_value)
+        sketch.merge(self)
+        return sketch
+
+    def quantile(self, q: float) -> float:
+        """估算分位數 q（0 到 1），沒有樣本時回傳 0"""
+        return self.quantiles((q,))[q]
+
+    def quantiles(self, qs: Iterable[float] = DEFAULT_QUANTILES) -> Dict[float, float]:
+        """一次估算多個分位數（只排序一次區間），沒有樣本時皆為 0"""
+        qs = sorted(qs)
+        result = {q: self.max if self.count else 0.0 for q in qs}
+        if not self.count:
+            return result
+        pending = iter(qs)
+        q = next(pending, None)
+        seen = self.zero_count
+        while q is not None and q * (self.count - 1) < seen:
+            result[q] = max(self.min, 0.0)
+            q = next(pending, None)
+        overflow = self._index(self.max_value)
+        for index in sorted(self.buckets):
+            if q is None:
+                break
+            seen += self.buckets[index]
+            # 最高區間收集所有超過 max_value 的樣本，以實際最大值代表
+            value = self.max if index >= overflow else self._value(index)
+            while q is not None and q * (self.count - 1) < seen:
+                result[q] = min(max(value, self.min), self.max)
+                q = next(pending, None)
+        return result
+
+    def summary(self) -> Dict:
+        """p50/p90/p95/p99/max 摘要（毫秒）"""
+        p50, p90, p95, p99 = (
+            round(value, 2) for value in self.quantiles(DEFAULT_QUANTILES).values()
+        )
+        return {
+            'count': self.count,
+            'p50': p50,
+            'p90': p90,
+            'p95': p95,
+            'p99': p99,
+            'max': round(self.max, 2),
+        }
+
+    def to_dict(self) -> Dict:
+        """序列化為 JSON 相容的字典，供跨 worker / 節點傳送後合併"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'min_value': self.min_value,
+            'max_value': self.max_value,
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencySketch':
+        sketch = cls(data['relative_accuracy'], data['min_value'], data['max_value'])
+        sketch.buckets = {int(index): count for index, count in data['buckets'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        sketch.min = data['min'] if data['min'] is not None else math.inf
+        sketch.max = data['max']
+        return sketch
+
+
+def merge_sketches(sketches: Iterable[LatencySketch],
+                   relative_accuracy: float = 0.01) -> LatencySketch:
+    """合併多個 sketch 為一個新的 sketch"""
+    merged: Optional[LatencySketch] = None
+    for sketch in sketches:
+        if merged is None:
+            merged = sketch.copy()
+        else:
+            merged.merge(sketch)
+    return merged if merged is not None else LatencySketch(relative_accuracy)
@@ -3,36 +3,78 @@
 監控基線配置 - 5 個核心指標（QPS、p95 延遲、錯誤率、隊列滯留、外部調用失敗率）+ 基本告警
 """
 
+import os
 import time
 import json
 import logging
 import threading
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from collections import defaultdict
 from typing import Dict, List, Optional
-import statistics
 
-# 配置結構化日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('monitoring.log'),
-        logging.StreamHandler()
-    ]
-)
+from endpoint_metrics import EndpointWindow
+from latency_sketch import LatencySketch
+from worker_snapshots import MULTIPROC_DIR_ENV, SnapshotWriter
+
+class _SecondBucket:
+    """一秒內的彙總數據"""
+
+    __slots__ = (
+        'second', 'requests', 'errors', 'latency',
+        'external_calls', 'external_failures', 'max_queue_size', 'queue_samples'
+    )
+
+    def __init__(self):
+        self.latency = LatencySketch()
+        self.reset(-1)
+
+    def reset(self, second: int):
+        self.second = second
+        self.requests = 0
+        self.errors = 0
+        self.latency.clear()
+        self.external_calls = 0
+        self.external_failures = 0
+        self.max_queue_size = 0
+        self.queue_samples = 0
+
+
+class _BucketRing:
+    """固定大小的每秒桶環形緩衝區，由自己的鎖保護"""
+
+    def __init__(self, size: int):
+        self.lock = threading.Lock()
+        self.buckets = [_SecondBucket() for _ in range(size)]
+        # 自行程啟動以來的累計值（Prometheus 匯出用）
+        self.external_totals: Dict[str, List[int]] = {}  # 服務名稱 -> [成功, 失敗]
+        self.queue_sizes: Dict[str, tuple] = {}  # 隊列名稱 -> (時間戳, 最新大小)
+
+    def bucket(self, second: int) -> _SecondBucket:
+        """取得該秒的桶，桶中若是舊數據則先清空（呼叫者需持有鎖）"""
+        bucket = self.buckets[second % len(self.buckets)]
+        if bucket.second != second:
+            bucket.reset(second)
+        return bucket
+
 
 class MetricsCollector:
     """核心指標收集器"""
     
-    def __init__(self, window_size_minutes=5):
+    def __init__(self, window_size_minutes=5, lock_stripes=8, max_endpoints=200, clock=time.time,
+                 snapshot_dir=None):
         self.window_size = window_size_minutes * 60  # 轉換為秒
         self.logger = logging.getLogger(__name__)
+        self._clock = clock
+        # 行程啟動時間，與 pid 一起識別 worker（pid 可能被新 worker 沿用）
+        self.started_at = time.time()
         
-        # 指標數據存儲（使用 deque 實現滑動窗口）
-        self.request_times = deque()  # (timestamp, response_time, status_code, endpoint)
-        self.external_calls = deque()  # (timestamp, success, service_name, response_time)
-        self.queue_metrics = deque()  # (timestamp, queue_size, queue_name)
+        # 指標數據存儲：每秒一個桶的環形緩衝區，記憶體固定，與流量無關。
+        # 依執行緒分成多條 (鎖分段)，寫入時各執行緒大多只競爭自己那條的鎖。
+        self._stripes = [_BucketRing(self.window_size) for _ in range(lock_stripes)]
+        # 端點維度指標（10 秒一個時段，端點數量有上限）
+        self.endpoints = EndpointWindow(
+            self.window_size, lock_stripes=lock_stripes, max_endpoints=max_endpoints
+        )
         
         # 告警閾值配置
         self.thresholds = {
@@ -52,33 +94,63 @@ class MetricsCollector:
         self.monitoring_thread = threading.Thread(target=self._monitoring_loop, daemon=True)
         self.monitoring_thread.start()
         
+        # 多 worker 部署時定期寫出快照，供 /metrics 合併所有 worker 的數據
+        self.snapshot_writer = None
+        if snapshot_dir:
+            self.snapshot_writer = SnapshotWriter(
+                self, snapshot_dir, float(os.environ.get('METRICS_SNAPSHOT_SECONDS', 5))
+            ).start()
+        
         self.logger.info("MetricsCollector initialized with window size: %d seconds", self.window_size)
     
-    def record_request(self, response_time_ms: float, status_code: int, endpoint: str = "unknown"):
-        """記錄請求指標"""
-        timestamp = time.time()
-        self.request_times.append((timestamp, response_time_ms, status_code, endpoint))
-        self._cleanup_old_data()
+    def _stripe(self) -> _BucketRing:
+        return self._stripes[threading.get_ident() % len(self._stripes)]
+    
+    def record_request(self, response_time_ms: float, status_code: int, endpoint: str = "unknown",
+                       method: Optional[str] = None, phases: Optional[Dict[str, float]] = None,
+                       queries: int = 0, n_plus_one: bool = False):
+        """
+        記錄請求指標（endpoint 應為 Flask 路由規則，未匹配路由傳 None）
+
+        phases 為各階段耗時毫秒，queries 為 SQL 查詢數，n_plus_one 表示偵測到疑似 N+1 查詢
+        """
+        timestamp = self._clock()
+        stripe = self._stripe()
+        with stripe.lock:
+            bucket = stripe.bucket(int(timestamp))
+            bucket.requests += 1
+            if status_code >= 400:
+                bucket.errors += 1
+            bucket.latency.add(response_time_ms)
+        self.endpoints.record(timestamp, endpoint, method, status_code, response_time_ms, phases,
+                              queries, n_plus_one)
         
-        # 結構化日誌
-        self.logger.info(
+        # 每個請求都會執行，只在 DEBUG 時記錄（可用 LOG_SAMPLE_RATES 取樣）
+        self.logger.debug(
             "Request recorded",
             extra={
                 "metric_type": "request",
                 "response_time_ms": response_time_ms,
                 "status_code": status_code,
                 "endpoint": endpoint,
+                "method": method,
                 "timestamp": timestamp
             }
         )
     
     def record_external_call(self, success: bool, service_name: str, response_time_ms: float = 0):
         """記錄外部調用指標"""
-        timestamp = time.time()
-        self.external_calls.append((timestamp, success, service_name, response_time_ms))
-        self._cleanup_old_data()
+        timestamp = self._clock()
+        stripe = self._stripe()
+        with stripe.lock:
+            bucket = stripe.bucket(int(timestamp))
+            bucket.external_calls += 1
+            if not success:
+                bucket.external_failures += 1
+            totals = stripe.external_totals.setdefault(service_name, [0, 0])
+            totals[0 if success else 1] += 1
         
-        self.logger.info(
+        self.logger.debug(
             "External call recorded",
             extra={
                 "metric_type": "external_call",
@@ -91,11 +163,16 @@ class MetricsCollector:
     
     def record_queue_size(self, queue_size: int, queue_name: str = "default"):
         """記錄隊列大小指標"""
-        timestamp = time.time()
-        self.queue_metrics.append((timestamp, queue_size, queue_name))
-        self._cleanup_old_data()
+        timestamp = self._clock()
+        stripe = self._stripe()
+        with stripe.lock:
+            bucket = stripe.bucket(int(timestamp))
+            bucket.queue_samples += 1
+            if queue_size > bucket.max_queue_size:
+                bucket.max_queue_size = queue_size
+            stripe.queue_sizes[queue_name] = (timestamp, queue_size)
         
-        self.logger.info(
+        self.logger.debug(
             "Queue size recorded",
             extra={
                 "metric_type": "queue_size",
@@ -105,88 +182,157 @@ class MetricsCollector:
             }
         )
     
-    def _cleanup_old_data(self):
-        """清理超出時間窗口的舊數據"""
-        cutoff_time = time.time() - self.window_size
+    def _aggregate(self) -> Dict:
+        """合併時間窗口內所有桶的數據，成本只與桶數有關"""
+        now = self._clock()
+        current = int(now)
+        oldest = current - self.window_size
+        totals = {
+            'requests': 0,
+            'errors': 0,
+            'latency': LatencySketch(),
+            'external_calls': 0,
+            'external_failures': 0,
+            'max_queue_size': 0,
+            'queue_samples': 0,
+            'first_request_second': None,
+        }
         
-        while self.request_times and self.request_times[0][0] < cutoff_time:
-            self.request_times.popleft()
-            
-        while self.external_calls and self.external_calls[0][0] < cutoff_time:
-            self.external_calls.popleft()
-            
-        while self.queue_metrics and self.queue_metrics[0][0] < cutoff_time:
-            self.queue_metrics.popleft()
+        for stripe in self._stripes:
+            with stripe.lock:
+                for bucket in stripe.buckets:
+                    if bucket.second <= oldest or bucket.second > current:
+                        continue
+                    if bucket.requests:
+                        totals['requests'] += bucket.requests
+                        totals['errors'] += bucket.errors
+                        totals['latency'].merge(bucket.latency)
+                        first = totals['first_request_second']
+                        if first is None or bucket.second < first:
+                            totals['first_request_second'] = bucket.second
+                    totals['external_calls'] += bucket.external_calls
+                    totals['external_failures'] += bucket.external_failures
+                    totals['max_queue_size'] = max(totals['max_queue_size'], bucket.max_queue_size)
+                    totals['queue_samples'] += bucket.queue_samples
+        
+        totals['now'] = now
+        return totals
+    
+    @staticmethod
+    def _qps(totals: Dict, window_size: int) -> float:
+        if not totals['requests']:
+            return 0.0
+        # 實際時間窗口（可能小於配置的窗口大小），至少一秒
+        actual_window = min(window_size, max(totals['now'] - totals['first_request_second'], 1.0))
+        return totals['requests'] / actual_window
+    
+    @staticmethod
+    def _error_rate(totals: Dict) -> float:
+        if not totals['requests']:
+            return 0.0
+        return totals['errors'] / totals['requests'] * 100
+    
+    @staticmethod
+    def _external_failure_rate(totals: Dict) -> float:
+        if not totals['external_calls']:
+            return 0.0
+        return totals['external_failures'] / totals['external_calls'] * 100
     
     def get_qps(self) -> float:
         """計算當前 QPS（每秒請求數）"""
-        if not self.request_times:
-            return 0.0
-        
-        current_time = time.time()
-        window_start = current_time - self.window_size
-        
-        # 計算時間窗口內的請求數
-        requests_in_window = sum(1 for timestamp, _, _, _ in self.request_times if timestamp >= window_start)
-        
-        # 計算實際時間窗口大小（可能小於配置的窗口大小）
-        actual_window = min(self.window_size, current_time - self.request_times[0][0]) if self.request_times else self.window_size
-        
-        return requests_in_window / actual_window if actual_window > 0 else 0.0
+        return self._qps(self._aggregate(), self.window_size)
     
     def get_p95_latency(self) -> float:
         """計算 P95 延遲（毫秒）"""
-        if not self.request_times:
-            return 0.0
-        
-        response_times = [response_time for _, response_time, _, _ in self.request_times]
-        
-        if len(response_times) < 2:
-            return response_times[0] if response_times else 0.0
+        return self._aggregate()['latency'].quantile(0.95)
+    
+    def get_latency_sketch(self, endpoint: Optional[str] = None) -> LatencySketch:
+        """合併時間窗口內的延遲 sketch（可指定端點），可再與其他 worker 的 sketch 合併"""
+        if endpoint is not None:
+            merged = LatencySketch()
+            for stats in self.endpoints.snapshot(self._clock(), endpoint).values():
+                merged.merge(stats.latency)
+            return merged
         
-        return statistics.quantiles(response_times, n=20)[18]  # P95 = 95th percentile
+        current = int(self._clock())
+        oldest = current - self.window_size
+        merged = LatencySketch()
+        for stripe in self._stripes:
+            with stripe.lock:
+                for bucket in stripe.buckets:
+                    if bucket.second <= oldest or bucket.second > current:
+                        continue
+                    merged.merge(bucket.latency)
+        return merged
+    
+    def get_latency_percentiles(self, endpoint: Optional[str] = None) -> Dict:
+        """獲取 p50/p90/p95/p99/max 延遲（毫秒）"""
+        return self.get_latency_sketch(endpoint).summary()
+    
+    def get_endpoint_metrics(self, top: Optional[int] = None, sort_by: str = 'p95') -> List[Dict]:
+        """各端點指標，依延遲分位數由慢到快排序（top 為只取前幾名）"""
+        return self.endpoints.get_endpoint_metrics(self._clock(), top=top, sort_by=sort_by)
     
     def get_error_rate(self) -> float:
         """計算錯誤率（百分比）"""
-        if not self.request_times:
-            return 0.0
-        
-        total_requests = len(self.request_times)
-        error_requests = sum(1 for _, _, status_code, _ in self.request_times if status_code >= 400)
-        
-        return (error_requests / total_requests) * 100 if total_requests > 0 else 0.0
+        return self._error_rate(self._aggregate())
     
     def get_max_queue_size(self) -> int:
         """獲取最大隊列大小"""
-        if not self.queue_metrics:
-            return 0
-        
-        return max(queue_size for _, queue_size, _ in self.queue_metrics)
+        return self._aggregate()['max_queue_size']
     
     def get_external_failure_rate(self) -> float:
         """計算外部調用失敗率（百分比）"""
-        if not self.external_calls:
-            return 0.0
-        
-        total_calls = len(self.external_calls)
-        failed_calls = sum(1 for _, success, _, _ in self.external_calls if not success)
+        return self._external_failure_rate(self._aggregate())
+    
+    def snapshot(self) -> Dict:
+        """本行程的累計值與窗口延遲 sketch（JSON 相容），供跨 worker 合併後匯出 Prometheus"""
+        external: Dict[str, List[int]] = {}
+        queues: Dict[str, tuple] = {}
+        for stripe in self._stripes:
+            with stripe.lock:
+                for service_name, (succeeded, failed) in stripe.external_totals.items():
+                    totals = external.setdefault(service_name, [0, 0])
+                    totals[0] += succeeded
+                    totals[1] += failed
+                for queue_name, sample in stripe.queue_sizes.items():
+                    if queue_name not in queues or sample[0] > queues[queue_name][0]:
+                        queues[queue_name] = sample
         
-        return (failed_calls / total_calls) * 100 if total_calls > 0 else 0.0
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "written_at": self._clock(),
+            "endpoints": self.endpoints.totals(),
+            "external_calls": external,
+            "queue_sizes": {name: size for name, (_, size) in queues.items()},
+            "endpoints_folded": self.endpoints.limiter.folded,
+            "window_latency": self.get_latency_sketch().to_dict()
+        }
     
-    def get_all_metrics(self) -> Dict:
-        """獲取所有核心指標"""
+    def get_all_metrics(self, top_endpoints: int = 10) -> Dict:
+        """獲取所有核心指標（只合併一次桶數據），附上最慢的 top_endpoints 個端點"""
+        totals = self._aggregate()
+        latency = totals['latency'].summary()
         return {
             "timestamp": datetime.utcnow().isoformat() + "Z",
-            "qps": round(self.get_qps(), 2),
-            "p95_latency_ms": round(self.get_p95_latency(), 2),
-            "error_rate_percent": round(self.get_error_rate(), 2),
-            "max_queue_size": self.get_max_queue_size(),
-            "external_failure_rate_percent": round(self.get_external_failure_rate(), 2),
+            "qps": round(self._qps(totals, self.window_size), 2),
+            "p95_latency_ms": latency['p95'],
+            "latency_ms": latency,
+            "error_rate_percent": round(self._error_rate(totals), 2),
+            "max_queue_size": totals['max_queue_size'],
+            "external_failure_rate_percent": round(self._external_failure_rate(totals), 2),
             "window_size_seconds": self.window_size,
+            "slowest_endpoints": self.get_endpoint_metrics(top=top_endpoints),
+            "endpoint_cardinality": {
+                "tracked": self.endpoints.limiter.tracked,
+                "max": self.endpoints.limiter.max_endpoints,
+                "folded_requests": self.endpoints.limiter.folded
+            },
             "data_points": {
-                "requests": len(self.request_times),
-                "external_calls": len(self.external_calls),
-                "queue_metrics": len(self.queue_metrics)
+                "requests": totals['requests'],
+                "external_calls": totals['external_calls'],
+                "queue_metrics": totals['queue_samples']
             }
         }
     
@@ -251,9 +397,6 @@ class MetricsCollector:
                 # 每分鐘檢查一次告警
                 time.sleep(60)
                 
-                # 清理舊數據
-                self._cleanup_old_data()
-                
                 # 檢查告警
                 alerts = self.check_alerts()
                 
@@ -275,7 +418,7 @@ class MetricsCollector:
                 self.logger.error(f"Error in monitoring loop: {e}")
 
 # 全局指標收集器實例
-metrics_collector = MetricsCollector()
+metrics_collector = MetricsCollector(snapshot_dir=os.environ.get(MULTIPROC_DIR_ENV))
 
 def get_metrics_collector() -> MetricsCollector:
     """獲取全局指標收集器實例"""
@@ -295,12 +438,14 @@ def flask_metrics_middleware(app):
         import flask
         if hasattr(flask.g, 'start_time'):
             response_time_ms = (time.time() - flask.g.start_time) * 1000
-            endpoint = flask.request.endpoint or flask.request.path
+            # 以路由規則而非實際路徑作為端點，未匹配的路徑歸入 other
+            url_rule = flask.request.url_rule
             
             metrics_collector.record_request(
                 response_time_ms=response_time_ms,
                 status_code=response.status_code,
-                endpoint=endpoint
+                endpoint=url_rule.rule if url_rule else None,
+                method=flask.request.method
             )
         
         return response
@@ -309,6 +454,12 @@ def flask_metrics_middleware(app):
 
 # 使用示例
 if __name__ == "__main__":
+    # 單獨執行時才設定日誌輸出（作為模組載入時由應用程式設定）
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
     # 模擬一些指標數據
     import random
     
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Prometheus 文字格式（text/plain; version=0.0.4）匯出
+
+輸入為 worker_snapshots.merge_snapshots 合併後的全叢集快照，輸出累計的
+請求計數、延遲直方圖、各階段耗時與 SQL 查詢數、外部調用計數、隊列大小，以及由可合併 sketch 算出的
+窗口延遲分位數。
+"""
+
+import os
+import re
+from typing import Dict, Iterable, List
+
+from endpoint_metrics import DURATION_BUCKETS_SECONDS
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+METRIC_PREFIX = re.sub(r'[^a-zA-Z0-9_]', '_', os.environ.get('APP_NAME', 'morningai'))
+
+WINDOW_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value) -> str:
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _family(lines: List[str], name: str, metric_type: str, help_text: str,
+            samples: Iterable[tuple]):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+    for suffix, labels, value in samples:
+        lines.append(f'{name}{suffix}{_labels(**labels)} {_number(value)}')
+
+
+def _request_samples(endpoints: List[Dict]):
+    for row in endpoints:
+        for status_class, count in sorted(row['status_counts'].items()):
+            yield '', {'endpoint': row['endpoint'], 'method': row['method'],
+                             'status': status_class}, count
+
+
+def _duration_samples(endpoints: List[Dict]):
+    for row in endpoints:
+        labels = {'endpoint': row['endpoint'], 'method': row['method']}
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS_SECONDS, row['bucket_counts']):
+            cumulative += count
+            yield '_bucket', dict(labels, le=repr(float(bound))), cumulative
+        yield '_bucket', dict(labels, le='+Inf'), row['count']
+        yield '_sum', labels, row['sum_seconds']
+        yield '_count', labels, row['count']
+
+
+def _phase_samples(endpoints: List[Dict]):
+    for row in endpoints:
+        for phase, seconds in sorted(row['phase_seconds'].items()):
+            yield '', {'endpoint': row['endpoint'], 'method': row['method'],
+                       'phase': phase}, seconds
+
+
+def render_prometheus(cluster: Dict) -> str:
+    """將合併後的快照轉為 Prometheus 文字格式"""
+    lines: List[str] = []
+    prefix = METRIC_PREFIX
+
+    _family(lines, f'{prefix}_http_requests_total', 'counter',
+            'HTTP requests by route rule, method and status class.',
+            _request_samples(cluster['endpoints']))
+    _family(lines, f'{prefix}_http_request_duration_seconds', 'histogram',
+            'HTTP request latency by route rule and method.',
+            _duration_samples(cluster['endpoints']))
+    _family(lines, f'{prefix}_http_request_phase_seconds_total', 'counter',
+            'Time spent per request phase (auth, db, serialize, ...) by route rule and method.',
+            _phase_samples(cluster['endpoints']))
+    _family(lines, f'{prefix}_db_queries_total', 'counter',
+            'SQL statements executed while serving requests, by route rule and method.',
+            [('', {'endpoint': row['endpoint'], 'method': row['method']}, row['queries'])
+             for row in cluster['endpoints']])
+    _family(lines, f'{prefix}_db_n_plus_one_requests_total', 'counter',
+            'Requests that repeated one statement shape past the N+1 threshold.',
+            [('', {'endpoint': row['endpoint'], 'method': row['method']}, row['n_plus_one'])
+             for row in cluster['endpoints']])
+
+    window = cluster['window_latency']
+    quantiles = window.quantiles(WINDOW_QUANTILES)
+    _family(lines, f'{prefix}_http_request_duration_window_seconds', 'summary',
+            'HTTP request latency quantiles over the rolling window, merged across workers.',
+            [('', {'quantile': str(q)}, quantiles[q] / 1000) for q in WINDOW_QUANTILES]
+            + [('_sum', {}, window.sum / 1000), ('_count', {}, window.count)])
+
+    _family(lines, f'{prefix}_external_calls_total', 'counter',
+            'External calls by service and result.',
+            [('', {'service': service, 'result': result}, count)
+             for service, counts in sorted(cluster['external_calls'].items())
+             for result, count in zip(('success', 'failure'), counts)])
+    _family(lines, f'{prefix}_queue_size', 'gauge',
+            'Latest reported queue size, summed across live workers.',
+            [('', {'queue': name}, size) for name, size in sorted(cluster['queue_sizes'].items())])
+    _family(lines, f'{prefix}_metrics_endpoints_folded_total', 'counter',
+            'Requests recorded under the "other" endpoint by the cardinality guard.',
+            [('', {}, cluster['endpoints_folded'])])
+    _family(lines, f'{prefix}_metrics_workers', 'gauge',
+            'Live worker processes included in this scrape.',
+            [('', {}, cluster['workers'])])
+
+    return '\n'.join(lines) + '\n'
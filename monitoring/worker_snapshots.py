@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+多行程（gunicorn workers）指標合併
+
+每個 worker 的背景執行緒定期把 MetricsCollector.snapshot() 以原子替換的方式
+寫入共用目錄（METRICS_MULTIPROC_DIR）中的 worker-<pid>-<啟動毫秒>.json，
+行程結束時再寫入最後一次；請求路徑完全不碰檔案。檔名含啟動時間，新 worker
+沿用已結束 worker 的 pid 時不會覆寫其累計值。
+抓取時讀取所有 worker 的快照並合併：counter / histogram 相加（已結束 worker 的
+累計值保留，避免計數倒退），gauge 只取仍存活的 worker（同一 pid 只認最新啟動的
+快照），窗口延遲 sketch 只合併仍在窗口內的快照。回應抓取的 worker 以記憶體中的
+即時數據取代自己的檔案。
+
+目錄應在服務啟動前清空，否則上次部署的計數會被一併加總。
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from latency_sketch import LatencySketch
+
+MULTIPROC_DIR_ENV = 'METRICS_MULTIPROC_DIR'
+
+logger = logging.getLogger(__name__)
+
+
+def _snapshot_path(directory: str, pid: int, started_at: float) -> str:
+    return os.path.join(directory, f"worker-{pid}-{int(started_at * 1000)}.json")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SnapshotWriter:
+    """定期將收集器快照寫入共用目錄"""
+
+    def __init__(self, collector, directory: str, interval: float = 5.0):
+        self.collector = collector
+        self.directory = directory
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'SnapshotWriter':
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name="metrics-snapshot-writer", daemon=True
+        )
+        self._thread.start()
+        # worker 結束（gunicorn 回收或重啟）時寫入最後一次快照，不遺失最後一個間隔的計數
+        atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        try:
+            self.write_now()
+        except Exception as e:
+            logger.error(f"Error writing final metrics snapshot: {e}")
+
+    def write_now(self):
+        """寫入一次快照（先寫暫存檔再原子替換，讀取端不會讀到半份檔案）"""
+        snapshot = self.collector.snapshot()
+        path = _snapshot_path(self.directory, snapshot['pid'], snapshot['started_at'])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as handle:
+            json.dump(snapshot, handle, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.write_now()
+            except Exception as e:
+                logger.error(f"Error writing metrics snapshot: {e}")
+
+
+def read_snapshots(directory: str, exclude_pid: Optional[int] = None,
+                   exclude_started_at: Optional[float] = None) -> List[Dict]:
+    """
+    讀取目錄中所有 worker 的快照（略過無法解析的檔案）
+
+    exclude_pid / exclude_started_at 排除指定的 worker；只給 pid 時排除該 pid 的所有快照。
+    """
+    snapshots = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return snapshots
+
+    for name in names:
+        if not (name.startswith('worker-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as handle:
+                snapshot = json.load(handle)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable metrics snapshot {name}: {e}")
+            continue
+        excluded = snapshot.get('pid') == exclude_pid and (
+            exclude_started_at is None or snapshot.get('started_at') == exclude_started_at
+        )
+        if not excluded:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def merge_snapshots(snapshots: List[Dict], now: float, window_size: int,
+                    live_pids: Optional[set] = None) -> Dict:
+    """
+    合併多個 worker 的快照
+
+    live_pids 為仍存活的 worker（None 表示以 os.kill 檢查）；gauge 與窗口
+    sketch 只採用存活且 window_size 秒內寫入的快照。pid 被新 worker 沿用時，
+    只有最新啟動的快照視為存活，舊快照只計入累計值。
+    """
+    endpoints: Dict[tuple, Dict] = {}
+    external: Dict[str, List[int]] = {}
+    queue_sizes: Dict[str, int] = {}
+    window_latency = LatencySketch()
+    folded = 0
+    live_workers = 0
+    newest: Dict[int, float] = {}
+    for snapshot in snapshots:
+        pid = snapshot['pid']
+        newest[pid] = max(newest.get(pid, 0), snapshot.get('started_at', 0))
+
+    for snapshot in snapshots:
+        pid = snapshot['pid']
+        alive = snapshot.get('started_at', 0) == newest[pid] and (
+            pid in live_pids if live_pids is not None else _pid_alive(pid)
+        )
+
+        for row in snapshot['endpoints']:
+            key = (row['endpoint'], row['method'])
+            total = endpoints.get(key)
+            if total is None:
+                total = endpoints[key] = {
+                    'endpoint': row['endpoint'],
+                    'method': row['method'],
+                    'status_counts': {},
+                    'bucket_counts': [0] * len(row['bucket_counts']),
+                    'sum_seconds': 0.0,
+                    'count': 0,
+                    'phase_seconds': {},
+                    'queries': 0,
+                    'n_plus_one': 0,
+                }
+            for status_class, count in row['status_counts'].items():
+                total['status_counts'][status_class] = (
+                    total['status_counts'].get(status_class, 0) + count
+                )
+            for index, count in enumerate(row['bucket_counts']):
+                total['bucket_counts'][index] += count
+            total['sum_seconds'] += row['sum_seconds']
+            total['count'] += row['count']
+            for phase, seconds in row.get('phase_seconds', {}).items():
+                total['phase_seconds'][phase] = total['phase_seconds'].get(phase, 0.0) + seconds
+            total['queries'] += row.get('queries', 0)
+            total['n_plus_one'] += row.get('n_plus_one', 0)
+
+        for service_name, (succeeded, failed) in snapshot['external_calls'].items():
+            totals = external.setdefault(service_name, [0, 0])
+            totals[0] += succeeded
+            totals[1] += failed
+        folded += snapshot['endpoints_folded']
+
+        if not alive:
+            continue
+        live_workers += 1
+        for queue_name, size in snapshot['queue_sizes'].items():
+            queue_sizes[queue_name] = queue_sizes.get(queue_name, 0) + size
+        if now - snapshot['written_at'] <= window_size:
+            window_latency.merge(LatencySketch.from_dict(snapshot['window_latency']))
+
+    return {
+        'workers': live_workers,
+        'endpoints': sorted(endpoints.values(), key=lambda row: (row['endpoint'], row['method'])),
+        'external_calls': external,
+        'queue_sizes': queue_sizes,
+        'endpoints_folded': folded,
+        'window_latency': window_latency,
+    }
+
+
+def collect_cluster_snapshot(collector, directory: Optional[str] = None) -> Dict:
+    """本 worker 的即時快照加上其他 worker 寫入的快照，合併後回傳"""
+    directory = directory or os.environ.get(MULTIPROC_DIR_ENV)
+    local = collector.snapshot()
+    snapshots = [local]
+    if directory:
+        snapshots.extend(read_snapshots(
+            directory, exclude_pid=local['pid'], exclude_started_at=local['started_at']
+        ))
+    return merge_snapshots(snapshots, local['written_at'], collector.window_size)